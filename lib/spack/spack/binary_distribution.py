@@ -20,13 +20,28 @@
 import tarfile
 import tempfile
 import textwrap
+import threading
 import time
 import urllib.error
 import urllib.parse
 import urllib.request
+import uuid
 import warnings
 from contextlib import closing
-from typing import IO, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import spack.caches
 import spack.config
@@ -94,12 +109,27 @@
     ListMirrorSpecsError,
     MirrorForSpec,
     MirrorURLAndVersion,
+    NoSuchBlobException,
     URLBuildcacheEntry,
     get_entries_from_cache,
     get_url_buildcache_class,
     get_valid_spec_file,
 )
 
+#: Number of leading characters of the DAG hash of a spec, selecting the shard of the buildcache
+#: index where the spec is recorded
+INDEX_SHARD_PREFIX_LENGTH = 2
+
+#: Version of the format of the table of shards of the buildcache index
+INDEX_SHARDS_FORMAT_VERSION = 1
+
+#: Version of the format of the deltas in the changelog of the buildcache index
+INDEX_DELTA_FORMAT_VERSION = 1
+
+#: Number of deltas kept in the changelog of the buildcache index. Clients whose copy of the
+#: index is older than the first of them fetch the shards that changed instead.
+INDEX_CHANGELOG_LENGTH = 64
+
 
 class BuildCacheDatabase(spack.database.Database):
     """A database for binary buildcaches.
@@ -107,6 +137,9 @@ class BuildCacheDatabase(spack.database.Database):
     A database supports writing buildcache index files, in which case certain fields are not
     needed in each install record, and no locking is required. To use this feature, it provides
     ``lock_cfg=NO_LOCK``, and override the list of ``record_fields``.
+
+    Buildcache indices have no journal, and are written at the last version without one, so
+    that older versions of Spack can read them.
     """
 
     record_fields = ("spec", "ref_count", "in_buildcache")
@@ -116,6 +149,9 @@ def __init__(self, root):
         self._write_transaction_impl = spack.llnl.util.lang.nullcontext
         self._read_transaction_impl = spack.llnl.util.lang.nullcontext
 
+    def _index_version(self):
+        return spack.database._DB_VERSION_WITHOUT_JOURNAL
+
     def _handle_old_db_versions_read(self, check, db, *, reindex: bool):
         if not self.is_readable():
             raise spack.database.DatabaseNotReadableError(
@@ -146,6 +182,23 @@ def __init__(self, errors):
         super().__init__(self.message)
 
 
+def _run_in_daemon_thread(fn: Callable, *args) -> concurrent.futures.Future:
+    """Runs a function in a new daemon thread, and returns the future of its result. Unlike
+    the threads of an executor, the thread is not waited for when the interpreter exits."""
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
 class BinaryCacheIndex:
     """
     The BinaryCacheIndex tracks what specs are available on (usually remote)
@@ -411,6 +464,7 @@ def update(self, with_cooldown=False):
 
         fetch_errors = []
         all_methods_failed = True
+        to_fetch: Dict[MirrorURLAndVersion, dict] = {}
         ttl = spack.config.get("config:binary_index_ttl", 600)
         now = time.time()
 
@@ -434,25 +488,18 @@ def update(self, with_cooldown=False):
                         all_methods_failed = False
                 else:
                     # May need to fetch the index and update the local caches
-                    try:
-                        needs_regen = self._fetch_and_cache_index(
-                            urlAndVersion, cache_entry=cache_entry
-                        )
-                        self._last_fetch_times[urlAndVersion] = (now, True)
-                        all_methods_failed = False
-                    except FetchIndexError as e:
-                        needs_regen = False
-                        fetch_errors.append(e)
-                        self._last_fetch_times[urlAndVersion] = (now, False)
-                    # The need to regenerate implies a need to clear as well.
-                    spec_cache_clear_needed |= needs_regen
-                    spec_cache_regenerate_needed |= needs_regen
+                    to_fetch[urlAndVersion] = cache_entry
             else:
                 # No longer have this mirror, cached index should be removed
+                url_hash = compute_hash(f"{cached_mirror_url}/v{urlAndVersion.version}")
                 items_to_remove.append(
                     {
                         "url": local_index_cache_key,
                         "cache_key": os.path.join(self._index_cache_root, cached_index_path),
+                        "shard_keys": [
+                            self._index_shard_key(url_hash, prefix)
+                            for prefix in cache_entry.get("shards", {})
+                        ],
                     }
                 )
                 if urlAndVersion in self._last_fetch_times:
@@ -465,28 +512,38 @@ def update(self, with_cooldown=False):
             url = item["url"]
             cache_key = item["cache_key"]
             self._index_file_cache.remove(cache_key)
+            for shard_key in item["shard_keys"]:
+                self._index_file_cache.remove(shard_key)
             del self._local_index_cache[url]
 
         # Iterate the configured mirrors now.  Any mirror urls we do not
         # already have in our cache must be fetched, stored, and represented
         # locally.
+        new_mirrors = set()
         for urlAndVersion in configured_mirrors:
             if str(urlAndVersion) in self._local_index_cache:
                 continue
 
             # Need to fetch the index and update the local caches
-            try:
-                needs_regen = self._fetch_and_cache_index(urlAndVersion)
+            to_fetch[urlAndVersion] = {}
+            new_mirrors.add(urlAndVersion)
+
+        # Fetch the indices of all the mirrors concurrently, so that their latencies don't add up
+        for urlAndVersion, needs_regen, error in self._fetch_and_cache_indices(to_fetch):
+            if error is None:
                 self._last_fetch_times[urlAndVersion] = (now, True)
                 all_methods_failed = False
-            except FetchIndexError as e:
-                fetch_errors.append(e)
-                needs_regen = False
+            else:
+                fetch_errors.append(error)
                 self._last_fetch_times[urlAndVersion] = (now, False)
-            # Generally speaking, a new mirror wouldn't imply the need to
-            # clear the spec cache, so leave it as is.
-            if needs_regen:
-                spec_cache_regenerate_needed = True
+            if urlAndVersion in new_mirrors:
+                # Generally speaking, a new mirror wouldn't imply the need to
+                # clear the spec cache, so leave it as is.
+                spec_cache_regenerate_needed |= needs_regen
+            else:
+                # The need to regenerate implies a need to clear as well.
+                spec_cache_clear_needed |= needs_regen
+                spec_cache_regenerate_needed |= needs_regen
 
         self._write_local_index_cache()
 
@@ -500,6 +557,60 @@ def update(self, with_cooldown=False):
         if spec_cache_regenerate_needed:
             self.regenerate_spec_cache(clear_existing=spec_cache_clear_needed)
 
+    def _index_shard_key(self, url_hash: str, prefix: str) -> str:
+        return f"{url_hash[:10]}_shards/{prefix}.json"
+
+    def _read_cached_index_shard(self, url_hash: str, prefix: str) -> Optional[str]:
+        """Returns the contents of a shard of the index of a mirror, as it was last fetched, or
+        None if it is not in the cache."""
+        return self._read_cached_index(self._index_shard_key(url_hash, prefix))
+
+    def cached_index_shard(self, mirror_url: str, prefix: str, checksum: str) -> Optional[str]:
+        """Returns the contents of a shard of the index of a mirror, at the current layout
+        version, if it was last fetched with the given checksum, or None otherwise."""
+        self._init_local_index_cache()
+        url_and_version = MirrorURLAndVersion(mirror_url, CURRENT_BUILD_CACHE_LAYOUT_VERSION)
+        cache_entry = self._local_index_cache.get(str(url_and_version), {})
+        if cache_entry.get("shards", {}).get(prefix) != checksum:
+            return None
+        url_hash = compute_hash(f"{mirror_url}/v{CURRENT_BUILD_CACHE_LAYOUT_VERSION}")
+        contents = self._read_cached_index_shard(url_hash, prefix)
+        if contents is None or compute_hash(contents) != checksum:
+            return None
+        return contents
+
+    def _read_local_copies(
+        self, url_and_version: MirrorURLAndVersion, cache_entry: dict
+    ) -> Tuple[Dict[str, str], Optional[str]]:
+        """Returns the contents of the shards, by prefix, and of the index of a mirror, as they
+        were last fetched, if its index was sharded. They are read before fetching the index,
+        since the locks of the file cache are not thread safe."""
+        local_shards: Dict[str, str] = cache_entry.get("shards", {})
+        if not local_shards:
+            return {}, None
+
+        url_hash = compute_hash(f"{url_and_version.url}/v{url_and_version.version}")
+        shards = {}
+        for prefix in local_shards:
+            contents = self._read_cached_index_shard(url_hash, prefix)
+            if contents is not None:
+                shards[prefix] = contents
+        return shards, self._read_cached_index(cache_entry.get("index_path", None))
+
+    def _read_cached_index(self, cache_key: Optional[str]) -> Optional[str]:
+        """Returns the contents of a file of the index of a mirror, as it was last fetched, or
+        None if it is not in the cache."""
+        if not cache_key:
+            return None
+        try:
+            if not self._index_file_cache.init_entry(cache_key):
+                return None
+            with self._index_file_cache.read_transaction(cache_key) as f:
+                return f.read() if f is not None else None
+        except (OSError, file_cache.CacheError) as e:
+            tty.debug(f"Cannot read {cache_key} from the binary index cache: {e}")
+            return None
+
     def _fetch_and_cache_index(self, url_and_version: MirrorURLAndVersion, cache_entry={}):
         """Fetch a buildcache index file from a remote mirror and cache it.
 
@@ -509,11 +620,83 @@ def _fetch_and_cache_index(self, url_and_version: MirrorURLAndVersion, cache_ent
         Args:
             url_and_version: Contains mirror base url and target binary cache layout version
             cache_entry (dict): Old cache metadata with keys ``index_hash``, ``index_path``,
-                ``etag``
+                ``etag``, and for a sharded index ``shards``, ``generation`` and ``changelog``
 
         Returns:
             True if the local index.json was updated.
 
+        Throws:
+            FetchIndexError
+        """
+        local_copies = self._read_local_copies(url_and_version, cache_entry)
+        result = self._fetch_index(url_and_version, cache_entry, local_copies)
+        return self._cache_index(url_and_version, cache_entry, result)
+
+    def _fetch_and_cache_indices(
+        self, cache_entries: Dict[MirrorURLAndVersion, dict]
+    ) -> List[Tuple[MirrorURLAndVersion, bool, Optional["FetchIndexError"]]]:
+        """Fetch the buildcache indices of remote mirrors concurrently, and cache them.
+
+        Indices are fetched in daemon threads, and cached in the current thread. An index that is
+        not fetched within ``config:binary_index_timeout`` seconds is reported as an error, so
+        that a slow mirror does not delay the indices of the others, and its fetch is abandoned
+        without delaying the exit of the process.
+
+        Args:
+            cache_entries: Old cache metadata of each mirror, as in ``_fetch_and_cache_index``
+
+        Returns:
+            For each mirror, whether the local index.json was updated, and the error that
+            prevented fetching its index, if any.
+        """
+        if not cache_entries:
+            return []
+
+        timeout = spack.config.get("config:binary_index_timeout", 0) or None
+        deadline = time.monotonic() + timeout if timeout else None
+        results: List[Tuple[MirrorURLAndVersion, bool, Optional["FetchIndexError"]]] = []
+
+        # Fetches that time out are left running, and their result is discarded
+        futures = {
+            url_and_version: _run_in_daemon_thread(
+                self._fetch_index,
+                url_and_version,
+                cache_entry,
+                self._read_local_copies(url_and_version, cache_entry),
+            )
+            for url_and_version, cache_entry in cache_entries.items()
+        }
+        for url_and_version, future in futures.items():
+            remaining = max(deadline - time.monotonic(), 0) if deadline else None
+            try:
+                result = future.result(timeout=remaining)
+            except concurrent.futures.TimeoutError:
+                error = FetchIndexError(
+                    f"Timed out after {timeout} seconds fetching the index of "
+                    f"{url_and_version.url}"
+                )
+                results.append((url_and_version, False, error))
+                continue
+            except FetchIndexError as e:
+                results.append((url_and_version, False, e))
+                continue
+            cache_entry = cache_entries[url_and_version]
+            needs_regen = self._cache_index(url_and_version, cache_entry, result)
+            results.append((url_and_version, needs_regen, None))
+        return results
+
+    def _fetch_index(
+        self,
+        url_and_version: MirrorURLAndVersion,
+        cache_entry: dict,
+        local_copies: Tuple[Dict[str, str], Optional[str]],
+    ) -> Optional["FetchIndexResult"]:
+        """Fetch a buildcache index file from a remote mirror, without caching it. Returns None
+        if the mirror has no index.
+
+        This doesn't access the local caches, so that it can run in a thread. The local copies
+        of the index and of its shards, as returned by ``_read_local_copies``, are used instead.
+
         Throws:
             FetchIndexError
         """
@@ -522,21 +705,47 @@ def _fetch_and_cache_index(self, url_and_version: MirrorURLAndVersion, cache_ent
 
         # TODO: get rid of this request, handle 404 better
         scheme = urllib.parse.urlparse(mirror_url).scheme
+        local_shards: Dict[str, str] = cache_entry.get("shards", {})
+        local_shard_contents, local_index = local_copies
 
+        fetcher: Optional[IndexFetcher] = None
         if scheme != "oci":
             cache_class = get_url_buildcache_class(layout_version=layout_version)
-            if not web_util.url_exists(cache_class.get_index_url(mirror_url)):
-                return False
+            if layout_version >= 3 and web_util.url_exists(
+                cache_class.get_index_shards_url(mirror_url)
+            ):
+                fetcher = ShardedIndexFetcher(
+                    url_and_version,
+                    cache_entry.get("index_hash", None),
+                    local_shards,
+                    local_shard_contents.get,
+                    cache_entry.get("generation", None),
+                    lambda: local_index,
+                    cache_entry.get("changelog", None),
+                )
+            elif not web_util.url_exists(cache_class.get_index_url(mirror_url)):
+                return None
 
-        fetcher: IndexFetcher = get_index_fetcher(scheme, url_and_version, cache_entry)
-        result = fetcher.conditional_fetch()
+        if fetcher is None:
+            fetcher = get_index_fetcher(scheme, url_and_version, cache_entry)
+        return fetcher.conditional_fetch()
 
+    def _cache_index(
+        self,
+        url_and_version: MirrorURLAndVersion,
+        cache_entry: dict,
+        result: Optional["FetchIndexResult"],
+    ) -> bool:
+        """Cache a buildcache index fetched from a remote mirror, and return True if the local
+        index.json was updated."""
         # Nothing to do
-        if result.fresh:
+        if result is None or result.fresh:
             return False
 
+        url_hash = compute_hash(f"{url_and_version.url}/v{url_and_version.version}")
+        local_shards: Dict[str, str] = cache_entry.get("shards", {})
+
         # Persist new index.json
-        url_hash = compute_hash(f"{mirror_url}/v{layout_version}")
         cache_key = "{}_{}.json".format(url_hash[:10], result.hash[:10])
         self._index_file_cache.init_entry(cache_key)
         with self._index_file_cache.write_transaction(cache_key) as (old, new):
@@ -548,6 +757,31 @@ def _fetch_and_cache_index(self, url_and_version: MirrorURLAndVersion, cache_ent
             "etag": result.etag,
         }
 
+        if result.generation is not None:
+            self._local_index_cache[str(url_and_version)]["generation"] = result.generation
+            self._local_index_cache[str(url_and_version)]["changelog"] = result.changelog
+
+        # Persist the shards that changed, so that they are not fetched again. An index updated
+        # from its changelog keeps the shards of the previous generation, which are fetched
+        # again only if they changed once the changelog cannot be used.
+        if result.shards is None:
+            shards_checksums = local_shards if result.generation is not None else {}
+        else:
+            for prefix, (checksum, contents) in result.shards.items():
+                if local_shards.get(prefix) != checksum:
+                    shard_key = self._index_shard_key(url_hash, prefix)
+                    self._index_file_cache.init_entry(shard_key)
+                    with self._index_file_cache.write_transaction(shard_key) as (old, new):
+                        new.write(contents)
+            shards_checksums = {
+                prefix: checksum for prefix, (checksum, _) in result.shards.items()
+            }
+        for prefix in local_shards:
+            if prefix not in shards_checksums:
+                self._index_file_cache.remove(self._index_shard_key(url_hash, prefix))
+        if shards_checksums:
+            self._local_index_cache[str(url_and_version)]["shards"] = shards_checksums
+
         # clean up the old cache_key if necessary
         old_cache_key = cache_entry.get("index_path", None)
         if old_cache_key:
@@ -698,8 +932,9 @@ def select_signing_key() -> str:
     return keys[0]
 
 
-def _push_index(db: BuildCacheDatabase, temp_dir: str, cache_prefix: str):
-    """Generate the index, compute its hash, and push the files to the mirror"""
+def _push_index(db: BuildCacheDatabase, temp_dir: str, cache_prefix: str) -> str:
+    """Generate the index, compute its hash, and push the files to the mirror. Returns the
+    checksum of the index."""
     index_json_path = os.path.join(temp_dir, spack.database.INDEX_JSON_FILE)
     with open(index_json_path, "w", encoding="utf-8") as f:
         db._write_to_file(f)
@@ -708,8 +943,23 @@ def _push_index(db: BuildCacheDatabase, temp_dir: str, cache_prefix: str):
     cache_class.push_local_file_as_blob(
         index_json_path, cache_prefix, "index", BuildcacheComponent.INDEX, compression="none"
     )
+
+    # Push the same records as shards, replacing the shards that changed. An index whose shards
+    # cannot be read is replaced as a whole, and starts a new changelog.
+    try:
+        current = _fetch_index_shards(cache_prefix)
+        if current is not None:
+            _check_index_blobs(cache_prefix, current)
+        _push_index_shards(cache_prefix, _index_shards_of(db, current), current, temp_dir)
+    except BuildcacheIndexError as e:
+        tty.warn(f"{e}. Replacing it.")
+        _push_index_shards(cache_prefix, _index_shards_of(db, None), None, temp_dir)
+
     cache_class.maybe_push_layout_json(cache_prefix)
 
+    with open(index_json_path, "rb") as f:
+        return compute_hash(f.read())
+
 
 def _read_specs_and_push_index(
     file_list: List[str],
@@ -746,6 +996,101 @@ def _read_specs_and_push_index(
     _push_index(db, temp_dir, cache_prefix)
 
 
+def _fetch_index_record(url: str) -> Optional[BlobRecord]:
+    """Returns the blob record of the buildcache index of a mirror, or None if it cannot be read"""
+    cache_class = get_url_buildcache_class(layout_version=CURRENT_BUILD_CACHE_LAYOUT_VERSION)
+    cache_entry = cache_class(url, allow_unsigned=True)
+    try:
+        manifest = cache_entry.read_manifest(cache_class.get_index_url(url))
+        return manifest.get_blob_records(
+            cache_class.component_to_media_type(BuildcacheComponent.INDEX)
+        )[0]
+    except (BuildcacheEntryError, NoSuchBlobException):
+        return None
+    finally:
+        cache_entry.destroy()
+
+
+def _url_update_package_index(url: str, specs: List[spack.spec.Spec], tmpdir: str) -> None:
+    """Adds specs to the sharded buildcache index of a mirror, reading and pushing only the
+    shards that record the specs or their dependencies, so that the cost of a push doesn't
+    depend on the size of the index. A mirror without a sharded index gets a full index.
+
+    The unsharded index, read by clients that don't know about shards, is rebuilt from the
+    shards that were pushed, and from the other shards, which are read from the local binary
+    index cache when it has them, and fetched otherwise.
+
+    Mirrors cannot replace the table of shards atomically, so it is read again right before and
+    after pushing it. If another process pushed it in between, the index is regenerated from
+    all the spec manifests, so that it records the specs pushed by both.
+
+    Args:
+        url: url of the mirror
+        specs: specs that are in the buildcache
+        tmpdir: directory where files are written before being pushed
+    """
+    try:
+        current = _fetch_index_shards(url)
+        if current is None:
+            _url_generate_package_index(url, tmpdir)
+            return
+
+        db = BuildCacheDatabase(tmpdir)
+        for spec in specs:
+            db.add(spec)
+            db.mark(spec, "in_buildcache", True)
+        shards = _index_shards_with_records(url, db, current)
+
+        latest = _fetch_index_shards(url)
+        if latest is not None and latest.checksum == current.checksum:
+            pushed = _push_index_shards(url, shards, current, tmpdir)
+            latest = _fetch_index_shards(url)
+            if latest is not None and latest.checksum == pushed:
+                if pushed != current.checksum:
+                    _push_index_from_shards(url, shards, latest, tmpdir)
+                return
+    except Exception as e:
+        raise GenerateIndexError(
+            f"Encountered problem updating package index of {url}: {e}. "
+            "Run `spack buildcache update-index` to regenerate it."
+        ) from e
+
+    tty.debug(f"The package index of {url} was pushed concurrently, regenerating it")
+    _url_generate_package_index(url, tmpdir)
+
+
+def _push_index_from_shards(
+    url: str, shards: Dict[str, Dict[str, Any]], current: "IndexShards", tmpdir: str
+) -> None:
+    """Pushes the unsharded buildcache index of a mirror, with the records of all its shards.
+
+    Args:
+        url: url of the mirror
+        shards: install records of the shards that were just pushed, by prefix
+        current: shards of the index, as pushed
+        tmpdir: directory where the index is written before being pushed
+    """
+    installs: Dict[str, Any] = {}
+    for prefix, record in current.shards.items():
+        if prefix in shards:
+            installs.update(shards[prefix])
+            continue
+        contents = BINARY_INDEX.cached_index_shard(url, prefix, record.checksum)
+        if contents is None:
+            installs.update(_fetch_index_shard(url, record))
+        else:
+            installs.update(json.loads(contents)["database"]["installs"])
+
+    index_json_path = os.path.join(tmpdir, spack.database.INDEX_JSON_FILE)
+    with open(index_json_path, "w", encoding="utf-8") as f:
+        f.write(_index_shard_contents(installs))
+
+    cache_class = get_url_buildcache_class(layout_version=CURRENT_BUILD_CACHE_LAYOUT_VERSION)
+    cache_class.push_local_file_as_blob(
+        index_json_path, url, "index", BuildcacheComponent.INDEX, compression="none"
+    )
+
+
 def _url_generate_package_index(url: str, tmpdir: str):
     """Create or replace the build cache index on the given mirror.  The
     buildcache index contains an entry for each binary package under the
@@ -778,6 +1123,275 @@ def _url_generate_package_index(url: str, tmpdir: str):
             ) from e
 
 
+def _index_shard_prefix(dag_hash: str) -> str:
+    """Returns the prefix of the shard of the buildcache index recording a DAG hash"""
+    return dag_hash[:INDEX_SHARD_PREFIX_LENGTH]
+
+
+def _index_shards_of(
+    db: BuildCacheDatabase, current: Optional["IndexShards"]
+) -> Dict[str, Dict[str, Any]]:
+    """Returns the install records of a database split in shards, by prefix. Shards of the
+    current index that have no record in the database are returned empty, so that they are
+    removed."""
+    shards: Dict[str, Dict[str, Any]] = {}
+    if current:
+        shards = {prefix: {} for prefix in current.shards}
+    for dag_hash, record in db._data.items():
+        shards.setdefault(_index_shard_prefix(dag_hash), {})[dag_hash] = record.to_dict(
+            include_fields=db.record_fields
+        )
+    return shards
+
+
+def _index_shards_with_records(
+    url: str, db: BuildCacheDatabase, current: "IndexShards"
+) -> Dict[str, Dict[str, Any]]:
+    """Returns the shards of the index of a mirror that record the specs in a database, with
+    the records of the database merged in, by prefix. Only these shards are fetched.
+
+    Records that are not in the shards yet are added, and the reference counts of their
+    dependencies are increased. Records that are already there are kept, and marked as in the
+    buildcache if they are in the database. The records are the same as the ones of an index
+    generated from scratch with all the specs.
+    """
+    shards: Dict[str, Dict[str, Any]] = {}
+    for dag_hash in db._data:
+        prefix = _index_shard_prefix(dag_hash)
+        if prefix not in shards:
+            record = current.shards.get(prefix)
+            shards[prefix] = _fetch_index_shard(url, record) if record else {}
+
+    added = {h for h in db._data if h not in shards[_index_shard_prefix(h)]}
+    for dag_hash in added:
+        record = db._data[dag_hash]
+        shards[_index_shard_prefix(dag_hash)][dag_hash] = record.to_dict(
+            include_fields=db.record_fields
+        )
+    for dag_hash in added:
+        spec = db._data[dag_hash].spec
+        for edge in spec.edges_to_dependencies(depflag=ht.dag_hash.depflag):
+            dependency = edge.spec.dag_hash()
+            if dependency not in added:
+                shards[_index_shard_prefix(dependency)][dependency]["ref_count"] += 1
+    for dag_hash, record in db._data.items():
+        if record.in_buildcache:
+            shards[_index_shard_prefix(dag_hash)][dag_hash]["in_buildcache"] = True
+    return shards
+
+
+def _index_shard_contents(installs: Dict[str, Any]) -> str:
+    """Returns the contents of a shard of the buildcache index, which is an index on its own"""
+    return sjson.dump(  # type: ignore[return-value]
+        {
+            "database": {
+                "version": str(spack.database._DB_VERSION_WITHOUT_JOURNAL),
+                "installs": dict(sorted(installs.items())),
+            }
+        }
+    )
+
+
+class IndexShards(NamedTuple):
+    """The shards of the buildcache index of a mirror, and its changelog"""
+
+    #: blob records of the shards, by prefix
+    shards: Dict[str, BlobRecord]
+    #: generation of the index, increased by every push of the index
+    generation: int
+    #: blob records of the deltas in the changelog, by the generation they lead to
+    deltas: Dict[int, BlobRecord]
+    #: random identifier of the changelog, changed whenever the changelog starts over, so that
+    #: clients don't apply its deltas to an index from another changelog with the same generation
+    changelog: Optional[str] = None
+    #: checksum of the table of shards, which changes with every push of the index
+    checksum: Optional[str] = None
+
+
+def _fetch_index_shards(url: str) -> Optional[IndexShards]:
+    """Returns the shards of the buildcache index of a mirror, and its changelog, or None if the
+    mirror has no sharded index.
+
+    Raises:
+        BuildcacheIndexError: if the mirror has a sharded index, but it cannot be read
+    """
+    cache_class = get_url_buildcache_class(layout_version=CURRENT_BUILD_CACHE_LAYOUT_VERSION)
+    shards_url = cache_class.get_index_shards_url(url)
+    if not web_util.url_exists(shards_url):
+        return None
+
+    cache_entry = cache_class(url, allow_unsigned=True)
+    try:
+        manifest = cache_entry.read_manifest(shards_url)
+        table_record = manifest.get_blob_records(
+            cache_class.component_to_media_type(BuildcacheComponent.INDEX_SHARDS)
+        )[0]
+        with open(cache_entry.fetch_blob(table_record), encoding="utf-8") as f:
+            table = json.load(f)
+        records = {record.checksum: record for record in manifest.data}
+        return IndexShards(
+            shards={prefix: records[checksum] for prefix, checksum in table["shards"].items()},
+            generation=table.get("generation", 0),
+            deltas={
+                int(generation): records[checksum]
+                for generation, checksum in table.get("deltas", {}).items()
+            },
+            changelog=table.get("changelog"),
+            checksum=table_record.checksum,
+        )
+    except (BuildcacheEntryError, NoSuchBlobException, ValueError, KeyError, TypeError) as e:
+        raise BuildcacheIndexError(f"Cannot read the sharded index of {url}: {e}") from e
+    finally:
+        cache_entry.destroy()
+
+
+def _check_index_blobs(url: str, shards: IndexShards) -> None:
+    """Checks that the blobs of the shards, and of the changelog, of the buildcache index of a
+    mirror exist.
+
+    Raises:
+        BuildcacheIndexError: if some of them are missing
+    """
+    cache_class = get_url_buildcache_class(layout_version=CURRENT_BUILD_CACHE_LAYOUT_VERSION)
+    for record in itertools.chain(shards.shards.values(), shards.deltas.values()):
+        if not web_util.url_exists(cache_class.get_blob_url(url, record)):
+            raise BuildcacheIndexError(
+                f"Cannot read the sharded index of {url}: blob {record.checksum} is missing"
+            )
+
+
+def _fetch_index_shard(url: str, record: BlobRecord) -> Dict[str, Any]:
+    """Returns the install records in a shard of the buildcache index of a mirror
+
+    Raises:
+        BuildcacheIndexError: if the shard cannot be read
+    """
+    cache_class = get_url_buildcache_class(layout_version=CURRENT_BUILD_CACHE_LAYOUT_VERSION)
+    cache_entry = cache_class(url, allow_unsigned=True)
+    try:
+        with open(cache_entry.fetch_blob(record), encoding="utf-8") as f:
+            return json.load(f)["database"]["installs"]
+    except (BuildcacheEntryError, ValueError, KeyError, TypeError) as e:
+        raise BuildcacheIndexError(
+            f"Cannot read the shard {record.checksum} of the index of {url}: {e}"
+        ) from e
+    finally:
+        cache_entry.destroy()
+
+
+def _push_index_blob(url: str, path: str, component: BuildcacheComponent) -> BlobRecord:
+    """Pushes a file of the buildcache index as an uncompressed blob, and returns its record"""
+    cache_class = get_url_buildcache_class(layout_version=CURRENT_BUILD_CACHE_LAYOUT_VERSION)
+    with open(path, "rb") as f:
+        checksum = compute_hash(f.read())
+    record = BlobRecord(
+        os.stat(path).st_size,
+        cache_class.component_to_media_type(component),
+        "none",
+        "sha256",
+        checksum,
+    )
+    cache_class.push_blob(url, path, record)
+    return record
+
+
+def _push_index_shards(
+    url: str, shards: Dict[str, Dict[str, Any]], current: Optional[IndexShards], tmpdir: str
+) -> Optional[str]:
+    """Pushes the shards of the buildcache index that changed, followed by the manifest listing
+    all the shards, and the changelog of the index. Nothing is pushed if no shard changed.
+    Returns the checksum of the table of shards of the index, as pushed or as it was.
+
+    Args:
+        url: url of the mirror
+        shards: install records of the shards to push, by prefix. Shards without records are
+            removed from the index.
+        current: shards currently in the index, if any. Shards that are not in ``shards`` are
+            kept as they are. Records that differ from the ones in these shards are appended
+            to the changelog of the index. If None, the changelog starts over.
+        tmpdir: directory where files are written before being pushed
+    """
+    cache_class = get_url_buildcache_class(layout_version=CURRENT_BUILD_CACHE_LAYOUT_VERSION)
+    keep_changelog = current is not None and INDEX_CHANGELOG_LENGTH > 0
+    records = dict(current.shards) if current else {}
+    changed = False
+    # Install records that changed, or None for the ones that were removed
+    delta: Dict[str, Any] = {}
+    for prefix, installs in shards.items():
+        previous = records.get(prefix)
+        if installs:
+            contents = _index_shard_contents(installs)
+            if previous and previous.checksum == compute_hash(contents):
+                continue
+
+            shard_path = os.path.join(tmpdir, f"index-shard-{prefix}.json")
+            with open(shard_path, "w", encoding="utf-8") as f:
+                f.write(contents)
+            records[prefix] = _push_index_blob(url, shard_path, BuildcacheComponent.INDEX)
+        elif previous:
+            del records[prefix]
+        else:
+            continue
+
+        changed = True
+        if keep_changelog:
+            new = json.loads(contents)["database"]["installs"] if installs else {}
+            old = _fetch_index_shard(url, previous) if previous else {}
+            delta.update((h, r) for h, r in new.items() if old.get(h) != r)
+            delta.update((h, None) for h in old if h not in new)
+
+    if current and not changed:
+        return current.checksum
+
+    # Clients that have the previous generation of the index only need the records in the delta
+    generation = current.generation + 1 if current else 1
+    deltas: Dict[int, BlobRecord] = {}
+    changelog = uuid.uuid4().hex
+    if current and keep_changelog and current.changelog:
+        changelog = current.changelog
+        first = generation - INDEX_CHANGELOG_LENGTH
+        deltas = {g: r for g, r in current.deltas.items() if g > first}
+        delta_path = os.path.join(tmpdir, f"index-delta-{generation}.json")
+        with open(delta_path, "w", encoding="utf-8") as f:
+            sjson.dump(
+                {
+                    "version": INDEX_DELTA_FORMAT_VERSION,
+                    "generation": generation,
+                    "installs": dict(sorted(delta.items())),
+                },
+                f,
+            )
+        deltas[generation] = _push_index_blob(url, delta_path, BuildcacheComponent.INDEX_DELTA)
+
+    # The manifest lists the table of shards first, then every shard, and every delta, so that
+    # all of their blobs are referenced by a manifest
+    table_path = os.path.join(tmpdir, "index-shards.json")
+    with open(table_path, "w", encoding="utf-8") as f:
+        sjson.dump(
+            {
+                "version": INDEX_SHARDS_FORMAT_VERSION,
+                "generation": generation,
+                "changelog": changelog,
+                "shards": {prefix: records[prefix].checksum for prefix in sorted(records)},
+                "deltas": {str(g): deltas[g].checksum for g in sorted(deltas)},
+            },
+            f,
+        )
+    table_record = _push_index_blob(url, table_path, BuildcacheComponent.INDEX_SHARDS)
+    manifest = BuildcacheManifest(
+        layout_version=CURRENT_BUILD_CACHE_LAYOUT_VERSION,
+        data=[
+            table_record,
+            *(records[prefix] for prefix in sorted(records)),
+            *(deltas[g] for g in sorted(deltas)),
+        ],
+    )
+    cache_class.push_manifest(
+        url, "index-shards", manifest, tmpdir, component_type=BuildcacheComponent.INDEX_SHARDS
+    )
+    return table_record.checksum
+
+
 def generate_key_index(mirror_url: str, tmpdir: str) -> None:
     """Create the key index page.
 
@@ -930,25 +1544,43 @@ def add_symlink(tar: tarfile.TarFile, info: tarfile.TarInfo, path: str):
     }
 
 
-def create_tarball(spec: spack.spec.Spec, tarfile_path: str) -> Tuple[str, str]:
+def create_tarball(
+    spec: spack.spec.Spec, tarfile_path: str, jobs: Optional[int] = None
+) -> Tuple[str, str]:
     """Create a tarball of a spec and return the checksums of the compressed tarfile and the
-    uncompressed tarfile."""
+    uncompressed tarfile. The tarball is compressed with ``jobs`` threads, by default the
+    number of jobs in the configuration."""
     return _do_create_tarball(
         tarfile_path,
         spec.prefix,
         buildinfo=get_buildinfo_dict(spec),
         prefixes_to_relocate=prefixes_to_relocate(spec),
+        jobs=jobs,
     )
 
 
+def _compression_jobs(executor: concurrent.futures.Executor, tarballs: int) -> int:
+    """Returns the number of threads compressing each of the tarballs created concurrently by an
+    executor, so that together they don't run more threads than the number of jobs"""
+    jobs = spack.config.determine_number_of_jobs(parallel=True)
+    if isinstance(executor, spack.util.parallel.SequentialExecutor):
+        return jobs
+    # Executors have as many workers as the number of jobs
+    return max(1, jobs // max(1, min(jobs, tarballs)))
+
+
 def _do_create_tarball(
-    tarfile_path: str, prefix: str, buildinfo: dict, prefixes_to_relocate: List[str]
+    tarfile_path: str,
+    prefix: str,
+    buildinfo: dict,
+    prefixes_to_relocate: List[str],
+    jobs: Optional[int] = None,
 ) -> Tuple[str, str]:
-    with spack.util.archive.gzip_compressed_tarfile(tarfile_path) as (
-        tar,
-        tar_gz_checksum,
-        tar_checksum,
-    ):
+    # Compress in parallel: tarballs of large prefixes are otherwise bound by a single core. The
+    # output doesn't depend on the number of threads.
+    with spack.util.archive.gzip_compressed_tarfile(
+        tarfile_path, jobs=jobs or spack.config.determine_number_of_jobs(parallel=True)
+    ) as (tar, tar_gz_checksum, tar_checksum):
         # Tarball the install prefix
         files_to_relocate = tarfile_of_spec_prefix(tar, prefix, prefixes_to_relocate)
         buildinfo.update(files_to_relocate)
@@ -983,10 +1615,14 @@ def prefixes_to_relocate(spec):
 
 
 def _url_upload_tarball_and_specfile(
-    spec: spack.spec.Spec, tmpdir: str, cache_entry: URLBuildcacheEntry, signing_key: Optional[str]
+    spec: spack.spec.Spec,
+    tmpdir: str,
+    cache_entry: URLBuildcacheEntry,
+    signing_key: Optional[str],
+    jobs: Optional[int] = None,
 ):
     tarball = os.path.join(tmpdir, f"{spec.dag_hash()}.tar.gz")
-    checksum, _ = create_tarball(spec, tarball)
+    checksum, _ = create_tarball(spec, tarball, jobs=jobs)
 
     cache_entry.push_binary_package(spec, tarball, "sha256", checksum, tmpdir, signing_key)
 
@@ -1218,6 +1854,7 @@ def _url_push(
     if total != len(specs):
         tty.info(f"{total} specs need to be pushed to {out_url}")
 
+    jobs = _compression_jobs(executor, total)
     upload_futures = [
         executor.submit(
             _url_upload_tarball_and_specfile,
@@ -1225,25 +1862,26 @@ def _url_push(
             tmpdir,
             cache_entries[spec.dag_hash()],
             signing_key,
+            jobs=jobs,
         )
         for spec in specs_to_upload
     ]
 
-    uploaded_any = False
+    uploaded: List[spack.spec.Spec] = []
     fancy_progress = FancyProgress(total)
 
     for spec, upload_future in zip(specs_to_upload, upload_futures):
         fancy_progress.start(spec, upload_future.running())
         error = upload_future.exception()
         if error is None:
-            uploaded_any = True
+            uploaded.append(spec)
             fancy_progress.ok()
         else:
             fancy_progress.fail()
             errors.append((spec, error))
 
     # don't bother pushing keys / index if all failed to upload
-    if not uploaded_any:
+    if not uploaded:
         return skipped, errors
 
     # If the layout.json doesn't yet exist on this mirror, push it
@@ -1258,7 +1896,8 @@ def _url_push(
     if update_index:
         index_tmpdir = os.path.join(tmpdir, "index")
         os.mkdir(index_tmpdir)
-        _url_generate_package_index(out_url, index_tmpdir)
+        # Skipped specs are in the buildcache already, so they're recorded in the index too
+        _url_update_package_index(out_url, skipped + uploaded, index_tmpdir)
 
     return skipped, errors
 
@@ -1286,13 +1925,13 @@ def _oci_get_blob_info(image_ref: ImageReference) -> Optional[spack.oci.oci.Blob
 
 
 def _oci_push_pkg_blob(
-    image_ref: ImageReference, spec: spack.spec.Spec, tmpdir: str
+    image_ref: ImageReference, spec: spack.spec.Spec, tmpdir: str, jobs: Optional[int] = None
 ) -> Tuple[spack.oci.oci.Blob, float]:
     """Push a package blob to the registry and return the blob info and the time taken"""
     filename = os.path.join(tmpdir, f"{spec.dag_hash()}.tar.gz")
 
     # Create an oci.image.layer aka tarball of the package
-    tar_gz_checksum, tar_checksum = create_tarball(spec, filename)
+    tar_gz_checksum, tar_checksum = create_tarball(spec, filename, jobs=jobs)
 
     blob = spack.oci.oci.Blob(
         Digest.from_sha256(tar_gz_checksum),
@@ -1528,8 +2167,10 @@ def _oci_push(
     blob_progress = FancyProgress(len(blobs_to_upload))
 
     # Upload blobs
+    jobs = _compression_jobs(executor, len(blobs_to_upload))
     blob_futures = [
-        executor.submit(_oci_push_pkg_blob, target_image, spec, tmpdir) for spec in blobs_to_upload
+        executor.submit(_oci_push_pkg_blob, target_image, spec, tmpdir, jobs=jobs)
+        for spec in blobs_to_upload
     ]
 
     manifests_to_upload: List[spack.spec.Spec] = []
@@ -2574,25 +3215,38 @@ class BuildcacheIndexError(spack.error.SpackError):
     """Raised when a buildcache cannot be read for any reason"""
 
 
-FetchIndexResult = collections.namedtuple("FetchIndexResult", "etag hash data fresh")
+#: Result of a fetch of an index. For a sharded index, ``generation`` and ``changelog`` are the
+#: generation of the index and the identifier of its changelog, and ``shards`` maps the prefix of
+#: each shard to its checksum and contents, unless the index was updated from its changelog,
+#: without fetching the shards.
+FetchIndexResult = collections.namedtuple(
+    "FetchIndexResult",
+    "etag hash data fresh shards generation changelog",
+    defaults=(None, None, None),
+)
 
 
 class IndexFetcher:
     def conditional_fetch(self) -> FetchIndexResult:
         raise NotImplementedError(f"{self.__class__.__name__} is abstract")
 
-    def get_index_manifest(self, manifest_response) -> BlobRecord:
-        """Read the response of the manifest request and return a BlobRecord"""
+    def read_manifest(self, manifest_response) -> BuildcacheManifest:
+        """Read the response of a manifest request and return the manifest"""
         cache_class = get_url_buildcache_class(CURRENT_BUILD_CACHE_LAYOUT_VERSION)
         try:
             result = codecs.getreader("utf-8")(manifest_response).read()
         except (ValueError, OSError) as e:
             raise FetchIndexError(f"Remote index {manifest_response.url} is invalid", e) from e
 
-        manifest = BuildcacheManifest.from_dict(
+        return BuildcacheManifest.from_dict(
             # Currently we do not sign buildcache index, but we could
             cache_class.verify_and_extract_manifest(result, verify=False)
         )
+
+    def get_index_manifest(self, manifest_response) -> BlobRecord:
+        """Read the response of the manifest request and return a BlobRecord"""
+        cache_class = get_url_buildcache_class(CURRENT_BUILD_CACHE_LAYOUT_VERSION)
+        manifest = self.read_manifest(manifest_response)
         blob_record = manifest.get_blob_records(
             cache_class.component_to_media_type(BuildcacheComponent.INDEX)
         )[0]
@@ -2886,6 +3540,174 @@ def conditional_fetch(self) -> FetchIndexResult:
         )
 
 
+class ShardedIndexFetcher(IndexFetcher):
+    """Fetcher for a buildcache index split in shards. If the changelog of the index has all the
+    deltas since the generation that was last fetched, and is the changelog that generation
+    belongs to, it downloads only those deltas, and applies them to the local copy of the index.
+    Otherwise, it downloads only the shards whose checksum changed since they were last fetched.
+
+    Args:
+        url_and_version: mirror url and layout version
+        local_hash: checksum of the table of shards that was last fetched
+        local_shards: checksums of the shards that were last fetched, by prefix
+        read_local_shard: function returning the contents of a shard that was last fetched,
+            given its prefix, or None if they are not available
+        local_generation: generation of the index that was last fetched
+        read_local_index: function returning the contents of the local copy of the index, or
+            None if they are not available
+        local_changelog: identifier of the changelog of the index that was last fetched
+    """
+
+    def __init__(
+        self,
+        url_and_version: MirrorURLAndVersion,
+        local_hash: Optional[str],
+        local_shards: Dict[str, str],
+        read_local_shard: Callable[[str], Optional[str]],
+        local_generation: Optional[int] = None,
+        read_local_index: Callable[[], Optional[str]] = lambda: None,
+        local_changelog: Optional[str] = None,
+        urlopen=web_util.urlopen,
+    ):
+        self.url = url_and_version.url
+        self.layout_version = url_and_version.version
+        self.local_hash = local_hash
+        self.local_shards = local_shards
+        self.read_local_shard = read_local_shard
+        self.local_generation = local_generation
+        self.read_local_index = read_local_index
+        self.local_changelog = local_changelog
+        self.urlopen = urlopen
+        self.headers = {"User-Agent": web_util.SPACK_USER_AGENT}
+
+    def conditional_fetch(self) -> FetchIndexResult:
+        cache_class = get_url_buildcache_class(layout_version=self.layout_version)
+        url_manifest = cache_class.get_index_shards_url(self.url)
+
+        try:
+            response = self.urlopen(urllib.request.Request(url_manifest, headers=self.headers))
+        except OSError as e:
+            raise FetchIndexError(f"Could not read index manifest from {url_manifest}") from e
+
+        manifest = self.read_manifest(response)
+        try:
+            table_record = manifest.get_blob_records(
+                cache_class.component_to_media_type(BuildcacheComponent.INDEX_SHARDS)
+            )[0]
+        except NoSuchBlobException as e:
+            raise FetchIndexError(f"Remote index {url_manifest} is invalid", e) from e
+
+        # Early exit if no shard changed
+        if self.local_hash and self.local_hash == table_record.checksum:
+            return FetchIndexResult(etag=None, hash=None, data=None, fresh=True)
+
+        records = {record.checksum: record for record in manifest.data}
+        shards: Dict[str, Tuple[str, str]] = {}
+        cache_entry = cache_class(self.url, allow_unsigned=True)
+        try:
+            table_hash, table_contents = self.fetch_index_blob(cache_entry, table_record)
+            try:
+                table = json.loads(table_contents)
+                generation = table.get("generation", 0)
+                changelog = table.get("changelog")
+                deltas = table.get("deltas", {})
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise FetchIndexError(f"Remote index {url_manifest} is invalid", e) from e
+
+            data = None
+            if changelog is not None and changelog == self.local_changelog:
+                data = self._apply_changelog(cache_entry, records, generation, deltas)
+            if data is not None:
+                return FetchIndexResult(
+                    etag=None,
+                    hash=table_hash,
+                    data=data,
+                    fresh=False,
+                    generation=generation,
+                    changelog=changelog,
+                )
+
+            for prefix, checksum in table["shards"].items():
+                contents = None
+                if self.local_shards.get(prefix) == checksum:
+                    contents = self.read_local_shard(prefix)
+                    if contents is not None and compute_hash(contents) != checksum:
+                        contents = None
+                if contents is None:
+                    if checksum not in records:
+                        raise FetchIndexError(f"Remote index {url_manifest} is invalid")
+                    _, contents = self.fetch_index_blob(cache_entry, records[checksum])
+                shards[prefix] = (checksum, contents)
+        finally:
+            cache_entry.destroy()
+
+        # The local copy of the index has the records of all the shards
+        installs: Dict[str, Any] = {}
+        try:
+            for _, contents in shards.values():
+                installs.update(json.loads(contents)["database"]["installs"])
+        except (ValueError, KeyError, TypeError) as e:
+            raise FetchIndexError(f"Remote index {url_manifest} is invalid", e) from e
+        data = sjson.dump(
+            {
+                "database": {
+                    "version": str(spack.database._DB_VERSION_WITHOUT_JOURNAL),
+                    "installs": installs,
+                }
+            }
+        )
+
+        return FetchIndexResult(
+            etag=None,
+            hash=table_hash,
+            data=data,
+            fresh=False,
+            shards=shards,
+            generation=generation,
+            changelog=changelog,
+        )
+
+    def _apply_changelog(
+        self,
+        cache_entry: URLBuildcacheEntry,
+        records: Dict[str, BlobRecord],
+        generation: int,
+        deltas: Dict[str, str],
+    ) -> Optional[str]:
+        """Returns the local copy of the index, updated with the deltas of the changelog since
+        the generation that was last fetched, or None if the changelog misses some of them.
+        The local copy must come from the same changelog."""
+        if self.local_generation is None or self.local_generation >= generation:
+            return None
+
+        generations = range(self.local_generation + 1, generation + 1)
+        if any(deltas.get(str(g)) not in records for g in generations):
+            return None
+
+        local_index = self.read_local_index()
+        if local_index is None:
+            return None
+
+        try:
+            index = json.loads(local_index)
+            installs = index["database"]["installs"]
+        except (ValueError, KeyError, TypeError) as e:
+            tty.debug(f"Cannot apply the changelog of {self.url} to the local index: {e}")
+            return None
+
+        for g in generations:
+            _, contents = self.fetch_index_blob(cache_entry, records[deltas[str(g)]])
+            try:
+                for dag_hash, record in json.loads(contents)["installs"].items():
+                    if record is None:
+                        installs.pop(dag_hash, None)
+                    else:
+                        installs[dag_hash] = record
+            except (ValueError, KeyError, TypeError) as e:
+                raise FetchIndexError(f"Remote index delta {g} of {self.url} is invalid", e) from e
+        return sjson.dump(index)
+
+
 def get_index_fetcher(
     scheme: str, url_and_version: MirrorURLAndVersion, cache_entry: Dict[str, str]
 ) -> IndexFetcher:
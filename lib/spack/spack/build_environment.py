@@ -1178,7 +1178,8 @@ def _setup_pkg_and_run(
 
         pkg = serialized_pkg.restore()
 
-        if not kwargs.get("fake", False):
+        # Fake builds, and extraction of binary packages, don't need a build environment
+        if not kwargs.get("fake", False) and kwargs.get("build_environment", True):
             kwargs["unmodified_env"] = os.environ.copy()
             kwargs["env_modifications"] = setup_package(
                 pkg, dirty=kwargs.get("dirty", False), context=Context.from_string(context)
@@ -1356,10 +1357,16 @@ def child_fun():
             input_fd = Connection(os.dup(sys.stdin.fileno()))
         mflags = os.environ.get("MAKEFLAGS")
         if mflags is not None:
-            m = re.search(r"--jobserver-[^=]*=(\d),(\d)", mflags)
+            m = re.search(r"--jobserver-[^=]*=(\d+),(\d+)", mflags)
             if m:
-                jobserver_fd1 = Connection(int(m.group(1)))
-                jobserver_fd2 = Connection(int(m.group(2)))
+                # Duplicate the descriptors, so that the parent keeps its own when the
+                # connections are garbage collected
+                try:
+                    jobserver_fd1 = Connection(os.dup(int(m.group(1))))
+                    jobserver_fd2 = Connection(os.dup(int(m.group(2))))
+                except OSError:
+                    # The descriptors were not inherited by this process
+                    pass
 
         p = BuildProcess(
             target=_setup_pkg_and_run,
@@ -0,0 +1,180 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+"""History of the builds and binary cache installs done in a store.
+
+Each installation appends a record to a JSON lines file next to the install database, with the
+duration of each phase and, for builds from source, the CPU time, the peak resident set size and
+the number of build jobs. Records are kept after packages are uninstalled, so the history is
+useful to estimate build times and memory requirements of future installations.
+
+When the file grows larger than :data:`MAX_HISTORY_SIZE`, it is rotated: it replaces the file of
+older records, which is dropped, and a new file is started. The history is the union of the two.
+"""
+import os
+import pathlib
+import statistics
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import spack.llnl.util.tty as tty
+import spack.util.spack_json as sjson
+
+#: Type of a single record in the build history
+BuildRecord = Dict[str, Any]
+
+#: Name of the file with the build history, in the database directory
+HISTORY_FILENAME = "build_history.jsonl"
+
+#: Size, in bytes, above which the file with the build history is rotated
+MAX_HISTORY_SIZE = 2 * 1024**2
+
+
+def resource_usage(sampled_peak_rss: Optional[int] = None) -> Dict[str, Optional[float]]:
+    """Returns the CPU time, in seconds, of the current process and of the children it waited
+    for, and the peak resident set size, in bytes, of those children. Values are None where
+    resource usage is not available.
+
+    The resident set size of the current process is left out, since a forked process shares
+    the memory of its parent.
+
+    Args:
+        sampled_peak_rss: peak memory of the process tree, above what it used when sampling
+            started. It is used when larger than the resident set size of the largest child.
+    """
+    if sys.platform == "win32":
+        return {"cpu_time": None, "peak_rss": sampled_peak_rss}
+
+    import resource
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_time = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    unit = 1 if sys.platform == "darwin" else 1024
+    peak_rss = max(children.ru_maxrss * unit, sampled_peak_rss or 0)
+    return {"cpu_time": cpu_time, "peak_rss": peak_rss}
+
+
+def make_record(
+    spec,
+    timer,
+    cache: bool,
+    jobs: Optional[int] = None,
+    resources: Optional[Dict[str, Optional[float]]] = None,
+) -> BuildRecord:
+    """Returns the record of the installation of a spec.
+
+    Args:
+        spec: spec that was installed
+        timer: timer with the phases of the installation
+        cache: whether the spec was installed from a binary cache
+        jobs: number of build jobs, for builds from source
+        resources: resource usage of the installation, as returned by :func:`resource_usage`
+    """
+    resources = resources or {}
+    return {
+        "name": spec.name,
+        "version": str(spec.version),
+        "compiler": spec.compilers.strip(),
+        "hash": spec.dag_hash(),
+        "cache": cache,
+        "time": time.time(),
+        "total": timer.duration(),
+        "phases": {name: timer.duration(name) for name in timer.phases},
+        "jobs": jobs,
+        "cpu_time": resources.get("cpu_time"),
+        "peak_rss": resources.get("peak_rss"),
+    }
+
+
+class BuildHistory:
+    """Build history of a store, stored as a file with one JSON record per line.
+
+    Records are appended with a single write, so that concurrent installations don't need to
+    hold a lock on the file. Records of concurrent installations may be lost when the file is
+    rotated.
+    """
+
+    def __init__(self, root_dir: str) -> None:
+        """
+        Args:
+            root_dir: directory of the install database
+        """
+        self.path = pathlib.Path(root_dir) / HISTORY_FILENAME
+        self.rotated_path = self.path.with_name(f"{HISTORY_FILENAME}.1")
+
+    def add(self, record: BuildRecord) -> None:
+        """Appends a record to the history."""
+        line = f"{sjson.dump(record)}\n"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+        if size > MAX_HISTORY_SIZE:
+            try:
+                if self.path.stat().st_size > MAX_HISTORY_SIZE:
+                    os.replace(self.path, self.rotated_path)
+            except OSError:
+                # Another installation rotated the file already
+                pass
+
+    def records(self, names: Optional[Iterable[str]] = None) -> List[BuildRecord]:
+        """Returns the records in the history, oldest first.
+
+        Args:
+            names: if given, return only the records of packages with these names
+        """
+        selected = set(names) if names is not None else None
+        lines: List[str] = []
+        for path in (self.rotated_path, self.path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    lines.extend(f.readlines())
+            except FileNotFoundError:
+                pass
+
+        result = []
+        for line in lines:
+            try:
+                record = sjson.load(line)
+            except ValueError:
+                # A line may be truncated, if an installation was interrupted while writing it
+                tty.debug(f"Skipping a malformed record in {self.path}")
+                continue
+
+            if selected is None or record.get("name") in selected:
+                result.append(record)
+        return result
+
+    def build_times(self, names: Iterable[str]) -> Dict[str, float]:
+        """Returns the median time, in seconds, of the builds from source of each package.
+        Packages that were never built from source are not in the result.
+
+        Args:
+            names: names of the packages
+        """
+        samples: Dict[str, List[float]] = {}
+        for record in self.records(names):
+            if not record["cache"]:
+                samples.setdefault(record["name"], []).append(float(record["total"]))
+        return {name: statistics.median(x) for name, x in samples.items()}
+
+    def peak_memory(self, names: Iterable[str]) -> Dict[str, float]:
+        """Returns the largest peak memory, in bytes, of the builds from source of each package.
+        Packages without a known peak memory are not in the result.
+
+        Args:
+            names: names of the packages
+        """
+        result: Dict[str, float] = {}
+        for record in self.records(names):
+            if not record["cache"] and record.get("peak_rss") is not None:
+                result[record["name"]] = max(result.get(record["name"], 0.0), record["peak_rss"])
+        return result
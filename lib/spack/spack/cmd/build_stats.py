@@ -0,0 +1,140 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import argparse
+import statistics
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import spack.build_history
+import spack.llnl.util.tty as tty
+import spack.store
+import spack.util.spack_json as sjson
+from spack.llnl.util.lang import pretty_date
+from spack.llnl.util.tty.colify import colify_table
+
+description = "show the history of builds and binary cache installs"
+section = "build"
+level = "long"
+
+
+def setup_parser(subparser: argparse.ArgumentParser) -> None:
+    subparser.add_argument(
+        "-a",
+        "--all",
+        action="store_true",
+        default=False,
+        help="show every installation, instead of a summary for each package, version and "
+        "compiler",
+    )
+    subparser.add_argument(
+        "--json",
+        action="store_true",
+        default=False,
+        help="output the installations as machine-readable json records, one per line",
+    )
+    subparser.add_argument("packages", nargs="*", help="show only installations of these packages")
+
+
+def _seconds(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    minutes, seconds = divmod(int(round(value)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{value:.1f}s"
+
+
+def _bytes(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB"):
+        if value < 1024:
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}GiB"
+
+
+def _median(values: List[Optional[float]]) -> Optional[float]:
+    known = [x for x in values if x is not None]
+    return statistics.median(known) if known else None
+
+
+def _maximum(values: List[Optional[float]]) -> Optional[float]:
+    known = [x for x in values if x is not None]
+    return max(known) if known else None
+
+
+def _origin(record: spack.build_history.BuildRecord) -> str:
+    return "binary" if record["cache"] else "source"
+
+
+def print_records(records: List[spack.build_history.BuildRecord]) -> None:
+    """Prints a table with one row for each installation."""
+    table: List[List[Any]] = [
+        ["DATE", "PACKAGE", "COMPILER", "FROM", "TIME", "CPU TIME", "PEAK RSS", "JOBS"]
+    ]
+    for record in records:
+        table.append(
+            [
+                pretty_date(int(record["time"])),
+                f"{record['name']}@{record['version']}/{record['hash'][:7]}",
+                record["compiler"] or "-",
+                _origin(record),
+                _seconds(record["total"]),
+                _seconds(record["cpu_time"]),
+                _bytes(record["peak_rss"]),
+                record["jobs"] or "-",
+            ]
+        )
+    colify_table(table)
+
+
+def print_summary(records: List[spack.build_history.BuildRecord]) -> None:
+    """Prints a table with the median time and CPU time, and the largest peak RSS, of the
+    installations of each package, version and compiler."""
+    groups: Dict[Tuple[str, str, str, str], List[spack.build_history.BuildRecord]] = {}
+    for record in records:
+        key = (record["name"], record["version"], record["compiler"], _origin(record))
+        groups.setdefault(key, []).append(record)
+
+    table: List[List[Any]] = [
+        ["PACKAGE", "COMPILER", "FROM", "COUNT", "TIME", "CPU TIME", "PEAK RSS", "JOBS"]
+    ]
+    for (name, version, compiler, origin), group in sorted(groups.items()):
+        jobs = _maximum([x["jobs"] for x in group])
+        table.append(
+            [
+                f"{name}@{version}",
+                compiler or "-",
+                origin,
+                len(group),
+                _seconds(_median([x["total"] for x in group])),
+                _seconds(_median([x["cpu_time"] for x in group])),
+                _bytes(_maximum([x["peak_rss"] for x in group])),
+                int(jobs) if jobs is not None else "-",
+            ]
+        )
+    colify_table(table)
+
+
+def build_stats(parser, args):
+    records = spack.store.STORE.build_history.records(args.packages or None)
+
+    if args.json:
+        for record in records:
+            sys.stdout.write(f"{sjson.dump(record)}\n")
+        return
+
+    if not records:
+        tty.msg("No installations in the build history")
+        return
+
+    if args.all:
+        print_records(records)
+    else:
+        print_summary(records)
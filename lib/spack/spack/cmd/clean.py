@@ -8,9 +8,11 @@
 
 import spack.caches
 import spack.cmd
+import spack.cmd.solve
 import spack.config
 import spack.llnl.util.filesystem
 import spack.llnl.util.tty as tty
+import spack.solver.asp
 import spack.stage
 import spack.store
 import spack.util.path
@@ -54,6 +56,11 @@ def setup_parser(subparser: argparse.ArgumentParser) -> None:
         action="store_true",
         help="remove .pyc, .pyo files and __pycache__ folders",
     )
+    subparser.add_argument(
+        "--concretization-cache",
+        action="store_true",
+        help="report statistics of the concretization cache, then remove all its entries",
+    )
     subparser.add_argument(
         "-b",
         "--bootstrap",
@@ -95,6 +102,7 @@ def clean(parser, args):
             args.failures,
             args.misc_cache,
             args.python_cache,
+            args.concretization_cache,
             args.bootstrap,
         ]
     ):
@@ -126,6 +134,11 @@ def clean(parser, args):
         tty.msg("Removing cached information on repositories")
         spack.caches.MISC_CACHE.destroy()
 
+    if args.concretization_cache:
+        spack.cmd.solve.print_concretization_cache_stats(spack.solver.asp.CONC_CACHE)
+        tty.msg("Removing cached concretization results")
+        spack.solver.asp.CONC_CACHE.destroy()
+
     if args.python_cache:
         tty.msg("Removing python cache files")
         remove_python_cache()
@@ -12,6 +12,7 @@
 import spack.config
 import spack.environment
 import spack.hash_types as ht
+import spack.llnl.util.lang
 import spack.llnl.util.tty as tty
 import spack.llnl.util.tty.color as color
 import spack.solver.asp as asp
@@ -47,10 +48,72 @@ def setup_parser(subparser: argparse.ArgumentParser) -> None:
     subparser.add_argument(
         "--stats", action="store_true", default=False, help="print out statistics from clingo"
     )
+    subparser.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="print time spent and facts emitted by each setup phase and package, "
+        "together with grounding and solving statistics",
+    )
+    subparser.add_argument(
+        "--profile-json",
+        metavar="FILE",
+        default=None,
+        help="write the profiling report as JSON to FILE",
+    )
+    subparser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        default=False,
+        help="print out hit/miss statistics of the concretization cache",
+    )
+    subparser.add_argument(
+        "--cache-compact",
+        action="store_true",
+        default=False,
+        help="fold the access logs of the concretization cache into its index, and prune it",
+    )
 
     spack.cmd.spec.setup_parser(subparser)
 
 
+def print_concretization_cache_stats(cache: asp.ConcretizationCache) -> None:
+    """Prints the statistics recorded by a concretization cache"""
+    stats = cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = 100.0 * stats["hits"] / lookups if lookups else 0.0
+    tty.msg(f"Concretization cache at {cache.root}")
+    rows = [
+        ("entries", f"{stats['entries']} ({stats['bytes'] / 1e6:.1f} MB)"),
+        ("hits", f"{stats['hits']} ({hit_rate:.1f}%)"),
+        ("misses", f"{stats['misses']}"),
+        ("stores", f"{stats['stores']}"),
+        ("evictions", f"{stats['evictions']} ({stats['bytes_evicted'] / 1e6:.1f} MB)"),
+        ("bytes saved", f"{stats['bytes_saved'] / 1e6:.1f} MB"),
+        ("solve time saved", spack.llnl.util.lang.pretty_seconds(stats["seconds_saved"])),
+    ]
+    maxlen = max(len(name) for name, _ in rows)
+    for name, value in rows:
+        print(f"    {name:<{maxlen}}  {value}")
+
+
+def _concretization_cache_maintenance(args) -> None:
+    if args.cache_compact:
+        tty.msg("Compacting the concretization cache")
+        asp.CONC_CACHE.cleanup()
+    if args.cache_stats:
+        print_concretization_cache_stats(asp.CONC_CACHE)
+
+
+def _write_profile(profile: asp.SolveProfile, args) -> None:
+    if args.profile:
+        profile.write_tty(sys.stdout)
+    if args.profile_json:
+        with open(args.profile_json, "w", encoding="utf-8") as f:
+            profile.write_json(f)
+        tty.msg(f"Profiling report written to {args.profile_json}")
+
+
 def _process_result(result, show, required_format, kwargs):
     opt, _, _ = min(result.answers)
     if ("opt" in show) and (not required_format):
@@ -140,10 +203,14 @@ def solve(parser, args):
         specs = spack.cmd.parse_specs(args.specs)
     elif env:
         specs = list(env.user_specs)
+    elif args.cache_stats or args.cache_compact:
+        _concretization_cache_maintenance(args)
+        return
     else:
         tty.die("spack solve requires at least one spec or an active environment")
 
     solver = asp.Solver()
+    profile = asp.SolveProfile() if args.profile or args.profile_json else None
     output = sys.stdout if "asp" in show else None
     setup_only = set(show) == {"asp"}
     unify = spack.config.get("concretizer:unify")
@@ -156,6 +223,7 @@ def solve(parser, args):
                 timers=args.timers,
                 stats=args.stats,
                 allow_deprecated=allow_deprecated,
+                profile=profile,
             )
         ):
             if "solutions" in show:
@@ -175,10 +243,13 @@ def solve(parser, args):
             stats=args.stats,
             setup_only=setup_only,
             allow_deprecated=allow_deprecated,
+            profile=profile,
         )
         if not setup_only:
             _process_result(result, show, required_format, kwargs)
     else:
+        # Compute reusable specs and possible dependencies once for all the solves
+        solver.warm_up(specs)
         for spec in specs:
             tty.msg("SOLVING SPEC:", spec)
             result = solver.solve(
@@ -188,6 +259,12 @@ def solve(parser, args):
                 stats=args.stats,
                 setup_only=setup_only,
                 allow_deprecated=allow_deprecated,
+                profile=profile,
             )
             if not setup_only:
                 _process_result(result, show, required_format, kwargs)
+
+    if profile is not None:
+        _write_profile(profile, args)
+
+    _concretization_cache_maintenance(args)
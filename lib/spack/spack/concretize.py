@@ -5,24 +5,32 @@
 import importlib
 import sys
 import time
-from typing import Iterable, List, Optional, Sequence, Tuple, Union
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence, Tuple, Union
 
 import spack.compilers
 import spack.compilers.config
 import spack.config
+import spack.deptypes as dt
 import spack.error
 import spack.llnl.util.tty as tty
 import spack.repo
+import spack.traverse
 import spack.util.parallel
 from spack.spec import ArchSpec, CompilerSpec, Spec
 
+if TYPE_CHECKING:
+    import spack.solver.asp
+
 SpecPairInput = Tuple[Spec, Optional[Spec]]
 SpecPair = Tuple[Spec, Spec]
 TestsType = Union[bool, Iterable[str]]
 
+#: Solver warmed up before starting a pool of processes, shared by all the workers
+_SHARED_SOLVER: Optional["spack.solver.asp.Solver"] = None
+
 
 def _concretize_specs_together(
-    abstract_specs: Sequence[Spec], tests: TestsType = False
+    abstract_specs: Sequence[Spec], tests: TestsType = False, reusable_specs: Sequence[Spec] = ()
 ) -> List[Spec]:
     """Given a number of specs as input, tries to concretize them together.
 
@@ -30,11 +38,17 @@ def _concretize_specs_together(
         abstract_specs: abstract specs to be concretized
         tests: list of package names for which to consider tests dependencies. If True, all nodes
             will have test dependencies. If False, test dependencies will be disregarded.
+        reusable_specs: concrete specs that can be reused, like the nodes of concrete input specs
     """
     from spack.solver.asp import Solver
 
     allow_deprecated = spack.config.get("config:deprecated", False)
-    result = Solver().solve(abstract_specs, tests=tests, allow_deprecated=allow_deprecated)
+    result = Solver().solve(
+        abstract_specs,
+        tests=tests,
+        allow_deprecated=allow_deprecated,
+        reusable_specs=reusable_specs,
+    )
     return [s.copy() for s in result.specs]
 
 
@@ -55,6 +69,64 @@ def concretize_together(
     return list(zip(abstract_specs, concrete_specs))
 
 
+def concretize_together_incrementally(
+    spec_list: Sequence[SpecPairInput], tests: TestsType = False
+) -> List[SpecPair]:
+    """Given a number of specs as input, concretizes the abstract ones together with the
+    concrete ones, without modifying the latter.
+
+    The result is the same as ``concretize_together``, but only the part of the concrete DAGs
+    that can interact with the abstract specs is sent to the solver. As in a full solve, the
+    link and run dependencies of the concrete specs are pinned by hash, so the new specs are
+    unified with them, and all their nodes can be reused. Pinned nodes whose package is not a
+    possible dependency of the abstract specs are left out of the solve.
+
+    Args:
+        spec_list: list of tuples to concretize. First entry is abstract spec, second entry is
+            already concrete spec or None if not yet concretized
+        tests: list of package names for which to consider tests dependencies. If True, all nodes
+            will have test dependencies. If False, test dependencies will be disregarded.
+
+    Returns:
+        The newly concretized specs, in input order, followed by the ones that were already
+        concrete.
+    """
+    from spack.solver.input_analysis import create_graph_analyzer
+
+    new_specs = [abstract for abstract, concrete in spec_list if not concrete]
+    kept_specs = [(abstract, concrete) for abstract, concrete in spec_list if concrete]
+    if not new_specs:
+        return kept_specs
+
+    possible = create_graph_analyzer().possible_dependencies(*new_specs, allowed_deps=dt.ALL)
+    affected = possible.real_pkgs | spack.repo.PATH.packages_with_tags("runtime")
+
+    # Packages that may have multiple nodes in a DAG are not unified, so they need no pinning
+    if spack.config.get("concretizer:duplicates:strategy", "none") != "none":
+        for tag in ("build-tools", "compiler"):
+            affected -= spack.repo.PATH.packages_with_tags(tag)
+
+    # The build dependencies of concrete specs are not imposed by a full solve, but reused
+    roots = [concrete for _, concrete in kept_specs]
+    pinned = [
+        node
+        for node in spack.traverse.traverse_nodes(
+            roots, deptype=dt.LINK | dt.RUN, key=spack.traverse.by_dag_hash
+        )
+        if node.name in affected
+    ]
+    reusable = list(spack.traverse.traverse_nodes(roots, key=spack.traverse.by_dag_hash))
+
+    tty.debug(
+        f"[INCREMENTAL] concretizing {len(new_specs)} new specs, "
+        f"pinning {len(pinned)} nodes from {len(kept_specs)} concrete specs"
+    )
+    concrete_specs = _concretize_specs_together(
+        new_specs + pinned, tests=tests, reusable_specs=reusable
+    )
+    return list(zip(new_specs, concrete_specs)) + kept_specs
+
+
 def concretize_together_when_possible(
     spec_list: Sequence[SpecPairInput], tests: TestsType = False
 ) -> List[SpecPair]:
@@ -103,6 +175,7 @@ def concretize_separately(
             will have test dependencies. If False, test dependencies will be disregarded.
     """
     from spack.bootstrap import ensure_bootstrap_configuration, ensure_clingo_importable_or_raise
+    from spack.solver.asp import Solver
 
     to_concretize = [abstract for abstract, concrete in spec_list if not concrete]
     args = [
@@ -146,18 +219,34 @@ def concretize_separately(
         msg += f" pool with {num_procs} processes"
     tty.msg(msg)
 
-    for j, (i, concrete, duration) in enumerate(
-        spack.util.parallel.imap_unordered(
-            _concretize_task, args, processes=num_procs, debug=tty.is_debug(), maxtaskperchild=1
-        )
-    ):
-        ret.append((i, concrete))
-        percentage = (j + 1) / len(args) * 100
-        tty.verbose(
-            f"{duration:6.1f}s [{percentage:3.0f}%] {concrete.cformat('{hash:7}')} "
-            f"{to_concretize[i].colored_str}"
-        )
-        sys.stdout.flush()
+    # Select reusable specs and analyze possible dependencies once, before starting the pool,
+    # so that forked workers share the results copy-on-write instead of recomputing them.
+    # Spawned workers import this module again, and can't see the solver.
+    global _SHARED_SOLVER
+    if spack.util.parallel.inherits_state(len(args), num_procs):
+        _SHARED_SOLVER = Solver()
+        _SHARED_SOLVER.warm_up([abstract for abstract in to_concretize if not abstract.concrete])
+
+    try:
+        for j, (i, concrete, duration) in enumerate(
+            spack.util.parallel.imap_unordered(
+                _concretize_task,
+                args,
+                processes=num_procs,
+                debug=tty.is_debug(),
+                maxtaskperchild=1,
+                inherit_state=True,
+            )
+        ):
+            ret.append((i, concrete))
+            percentage = (j + 1) / len(args) * 100
+            tty.verbose(
+                f"{duration:6.1f}s [{percentage:3.0f}%] {concrete.cformat('{hash:7}')} "
+                f"{to_concretize[i].colored_str}"
+            )
+            sys.stdout.flush()
+    finally:
+        _SHARED_SOLVER = None
 
     # Add specs in original order
     ret.sort(key=lambda x: x[0])
@@ -171,7 +260,7 @@ def _concretize_task(packed_arguments: Tuple[int, str, TestsType]) -> Tuple[int,
     index, spec_str, tests = packed_arguments
     with tty.SuppressOutput(msg_enabled=False):
         start = time.time()
-        spec = concretize_one(Spec(spec_str), tests=tests)
+        spec = _concretize_one(Spec(spec_str), tests=tests, solver=_SHARED_SOLVER)
         return index, spec, time.time() - start
 
 
@@ -182,6 +271,14 @@ def concretize_one(spec: Union[str, Spec], tests: TestsType = False) -> Spec:
         tests: if False disregard test dependencies, if a list of names activate them for
             the packages in the list, if True activate test dependencies for all packages.
     """
+    return _concretize_one(spec, tests=tests)
+
+
+def _concretize_one(
+    spec: Union[str, Spec],
+    tests: TestsType = False,
+    solver: Optional["spack.solver.asp.Solver"] = None,
+) -> Spec:
     from spack.solver.asp import Solver, SpecBuilder
 
     if isinstance(spec, str):
@@ -198,7 +295,8 @@ def concretize_one(spec: Union[str, Spec], tests: TestsType = False) -> Spec:
             )
 
     allow_deprecated = spack.config.get("config:deprecated", False)
-    result = Solver().solve([spec], tests=tests, allow_deprecated=allow_deprecated)
+    solver = solver or Solver()
+    result = solver.solve([spec], tests=tests, allow_deprecated=allow_deprecated)
 
     # take the best answer
     opt, i, answer = min(result.answers)
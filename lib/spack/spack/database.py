@@ -16,8 +16,11 @@
 provides a cache and a sanity checking mechanism for what is in the
 filesystem.
 """
+import bisect
 import contextlib
 import datetime
+import functools
+import hashlib
 import os
 import pathlib
 import sys
@@ -30,7 +33,9 @@
     Dict,
     Generator,
     Iterable,
+    Iterator,
     List,
+    Mapping,
     NamedTuple,
     Optional,
     Set,
@@ -56,6 +61,7 @@
 import spack.llnl.util.tty as tty
 import spack.spec
 import spack.traverse as tr
+import spack.util.file_cache
 import spack.util.lock as lk
 import spack.util.spack_json as sjson
 import spack.version as vn
@@ -79,7 +85,12 @@
 #: DB version.  This is stuck in the DB file to track changes in format.
 #: Increment by one when the database format changes.
 #: Versions before 5 were not integers.
-_DB_VERSION = vn.Version("8")
+_DB_VERSION = vn.StandardVersion.from_string("9")
+
+#: Last DB version without a journal. A database at this version is written at this version, in
+#: full and without a journal, until ``spack reindex`` upgrades it, so that older versions of
+#: Spack can keep using it. Buildcache indices, which have no journal, are at this version too.
+_DB_VERSION_WITHOUT_JOURNAL = vn.StandardVersion.from_string("8")
 
 #: For any version combinations here, skip reindex when upgrading.
 #: Reindexing can take considerable time and is not always necessary.
@@ -94,6 +105,10 @@
     (vn.Version("6"), vn.Version("7")),
     (vn.Version("6"), vn.Version("8")),
     (vn.Version("7"), vn.Version("8")),
+    # v9 records are the same as v8 ones: v9 adds the journal, written next to the index
+    (vn.Version("6"), vn.Version("9")),
+    (vn.Version("7"), vn.Version("9")),
+    (vn.Version("8"), vn.Version("9")),
 ]
 
 #: Default timeout for spack database locks in seconds or None (no timeout).
@@ -134,6 +149,16 @@
 # Lockfile for the database
 _LOCK_FILE = "lock"
 
+#: Journal of the records written since the index was last written in full
+JOURNAL_FILE = "index_journal.jsonl"
+
+#: Bump this number whenever the structure of the entries of the upstream index cache changes
+UPSTREAM_INDEX_CACHE_FORMAT_VERSION = 2
+
+#: The index is compacted, i.e. written in full with the records in the journal, when the
+#: journal grows larger than this fraction of the size of the index
+_JOURNAL_COMPACTION_RATIO = 0.25
+
 
 def reader(version: vn.StandardVersion) -> Type["spack.spec.SpecfileReaderBase"]:
     reader_cls = {
@@ -141,6 +166,7 @@ def reader(version: vn.StandardVersion) -> Type["spack.spec.SpecfileReaderBase"]
         vn.StandardVersion.from_string("6"): spack.spec.SpecfileV3,
         vn.StandardVersion.from_string("7"): spack.spec.SpecfileV4,
         vn.StandardVersion.from_string("8"): spack.spec.SpecfileV5,
+        vn.StandardVersion.from_string("9"): spack.spec.SpecfileV5,
     }
     return reader_cls[version]
 
@@ -217,6 +243,25 @@ def __init__(
         self.in_buildcache = in_buildcache
         self.origin = origin
 
+    @property
+    def name(self) -> str:
+        """Name of the package of the spec tracked by the record"""
+        return self.spec.name
+
+    @property
+    def external(self) -> bool:
+        """Whether the spec tracked by the record is external"""
+        return self.spec.external
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the spec tracked by the record was created"""
+        return True
+
+    def get_spec(self) -> "spack.spec.Spec":
+        """Returns the spec tracked by the record."""
+        return self.spec
+
     def install_type_matches(self, installed: InstallRecordStatus) -> bool:
         if self.installed:
             return InstallRecordStatus.INSTALLED in installed
@@ -240,8 +285,9 @@ def to_dict(self, include_fields=DEFAULT_INSTALL_RECORD_FIELDS):
 
         return rec_dict
 
-    @classmethod
-    def from_dict(cls, spec, dictionary):
+    @staticmethod
+    def fields_from_dict(dictionary) -> Dict[str, Any]:
+        """Returns the fields of a record in a dictionary, other than its spec"""
         d = dict(dictionary.items())
         d.pop("spec", None)
 
@@ -252,7 +298,103 @@ def from_dict(cls, spec, dictionary):
         if "installed" not in d:
             d["installed"] = False
 
-        return InstallRecord(spec, **d)
+        return d
+
+    @classmethod
+    def from_dict(cls, spec, dictionary):
+        return InstallRecord(spec, **InstallRecord.fields_from_dict(dictionary))
+
+    def updated(self, dictionary) -> "InstallRecord":
+        """Returns a record for the same spec, with the other fields read from a dictionary"""
+        return InstallRecord.from_dict(self.spec, dictionary)
+
+
+class LazyInstallRecord(InstallRecord):
+    """An install record read from the index, whose spec is created the first time it is used.
+
+    Until then, the record keeps what queries need to select it without creating its spec, and
+    the records read from the index, so that it can be written back as it was read.
+
+    Args:
+        name: name of the package of the spec
+        external: whether the spec is external
+        dependencies: names and hashes of the dependencies in the node dictionary
+        installs: records read from the index, keyed by hash, in the format of the current
+            database version
+        hash_key: hash of the spec
+        load_spec: function creating the spec, and the specs of its dependencies, when first
+            needed. The specs of its dependents are created only when they are asked for.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        external: bool,
+        dependencies: List[Tuple[str, str]],
+        installs: Mapping[str, Any],
+        hash_key: str,
+        load_spec: Callable[[], None],
+        **kwargs,
+    ) -> None:
+        self._spec: Optional["spack.spec.Spec"] = None
+        self._name = name
+        self._external = external
+        self._installs = installs
+        self._hash_key = hash_key
+        self._load_spec = load_spec
+        self.dependencies = dependencies
+        super().__init__(None, **kwargs)  # type: ignore[arg-type]
+
+    @property
+    def spec(self) -> "spack.spec.Spec":  # type: ignore[override]
+        return self.get_spec()
+
+    @spec.setter
+    def spec(self, value: "spack.spec.Spec") -> None:
+        self._spec = value
+
+    def unload(self) -> None:
+        """Forgets the spec of the record, which is created again when it is next used"""
+        self._spec = None
+
+    def get_spec(self) -> "spack.spec.Spec":
+        if self._spec is None:
+            self._load_spec()
+        assert self._spec is not None
+        return self._spec
+
+    @property
+    def loaded(self) -> bool:
+        return self._spec is not None
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def external(self) -> bool:
+        return self._external
+
+    def updated(self, dictionary) -> InstallRecord:
+        if self.loaded:
+            return super().updated(dictionary)
+        return LazyInstallRecord(
+            self._name,
+            self._external,
+            self.dependencies,
+            self._installs,
+            self._hash_key,
+            self._load_spec,
+            **InstallRecord.fields_from_dict(dictionary),
+        )
+
+    def to_dict(self, include_fields=DEFAULT_INSTALL_RECORD_FIELDS):
+        if self.loaded or "spec" not in include_fields:
+            return super().to_dict(include_fields=include_fields)
+
+        rec_dict = {"spec": self._installs[self._hash_key]["spec"]}
+        rec_dict.update(super().to_dict(include_fields=[f for f in include_fields if f != "spec"]))
+        return rec_dict
 
 
 class ForbiddenLockError(SpackError):
@@ -553,6 +695,184 @@ def _path(self, spec: "spack.spec.Spec") -> pathlib.Path:
 SelectType = Callable[[InstallRecord], bool]
 
 
+class UpstreamIndexCache:
+    """Stores the index of an upstream database in a file cache, split so that reading the
+    upstream doesn't require parsing its whole ``index.json``.
+
+    The summary entry holds, for each record, the name of its package, whether it is external,
+    its dependencies and its other fields. The node dictionaries of the specs are stored in one
+    entry per package, which is read the first time a spec of that package is created. Every
+    entry records the fingerprint of the index files it was derived from, and is ignored when
+    they change. Entries of packages that are no longer in the index are deleted when a new
+    summary is stored.
+
+    Args:
+        cache: file cache where entries are stored
+        root: root directory of the upstream database
+    """
+
+    def __init__(self, cache: spack.util.file_cache.FileCache, root: str) -> None:
+        self.cache = cache
+        self.root = root
+        digest = hashlib.sha256(os.path.abspath(root).encode()).hexdigest()[:16]
+        self.prefix = f"upstream-db/{digest}"
+
+    @staticmethod
+    def fingerprint(*paths: pathlib.Path) -> str:
+        """Returns a string that changes whenever any of the files passed as input is
+        modified or replaced.
+        """
+        parts = [str(UPSTREAM_INDEX_CACHE_FORMAT_VERSION), str(_DB_VERSION)]
+        for path in paths:
+            try:
+                st = path.stat()
+                parts.append(f"{st.st_ino}:{st.st_size}:{st.st_mtime_ns}")
+            except FileNotFoundError:
+                parts.append("-")
+        return hashlib.sha256(" ".join(parts).encode()).hexdigest()
+
+    def _specs_key(self, name: str) -> str:
+        return f"{self.prefix}/specs/{name}.json"
+
+    def _stored_names(self) -> List[str]:
+        """Returns the names of the packages with an entry in the cache"""
+        try:
+            paths = self.cache.cache_path(f"{self.prefix}/specs").iterdir()
+            return [p.stem for p in paths if p.suffix == ".json" and not p.name.startswith(".")]
+        except FileNotFoundError:
+            return []
+
+    def _read(self, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        try:
+            if not self.cache.init_entry(key):
+                return None
+            with self.cache.read_transaction(key) as f:
+                if f is None:
+                    return None
+                data = sjson.load(f)
+            if data.get("fingerprint") != fingerprint:
+                return None
+            return data
+        except (OSError, ValueError, KeyError, TypeError, spack.util.file_cache.CacheError) as e:
+            tty.debug(f"[UPSTREAM INDEX CACHE] cannot read {key} for {self.root}: {e}")
+            return None
+
+    def _write(self, key: str, data: Dict[str, Any]) -> None:
+        self.cache.init_entry(key)
+        with self.cache.write_transaction(key) as (old, new):
+            sjson.dump(data, new)
+
+    def fetch_summary(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Returns the summary of the index, or None if there is no valid cache entry"""
+        return self._read(f"{self.prefix}/summary.json", fingerprint)
+
+    def fetch_specs(self, name: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Returns the records of a package, with only their spec, keyed by hash, or None if
+        there is no valid cache entry.
+        """
+        data = self._read(self._specs_key(name), fingerprint)
+        return data["installs"] if data is not None else None
+
+    def store(
+        self,
+        fingerprint: str,
+        summary: Dict[str, Any],
+        installs: Mapping[str, Any],
+        records: Dict[str, Dict[str, Any]],
+    ) -> None:
+        """Stores the index of the upstream, replacing any previous entry.
+
+        Args:
+            fingerprint: fingerprint of the index files
+            summary: data about the whole index, other than its records
+            installs: records read from the index
+            records: summaries of the records, keyed by hash
+        """
+        by_name: Dict[str, Dict[str, Any]] = {}
+        for hash_key, record in records.items():
+            by_name.setdefault(record["name"], {})[hash_key] = {"spec": installs[hash_key]["spec"]}
+        try:
+            # The summary is written last, so that a valid summary implies valid specs
+            for name, specs in by_name.items():
+                self._write(self._specs_key(name), {"fingerprint": fingerprint, "installs": specs})
+            self._write(
+                f"{self.prefix}/summary.json",
+                {"fingerprint": fingerprint, "records": records, **summary},
+            )
+            for name in self._stored_names():
+                if name not in by_name:
+                    self.cache.remove(self._specs_key(name))
+        except (OSError, TypeError, ValueError, spack.util.file_cache.CacheError) as e:
+            tty.debug(f"[UPSTREAM INDEX CACHE] cannot write the index of {self.root}: {e}")
+
+
+class _CachedInstalls(Mapping[str, Any]):
+    """Records of an upstream index, with only their spec, keyed by hash. They are read from
+    the cache one package at a time. If the cache changed after its summary was read, the
+    whole database is read again, and they are looked up in the records read.
+    """
+
+    def __init__(
+        self,
+        cache: UpstreamIndexCache,
+        fingerprint: str,
+        records: Dict[str, Dict[str, Any]],
+        reread: Callable[[], Mapping[str, Any]],
+    ) -> None:
+        self._cache = cache
+        self._fingerprint = fingerprint
+        self._records = records
+        self._reread = reread
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        self._index: Optional[Mapping[str, Any]] = None
+
+    def __getitem__(self, hash_key: str) -> Any:
+        if self._index is not None:
+            return self._index[hash_key]
+
+        name = self._records[hash_key]["name"]
+        if name not in self._by_name:
+            specs = self._cache.fetch_specs(name, self._fingerprint)
+            if specs is None:
+                tty.debug(f"[UPSTREAM INDEX CACHE] {self._cache.root} changed, reading it again")
+                self._index = self._reread()
+                return self._index[hash_key]
+            self._by_name[name] = specs
+        return self._by_name[name][hash_key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+class _WriteBatch:
+    """Records added to a database in memory, that are not written to disk yet"""
+
+    def __init__(self, max_writes: int, max_seconds: float) -> None:
+        self.max_writes = max_writes
+        self.max_seconds = max_seconds
+        #: Arguments of the additions not written yet, in order
+        self.pending: List[Tuple["spack.spec.Spec", Dict[str, Any]]] = []
+        self._start = 0.0
+
+    def add(self, spec: "spack.spec.Spec", **kwargs) -> None:
+        if not self.pending:
+            self._start = time.monotonic()
+        self.pending.append((spec, kwargs))
+
+    def due(self) -> bool:
+        """Returns whether the pending records should be written"""
+        return (
+            len(self.pending) >= self.max_writes
+            or time.monotonic() - self._start >= self.max_seconds
+        )
+
+    def flushed(self) -> None:
+        self.pending.clear()
+
+
 class Database:
     #: Fields written for each install record
     record_fields: Tuple[str, ...] = DEFAULT_INSTALL_RECORD_FIELDS
@@ -565,6 +885,7 @@ def __init__(
         is_upstream: bool = False,
         lock_cfg: LockConfiguration = DEFAULT_LOCK_CFG,
         layout: Optional[DirectoryLayout] = None,
+        index_cache: Optional[spack.util.file_cache.FileCache] = None,
     ) -> None:
         """Database for Spack installations.
 
@@ -584,6 +905,9 @@ def __init__(
             is_upstream: whether this repository is an upstream.
             lock_cfg: configuration for the locks to be used by this repository.
                 Relevant only if the repository is not an upstream.
+            index_cache: file cache where the index of an upstream is stored, so that it is
+                read in full only when it changes. Relevant only if the repository is an
+                upstream.
         """
         self.root = root
         self.database_directory = pathlib.Path(self.root) / _DB_DIRNAME
@@ -591,6 +915,7 @@ def __init__(
 
         # Set up layout of database files within the db dir
         self._index_path = self.database_directory / INDEX_JSON_FILE
+        self._journal_path = self.database_directory / JOURNAL_FILE
         self._verifier_path = self.database_directory / _INDEX_VERIFIER_FILE
         self._lock_path = self.database_directory / _LOCK_FILE
 
@@ -626,22 +951,52 @@ def __init__(
         # before installing a different spec.
         self._installed_prefixes: Set[str] = set()
 
+        # Hash keys of the records by package name, and all the hash keys in sorted order, so
+        # that queries by name or by hash prefix don't have to look at every record, and hash
+        # keys of the lazy records depending on each record. They are created when first
+        # needed, and cleared when records are added or removed.
+        self._keys_by_name: Optional[Dict[str, List[str]]] = None
+        self._sorted_keys: Optional[List[str]] = None
+        self._keys_of_dependents: Optional[Dict[str, List[str]]] = None
+
         self.upstream_dbs = list(upstream_dbs) if upstream_dbs else []
 
+        self._index_cache: Optional[UpstreamIndexCache] = None
+        if self.is_upstream and index_cache is not None:
+            self._index_cache = UpstreamIndexCache(index_cache, self.root)
+
         self._write_transaction_impl = lk.WriteTransaction
         self._read_transaction_impl = lk.ReadTransaction
-        self._db_version: Optional[vn.ConcreteVersion] = None
+        self._db_version: Optional[vn.StandardVersion] = None
+
+        # Keys of the records added, modified or removed since the last write
+        self._modified: Set[str] = set()
+
+        # Id of the snapshot of the index that was last read or written, which the records in
+        # the journal apply to, and number of bytes of the journal applied so far
+        self._snapshot: Optional[str] = None
+        self._journal_offset = 0
+
+        # Records added in memory, and not written yet, in a batch of writes
+        self._batch: Optional[_WriteBatch] = None
 
     @property
-    def db_version(self) -> vn.ConcreteVersion:
+    def db_version(self) -> vn.StandardVersion:
         if self._db_version is None:
             raise AttributeError("version not set -- DB has not been read yet")
         return self._db_version
 
     @db_version.setter
-    def db_version(self, value: vn.ConcreteVersion):
+    def db_version(self, value: vn.StandardVersion):
         self._db_version = value
 
+    def _index_version(self) -> vn.StandardVersion:
+        """Returns the version of the index written by this database. A database read at the
+        last version without a journal stays at that version, until it is reindexed."""
+        if self._db_version == _DB_VERSION_WITHOUT_JOURNAL:
+            return _DB_VERSION_WITHOUT_JOURNAL
+        return _DB_VERSION
+
     def _ensure_parent_directories(self):
         """Create the parent directory for the DB, if necessary."""
         if not self.is_upstream:
@@ -655,10 +1010,13 @@ def read_transaction(self):
         """Get a read lock context manager for use in a ``with`` block."""
         return self._read_transaction_impl(self.lock, acquire=self._read)
 
-    def _write_to_file(self, stream):
+    def _write_to_file(self, stream, snapshot: Optional[str] = None):
         """Write out the database in JSON format to the stream passed
         as argument.
 
+        If a snapshot id is given, it is written in the index, so that the journal written
+        afterwards can be applied to it.
+
         This function does not do any locking or transactions.
         """
         self._ensure_parent_directories()
@@ -678,16 +1036,18 @@ def _write_to_file(self, stream):
             "database": {
                 # TODO: move this to a top-level _meta section if we ever
                 # TODO: bump the DB version to 7
-                "version": str(_DB_VERSION),
+                "version": str(self._index_version()),
                 # dictionary of installation records, keyed by DAG hash
                 "installs": installs,
             }
         }
+        if snapshot is not None:
+            database["database"]["snapshot"] = snapshot
 
         try:
             sjson.dump(database, stream)
         except (TypeError, ValueError) as e:
-            raise sjson.SpackJSONError("error writing JSON database:", str(e))
+            raise sjson.SpackJSONError("error writing JSON database:", e)
 
     def _read_spec_from_dict(self, spec_reader, hash_key, installs, hash=ht.dag_hash):
         """Recursively construct a spec from a hash in a YAML database.
@@ -755,12 +1115,13 @@ def _assign_dependencies(
         self,
         spec_reader: Type["spack.spec.SpecfileReaderBase"],
         hash_key: str,
-        installs: dict,
+        installs: Mapping[str, Any],
         data: Dict[str, InstallRecord],
+        warn_missing: bool = True,
     ):
         # Add dependencies from other records in the install DB to
         # form a full spec.
-        spec = data[hash_key].spec
+        spec = data[hash_key].get_spec()
         spec_node_dict = installs[hash_key]["spec"]
         if "name" not in spec_node_dict:
             # old format
@@ -777,9 +1138,11 @@ def _assign_dependencies(
                 # determine which one a local package depends on, so the convention ensures that
                 # this isn't an issue.
                 _, record = self.query_by_spec_hash(dhash, data=data)
-                child = record.spec if record else None
+                child = record.get_spec() if record else None
 
                 if not child:
+                    if not warn_missing:
+                        continue
                     tty.warn(
                         f"Missing dependency not in database: "
                         f"{spec.cformat('{name}{/hash:7}')} needs {dname}-{dhash[:7]}"
@@ -794,6 +1157,33 @@ def _read_from_file(self, filename: pathlib.Path, *, reindex: bool = False) -> N
         """Fill database from file, do not maintain old data.
         Translate the spec portions from node-dict form to spec form.
 
+        Does not do any locking.
+        """
+        installs = self._read_installs(filename, reindex=reindex)
+        if installs is None:
+            return
+
+        data: Dict[str, InstallRecord] = {}
+        installed_prefixes = self._load_records(reader(self.db_version), installs, data)
+        self._set_records(data, installed_prefixes)
+
+    def _set_records(self, data: Dict[str, InstallRecord], installed_prefixes: Set[str]) -> None:
+        """Replaces the records of the database.
+
+        Does not do any locking.
+        """
+        self._data = data
+        self._installed_prefixes = installed_prefixes
+        self._modified.clear()
+        self._clear_indexes()
+
+    def _read_installs(
+        self, filename: pathlib.Path, *, reindex: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """Parses an index file, sets the version of the database, and returns the records in
+        the file, with those written to the journal afterwards if it is the index of this
+        database.
+
         Does not do any locking.
         """
         try:
@@ -803,7 +1193,7 @@ def _read_from_file(self, filename: pathlib.Path, *, reindex: bool = False) -> N
             raise CorruptDatabaseError(f"error parsing database at {filename}:", str(e)) from e
 
         if fdata is None:
-            return
+            return None
 
         def check(cond, msg):
             if not cond:
@@ -818,20 +1208,233 @@ def check(cond, msg):
         self.db_version = vn.StandardVersion.from_string(db["version"])
         if self.db_version > _DB_VERSION:
             raise InvalidDatabaseVersionError(self, _DB_VERSION, self.db_version)
-        elif self.db_version < _DB_VERSION:
+        elif self.db_version < _DB_VERSION_WITHOUT_JOURNAL:
             installs = self._handle_old_db_versions_read(check, db, reindex=reindex)
         else:
             installs = self._handle_current_version_read(check, db)
 
-        spec_reader = reader(self.db_version)
+        if filename == self._index_path:
+            # The journal applies only to the snapshot of the index it was written after
+            self._snapshot = db.get("snapshot")
+            self._journal_offset = 0
+            if self._snapshot is not None:
+                records, self._journal_offset = self._read_journal(0)
+                for hash_key, rec in records.items():
+                    if rec is None:
+                        installs.pop(hash_key, None)
+                    else:
+                        installs[hash_key] = rec
 
-        def invalid_record(hash_key, error):
-            return CorruptDatabaseError(
-                f"Invalid record in Spack database: hash: {hash_key}, cause: "
-                f"{type(error).__name__}: {error}",
-                self._index_path,
-            )
+        return installs
+
+    def _clear_indexes(self) -> None:
+        """Clears the lookups of hash keys, after records were added or removed.
+
+        Does not do any locking.
+        """
+        self._keys_by_name = None
+        self._sorted_keys = None
+        self._keys_of_dependents = None
+
+    def _keys_named(self, name: str) -> List[str]:
+        """Returns the hash keys of the records of a package, in the order of the records.
+
+        Does not do any locking.
+        """
+        if self._keys_by_name is None:
+            self._keys_by_name = {}
+            for key, rec in self._data.items():
+                self._keys_by_name.setdefault(rec.name, []).append(key)
+        return self._keys_by_name.get(name, [])
+
+    def _dependent_keys(self) -> Dict[str, List[str]]:
+        """Returns the hash keys of the lazy records depending on each hash key.
+
+        Does not do any locking.
+        """
+        if self._keys_of_dependents is None:
+            self._keys_of_dependents = {}
+            for key, rec in self._data.items():
+                if isinstance(rec, LazyInstallRecord):
+                    for _, dhash in rec.dependencies:
+                        self._keys_of_dependents.setdefault(dhash, []).append(key)
+        return self._keys_of_dependents
+
+    def _keys_with_prefix(self, prefix: str) -> List[str]:
+        """Returns the hash keys of the records starting with a prefix, in sorted order.
+
+        Does not do any locking.
+        """
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self._data)
+        keys = self._sorted_keys
+        start = end = bisect.bisect_left(keys, prefix)
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        return keys[start:end]
+
+    def _invalid_record(self, hash_key: str, error: Exception) -> "CorruptDatabaseError":
+        return CorruptDatabaseError(
+            f"Invalid record in Spack database: hash: {hash_key}, cause: "
+            f"{type(error).__name__}: {error}",
+            self._index_path,
+        )
+
+    def _summarize_records(
+        self, spec_reader: Type["spack.spec.SpecfileReaderBase"], installs: Mapping[str, Any]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Returns what queries need to know about the records read from a file, without
+        creating their specs: the name of the package, whether it is external, the names and
+        hashes of the dependencies, and the other fields of each record.
+
+        Does not do any locking.
+        """
+        summaries = {}
+        for hash_key, rec in installs.items():
+            try:
+                node_dict = rec["spec"]
+                external = node_dict.get("external") or {}
+                summaries[hash_key] = {
+                    "name": node_dict["name"],
+                    "external": bool(external.get("path") or external.get("module")),
+                    "dependencies": [
+                        (dname, dhash)
+                        for dname, dhash, *_ in spec_reader.read_specfile_dep_specs(
+                            node_dict.get("dependencies", [])
+                        )
+                    ],
+                    "fields": InstallRecord.fields_from_dict(rec),
+                }
+            except Exception as e:
+                raise self._invalid_record(hash_key, e) from e
+        return summaries
+
+    def _load_records(
+        self,
+        spec_reader: Type["spack.spec.SpecfileReaderBase"],
+        installs: Mapping[str, Any],
+        data: Dict[str, InstallRecord],
+        summaries: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> Set[str]:
+        """Creates the install records read from a file, and adds them to the records in
+        ``data``, which dependencies are also looked up in. Returns the prefixes of the specs
+        that are installed among the new records.
+
+        Records in the format of the current database version are lazy: the spec of a record
+        is created only when it is first used, so that queries touching a few records don't
+        pay for creating the specs of the whole database. Records in older formats are read
+        eagerly.
+
+        If ``summaries`` of the records are given, ``installs`` is used only to create specs.
+
+        Does not do any locking.
+        """
+        if spec_reader is not reader(_DB_VERSION):
+            return self._load_records_eagerly(spec_reader, installs, data)
+
+        if summaries is None:
+            summaries = self._summarize_records(spec_reader, installs)
+
+        installed_prefixes: Set[str] = set()
+        for hash_key, summary in summaries.items():
+            try:
+                record = LazyInstallRecord(
+                    summary["name"],
+                    summary["external"],
+                    [(dname, dhash) for dname, dhash in summary["dependencies"]],
+                    installs,
+                    hash_key,
+                    functools.partial(self._load_spec, spec_reader, hash_key, installs, data),
+                    **summary["fields"],
+                )
+            except Exception as e:
+                raise self._invalid_record(hash_key, e) from e
+
+            data[hash_key] = record
+            if not record.external and record.installed and record.path is not None:
+                installed_prefixes.add(record.path)
+
+        # Specs are connected to their dependencies later, but missing ones are reported now
+        for hash_key in summaries:
+            record = data[hash_key]
+            assert isinstance(record, LazyInstallRecord)
+            for dname, dhash in record.dependencies:
+                upstream, dependency = self.query_by_spec_hash(dhash, data=data)
+                if dependency is None:
+                    tty.warn(
+                        f"Missing dependency not in database: "
+                        f"{record.name}/{hash_key[:7]} needs {dname}-{dhash[:7]}"
+                    )
+                elif not upstream and dependency.loaded:
+                    # The dependency has a new dependent, whose spec was not created yet
+                    dependency.spec._connect_dependents = functools.partial(
+                        self._connect_dependents, dhash, data
+                    )
 
+        return installed_prefixes
+
+    def _load_spec(
+        self,
+        spec_reader: Type["spack.spec.SpecfileReaderBase"],
+        hash_key: str,
+        installs: Mapping[str, Any],
+        data: Dict[str, InstallRecord],
+    ) -> None:
+        """Creates the spec of a lazy record, and connects it to the specs of its dependencies,
+        which are created first if needed. The spec is connected to its dependents the first
+        time they are asked for.
+
+        Does not do any locking.
+        """
+        record = data[hash_key]
+        if record.loaded:
+            return
+        assert isinstance(record, LazyInstallRecord)
+
+        try:
+            record.spec = spec = self._read_spec_from_dict(spec_reader, hash_key, installs)
+            self._assign_dependencies(spec_reader, hash_key, installs, data, warn_missing=False)
+        except CorruptDatabaseError:
+            # A dependency is invalid
+            record.unload()
+            raise
+        except Exception as e:
+            record.unload()
+            raise self._invalid_record(hash_key, e) from e
+
+        # Dependencies are concrete already, since they were created first
+        spec._mark_root_concrete()
+        spec._connect_dependents = functools.partial(self._connect_dependents, hash_key, data)
+
+    def _connect_dependents(self, hash_key: str, data: Dict[str, InstallRecord]) -> None:
+        """Creates the specs of the lazy records depending directly on a record, which connects
+        them to its spec.
+
+        Does not do any locking.
+        """
+        if data is self._data:
+            dependent_keys = self._dependent_keys().get(hash_key, [])
+        else:
+            # Not worth indexing the dependents of records that were replaced
+            dependent_keys = [
+                key
+                for key, record in data.items()
+                if isinstance(record, LazyInstallRecord)
+                and any(dhash == hash_key for _, dhash in record.dependencies)
+            ]
+        for key in dependent_keys:
+            data[key].get_spec()
+
+    def _load_records_eagerly(
+        self,
+        spec_reader: Type["spack.spec.SpecfileReaderBase"],
+        installs: Mapping[str, Any],
+        data: Dict[str, InstallRecord],
+    ) -> Set[str]:
+        """Creates the install records read from a file, and their specs.
+
+        Does not do any locking.
+        """
         # Build up the database in three passes:
         #
         #   1. Read in all specs without dependencies.
@@ -842,7 +1445,6 @@ def invalid_record(hash_key, error):
         # (i.e., its specs are a true Merkle DAG, unlike most specs.)
 
         # Pass 1: Iterate through database and build specs w/o dependencies
-        data: Dict[str, InstallRecord] = {}
         installed_prefixes: Set[str] = set()
         for hash_key, rec in installs.items():
             try:
@@ -858,27 +1460,26 @@ def invalid_record(hash_key, error):
                 if not spec.external and "installed" in rec and rec["installed"]:
                     installed_prefixes.add(rec["path"])
             except Exception as e:
-                raise invalid_record(hash_key, e) from e
+                raise self._invalid_record(hash_key, e) from e
 
         # Pass 2: Assign dependencies once all specs are created.
-        for hash_key in data:
+        for hash_key in installs:
             try:
                 self._assign_dependencies(spec_reader, hash_key, installs, data)
             except MissingDependenciesError:
                 raise
             except Exception as e:
-                raise invalid_record(hash_key, e) from e
+                raise self._invalid_record(hash_key, e) from e
 
         # Pass 3: Mark all specs concrete.  Specs representing real
         # installations must be explicitly marked.
         # We do this *after* all dependencies are connected because if we
         # do it *while* we're constructing specs,it causes hashes to be
         # cached prematurely.
-        for hash_key, rec in data.items():
-            rec.spec._mark_root_concrete()
+        for hash_key in installs:
+            data[hash_key].spec._mark_root_concrete()
 
-        self._data = data
-        self._installed_prefixes = installed_prefixes
+        return installed_prefixes
 
     def _handle_current_version_read(self, check, db):
         check("installs" in db, "no 'installs' in JSON DB.")
@@ -924,6 +1525,17 @@ def raise_explicit_database_upgrade_error(self):
             ),
         )
 
+    def compact(self) -> None:
+        """Writes the index in full, together with the records in its journal, so that the
+        index can be read without the journal."""
+        if isinstance(self.lock, ForbiddenLock):
+            raise UpstreamDatabaseLockingError("Cannot compact an upstream database")
+
+        with self._write_transaction_impl(
+            self.lock, acquire=self._read, release=functools.partial(self._write, compact=True)
+        ):
+            pass
+
     def reindex(self):
         """Build database index from scratch based on a directory layout.
 
@@ -943,17 +1555,26 @@ def _read_suppress_error():
             except (CorruptDatabaseError, DatabaseNotReadableError):
                 self._data = {}
                 self._installed_prefixes = set()
+                self._clear_indexes()
 
-        with lk.WriteTransaction(self.lock, acquire=_read_suppress_error, release=self._write):
+        with lk.WriteTransaction(
+            self.lock,
+            acquire=_read_suppress_error,
+            release=functools.partial(self._write, compact=True),
+        ):
             old_installed_prefixes, self._installed_prefixes = self._installed_prefixes, set()
             old_data, self._data = self._data, {}
             try:
                 self._reindex(old_data)
+                # Reindexing upgrades the database to the current version
+                self.db_version = _DB_VERSION
             except BaseException:
                 # If anything explodes, restore old data, skip write.
                 self._data = old_data
                 self._installed_prefixes = old_installed_prefixes
                 raise
+            finally:
+                self._clear_indexes()
 
     def _reindex(self, old_data: Dict[str, InstallRecord]):
         # Specs on the file system are the source of truth for record.spec. The old database values
@@ -1080,9 +1701,16 @@ def _check_ref_counts(self):
                     % (key, found, expected, self._index_path)
                 )
 
-    def _write(self, type=None, value=None, traceback=None):
+    def _write(self, type=None, value=None, traceback=None, *, compact: bool = False):
         """Write the in-memory database index to its file path.
 
+        The records modified by the transaction are appended to the journal, unless the journal
+        grew too large, in which case the index is compacted: it is written in full as a new
+        snapshot, and the journal is removed.
+
+        In a batch of writes, this also writes the records that were added to the database
+        in memory, and not written yet.
+
         This is a helper function called by the WriteTransaction context
         manager. If there is an exception while the write lock is active,
         nothing will be written to the database file, but the in-memory
@@ -1090,6 +1718,9 @@ def _write(self, type=None, value=None, traceback=None):
         after the start of the next transaction, when it read from disk again.
 
         This routine does no locking.
+
+        Args:
+            compact: write the index in full, even if the journal is small
         """
         self._ensure_parent_directories()
 
@@ -1101,19 +1732,32 @@ def _write(self, type=None, value=None, traceback=None):
             self._state_is_inconsistent = True
             return
 
+        if not compact and self._can_write_journal():
+            self._write_journal()
+            if self._batch is not None:
+                self._batch.flushed()
+            return
+
+        verifier = str(uuid.uuid4()) if _use_uuid else None
         temp_file = str(self._index_path) + (".%s.%s.temp" % (_getfqdn(), os.getpid()))
 
+        # Only indices at the current version have a journal, which applies to their snapshot
+        snapshot = verifier if self._index_version() == _DB_VERSION else None
+
         # Write a temporary database file them move it into place
         try:
             with open(temp_file, "w", encoding="utf-8") as f:
-                self._write_to_file(f)
+                self._write_to_file(f, snapshot=snapshot)
             fs.rename(temp_file, str(self._index_path))
 
-            if _use_uuid:
+            if verifier is not None:
                 with self._verifier_path.open("w", encoding="utf-8") as f:
-                    new_verifier = str(uuid.uuid4())
-                    f.write(new_verifier)
-                    self.last_seen_verifier = new_verifier
+                    f.write(verifier)
+                    self.last_seen_verifier = verifier
+
+            # The new snapshot has all the records in the journal
+            if self._journal_path.exists():
+                self._journal_path.unlink()
         except BaseException as e:
             tty.debug(e)
             # Clean up temp file if something goes wrong.
@@ -1121,6 +1765,195 @@ def _write(self, type=None, value=None, traceback=None):
                 os.remove(temp_file)
             raise
 
+        self._snapshot = snapshot
+        self._journal_offset = 0
+        self._modified.clear()
+        if self._batch is not None:
+            self._batch.flushed()
+
+    def _can_write_journal(self) -> bool:
+        """Returns whether the records modified by a transaction can be appended to the journal
+        of the current snapshot of the index, instead of writing the index in full."""
+        if self._snapshot is None:
+            return False
+
+        try:
+            index_size = self._index_path.stat().st_size
+        except OSError:
+            return False
+        return self._journal_offset <= _JOURNAL_COMPACTION_RATIO * index_size
+
+    def _write_journal(self) -> None:
+        """Appends the records modified since the last write to the journal, as a single line,
+        so that a write interrupted half-way is ignored when reading the journal.
+
+        This routine does no locking.
+        """
+        records = {
+            key: (
+                self._data[key].to_dict(include_fields=self.record_fields)
+                if key in self._data
+                else None
+            )
+            for key in self._modified
+        }
+        self._modified.clear()
+        if not records:
+            return
+
+        try:
+            line = f"{sjson.dump({'snapshot': self._snapshot, 'records': records})}\n"
+        except (TypeError, ValueError) as e:
+            raise sjson.SpackJSONError("error writing JSON database journal:", e)
+
+        data = line.encode("utf-8")
+        fd = os.open(self._journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        self._journal_offset += len(data)
+
+    def _read_journal(self, offset: int) -> Tuple[Dict[str, Optional[dict]], int]:
+        """Reads the journal of the current snapshot from an offset, and returns the records
+        written after it, with None for removed records, together with the offset of the end of
+        the last complete entry.
+
+        Does not do any locking.
+        """
+        records: Dict[str, Optional[dict]] = {}
+        try:
+            with self._journal_path.open("rb") as f:
+                f.seek(offset)
+                content = f.read()
+        except FileNotFoundError:
+            return records, offset
+
+        # An incomplete last entry is from a write that was interrupted
+        end = content.rfind(b"\n") + 1
+        for line in content[:end].splitlines():
+            try:
+                entry = sjson.load(line.decode("utf-8"))
+                if entry["snapshot"] != self._snapshot:
+                    continue
+                records.update(entry["records"])
+            except (ValueError, KeyError, TypeError):
+                tty.debug(f"Skipping a malformed entry in {self._journal_path}")
+        return records, offset + end
+
+    def _read_journal_tail(self) -> None:
+        """Applies the records written to the journal since it was last read to the database.
+
+        Does not do any locking.
+        """
+        if self._snapshot is None:
+            return
+
+        try:
+            if self._journal_path.stat().st_size <= self._journal_offset:
+                return
+        except FileNotFoundError:
+            return
+
+        records, self._journal_offset = self._read_journal(self._journal_offset)
+
+        new_records = {}
+        for hash_key, rec in records.items():
+            old = self._data.get(hash_key)
+            if old is not None and not old.external and old.installed:
+                self._installed_prefixes.discard(old.path)
+
+            if rec is None:
+                if old is not None:
+                    del self._data[hash_key]
+                    if old.loaded:
+                        old.get_spec().detach(deptype=_TRACKED_DEPENDENCIES)
+            elif old is not None:
+                # Same hash, so the same spec: only the rest of the record changed
+                self._data[hash_key] = old.updated(rec)
+                if not old.external and rec.get("installed"):
+                    self._installed_prefixes.add(rec["path"])
+            else:
+                new_records[hash_key] = rec
+
+        if new_records:
+            self._installed_prefixes |= self._load_records(
+                reader(_DB_VERSION), new_records, self._data
+            )
+        self._clear_indexes()
+
+    def _journal_grew(self) -> bool:
+        """Returns whether records were written to the journal since it was last read."""
+        try:
+            return self._journal_path.stat().st_size > self._journal_offset
+        except FileNotFoundError:
+            return False
+
+    def _add_batch(self) -> None:
+        """Adds the records of the current batch that are not written yet to the records read
+        from disk.
+
+        Does not do any locking.
+        """
+        if self._batch is None:
+            return
+        for spec, kwargs in self._batch.pending:
+            self._add(spec, **kwargs)
+
+    def _read_index(self) -> None:
+        """Reads the index of the database, and the journal written after it. The index of an
+        upstream is read from the cache, if there is a valid entry, and stored there otherwise.
+
+        Does not do any locking.
+        """
+        if self._index_cache is None:
+            self._read_from_file(self._index_path)
+        else:
+            self._read_cached_index(self._index_cache)
+
+    def _read_cached_index(self, index_cache: UpstreamIndexCache) -> Mapping[str, Any]:
+        """Reads the index of an upstream, and the journal written after it, from the cache if
+        there is a valid entry, and stores them there otherwise. Returns the records read, keyed
+        by hash.
+
+        Does not do any locking.
+        """
+        fingerprint = UpstreamIndexCache.fingerprint(self._index_path, self._journal_path)
+        summary = index_cache.fetch_summary(fingerprint)
+        if summary is not None:
+            tty.debug(f"[UPSTREAM INDEX CACHE] reading the index of {self.root} from the cache")
+            self.db_version = vn.StandardVersion.from_string(summary["version"])
+            self._snapshot = summary["snapshot"]
+            self._journal_offset = summary["journal_offset"]
+            records = summary["records"]
+            # Records whose spec is created after the index changed would otherwise mix two
+            # versions of the index, so the whole database is read again
+            installs = _CachedInstalls(
+                index_cache, fingerprint, records, lambda: self._read_cached_index(index_cache)
+            )
+        else:
+            installs = self._read_installs(self._index_path)
+            if installs is None:
+                return {}
+            records = None
+            if self.db_version >= _DB_VERSION_WITHOUT_JOURNAL:
+                records = self._summarize_records(reader(self.db_version), installs)
+                index_cache.store(
+                    fingerprint,
+                    {
+                        "version": str(self.db_version),
+                        "snapshot": self._snapshot,
+                        "journal_offset": self._journal_offset,
+                    },
+                    installs,
+                    records,
+                )
+
+        data: Dict[str, InstallRecord] = {}
+        installed_prefixes = self._load_records(reader(self.db_version), installs, data, records)
+        self._set_records(data, installed_prefixes)
+        return installs
+
     def _read(self):
         """Re-read Database from the data in the set location. This does no locking."""
         if self._index_path.is_file():
@@ -1134,10 +1967,20 @@ def _read(self):
             if (current_verifier != self.last_seen_verifier) or (current_verifier == ""):
                 self.last_seen_verifier = current_verifier
                 # Read from file if a database exists
-                self._read_from_file(self._index_path)
+                self._read_index()
+                self._add_batch()
             elif self._state_is_inconsistent:
                 self._read_from_file(self._index_path)
                 self._state_is_inconsistent = False
+                self._add_batch()
+            elif self._batch is not None and self._batch.pending and self._journal_grew():
+                # Records written by other processes may replace, or depend on, those not written
+                # yet, so the database is read in full before adding them again
+                self._read_index()
+                self._add_batch()
+            else:
+                # Same snapshot: apply only what was written to the journal since the last read
+                self._read_journal_tail()
             return
         elif self.is_upstream:
             tty.warn(f"upstream not found: {self._index_path}")
@@ -1212,9 +2055,11 @@ def _add(
             path = None
             installed = True
 
+        self._modified.add(key)
         if key not in self._data:
             # Create a new install record with no deps initially.
             new_spec = spec.copy(deps=False)
+            self._clear_indexes()
             self._data[key] = InstallRecord(
                 new_spec,
                 path=path,
@@ -1230,9 +2075,12 @@ def _add(
                 dkey = dep.spec.dag_hash()
                 upstream, record = self.query_by_spec_hash(dkey)
                 assert record, f"Missing dependency {dep.spec.short_spec} in DB"
-                new_spec._add_dependency(record.spec, depflag=dep.depflag, virtuals=dep.virtuals)
+                new_spec._add_dependency(
+                    record.get_spec(), depflag=dep.depflag, virtuals=dep.virtuals
+                )
                 if not upstream:
                     record.ref_count += 1
+                    self._modified.add(dkey)
 
             # Mark concrete once everything is built, and preserve the original hashes of concrete
             # specs.
@@ -1255,9 +2103,49 @@ def add(self, spec: "spack.spec.Spec", *, explicit: bool = False, allow_missing=
 
         """
         # TODO: ensure that spec is concrete?
-        # Entire add is transactional.
-        with self.write_transaction():
+        if self._batch is None:
+            # Entire add is transactional.
+            with self.write_transaction():
+                self._add(spec, explicit=explicit, allow_missing=allow_missing)
+            return
+
+        # In a batch, the record is added in memory, and written with the next write
+        with self.read_transaction():
             self._add(spec, explicit=explicit, allow_missing=allow_missing)
+            self._batch.add(
+                spec,
+                explicit=explicit,
+                allow_missing=allow_missing,
+                installation_time=self._data[spec.dag_hash()].installation_time,
+            )
+        if self._batch.due():
+            with self.write_transaction():
+                pass
+
+    @contextlib.contextmanager
+    def batched_writes(self, max_writes: int, max_seconds: float) -> Iterator[None]:
+        """Context in which the records added with ``add()`` are written to disk in batches,
+        under the write lock: when ``max_writes`` of them are pending, when the first pending
+        one was added more than ``max_seconds`` ago, with any other write transaction, and on
+        exit.
+
+        Records not written yet are seen by this process only, and are lost if the process is
+        killed before they are written. ``spack reindex`` recovers them from the store.
+        """
+        if self.is_upstream or self._batch is not None:
+            yield
+            return
+
+        self._batch = _WriteBatch(max_writes, max_seconds)
+        try:
+            yield
+        finally:
+            try:
+                if self._batch.pending:
+                    with self.write_transaction():
+                        pass
+            finally:
+                self._batch = None
 
     def _get_matching_spec_key(self, spec: "spack.spec.Spec", **kwargs) -> str:
         """Get the exact spec OR get a single spec that matches."""
@@ -1286,9 +2174,11 @@ def _decrement_ref_count(self, spec: "spack.spec.Spec") -> None:
 
         rec = self._data[key]
         rec.ref_count -= 1
+        self._modified.add(key)
 
         if rec.ref_count == 0 and not rec.installed:
             del self._data[key]
+            self._clear_indexes()
 
             for dep in spec.dependencies(deptype=_TRACKED_DEPENDENCIES):
                 self._decrement_ref_count(dep)
@@ -1301,11 +2191,13 @@ def _increment_ref_count(self, spec: "spack.spec.Spec") -> None:
 
         rec = self._data[key]
         rec.ref_count += 1
+        self._modified.add(key)
 
     def _remove(self, spec: "spack.spec.Spec") -> "spack.spec.Spec":
         """Non-locking version of remove(); does real work."""
         key = self._get_matching_spec_key(spec)
         rec = self._data[key]
+        self._modified.add(key)
 
         # This install prefix is now free for other specs to use, even if the
         # spec is only marked uninstalled.
@@ -1317,6 +2209,7 @@ def _remove(self, spec: "spack.spec.Spec") -> "spack.spec.Spec":
             return rec.spec
 
         del self._data[key]
+        self._clear_indexes()
 
         # Remove any reference to this node from dependencies and
         # decrement the reference count
@@ -1382,6 +2275,7 @@ def _deprecate(self, spec: "spack.spec.Spec", deprecator: "spack.spec.Spec") ->
         spec_rec.deprecated_for = deprecator_key
         spec_rec.installed = False
         self._data[spec_key] = spec_rec
+        self._modified.add(spec_key)
 
     @_autospec
     def mark(self, spec: "spack.spec.Spec", key: str, value: Any) -> None:
@@ -1390,8 +2284,9 @@ def mark(self, spec: "spack.spec.Spec", key: str, value: Any) -> None:
             return self._mark(spec, key, value)
 
     def _mark(self, spec: "spack.spec.Spec", key, value) -> None:
-        record = self._data[self._get_matching_spec_key(spec)]
-        setattr(record, key, value)
+        spec_key = self._get_matching_spec_key(spec)
+        setattr(self._data[spec_key], key, value)
+        self._modified.add(spec_key)
 
     @_autospec
     def deprecate(self, spec: "spack.spec.Spec", deprecator: "spack.spec.Spec") -> None:
@@ -1399,6 +2294,16 @@ def deprecate(self, spec: "spack.spec.Spec", deprecator: "spack.spec.Spec") -> N
         with self.write_transaction():
             return self._deprecate(spec, deprecator)
 
+    def _load_specs(self) -> None:
+        """Creates the specs of all the records in this database, and in its upstreams, so
+        that specs in upstreams know their dependents in this database.
+
+        Does not do any locking.
+        """
+        for db in (self, *self.upstream_dbs):
+            for rec in db._data.values():
+                rec.get_spec()
+
     @_autospec
     def installed_relatives(
         self,
@@ -1412,29 +2317,35 @@ def installed_relatives(
             raise ValueError("Invalid direction: %s" % direction)
 
         relatives: Set[spack.spec.Spec] = set()
-        for spec in self.query(spec):
-            if transitive:
-                to_add = spec.traverse(direction=direction, root=False, deptype=deptype)
-            elif direction == "parents":
-                to_add = spec.dependents(deptype=deptype)
-            else:  # direction == 'children'
-                to_add = spec.dependencies(deptype=deptype)
-
-            for relative in to_add:
-                hash_key = relative.dag_hash()
-                _, record = self.query_by_spec_hash(hash_key)
-                if not record:
-                    tty.warn(
-                        f"Inconsistent state: "
-                        f"{'dependent' if direction == 'parents' else 'dependency'} {hash_key} of "
-                        f"{spec.dag_hash()} not in DB"
-                    )
-                    continue
-
-                if not record.installed:
-                    continue
-
-                relatives.add(relative)
+        with self.read_transaction():
+            # Specs from the database know all their dependents in the same database when they
+            # are queried, but not their dependents in downstream databases
+            if direction == "parents" and self.upstream_dbs:
+                self._load_specs()
+
+            for spec in self.query(spec):
+                if transitive:
+                    to_add = spec.traverse(direction=direction, root=False, deptype=deptype)
+                elif direction == "parents":
+                    to_add = spec.dependents(deptype=deptype)
+                else:  # direction == 'children'
+                    to_add = spec.dependencies(deptype=deptype)
+
+                for relative in to_add:
+                    hash_key = relative.dag_hash()
+                    _, record = self.query_by_spec_hash(hash_key)
+                    if not record:
+                        relation = "dependent" if direction == "parents" else "dependency"
+                        tty.warn(
+                            f"Inconsistent state: {relation} {hash_key} of "
+                            f"{spec.dag_hash()} not in DB"
+                        )
+                        continue
+
+                    if not record.installed:
+                        continue
+
+                    relatives.add(relative)
         return relatives
 
     @_autospec
@@ -1461,9 +2372,9 @@ def _get_by_hash_local(
 
         # check if hash is a prefix of some installed (or previously installed) spec.
         matches = [
-            record.spec
-            for h, record in self._data.items()
-            if h.startswith(dag_hash) and record.install_type_matches(installed)
+            self._data[h].spec
+            for h in self._keys_with_prefix(dag_hash)
+            if self._data[h].install_type_matches(installed)
         ]
         if matches:
             return matches
@@ -1551,57 +2462,70 @@ def _query(
                 return []
             matching_hashes = {hash_key: matching_hashes[hash_key]}
 
-        results = []
         start_date = start_date or datetime.datetime.min
         end_date = end_date or datetime.datetime.max
 
-        deferred = []
-        for rec in matching_hashes.values():
+        # Records are selected by their fields first, so that their specs are created only if
+        # the query spec needs to be checked against them
+        def selected(rec: InstallRecord) -> bool:
             if origin and not (origin == rec.origin):
-                continue
+                return False
 
             if not rec.install_type_matches(installed):
-                continue
+                return False
 
             if in_buildcache is not None and rec.in_buildcache != in_buildcache:
-                continue
+                return False
 
             if explicit is not None and rec.explicit != explicit:
-                continue
+                return False
 
             if predicate_fn is not None and not predicate_fn(rec):
-                continue
+                return False
 
             if start_date or end_date:
                 inst_date = datetime.datetime.fromtimestamp(rec.installation_time)
                 if not (start_date < inst_date < end_date):
-                    continue
+                    return False
 
-            if query_spec is None or query_spec.concrete:
-                results.append(rec.spec)
-                continue
+            return True
 
-            # check anon specs and exact name matches first
-            if not query_spec.name or rec.spec.name == query_spec.name:
-                if rec.spec.satisfies(query_spec):
-                    results.append(rec.spec)
+        if query_spec is None or query_spec.concrete:
+            return [rec.spec for rec in matching_hashes.values() if selected(rec)]
 
-            # save potential virtual matches for later, but not if we already found a match
-            elif not results:
-                deferred.append(rec.spec)
+        # check anon specs
+        if not query_spec.name:
+            return [
+                rec.spec
+                for rec in matching_hashes.values()
+                if selected(rec) and rec.spec.satisfies(query_spec)
+            ]
+
+        # check exact name matches first
+        named = self._keys_named(query_spec.name)
+        results = [
+            matching_hashes[h].spec
+            for h in named
+            if h in matching_hashes
+            and selected(matching_hashes[h])
+            and matching_hashes[h].spec.satisfies(query_spec)
+        ]
 
         # Checking for virtuals is expensive, so we save it for last and only if needed.
         # If we get here, we didn't find anything in the DB that matched by name.
         # If we did fine something, the query spec can't be virtual b/c we matched an actual
         # package installation, so skip the virtual check entirely. If we *didn't* find anything,
-        # check all the deferred specs *if* the query is virtual.
-        if (
-            not results
-            and query_spec is not None
-            and deferred
-            and spack.repo.PATH.is_virtual(query_spec.name)
-        ):
-            results = [spec for spec in deferred if spec.satisfies(query_spec)]
+        # check all the other specs *if* the query is virtual.
+        if results:
+            return results
+
+        deferred = [
+            rec
+            for rec in matching_hashes.values()
+            if rec.name != query_spec.name and selected(rec)
+        ]
+        if deferred and spack.repo.PATH.is_virtual(query_spec.name):
+            results = [rec.spec for rec in deferred if rec.spec.satisfies(query_spec)]
 
         return results
 
@@ -0,0 +1,202 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+"""Index of the dependencies declared by each package, used to compute the graph of possible
+dependencies without loading package classes."""
+import copy
+import inspect
+import os
+from typing import Any, Dict, List, Optional, Set
+
+import spack.error
+import spack.paths
+import spack.spec
+import spack.util.spack_json as sjson
+
+#: Type of the entry of a single package in the index
+PackageEntry = Dict[str, Any]
+
+
+class DependencyIndex:
+    """Maps package names to their dependencies and unconditional requirements.
+
+    For each package the index stores:
+
+    * ``dependencies``: a mapping from the name of each dependency, possibly virtual, to the
+      ``when=`` conditions under which it is declared, and for each condition the list of
+      dependency type flags.
+    * ``requirements``: the specs in each unconditional ``requires()`` directive.
+    * ``sources``: the modification time of the files defining the base classes of the package,
+      like build systems or other packages, by path. Files in Spack itself are not recorded.
+
+    The modification times of all the recorded files are also stored together, in the header of
+    the serialized index, so that a cached index can be validated without going through every
+    package.
+
+    Conditions and requirements are stored as strings, and are meant to be parsed only when
+    needed.
+    """
+
+    def __init__(
+        self,
+        repository,
+        data: Optional[Dict[str, PackageEntry]] = None,
+        sources: Optional[Dict[str, Optional[float]]] = None,
+    ) -> None:
+        self.repository = repository
+        self._packages: Dict[str, PackageEntry] = data if data is not None else {}
+        #: modification times of the base class files of all packages, as read from the header
+        self._sources = sources
+        self._mtimes: Dict[str, Optional[float]] = {}
+
+    def __contains__(self, pkg_name: str) -> bool:
+        return pkg_name in self._packages
+
+    def dependencies(self, pkg_name: str) -> Dict[str, Dict[str, List[int]]]:
+        """Returns the dependencies of a package, as a mapping from the name of the dependency
+        to the conditions under which it applies, and their dependency type flags.
+
+        Args:
+            pkg_name: name of the package
+        """
+        return self._entry(pkg_name)["dependencies"]
+
+    def requirements(self, pkg_name: str) -> List[List[str]]:
+        """Returns the unconditional requirements of a package, as a list of specs for each
+        ``requires()`` directive.
+
+        Args:
+            pkg_name: name of the package
+        """
+        return self._entry(pkg_name)["requirements"]
+
+    def _entry(self, pkg_name: str) -> PackageEntry:
+        try:
+            return self._packages[pkg_name]
+        except KeyError:
+            # Packages are loaded on demand, if they are not in the index
+            import spack.repo
+
+            if not self.repository.exists(pkg_name):
+                raise spack.repo.UnknownPackageError(pkg_name)
+            self.update_package(pkg_name)
+            return self._packages[pkg_name]
+
+    def to_json(self, stream) -> None:
+        sjson.dump({"sources": self._all_sources(), "dependencies": self._packages}, stream)
+
+    @staticmethod
+    def from_json(stream, repository) -> "DependencyIndex":
+        d = sjson.load(stream)
+
+        if not isinstance(d, dict):
+            raise DependencyIndexError("DependencyIndex data was not a dict.")
+
+        if "dependencies" not in d:
+            raise DependencyIndexError("DependencyIndex data does not start with 'dependencies'")
+
+        return DependencyIndex(
+            repository=repository, data=d["dependencies"], sources=d.get("sources")
+        )
+
+    def copy(self) -> "DependencyIndex":
+        """Return a deep copy of this index."""
+        return DependencyIndex(repository=self.repository, data=copy.deepcopy(self._packages))
+
+    def merge(self, other: "DependencyIndex") -> None:
+        """Merge another dependency index into this one. Packages in the other index take
+        precedence over packages with the same name in this one.
+
+        Args:
+            other: dependency index to be merged
+        """
+        self._packages.update(other.copy()._packages)
+
+    def _mtime(self, path: str) -> Optional[float]:
+        if path not in self._mtimes:
+            try:
+                self._mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                self._mtimes[path] = None
+        return self._mtimes[path]
+
+    def _all_sources(self) -> Dict[str, Optional[float]]:
+        """Returns the modification times of the base class files of all packages. Files
+        recorded with different times by different packages are mapped to None, so that they
+        are always checked package by package."""
+        result: Dict[str, Optional[float]] = {}
+        for entry in self._packages.values():
+            for path, mtime in entry["sources"].items():
+                result[path] = mtime if result.get(path, mtime) == mtime else None
+        return result
+
+    def outdated_packages(self) -> Set[str]:
+        """Returns the packages that need to be updated, because a file defining one of their
+        base classes changed since they were indexed.
+
+        Only the files in the header of the index are checked, unless some of them changed.
+        """
+        if self._sources is None:
+            # Indexes written before the header was introduced don't record base classes
+            return set(self._packages)
+
+        changed = [path for path, mtime in self._sources.items() if self._mtime(path) != mtime]
+        if not changed:
+            return set()
+
+        return {
+            pkg_name
+            for pkg_name, entry in self._packages.items()
+            if any(
+                path in entry["sources"] and self._mtime(path) != entry["sources"][path]
+                for path in changed
+            )
+        }
+
+    def update_package(self, pkg_name: str) -> None:
+        """Updates a package in the dependency index.
+
+        Args:
+            pkg_name: name of the package to be updated
+        """
+        if not self.repository.exists(pkg_name):
+            self._packages.pop(pkg_name, None)
+            return
+
+        pkg_cls = self.repository.get_pkg_class(pkg_name)
+        dependencies: Dict[str, Dict[str, List[int]]] = {}
+        for name, conditions in pkg_cls.dependencies_by_name(when=True).items():
+            dependencies[name] = {
+                str(when_spec): [dep.depflag for dep in deps]
+                for when_spec, deps in conditions.items()
+            }
+
+        # Restrict to unconditional requirements
+        no_condition = spack.spec.Spec()
+        requirements = [
+            [str(x) for x in group]
+            for when_spec, groups in pkg_cls.requirements.items()
+            if when_spec == no_condition
+            for group, _, _ in groups
+        ]
+
+        # Dependencies may be inherited from base classes defined in other files
+        sources: Dict[str, Optional[float]] = {}
+        for cls in pkg_cls.__mro__[1:]:
+            try:
+                path = inspect.getsourcefile(cls)
+            except TypeError:
+                continue
+            if path and not path.startswith(spack.paths.lib_path):
+                self._mtimes.pop(path, None)
+                sources[path] = self._mtime(path)
+
+        self._packages[pkg_name] = {
+            "dependencies": dependencies,
+            "requirements": requirements,
+            "sources": sources,
+        }
+
+
+class DependencyIndexError(spack.error.SpackError):
+    """Raised when there is a problem with a DependencyIndex."""
@@ -1589,10 +1589,15 @@ def _concretize_together(self, tests: Union[bool, Sequence] = False) -> Sequence
         self.concretized_order = []
         self.specs_by_hash = {}
 
+        # Solve only for the part of the environment affected by the new user specs
+        incremental = kept_user_specs and spack.config.get("concretizer:incremental", False)
+        concretize_fn = (
+            spack.concretize.concretize_together_incrementally
+            if incremental
+            else spack.concretize.concretize_together
+        )
         try:
-            concretized_specs = spack.concretize.concretize_together(
-                specs_to_concretize, tests=tests
-            )
+            concretized_specs = concretize_fn(specs_to_concretize, tests=tests)
         except spack.error.UnsatisfiableSpecError as e:
             # "Enhance" the error message for multiple root specs, suggest a less strict
             # form of concretization.
@@ -25,23 +25,40 @@
 
 """
 
+import concurrent.futures
+import contextlib
 import copy
 import enum
 import glob
 import heapq
 import io
 import itertools
+import multiprocessing
+import multiprocessing.connection
 import os
 import shutil
+import statistics
 import sys
 import tempfile
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 from gzip import GzipFile
-from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+from typing import (
+    Callable,
+    ContextManager,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import spack.binary_distribution as binary_distribution
 import spack.build_environment
+import spack.build_history
 import spack.builder
 import spack.config
 import spack.database
@@ -57,11 +74,17 @@
 import spack.repo
 import spack.report
 import spack.rewiring
+import spack.scheduling
 import spack.spec
+import spack.stage
 import spack.store
 import spack.util.executable
+import spack.util.jobserver
+import spack.util.memory
 import spack.util.path
+import spack.util.prefetch
 import spack.util.timer as timer
+import spack.version
 from spack.llnl.string import ordinal
 from spack.llnl.util.lang import pretty_seconds
 from spack.llnl.util.tty.color import colorize
@@ -77,6 +100,18 @@
 
 _FAIL_FAST_ERR = "Terminating after first install failure"
 
+#: Seconds to wait before retrying tasks that were requeued, because another process holds
+#: the lock on their prefix
+_REQUEUE_DELAY = 0.1
+
+#: Number of ready tasks looked at for one that fits in the memory budget, when the first one
+#: doesn't
+_MEMORY_LOOKAHEAD = 8
+
+#: Number of times a task that doesn't fit in the memory budget can be overtaken by smaller
+#: tasks, before it is waited for
+_MAX_OVERTAKES = 4
+
 
 class BuildStatus(enum.Enum):
     """Different build (task) states."""
@@ -105,7 +140,9 @@ def __str__(self):
         return f"{self.name.lower()}"
 
 
-def _write_timer_json(pkg, timer, cache):
+def _write_timer_json(pkg, timer, cache, jobs=None, resources=None, history=True):
+    """Writes the install times of a package in its prefix, and unless ``history`` is False,
+    records them with the resource usage of the build in the build history of the store."""
     extra_attributes = {"name": pkg.name, "cache": cache, "hash": pkg.spec.dag_hash()}
     try:
         with open(pkg.times_log_path, "w", encoding="utf-8") as timelog:
@@ -114,6 +151,15 @@ def _write_timer_json(pkg, timer, cache):
         tty.debug(str(e))
         return
 
+    if not history:
+        return
+
+    record = spack.build_history.make_record(pkg.spec, timer, cache, jobs, resources)
+    try:
+        spack.store.STORE.build_history.add(record)
+    except OSError as e:
+        tty.debug(f"Cannot record the build of {pkg.spec.short_spec} in the history: {e}")
+
 
 class ExecuteResult(enum.Enum):
     # Task succeeded
@@ -354,6 +400,10 @@ def print_install_test_log(pkg: "spack.package_base.PackageBase") -> None:
     pkg.tester.print_log_path()
 
 
+def _gigabytes(size: float) -> str:
+    return f"{size / 1024**3:.1f} GB"
+
+
 def _print_timer(pre: str, pkg_id: str, timer: timer.BaseTimer) -> None:
     phases = [f"{p.capitalize()}: {_hms(timer.duration(p))}." for p in timer.phases]
     phases.append(f"Total: {_hms(timer.duration())}")
@@ -361,7 +411,10 @@ def _print_timer(pre: str, pkg_id: str, timer: timer.BaseTimer) -> None:
 
 
 def _install_from_cache(
-    pkg: "spack.package_base.PackageBase", explicit: bool, unsigned: Optional[bool] = False
+    pkg: "spack.package_base.PackageBase",
+    explicit: bool,
+    unsigned: Optional[bool] = False,
+    tarball_stage: Optional["spack.stage.Stage"] = None,
 ) -> bool:
     """
     Install the package from binary cache
@@ -371,25 +424,39 @@ def _install_from_cache(
         explicit: ``True`` if installing the package was explicitly
             requested by the user, otherwise, ``False``
         unsigned: if ``True`` or ``False`` override the mirror signature verification defaults
+        tarball_stage: stage of the binary package, if it was already downloaded
 
     Return: ``True`` if the package was extract from binary cache, ``False`` otherwise
     """
     t = timer.Timer()
-    installed_from_cache = _try_install_from_binary_cache(
-        pkg, explicit, unsigned=unsigned, timer=t
-    )
+    if tarball_stage is None:
+        installed_from_cache = _try_install_from_binary_cache(
+            pkg, explicit, unsigned=unsigned, timer=t
+        )
+    else:
+        installed_from_cache = _process_binary_cache_tarball(
+            pkg, explicit, unsigned, timer=t, tarball_stage=tarball_stage
+        )
     if not installed_from_cache:
         return False
     t.stop()
 
+    _finish_install_from_cache(pkg, explicit, t)
+    return True
+
+
+def _finish_install_from_cache(
+    pkg: "spack.package_base.PackageBase", explicit: bool, timer: timer.BaseTimer
+) -> None:
+    """Records the install times, and runs the post-install hooks, of a package that was
+    extracted from a binary cache and added to the database."""
     pkg_id = package_id(pkg.spec)
     tty.debug(f"Successfully extracted {pkg_id} from binary cache")
 
-    _write_timer_json(pkg, t, True)
-    _print_timer(pre=_log_prefix(pkg.name), pkg_id=pkg_id, timer=t)
+    _write_timer_json(pkg, timer, True)
+    _print_timer(pre=_log_prefix(pkg.name), pkg_id=pkg_id, timer=timer)
     _print_installed_pkg(pkg.spec.prefix)
     spack.hooks.post_install(pkg.spec, explicit)
-    return True
 
 
 def _process_external_package(pkg: "spack.package_base.PackageBase", explicit: bool) -> None:
@@ -439,6 +506,7 @@ def _process_binary_cache_tarball(
     unsigned: Optional[bool],
     mirrors_for_spec: Optional[list] = None,
     timer: timer.BaseTimer = timer.NULL_TIMER,
+    tarball_stage: Optional["spack.stage.Stage"] = None,
 ) -> bool:
     """
     Process the binary cache tarball.
@@ -450,22 +518,42 @@ def _process_binary_cache_tarball(
         mirrors_for_spec: Optional list of concrete specs and mirrors
         obtained by calling binary_distribution.get_mirrors_for_spec().
         timer: timer to keep track of binary install phases.
+        tarball_stage: stage of the binary package, if it was already downloaded
 
     Return:
         bool: ``True`` if the package was extracted from binary cache,
             else ``False``
     """
-    with timer.measure("fetch"):
-        tarball_stage = binary_distribution.download_tarball(
-            pkg.spec.build_spec, unsigned, mirrors_for_spec
-        )
+    if tarball_stage is None:
+        with timer.measure("fetch"):
+            tarball_stage = binary_distribution.download_tarball(
+                pkg.spec.build_spec, unsigned, mirrors_for_spec
+            )
 
         if tarball_stage is None:
             return False
 
     tty.msg(f"Extracting {package_id(pkg.spec)} from binary cache")
 
-    with timer.measure("install"), spack.util.path.filter_padding():
+    with timer.measure("install"):
+        _extract_binary_cache_tarball(pkg, tarball_stage, timer=timer)
+        _register_binary_cache_install(pkg, explicit)
+        return True
+
+
+def _extract_binary_cache_tarball(
+    pkg: "spack.package_base.PackageBase",
+    tarball_stage: "spack.stage.Stage",
+    timer: timer.BaseTimer = timer.NULL_TIMER,
+) -> None:
+    """Extracts and relocates a downloaded binary package into the prefix of the package.
+
+    Args:
+        pkg: the package being installed
+        tarball_stage: stage of the downloaded binary package, destroyed when done
+        timer: timer to keep track of binary install phases.
+    """
+    with spack.util.path.filter_padding():
         binary_distribution.extract_tarball(pkg.spec, tarball_stage, force=False, timer=timer)
 
         if pkg.spec.spliced:  # overwrite old metadata with new
@@ -476,9 +564,48 @@ def _process_binary_cache_tarball(
         if hasattr(pkg, "_post_buildcache_install_hook"):
             pkg._post_buildcache_install_hook()
 
-        pkg.installed_from_binary_cache = True
-        spack.store.STORE.db.add(pkg.spec, explicit=explicit)
-        return True
+
+def _register_binary_cache_install(pkg: "spack.package_base.PackageBase", explicit: bool) -> None:
+    """Adds a package extracted from a binary cache to the database."""
+    pkg.installed_from_binary_cache = True
+    spack.store.STORE.db.add(pkg.spec, explicit=explicit)
+
+
+def _prefetch_sources(
+    pkg: "spack.package_base.PackageBase",
+) -> Optional["spack.package_base.PackageBase"]:
+    """Fetches and checksums the sources, resources and patches of a package into its stage,
+    ahead of its build. This runs in a background thread, so it is best effort: packages that
+    would need the user to confirm the fetch are skipped, and errors are left to the build to
+    report when it fetches again.
+
+    Returns the package if its stage was created here, so that it can be removed if the package
+    is not built, or None otherwise.
+    """
+    spec = pkg.spec
+    if not pkg.has_code or spec.external or "dev_path" in spec.variants or pkg.manual_download:
+        return None
+
+    # Same checks as in do_fetch, which would prompt the user from a background thread
+    if (
+        spack.config.get("config:checksum")
+        and pkg.version not in pkg.versions
+        and not isinstance(pkg.version, spack.version.GitVersion)
+    ):
+        return None
+
+    if not spack.config.get("config:deprecated") and pkg.versions.get(pkg.version, {}).get(
+        "deprecated", False
+    ):
+        return None
+
+    created = False
+    try:
+        created = not os.path.exists(pkg.stage.path)
+        pkg.do_fetch()
+    except Exception as e:
+        tty.debug(f"Failed to prefetch the sources of {package_id(spec)}: {e}")
+    return pkg if created else None
 
 
 def _try_install_from_binary_cache(
@@ -978,6 +1105,14 @@ def __init__(
             pkg_id for pkg_id in self.dependencies if pkg_id not in installed
         )
 
+        # Estimated time of the longest chain of builds from this task to the end of the
+        # installation, used to start tasks on the critical path first.
+        self.rank = 0.0
+
+        # Estimated peak memory, in bytes, of the task while it runs, used to start tasks
+        # only when they fit in the memory budget of concurrent builds.
+        self.memory = 0.0
+
         # Ensure key sequence-related properties are updated accordingly.
         self.attempts = attempts
         self._update()
@@ -993,6 +1128,12 @@ def poll(self) -> bool:
         """Check if child process has information ready to receive."""
         raise NotImplementedError
 
+    def waitables(self) -> list:
+        """Objects that become ready for ``multiprocessing.connection.wait()`` when the
+        task has information ready to receive. Tasks that don't run in a child process
+        are ready as soon as they're started, and return an empty list."""
+        return []
+
     def complete(self) -> ExecuteResult:
         """Complete the work of this task."""
         raise NotImplementedError
@@ -1181,9 +1322,9 @@ def cache_only(self) -> bool:
             return self.request.install_args.get("dependencies_cache_only", _cache_only)
 
     @property
-    def key(self) -> Tuple[int, int]:
-        """The key is the tuple (# uninstalled dependencies, sequence)."""
-        return (self.priority, self.sequence)
+    def key(self) -> Tuple[int, float, int]:
+        """The key is the tuple (# uninstalled dependencies, -rank, sequence)."""
+        return (self.priority, -self.rank, self.sequence)
 
     def next_attempt(self, installed) -> "Task":
         """Create a new, updated task for the next installation attempt."""
@@ -1234,6 +1375,17 @@ class BuildTask(Task):
     no_op: bool = False
     tmpdir = None
     backup_dir = None
+    #: Download of the binary package, if the installer started it in the background. The
+    #: installer keeps it until the task extracts it.
+    prefetched_binary: Optional[concurrent.futures.Future] = None
+    #: Whether the prefetched binary package was extracted, or its extraction started
+    prefetched_binary_used: bool = False
+    #: Whether a prefetched binary package is extracted in a child process
+    extract_in_subprocess: bool = False
+    #: Timer of the installation from a binary cache, when it happens in a child process
+    binary_timer: Optional[timer.Timer] = None
+    #: Returns the context in which the task forks its child process, if it needs one
+    fork_context: Optional[Callable[[], ContextManager]] = None
 
     def start(self):
         """Attempt to use the binary cache to install
@@ -1261,12 +1413,17 @@ def start(self):
 
         # Use the binary cache to install if requested,
         # save result to be handled in BuildTask.complete()
-        # TODO: change binary installs to occur in subprocesses rather than the main Spack process
+        # TODO: change binary installs that are not prefetched to occur in subprocesses rather
+        # than the main Spack process
         if self.use_cache:
-            if _install_from_cache(pkg, self.explicit, unsigned):
+            if self.prefetched_binary is not None:
+                if self._install_prefetched_binary():
+                    return
+            elif _install_from_cache(pkg, self.explicit, unsigned):
                 self.success_result = ExecuteResult.SUCCESS
                 return
-            elif self.cache_only:
+
+            if self.cache_only:
                 self.error_result = spack.error.InstallError(
                     "No binary found when cache-only was specified", pkg=pkg
                 )
@@ -1284,11 +1441,43 @@ def start(self):
         self._setup_install_dir(pkg)
 
         # Create a child process to do the actual installation.
-        self.process_handle = spack.build_environment.start_build_process(
-            self.pkg, build_process, self.request.install_args
+        self._start_build_process(build_process, self.request.install_args)
+
+    def _install_prefetched_binary(self) -> bool:
+        """Installs the binary package that was downloaded in the background, either in this
+        process or in a child process.
+
+        Return: ``True`` if the installation was started, ``False`` if there is no binary package
+        """
+        assert self.prefetched_binary is not None
+        tarball_stage = self.prefetched_binary.result()
+        if tarball_stage is None:
+            return False
+
+        # Extraction destroys the stage, whether it succeeds or not
+        self.prefetched_binary_used = True
+        if not self.extract_in_subprocess:
+            _install_from_cache(self.pkg, self.explicit, tarball_stage=tarball_stage)
+            self.success_result = ExecuteResult.SUCCESS
+            return True
+
+        tty.msg(f"Extracting {self.pkg_id} from binary cache")
+        self.binary_timer = timer.Timer()
+        self.binary_timer.start("install")
+
+        # Relocation is CPU bound, so it happens in a child process that can run alongside
+        # the extraction of other binary packages, and of source builds
+        self._start_build_process(
+            extract_process, {"tarball_stage": tarball_stage, "build_environment": False}
         )
+        return True
 
-        # Identify the child process
+    def _start_build_process(self, function, kwargs) -> None:
+        """Starts the child process of the task, and identifies it."""
+        with self.fork_context() if self.fork_context else contextlib.nullcontext():
+            self.process_handle = spack.build_environment.start_build_process(
+                self.pkg, function, kwargs
+            )
         self.child_pid = self.process_handle.pid
 
     def poll(self):
@@ -1299,6 +1488,11 @@ def poll(self):
         ), "Can't call `poll()` before `start()` or identified no-operation task"
         return self.no_op or self.success_result or self.error_result or self.process_handle.poll()
 
+    def waitables(self) -> list:
+        # The read end of the pipe becomes ready when the child process sends its result,
+        # or when it exits, since the parent doesn't hold a handle to the writable end
+        return [self.process_handle.read_pipe] if self.process_handle else []
+
     def succeed(self):
         self.record.succeed()
 
@@ -1355,6 +1549,21 @@ def complete(self):
         if self.error_result is not None:
             self.fail(self.error_result)
 
+        # If the binary package was extracted in a child process, the parent adds it to the
+        # database and runs the post-install hooks
+        if self.binary_timer is not None:
+            try:
+                self.process_handle.complete()
+                self.binary_timer.stop("install")
+                _register_binary_cache_install(pkg, self.explicit)
+                self.binary_timer.stop()
+                _finish_install_from_cache(pkg, self.explicit, self.binary_timer)
+            except (Exception, KeyboardInterrupt, SystemExit) as e:
+                self.fail(e)
+
+            self.succeed()
+            return ExecuteResult.SUCCESS
+
         # hook that allows tests to inspect the Package before installation
         # see unit_test_check() docs.
         if not pkg.unit_test_check():
@@ -1534,7 +1743,7 @@ def __init__(
         self.build_requests = [BuildRequest(pkg, install_args) for pkg in packages]
 
         # Priority queue of tasks
-        self.build_pq: List[Tuple[Tuple[int, int], Task]] = []
+        self.build_pq: List[Tuple[Tuple[int, float, int], Task]] = []
 
         # Mapping of unique package ids to task
         self.build_tasks: Dict[str, Task] = {}
@@ -1564,6 +1773,41 @@ def __init__(
         # Maximum number of concurrent packages to build
         self.max_active_tasks = self.concurrent_packages
 
+        # Time to install all the packages, predicted when ranking tasks
+        self.predicted_makespan: Optional[float] = None
+
+        # Number of tasks requeued, because another process holds the lock on their prefix
+        self.requeued = 0
+
+        # Memory, in bytes, that concurrent builds are expected to use at most, or None if
+        # tasks are started regardless of their memory usage
+        self.memory_budget: Optional[float] = None
+
+        # Peak memory of previous builds from source, keyed on the package name
+        self.peak_memory: Dict[str, float] = {}
+
+        # Unique ids of the packages that were held back, because they would exceed the budget
+        self.held_back: Set[str] = set()
+
+        # Number of times each held back task was overtaken by a smaller one, keyed on the
+        # package's unique id
+        self.overtaken: Dict[str, int] = {}
+
+        # Maximum number of binary packages and sources downloaded in the background
+        self.fetch_jobs: int = spack.config.get("config:fetch_jobs", default=4)
+
+        # Downloads of binary packages, keyed on the package's unique id, while installing
+        self.binary_prefetcher: Optional[spack.util.prefetch.Prefetcher] = None
+
+        # Unique ids of the packages whose binary download was started in the background
+        self.prefetched: Set[str] = set()
+
+        # Fetches of sources into the stage, keyed on the package's unique id, while installing
+        self.source_prefetcher: Optional[spack.util.prefetch.Prefetcher] = None
+
+        # Tasks whose sources may still be fetched in the background, in queue order
+        self.sources_pending: Optional[Deque[Task]] = None
+
         # Reports on install success/failure
         self.reports: Dict[str, spack.report.RequestRecord] = {}
         for build_request in self.build_requests:
@@ -2012,6 +2256,17 @@ def _pop_task(self) -> Task:
         task.status = BuildStatus.DEQUEUED
         return task
 
+    def _pop_queued_task(self, task: Task) -> Task:
+        """Pop a task, which need not be the first one, off the queue and return it."""
+        if self.build_pq and self.build_pq[0][1] is task:
+            return self._pop_task()
+
+        self.build_pq = [entry for entry in self.build_pq if entry[1] is not task]
+        heapq.heapify(self.build_pq)
+        del self.build_tasks[task.pkg_id]
+        task.status = BuildStatus.DEQUEUED
+        return task
+
     def _pop_ready_task(self) -> Optional[Task]:
         """
         Pop the first ready task off the queue and return it.
@@ -2114,6 +2369,7 @@ def _requeue_task(self, task: Task, install_status: InstallStatus) -> None:
         new_task = task.next_attempt(self.installed)
         new_task.status = BuildStatus.INSTALLING
         self._push_task(new_task)
+        self.requeued += 1
 
     def _update_failed(
         self, task: Task, mark: bool = False, exc: Optional[BaseException] = None
@@ -2211,6 +2467,138 @@ def _init_queue(self) -> None:
                     task.add_dependent(dependent_id)
         self.all_dependencies = all_dependencies
 
+        # The order in which ready tasks are started, and the memory they use, matter only if
+        # more than one can run
+        if self.max_active_tasks > 1:
+            self._rank_tasks()
+            self._init_memory_budget()
+
+    def _init_memory_budget(self) -> None:
+        """Set the memory budget of concurrent builds, and the peak memory of the previous
+        builds of each package."""
+        budget = spack.config.get("config:memory_budget", None)
+        if budget is not None:
+            self.memory_budget = budget * 1024**3
+        else:
+            self.memory_budget = spack.util.memory.memory_available()
+
+        if self.memory_budget is None:
+            return
+
+        names = {task.pkg.name for task in self.build_tasks.values()}
+        self.peak_memory = spack.store.STORE.build_history.peak_memory(names)
+        tty.debug(
+            f"Memory budget of {_gigabytes(self.memory_budget)}, peak memory known for "
+            f"{len(self.peak_memory)} of {len(names)} packages"
+        )
+
+    def _estimated_memory(self, task: Task) -> float:
+        """Returns the peak memory, in bytes, that a task is expected to use."""
+        if (
+            not isinstance(task, BuildTask)
+            or task.pkg.spec.external
+            or task.pkg.spec.installed_upstream
+            or task.pkg_id in self.installed
+        ):
+            return 0.0
+
+        # Installing from a binary cache doesn't need much memory
+        if self.binary_prefetcher is not None:
+            future = self.binary_prefetcher.peek(task.pkg_id)
+            if future is not None and future.done() and not future.exception():
+                if future.result() is not None:
+                    return 0.0
+
+        return self.peak_memory.get(task.pkg.name, 0.0)
+
+    def _fits_in_memory(self, task: Task, active_tasks: List[Task]) -> bool:
+        """Returns whether a task can start without the peak memory of the active tasks
+        exceeding the memory budget. A task can always start when no other task is active."""
+        if self.memory_budget is None:
+            return True
+
+        task.memory = self._estimated_memory(task)
+        in_use = sum(x.memory for x in active_tasks)
+        if not active_tasks or in_use + task.memory <= self.memory_budget:
+            return True
+
+        if task.pkg_id not in self.held_back:
+            self.held_back.add(task.pkg_id)
+            tty.verbose(
+                f"Waiting to install {task.pkg_id}, whose builds peaked at "
+                f"{_gigabytes(task.memory)}: {_gigabytes(in_use)} of the memory budget of "
+                f"{_gigabytes(self.memory_budget)} are used by active builds"
+            )
+        return False
+
+    def _pop_task_that_fits(self, active_tasks: List[Task]) -> Optional[Task]:
+        """Pop the first ready task that fits in the memory budget off the queue and return it.
+
+        Return None if no ready task fits. The first ``_MEMORY_LOOKAHEAD`` ready tasks are
+        looked at, so that a large task doesn't hold back smaller ones. Tasks that were
+        overtaken ``_MAX_OVERTAKES`` times are waited for instead, so that they don't starve.
+        """
+        if not self._peek_ready_task():
+            return None
+
+        skipped: List[Task] = []
+        for _, task in heapq.nsmallest(_MEMORY_LOOKAHEAD, self.build_pq):
+            if task.priority != 0:
+                break
+
+            if task.status == BuildStatus.REMOVED:
+                continue
+
+            if self._fits_in_memory(task, active_tasks):
+                for held in skipped:
+                    self.overtaken[held.pkg_id] = self.overtaken.get(held.pkg_id, 0) + 1
+                return self._pop_queued_task(task)
+
+            if self.overtaken.get(task.pkg_id, 0) >= _MAX_OVERTAKES:
+                break
+
+            skipped.append(task)
+        return None
+
+    def _rank_tasks(self) -> None:
+        """Rank tasks by their position on the critical path of the installation, so that ready
+        tasks starting the longest chains of builds are started first."""
+        tasks = {
+            pkg_id: task
+            for pkg_id, task in self.build_tasks.items()
+            if task.status != BuildStatus.REMOVED
+        }
+        history = spack.scheduling.estimated_build_times(
+            (task.pkg.name for task in tasks.values()), spack.store.STORE
+        )
+        default = (
+            statistics.median(history.values()) if history else spack.scheduling.DEFAULT_BUILD_TIME
+        )
+        durations = {
+            pkg_id: (
+                0.0
+                if pkg_id in self.installed or task.pkg.spec.external
+                else history.get(task.pkg.name, default)
+            )
+            for pkg_id, task in tasks.items()
+        }
+        dependents = {pkg_id: task.dependents & tasks.keys() for pkg_id, task in tasks.items()}
+        ranks = spack.scheduling.critical_path_ranks(dependents, durations)
+        for pkg_id, task in tasks.items():
+            task.rank = ranks[pkg_id]
+
+        self.build_pq = [(task.key, task) for _, task in self.build_pq]
+        heapq.heapify(self.build_pq)
+
+        if history:
+            self.predicted_makespan = spack.scheduling.predicted_makespan(
+                dependents, durations, ranks, self.max_active_tasks
+            )
+        tty.debug(
+            f"Build times known for {len(history)} of {len(tasks)} packages, "
+            f"critical path of {pretty_seconds(max(ranks.values(), default=0.0))}"
+        )
+
     def start_task(
         self, task: Task, install_status: InstallStatus, term_status: TermStatusLine
     ) -> None:
@@ -2316,8 +2704,30 @@ def start_task(
         action = task.install_action
 
         if action in (InstallAction.INSTALL, InstallAction.OVERWRITE):
-            # Start a child process for a task that's ready to be installed.
-            task.start()
+            if self.binary_prefetcher is not None and isinstance(task, BuildTask):
+                # The download is claimed only once the task uses it, so that it's kept for the
+                # next attempt if the task is requeued before
+                task.prefetched_binary = self.binary_prefetcher.peek(pkg_id)
+                task.prefetched_binary_used = False
+                task.extract_in_subprocess = self.max_active_tasks > 1
+                if task.prefetched_binary is not None:
+                    concurrent.futures.wait([task.prefetched_binary])
+
+            if self.source_prefetcher is not None:
+                future = self.source_prefetcher.claim(pkg_id)
+                if future is not None and not future.cancel():
+                    # The build must not use the stage while it's being fetched
+                    concurrent.futures.wait([future])
+
+            # Start a task that's ready to be installed. No download starts in the background
+            # while it forks its child process, while the running ones go on.
+            if isinstance(task, BuildTask):
+                task.fork_context = self._prefetchers_paused
+            try:
+                task.start()
+            finally:
+                if isinstance(task, BuildTask) and task.prefetched_binary is not None:
+                    self._release_prefetched_binary(task)
             tty.msg(install_msg(pkg_id, self.pid, install_status))
 
     def complete_task(self, task: Task, install_status: InstallStatus) -> Optional[Tuple]:
@@ -2408,8 +2818,187 @@ def complete_task(self, task: Task, install_status: InstallStatus) -> Optional[T
     def install(self) -> None:
         """Install the requested package(s) and/or associated dependencies."""
         # ensure that build processes do not permanently bork terminal settings
-        with preserve_terminal_settings(sys.stdin):
-            self._install()
+        with preserve_terminal_settings(sys.stdin), self._jobserver(), self._prefetching():
+            with self._database_writes():
+                self._install()
+
+    def _database_writes(self):
+        """Returns a context in which installed packages are written to the database in batches,
+        if configured, or a null context."""
+        batch = spack.config.get("config:db_write_batch")
+        if not batch:
+            return contextlib.nullcontext()
+        return spack.store.STORE.db.batched_writes(
+            max_writes=batch.get("installs", 16), max_seconds=batch.get("seconds", 30)
+        )
+
+    def _jobserver(self):
+        """Returns a context hosting a jobserver, that limits the jobs of concurrent builds to
+        the number of build jobs, or a null context if it's not needed."""
+        if (
+            self.max_active_tasks <= 1
+            or sys.platform == "win32"
+            or spack.build_environment.jobserver_enabled()
+            # Build processes need to inherit the file descriptors of the jobserver
+            or multiprocessing.get_start_method() != "fork"
+        ):
+            return contextlib.nullcontext()
+
+        jobs = spack.config.determine_number_of_jobs(parallel=True)
+        tty.debug(f"Sharing {jobs} jobs among {self.max_active_tasks} concurrent builds")
+        return spack.util.jobserver.JobServer(jobs)
+
+    @contextlib.contextmanager
+    def _prefetching(self):
+        """Context in which binary packages and sources are downloaded in the background, while
+        earlier packages are being installed."""
+        if self.fetch_jobs <= 0:
+            yield
+            return
+
+        uses_cache = any(
+            request.install_args.get("package_use_cache", True)
+            or request.install_args.get("dependencies_use_cache", True)
+            for request in self.build_requests
+        )
+        if uses_cache and spack.mirrors.mirror.MirrorCollection(binary=True):
+            self.binary_prefetcher = spack.util.prefetch.Prefetcher(
+                self.fetch_jobs, cleanup=lambda stage: stage.destroy()
+            )
+        # Sources are fetched in the background only on request
+        if spack.config.get("config:prefetch_sources", default=False):
+            self.source_prefetcher = spack.util.prefetch.Prefetcher(
+                self.fetch_jobs, cleanup=lambda pkg: pkg.stage.destroy()
+            )
+        try:
+            yield
+        finally:
+            if self.source_prefetcher is not None:
+                self.source_prefetcher.shutdown()
+                self.source_prefetcher = None
+                self.sources_pending = None
+            if self.binary_prefetcher is not None:
+                self.binary_prefetcher.shutdown()
+                self.binary_prefetcher = None
+                self.prefetched.clear()
+
+    def _release_prefetched_binary(self, task: BuildTask) -> None:
+        """Forgets about the download of a binary package once a task started, if it was used,
+        or if there's no binary package to keep for a later attempt."""
+        binary = task.prefetched_binary
+        assert binary is not None and self.binary_prefetcher is not None
+        if (
+            task.prefetched_binary_used
+            or binary.exception() is not None
+            or binary.result() is None
+        ):
+            self.binary_prefetcher.claim(task.pkg_id)
+
+    @contextlib.contextmanager
+    def _prefetchers_paused(self):
+        """Context in which no download of a binary package or source starts in the background,
+        so that the process doesn't fork while a download thread is being set up. Downloads
+        that are running go on, so that forks don't wait for them. Processes that are spawned,
+        rather than forked, don't inherit the state of other threads, so nothing is held back
+        in that case."""
+        if multiprocessing.get_start_method() != "fork":
+            yield
+            return
+
+        with contextlib.ExitStack() as stack:
+            for prefetcher in (self.binary_prefetcher, self.source_prefetcher):
+                if prefetcher is not None:
+                    stack.enter_context(prefetcher.paused())
+            yield
+
+    def _prefetch_binaries(self) -> None:
+        """Starts downloading the binary packages of the tasks at the front of the queue, i.e.
+        the tasks that are ready, or will be soon. Downloads that were not claimed yet are
+        limited to twice the number of download jobs."""
+        if self.binary_prefetcher is None:
+            return
+
+        window = 2 * self.fetch_jobs
+        if len(self.binary_prefetcher) >= window:
+            return
+
+        for _, task in heapq.nsmallest(window, self.build_pq):
+            if len(self.binary_prefetcher) >= window:
+                break
+
+            if (
+                task.pkg_id in self.prefetched
+                or task.status == BuildStatus.REMOVED
+                or not isinstance(task, BuildTask)
+                or not task.use_cache
+                or task.install_action != InstallAction.INSTALL
+                or task.pkg.spec.external
+                or task.pkg.spec.installed_upstream
+                or task.pkg_id in self.installed
+            ):
+                continue
+
+            spec = task.pkg.spec
+            tty.debug(f"Searching for binary cache of {task.pkg_id}")
+            matches = binary_distribution.get_mirrors_for_spec(spec, index_only=True)
+            self.binary_prefetcher.submit(
+                task.pkg_id,
+                binary_distribution.download_tarball,
+                spec.build_spec,
+                task.request.install_args.get("unsigned"),
+                matches,
+            )
+            self.prefetched.add(task.pkg_id)
+
+    def _prefetch_sources(self) -> None:
+        """Starts fetching the sources of the tasks in the queue that will be built from source,
+        in queue order. Tasks that may be installed from a binary package are considered once its
+        download failed, and stop the search if their download didn't start yet."""
+        if self.source_prefetcher is None:
+            return
+
+        # Tasks are considered once, so they are sorted only the first time
+        if self.sources_pending is None:
+            self.sources_pending = deque(task for _, task in sorted(self.build_pq))
+
+        # Tasks whose binary package is being downloaded are considered again later
+        waiting: List[Task] = []
+        while self.sources_pending:
+            task = self.sources_pending[0]
+            if (
+                task.status == BuildStatus.REMOVED
+                or not isinstance(task, BuildTask)
+                or task.started
+                or task.install_action != InstallAction.INSTALL
+                or task.request.install_args.get("fake")
+                or task.cache_only
+                or task.pkg.spec.external
+                or task.pkg.spec.installed_upstream
+                or task.pkg_id in self.installed
+            ):
+                self.sources_pending.popleft()
+                continue
+
+            if task.use_cache and self.binary_prefetcher is not None:
+                if task.pkg_id not in self.prefetched:
+                    # not known yet whether the package will be built from source, nor are the
+                    # packages after it, whose download starts later
+                    break
+                binary = self.binary_prefetcher.peek(task.pkg_id)
+                if binary is not None and not binary.done():
+                    waiting.append(self.sources_pending.popleft())
+                    continue
+                if binary is None or binary.exception() is None and binary.result() is not None:
+                    self.sources_pending.popleft()
+                    continue
+
+            # Fetch with a package of its own, so that lazily computed attributes of the task's
+            # package, like its stage and patches, are not shared with the background thread
+            self.sources_pending.popleft()
+            pkg = task.pkg.spec.copy().package
+            self.source_prefetcher.submit(task.pkg_id, _prefetch_sources, pkg)
+
+        self.sources_pending.extendleft(reversed(waiting))
 
     def _install(self) -> None:
         """Helper with main implementation of ``install()``.
@@ -2430,13 +3019,19 @@ def _install(self) -> None:
             enabled=sys.stdout.isatty() and tty.msg_enabled() and not tty.is_debug()
         )
 
+        start_time = time.time()
+
         # While a task is ready or tasks are running
         while self._peek_ready_task() or active_tasks:
+            requeued = self.requeued
+            self._prefetch_binaries()
+            self._prefetch_sources()
+
             # While there's space for more active tasks to start
             while len(active_tasks) < self.max_active_tasks:
-                task = self._pop_ready_task()
+                task = self._pop_task_that_fits(active_tasks)
                 if not task:
-                    # no ready tasks
+                    # no ready tasks, or none fits until active tasks free memory
                     break
 
                 active_tasks.append(task)
@@ -2448,9 +3043,18 @@ def _install(self) -> None:
                     # handled in complete_task()
                     task.error_result = e
 
-            time.sleep(0.1)
-            # Check if any tasks have completed and add to list
+            # Check if any tasks have completed and add to list. If none has, block until a
+            # child process has information ready. Requeued tasks are retried after a delay,
+            # unless a child process gets ready first.
             done = [task for task in active_tasks if task.poll()]
+            if not done or self.requeued != requeued:
+                waitables = [x for task in active_tasks for x in task.waitables()]
+                if waitables:
+                    timeout = None if self.requeued == requeued else _REQUEUE_DELAY
+                    multiprocessing.connection.wait(waitables, timeout=timeout)
+                else:
+                    time.sleep(_REQUEUE_DELAY)
+                done = [task for task in active_tasks if task.poll()]
             try:
                 # Iterate through the done tasks and complete them
                 for task in done:
@@ -2466,6 +3070,12 @@ def _install(self) -> None:
                 active_tasks.clear()  # they're all done now
                 raise
 
+        if self.predicted_makespan is not None:
+            tty.verbose(
+                f"Installation took {pretty_seconds(time.time() - start_time)}, "
+                f"{pretty_seconds(self.predicted_makespan)} predicted from previous builds"
+            )
+
         self._clear_removed_tasks()
         if self.build_pq:
             task = self._pop_task()
@@ -2595,7 +3205,7 @@ def run(self) -> bool:
         stage = self.pkg.stage
         stage.keep = self.keep_stage
 
-        with stage:
+        with stage, spack.util.memory.PeakMemorySampler() as memory:
             if self.restage:
                 stage.destroy()
 
@@ -2636,7 +3246,12 @@ def run(self) -> bool:
 
             # Stop the timer and save results
             self.timer.stop()
-            _write_timer_json(self.pkg, self.timer, False)
+            jobs = spack.config.determine_number_of_jobs(parallel=self.pkg.parallel)
+            # Memory this process inherited from the installer is not used by the build
+            resources = spack.build_history.resource_usage(sampled_peak_rss=memory.growth)
+            _write_timer_json(
+                self.pkg, self.timer, False, jobs=jobs, resources=resources, history=not self.fake
+            )
 
         print_install_test_log(self.pkg)
         _print_timer(pre=self.pre, pkg_id=self.pkg_id, timer=self.timer)
@@ -2750,6 +3365,17 @@ def build_process(pkg: "spack.package_base.PackageBase", install_args: dict) ->
         return installer.run()
 
 
+def extract_process(pkg: "spack.package_base.PackageBase", install_args: dict) -> None:
+    """Extracts and relocates a downloaded binary package in a child process.
+
+    Args:
+        pkg: the package being installed
+        install_args: arguments to the child process, with the stage of the binary package
+            under ``tarball_stage``
+    """
+    _extract_binary_cache_tarball(pkg, install_args["tarball_stage"])
+
+
 def deprecate(spec: "spack.spec.Spec", deprecator: "spack.spec.Spec", link_fn) -> None:
     """Deprecate this package in favor of deprecator spec"""
     # Here we assume we don't deprecate across different stores, and that same hash
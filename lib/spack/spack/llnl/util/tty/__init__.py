@@ -8,6 +8,7 @@
 import struct
 import sys
 import textwrap
+import threading
 import traceback
 from datetime import datetime
 from sys import platform as _platform
@@ -30,6 +31,9 @@
 _output_filter = lambda s: s
 indent = "  "
 
+# Output suppressed in a single thread
+_thread_state = threading.local()
+
 
 def debug_level():
     return _debug
@@ -74,8 +78,12 @@ def set_error_enabled(flag):
     _error_enabled = flag
 
 
+def _thread_output_enabled():
+    return not getattr(_thread_state, "suppressed", False)
+
+
 def msg_enabled():
-    return _msg_enabled
+    return _msg_enabled and _thread_output_enabled()
 
 
 def warn_enabled():
@@ -98,6 +106,19 @@ def output_filter(filter_fn):
         _output_filter = saved_filter
 
 
+@contextlib.contextmanager
+def suppress_thread_output():
+    """Context manager that disables messages in the current thread only, e.g. in a background
+    thread whose progress would interleave with the output of the main thread. Warnings, errors
+    and debug messages are still printed."""
+    suppressed = getattr(_thread_state, "suppressed", False)
+    _thread_state.suppressed = True
+    try:
+        yield
+    finally:
+        _thread_state.suppressed = suppressed
+
+
 class SuppressOutput:
     """Class for disabling output in a scope using ``with`` keyword"""
 
@@ -214,7 +235,7 @@ def info(message, *args, **kwargs):
 
 def verbose(message, *args, **kwargs):
     """Print a verbose message if the verbose flag is set."""
-    if _verbose:
+    if _verbose and _thread_output_enabled():
         kwargs.setdefault("format", "c")
         info(message, *args, **kwargs)
 
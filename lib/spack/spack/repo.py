@@ -58,6 +58,7 @@
 from spack.llnl.util.filesystem import working_dir
 
 if TYPE_CHECKING:
+    import spack.dependency_index
     import spack.package_base
     import spack.patch
     import spack.spec
@@ -481,6 +482,15 @@ def needs_update(self, pkg) -> bool:
         """
         return False
 
+    def outdated_packages(self) -> Set[str]:
+        """Packages that need their index updated, even though their package files haven't
+        changed, e.g. because of other files they depend on.
+
+        This is checked every time a cached index is read, so it should not need to go through
+        every package when nothing changed.
+        """
+        return set()
+
     @abc.abstractmethod
     def read(self, stream):
         """Read this index from a provided file object."""
@@ -545,7 +555,7 @@ def _create(self) -> "spack.patch.PatchCache":
 
         return PatchCache(repository=self.repository)
 
-    def needs_update(self):
+    def needs_update(self, pkg) -> bool:
         # TODO: patches can change under a package and we should handle
         # TODO: it, but we currently punt. This should be refactored to
         # TODO: check whether patches changed each time a package loads,
@@ -564,6 +574,29 @@ def update(self, pkg_fullname):
         self.index.update_package(pkg_fullname)
 
 
+class DependencyIndexer(Indexer):
+    """Lifecycle methods for the index of package dependencies."""
+
+    def _create(self) -> "spack.dependency_index.DependencyIndex":
+        from spack.dependency_index import DependencyIndex
+
+        return DependencyIndex(self.repository)
+
+    def read(self, stream):
+        from spack.dependency_index import DependencyIndex
+
+        self.index = DependencyIndex.from_json(stream, self.repository)
+
+    def outdated_packages(self) -> Set[str]:
+        return self.index.outdated_packages()
+
+    def update(self, pkg_fullname):
+        self.index.update_package(pkg_fullname.split(".")[-1])
+
+    def write(self, stream):
+        self.index.to_json(stream)
+
+
 class RepoIndex:
     """Container class that manages a set of Indexers for a Repo.
 
@@ -642,21 +675,24 @@ def _build_index(self, name: str, indexer: Indexer):
             with self.cache.read_transaction(cache_filename) as f:
                 indexer.read(f)
 
-        else:
-            # Otherwise update it and rewrite the cache file
-            with self.cache.write_transaction(cache_filename) as (old, new):
-                indexer.read(old) if old else indexer.create()
+            # Packages may also need an update because of files other than their own
+            if not indexer.outdated_packages():
+                return indexer.index
+
+        # Otherwise update it and rewrite the cache file
+        with self.cache.write_transaction(cache_filename) as (old, new):
+            indexer.read(old) if old else indexer.create()
 
-                # Compute which packages needs to be updated **again** in case someone updated them
-                # while we waited for the lock
-                new_index_mtime = self.cache.mtime(cache_filename)
-                if new_index_mtime != index_mtime:
-                    needs_update = self.checker.modified_since(new_index_mtime)
+            # Compute which packages needs to be updated **again** in case someone updated them
+            # while we waited for the lock
+            new_index_mtime = self.cache.mtime(cache_filename)
+            if new_index_mtime != index_mtime:
+                needs_update = self.checker.modified_since(new_index_mtime)
 
-                for pkg_name in needs_update:
-                    indexer.update(f"{self.namespace}.{pkg_name}")
+            for pkg_name in set(needs_update) | indexer.outdated_packages():
+                indexer.update(f"{self.namespace}.{pkg_name}")
 
-                indexer.write(new)
+            indexer.write(new)
 
         return indexer.index
 
@@ -675,6 +711,7 @@ def __init__(self, *repos: "Repo") -> None:
         self._provider_index: Optional[spack.provider_index.ProviderIndex] = None
         self._patch_index: Optional["spack.patch.PatchCache"] = None
         self._tag_index: Optional["spack.tag.TagIndex"] = None
+        self._dependency_index: Optional["spack.dependency_index.DependencyIndex"] = None
 
         for repo in repos:
             self.put_last(repo)
@@ -833,6 +870,17 @@ def patch_index(self) -> "spack.patch.PatchCache":
                 self._patch_index.update(repo.patch_index)
         return self._patch_index
 
+    @property
+    def dependency_index(self) -> "spack.dependency_index.DependencyIndex":
+        """Merged DependencyIndex from all Repos in the RepoPath."""
+        if self._dependency_index is None:
+            from spack.dependency_index import DependencyIndex
+
+            self._dependency_index = DependencyIndex(repository=self)
+            for repo in reversed(self.repos):
+                self._dependency_index.merge(repo.dependency_index)
+        return self._dependency_index
+
     @autospec
     def providers_for(self, virtual_spec: "spack.spec.Spec") -> List["spack.spec.Spec"]:
         providers = [
@@ -1289,6 +1337,7 @@ def index(self) -> RepoIndex:
             self._repo_index.add_indexer("providers", ProviderIndexer(self))
             self._repo_index.add_indexer("tags", TagIndexer(self))
             self._repo_index.add_indexer("patches", PatchIndexer(self))
+            self._repo_index.add_indexer("dependencies", DependencyIndexer(self))
         return self._repo_index
 
     @property
@@ -1306,6 +1355,11 @@ def patch_index(self) -> "spack.patch.PatchCache":
         """Index of patches and packages they're defined on."""
         return self.index["patches"]
 
+    @property
+    def dependency_index(self) -> "spack.dependency_index.DependencyIndex":
+        """Index of the dependencies and unconditional requirements of each package."""
+        return self.index["dependencies"]
+
     @autospec
     def providers_for(self, vpkg_spec: "spack.spec.Spec") -> List["spack.spec.Spec"]:
         providers = self.provider_index.providers_for(vpkg_spec)
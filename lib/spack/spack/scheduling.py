@@ -0,0 +1,92 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+"""Critical-path scheduling of concurrent package installations.
+
+When more than one package is installed at a time, the order in which ready packages are started
+matters: a long build that is started late can leave the end of an installation running a single
+build. To avoid that, each package is ranked by the estimated time of the longest chain of builds
+from the package to the end of the installation, i.e. by its position on the critical path, and
+ready packages with a higher rank are started first.
+
+Build times are estimated from the build history of the store, see :mod:`spack.build_history`.
+"""
+import heapq
+from typing import Dict, Iterable, List, Set, Tuple
+
+import spack.store
+
+#: Build time, in seconds, assumed when there is no build history at all
+DEFAULT_BUILD_TIME = 1.0
+
+
+def estimated_build_times(names: Iterable[str], store: spack.store.Store) -> Dict[str, float]:
+    """Returns the median time, in seconds, of the previous builds from source of each package.
+    Packages that were never built from source are not in the result.
+
+    Args:
+        names: names of the packages
+        store: store with the build history
+    """
+    return store.build_history.build_times(names)
+
+
+def critical_path_ranks(
+    dependents: Dict[str, Set[str]], durations: Dict[str, float]
+) -> Dict[str, float]:
+    """Returns, for each node, its duration plus the duration of the longest chain of its
+    dependents.
+
+    Args:
+        dependents: dependents of each node
+        durations: estimated duration of each node
+    """
+    ranks: Dict[str, float] = {}
+    for root in dependents:
+        stack = [root]
+        while stack:
+            node = stack[-1]
+            pending = [x for x in dependents[node] if x not in ranks]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            ranks[node] = durations[node] + max((ranks[x] for x in dependents[node]), default=0.0)
+    return ranks
+
+
+def predicted_makespan(
+    dependents: Dict[str, Set[str]],
+    durations: Dict[str, float],
+    ranks: Dict[str, float],
+    workers: int,
+) -> float:
+    """Returns the time to run all the nodes of a graph, when ready nodes are started in order of
+    decreasing rank as soon as one of a number of workers is free.
+
+    Args:
+        dependents: dependents of each node
+        durations: estimated duration of each node
+        ranks: rank of each node
+        workers: maximum number of nodes run at the same time
+    """
+    dependencies = {x: 0 for x in dependents}
+    for x in dependents.values():
+        for dependent in x:
+            dependencies[dependent] += 1
+
+    ready = [(-ranks[x], x) for x, count in dependencies.items() if count == 0]
+    heapq.heapify(ready)
+    running: List[Tuple[float, str]] = []
+    now = 0.0
+    while ready or running:
+        while ready and len(running) < workers:
+            _, node = heapq.heappop(ready)
+            heapq.heappush(running, (now + durations[node], node))
+
+        now, node = heapq.heappop(running)
+        for dependent in dependents[node]:
+            dependencies[dependent] -= 1
+            if dependencies[dependent] == 0:
+                heapq.heappush(ready, (-ranks[dependent], dependent))
+    return now
@@ -93,7 +93,43 @@
                 },
             },
             "static_analysis": {"type": "boolean"},
+            "fact_cache": {"type": "boolean"},
+            "incremental": {"type": "boolean"},
             "timeout": {"type": "integer", "minimum": 0},
+            "portfolio": {
+                "type": "object",
+                "additionalProperties": False,
+                "properties": {
+                    "enable": {"type": "boolean"},
+                    "members": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "required": ["name"],
+                            "additionalProperties": False,
+                            "properties": {
+                                "name": {"type": "string"},
+                                "configuration": {
+                                    "type": "string",
+                                    "enum": [
+                                        "auto",
+                                        "frumpy",
+                                        "jumpy",
+                                        "tweety",
+                                        "handy",
+                                        "crafty",
+                                        "trendy",
+                                        "many",
+                                    ],
+                                },
+                                "heuristic": {"type": ["string", "null"]},
+                                "seed": {"type": "integer", "minimum": 0},
+                                "opt_strategy": {"type": "string"},
+                            },
+                        },
+                    },
+                },
+            },
             "error_on_timeout": {"type": "boolean"},
             "os_compatible": {"type": "object", "additionalProperties": {"type": "array"}},
         },
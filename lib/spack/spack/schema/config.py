@@ -53,6 +53,7 @@
                     "url": {"type": "string"},
                     "entry_limit": {"type": "integer", "minimum": 0},
                     "size_limit": {"type": "integer", "minimum": 0},
+                    "max_age": {"type": "number", "minimum": 0},
                 },
             },
             "install_hash_length": {"type": "integer", "minimum": 1},
@@ -67,6 +68,7 @@
             "license_dir": {"type": "string"},
             "source_cache": {"type": "string"},
             "misc_cache": {"type": "string"},
+            "upstream_index_cache": {"type": "boolean"},
             "environments_root": {"type": "string"},
             "connect_timeout": {"type": "integer", "minimum": 0},
             "verify_ssl": {"type": "boolean"},
@@ -80,8 +82,19 @@
             "build_language": {"type": "string"},
             "build_jobs": {"type": "integer", "minimum": 1},
             "concurrent_packages": {"type": "integer", "minimum:": 1},
+            "fetch_jobs": {"type": "integer", "minimum": 0},
+            "prefetch_sources": {"type": "boolean"},
+            "memory_budget": {"type": "number", "minimum": 0},
             "ccache": {"type": "boolean"},
             "db_lock_timeout": {"type": "integer", "minimum": 1},
+            "db_write_batch": {
+                "type": "object",
+                "additionalProperties": False,
+                "properties": {
+                    "installs": {"type": "integer", "minimum": 1},
+                    "seconds": {"type": "number", "minimum": 0},
+                },
+            },
             "package_lock_timeout": {
                 "anyOf": [{"type": "integer", "minimum": 1}, {"type": "null"}]
             },
@@ -91,6 +104,7 @@
             "url_fetch_method": {"type": "string", "pattern": r"^urllib$|^curl( .*)*"},
             "additional_external_search_paths": {"type": "array", "items": {"type": "string"}},
             "binary_index_ttl": {"type": "integer", "minimum": 0},
+            "binary_index_timeout": {"type": "number", "minimum": 0},
             "aliases": {"type": "object", "patternProperties": {r"\w[\w-]*": {"type": "string"}}},
         },
     }
@@ -36,6 +36,7 @@
                 },
             },
             "version": {"type": "string"},
+            "snapshot": {"type": "string"},
         },
     }
 }
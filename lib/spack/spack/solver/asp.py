@@ -4,7 +4,6 @@
 import collections
 import collections.abc
 import enum
-import errno
 import hashlib
 import io
 import itertools
@@ -14,14 +13,20 @@
 import pprint
 import random
 import re
+import shutil
+import socket
 import sys
+import tempfile
+import time
 import typing
+import uuid
 import warnings
-from contextlib import contextmanager
+from contextlib import contextmanager, suppress
 from typing import (
-    IO,
+    Any,
     Callable,
     Dict,
+    Iterable,
     Iterator,
     List,
     NamedTuple,
@@ -56,6 +61,7 @@
 import spack.util.crypto
 import spack.util.hash
 import spack.util.libc
+import spack.util.lock
 import spack.util.module_cmd as md
 import spack.util.path
 import spack.util.timer
@@ -64,10 +70,9 @@
 import spack.version.git_ref_lookup
 from spack import traverse
 from spack.compilers.libraries import CompilerPropertyDetector
-from spack.llnl.util.filesystem import current_file_position
 from spack.llnl.util.lang import elide_list
-from spack.util.file_cache import FileCache
 
+from . import fact_cache, portfolio
 from .core import (
     AspFunction,
     AspVar,
@@ -83,7 +88,14 @@
     parse_term,
     using_libc_compatibility,
 )
-from .input_analysis import create_counter, create_graph_analyzer
+from .input_analysis import PossibleDependencyGraph, create_counter, create_graph_analyzer
+from .profiler import (
+    NULL_SETUP_PROFILER,
+    NullSetupProfiler,
+    SetupProfiler,
+    SolveProfile,
+    setup_phase,
+)
 from .requirements import RequirementKind, RequirementParser, RequirementRule
 from .reuse import ReusableSpecsSelector, SpecFilter
 from .runtimes import RuntimePropertyRecorder, _external_config_with_implicit_externals
@@ -105,6 +117,8 @@ class OutputConfiguration(NamedTuple):
     out: Optional[io.IOBase]
     #: If True, stop after setup and don't solve
     setup_only: bool
+    #: Optional profile, where a report on the setup, grounding and solving is recorded
+    profile: Optional[SolveProfile] = None
 
 
 #: Default output configuration for a solve
@@ -329,6 +343,9 @@ def __init__(self, specs, asp=None):
         self.warnings = None
         self.nmodels = 0
 
+        # Name of the portfolio member that found the answer, if portfolio solving was used
+        self.portfolio_member = None
+
         # Saved control object for reruns when necessary
         self.control = None
 
@@ -597,12 +614,96 @@ def _dict_to_spec(spec_dict):
         return result
 
 
+#: Version of the format of the concretization cache index
+_CONC_CACHE_INDEX_VERSION = 1
+
+#: Counters stored in the concretization cache index
+_CONC_CACHE_COUNTERS = (
+    "hits",
+    "misses",
+    "stores",
+    "evictions",
+    "bytes_evicted",
+    "bytes_saved",
+    "seconds_saved",
+)
+
+#: Number of access logs that triggers an automatic compaction of the concretization cache
+_CONC_CACHE_LOGS_BEFORE_COMPACTION = 64
+
+
+def _lru_evictions(
+    entries: Dict[str, Dict[str, Any]],
+    *,
+    entry_limit: int,
+    bytes_limit: float,
+    max_age: float,
+    now: float,
+) -> List[str]:
+    """Returns the digests of the cache entries to be evicted, least recently used first.
+
+    Entries not accessed for more than ``max_age`` days are always evicted. Then, if the
+    remaining entries exceed either the entry or the byte limit, least recently used entries
+    are evicted until 10% of the limit has been freed. Limits equal to zero are disabled.
+    """
+    lru = sorted(entries, key=lambda digest: entries[digest]["accessed"])
+    evicted: List[str] = []
+    if max_age > 0:
+        cutoff = now - max_age * 24 * 3600
+        while lru and entries[lru[0]]["accessed"] < cutoff:
+            evicted.append(lru.pop(0))
+
+    count = len(lru)
+    total_bytes = sum(entries[digest]["bytes"] for digest in lru)
+    too_many = 0 < entry_limit < count
+    too_large = 0 < bytes_limit < total_bytes
+    if not too_many and not too_large:
+        return evicted
+
+    target_count = entry_limit - entry_limit // 10 if entry_limit > 0 else count
+    target_bytes = bytes_limit - bytes_limit // 10 if bytes_limit > 0 else total_bytes
+    for digest in lru:
+        if count <= target_count and total_bytes <= target_bytes:
+            break
+        evicted.append(digest)
+        count -= 1
+        total_bytes -= entries[digest]["bytes"]
+    return evicted
+
+
+def _publish(path: pathlib.Path, content: str) -> int:
+    """Writes a file atomically, by renaming a temporary file in the same directory.
+
+    Returns the number of characters written.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            written = f.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(tmp)
+        raise
+    return written
+
+
 class ConcretizationCache:
     """Store for Spack concretization results and statistics
 
     Serializes solver result objects and statistics to json and stores
     at a given endpoint in a cache associated by the sha256 of the
     asp problem and the involved control files.
+
+    The cache is meant to be shared by many concurrent processes, possibly on a network
+    filesystem, so neither reads nor writes of entries take locks:
+
+    * entries are immutable, and are published by renaming a temporary file into place
+    * each flush publishes the cache accesses of a process in a new log file under
+      ``.cache_log``, so logs are immutable too
+    * the index, recording size and last access of each entry along with hit and miss
+      counters, is rewritten only by compaction, which folds the logs into it, removes them,
+      and prunes least recently used entries. Compaction is the only operation taking a lock.
     """
 
     def __init__(self, root: Union[str, None] = None):
@@ -610,79 +711,69 @@ def __init__(self, root: Union[str, None] = None):
             "config:concretization_cache:url", spack.paths.default_conc_cache_path
         )
         self.root = pathlib.Path(spack.util.path.canonicalize_path(root))
-        self._fc = FileCache(self.root)
-        self._cache_manifest = ".cache_manifest"
-        self._manifest_queue: List[Tuple[pathlib.Path, int]] = []
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._cache_manifest = self.root / ".cache_manifest"
+        self._log_dir = self.root / ".cache_log"
+        self._log_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        #: Accesses to the cache not yet appended to the log, as tuples of
+        #: (event, digest, bytes, solve time, timestamp)
+        self._manifest_queue: List[Tuple[str, str, int, float, float]] = []
 
     def cleanup(self):
-        """Prunes the concretization cache according to configured size and entry
-        count limits. Cleanup is done in FIFO ordering."""
-        # TODO: determine a better default
-        entry_limit = spack.config.get("config:concretization_cache:entry_limit", 1000)
-        bytes_limit = spack.config.get("config:concretization_cache:size_limit", 3e8)
-        # lock the entire buildcache as we're removing a lot of data from the
-        # manifest and cache itself
-        with self._fc.read_transaction(self._cache_manifest) as f:
-            count, cache_bytes = self._extract_cache_metadata(f)
-            if not count or not cache_bytes:
-                return
-            entry_count = int(count)
-            manifest_bytes = int(cache_bytes)
-            # move beyond the metadata entry
-            f.readline()
-            if entry_count > entry_limit and entry_limit > 0:
-                with self._fc.write_transaction(self._cache_manifest) as (old, new):
-                    # prune the oldest 10% or until we have removed 10% of
-                    # total bytes starting from oldest entry
-                    # TODO: make this configurable?
-                    prune_count = entry_limit // 10
-                    lines_to_prune = f.readlines(prune_count)
-                    for i, line in enumerate(lines_to_prune):
-                        sha, cache_entry_bytes = self._parse_manifest_entry(line)
-                        if sha and cache_entry_bytes:
-                            cache_path = self._cache_path_from_hash(sha)
-                            if self._fc.remove(cache_path):
-                                entry_count -= 1
-                                manifest_bytes -= int(cache_entry_bytes)
-                        else:
-                            tty.warn(
-                                f"Invalid concretization cache entry: '{line}' on line: {i+1}"
-                            )
-                    self._write_manifest(f, entry_count, manifest_bytes)
-
-            elif manifest_bytes > bytes_limit and bytes_limit > 0:
-                with self._fc.write_transaction(self._cache_manifest) as (old, new):
-                    # take 10% of current size off
-                    prune_amount = bytes_limit // 10
-                    total_pruned = 0
-                    i = 0
-                    while total_pruned < prune_amount:
-                        sha, manifest_cache_bytes = self._parse_manifest_entry(f.readline())
-                        if sha and manifest_cache_bytes:
-                            entry_bytes = int(manifest_cache_bytes)
-                            cache_path = self.root / sha[:2] / sha
-                            if self._safe_remove(cache_path):
-                                entry_count -= 1
-                                entry_bytes -= entry_bytes
-                                total_pruned += entry_bytes
-                        else:
-                            tty.warn(
-                                "Invalid concretization cache entry "
-                                f"'{sha} {manifest_cache_bytes}' on line: {i}"
-                            )
-                        i += 1
-                    self._write_manifest(f, entry_count, manifest_bytes)
-            for cache_dir in self.root.iterdir():
-                if cache_dir.is_dir() and not any(cache_dir.iterdir()):
-                    self._safe_remove(cache_dir)
+        """Folds the access logs into the index, and prunes the concretization cache according
+        to configured size, entry count and age limits. Entries are pruned in least recently
+        used order."""
+        self.flush_manifest()
+        self._compact(blocking=True)
+
+    def flush_manifest(self):
+        """Publishes the accesses done since the last flush in a new log. If entries were
+        stored and the cache exceeds its limits, or if there are many logs waiting to be folded
+        into the index, compact the cache unless another process is already doing it."""
+        if not self._manifest_queue:
+            return
+        self._log_dir.mkdir(exist_ok=True)
+        lines = "".join(json.dumps(event) + "\n" for event in self._manifest_queue)
+        stored = any(event[0] == "store" for event in self._manifest_queue)
+        _publish(self._log_dir / f"{self._log_prefix}-{uuid.uuid4().hex[:12]}.log", lines)
+        self._manifest_queue.clear()
+
+        if len(self._access_logs()) > _CONC_CACHE_LOGS_BEFORE_COMPACTION or (
+            stored and self._needs_eviction()
+        ):
+            self._compact(blocking=False)
+
+    def destroy(self):
+        """Removes all the entries, and the index, from the cache"""
+        for f in self.root.iterdir():
+            if f.is_dir():
+                shutil.rmtree(f, True)
+            else:
+                f.unlink()
+        self._manifest_queue.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the counters recorded in the index and in the logs not yet compacted,
+        together with the current number of entries and bytes in the cache."""
+        manifest = self._read_manifest()
+        for log in self._access_logs():
+            self._fold(manifest, self._read_log(log))
+        self._fold(manifest, self._manifest_queue)
+        result: Dict[str, Any] = dict(manifest["stats"])
+        result["entries"] = len(manifest["entries"])
+        result["bytes"] = sum(entry["bytes"] for entry in manifest["entries"].values())
+        return result
 
     def cache_entries(self):
         """Generator producing cache entries"""
         for cache_dir in self.root.iterdir():
             # ensure component is cache entry directory
             # not metadata file
-            if cache_dir.is_dir():
+            if cache_dir.is_dir() and not cache_dir.name.startswith("."):
                 for cache_entry in cache_dir.iterdir():
+                    if cache_entry.name.startswith("."):
+                        # files being published
+                        continue
                     if not cache_entry.is_dir():
                         yield cache_entry
                     else:
@@ -692,71 +783,143 @@ def cache_entries(self):
                             "within the concretization cache."
                         )
 
-    def _parse_manifest_entry(self, line):
-        """Returns parsed manifest entry lines
-        with handling for invalid reads."""
-        if line:
-            cache_values = line.strip("\n").split(" ")
-            if len(cache_values) < 2:
-                tty.warn(f"Invalid cache entry at {line}")
-                return None, None
-        return None, None
+    def _access_logs(self) -> List[pathlib.Path]:
+        try:
+            return [x for x in self._log_dir.iterdir() if x.suffix == ".log"]
+        except FileNotFoundError:
+            return []
+
+    def _read_log(self, log: pathlib.Path) -> List[Tuple[str, str, int, float, float]]:
+        events = []
+        try:
+            with open(log, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # a line torn by a process that crashed while writing the log
+                        continue
+                    if isinstance(event, list) and len(event) == 5:
+                        events.append(tuple(event))
+        except FileNotFoundError:
+            pass
+        return events  # type: ignore[return-value]
 
-    def _write_manifest(self, manifest_file, entry_count, entry_bytes):
-        """Writes new concretization cache manifest file.
+    def _compact(self, blocking: bool):
+        """Folds the access logs into the index, and evicts entries exceeding the limits.
 
         Arguments:
-            manifest_file: IO stream opened for readin
-                            and writing wrapping the manifest file
-                            with cursor at calltime set to location
-                            where manifest should be truncated
-            entry_count: new total entry count
-            entry_bytes: new total entry bytes count
-
+            blocking: if False, and another process is compacting the cache, return
+                immediately instead of waiting for it to finish
         """
-        persisted_entries = manifest_file.readlines()
-        manifest_file.truncate(0)
-        manifest_file.write(f"{entry_count} {entry_bytes}\n")
-        manifest_file.writelines(persisted_entries)
+        lock = spack.util.lock.Lock(str(self.root / ".compaction.lock"), default_timeout=120)
+        try:
+            lock.acquire_write(timeout=None if blocking else 1e-6)
+        except spack.util.lock.LockTimeoutError:
+            tty.debug("Concretization cache is being compacted by another process")
+            return
 
-    def _results_from_cache(self, cache_entry_buffer: IO[str]) -> Union[Result, None]:
-        """Returns a Results object from the concretizer cache
+        try:
+            manifest = self._read_manifest()
+            # Logs are published complete, so they can be removed once folded into the index
+            folded = self._access_logs()
+            for log in folded:
+                self._fold(manifest, self._read_log(log))
+            self._evict(manifest)
+            _publish(self._cache_manifest, json.dumps(manifest))
+            for log in folded:
+                with suppress(FileNotFoundError):
+                    log.unlink()
+        finally:
+            lock.release_write()
 
-        Reads the cache hit and uses `Result`'s own deserializer
-        to produce a new Result object
-        """
+        for cache_dir in self.root.iterdir():
+            if cache_dir.is_dir() and not cache_dir.name.startswith("."):
+                with suppress(OSError):
+                    cache_dir.rmdir()
 
-        with current_file_position(cache_entry_buffer, 0):
-            cache_str = cache_entry_buffer.read()
-            # TODO: Should this be an error if None?
-            # Same for _stats_from_cache
-            if cache_str:
-                cache_entry = json.loads(cache_str)
-                result_json = cache_entry["results"]
-                return Result.from_dict(result_json)
-        return None
-
-    def _stats_from_cache(self, cache_entry_buffer: IO[str]) -> Union[List, None]:
-        """Returns concretization statistic from the
-        concretization associated with the cache.
-
-        Deserialzes the the json representation of the
-        statistics covering the cached concretization run
-        and returns the Python data structures
-        """
-        with current_file_position(cache_entry_buffer, 0):
-            cache_str = cache_entry_buffer.read()
-            if cache_str:
-                return json.loads(cache_str)["statistics"]
-        return None
-
-    def _extract_cache_metadata(self, cache_stream: IO[str]):
-        """Extracts and returns cache entry count and bytes count from head of manifest
-        file"""
-        # make sure we're always reading from the beginning of the stream
-        # concretization cache manifest data lives at the top of the file
-        with current_file_position(cache_stream, 0):
-            return self._parse_manifest_entry(cache_stream.readline())
+    @staticmethod
+    def _fold(manifest: Dict[str, Any], events: Iterable[Tuple[str, str, int, float, float]]):
+        entries, stats = manifest["entries"], manifest["stats"]
+        for event, digest, entry_bytes, solve_time, timestamp in events:
+            if event == "miss":
+                stats["misses"] += 1
+                continue
+
+            if event == "store":
+                entry = entries.setdefault(
+                    digest, {"bytes": entry_bytes, "solve_time": solve_time, "created": timestamp}
+                )
+                stats["stores"] += 1
+            elif event == "hit":
+                # A hit on an entry evicted since then must not bring it back in the index
+                entry = entries.get(digest)
+                if entry is None:
+                    continue
+                stats["hits"] += 1
+                stats["bytes_saved"] += entry_bytes
+                stats["seconds_saved"] += solve_time
+            else:
+                continue
+            entry["accessed"] = max(timestamp, entry.get("accessed", timestamp))
+
+    def _needs_eviction(self) -> bool:
+        """Whether the entries in the index and in the logs not yet folded into it exceed the
+        limits of the cache"""
+        manifest = self._read_manifest()
+        for log in self._access_logs():
+            self._fold(manifest, self._read_log(log))
+        return bool(self._evictions(manifest["entries"]))
+
+    @staticmethod
+    def _evictions(entries: Dict[str, Dict[str, Any]]) -> List[str]:
+        return _lru_evictions(
+            entries,
+            # TODO: determine a better default
+            entry_limit=spack.config.get("config:concretization_cache:entry_limit", 1000),
+            bytes_limit=spack.config.get("config:concretization_cache:size_limit", 3e8),
+            max_age=spack.config.get("config:concretization_cache:max_age", 0),
+            now=time.time(),
+        )
+
+    def _evict(self, manifest: Dict[str, Any]):
+        entries, stats = manifest["entries"], manifest["stats"]
+        evicted = self._evictions(entries)
+        for digest in evicted:
+            with suppress(FileNotFoundError):
+                (self.root / self._cache_path_from_hash(digest)).unlink()
+            stats["evictions"] += 1
+            stats["bytes_evicted"] += entries.pop(digest)["bytes"]
+        if evicted:
+            tty.debug(f"Evicted {len(evicted)} entries from the concretization cache")
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        """Reads the index of the cache, or rebuilds it from the entries on disk if it is
+        missing or in an unknown format"""
+        try:
+            with open(self._cache_manifest, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == _CONC_CACHE_INDEX_VERSION:
+                for counter in _CONC_CACHE_COUNTERS:
+                    manifest["stats"].setdefault(counter, 0)
+                return manifest
+        except (OSError, ValueError, AttributeError, KeyError):
+            pass
+
+        entries = {}
+        for cache_entry in self.cache_entries():
+            st = cache_entry.stat()
+            entries[cache_entry.name] = {
+                "bytes": st.st_size,
+                "solve_time": 0.0,
+                "created": st.st_mtime,
+                "accessed": st.st_mtime,
+            }
+        return {
+            "version": _CONC_CACHE_INDEX_VERSION,
+            "entries": entries,
+            "stats": {counter: 0 for counter in _CONC_CACHE_COUNTERS},
+        }
 
     def _prefix_digest(self, problem: str) -> Tuple[str, str]:
         """Return the first two characters of, and the full, sha256 of the given asp problem"""
@@ -775,80 +938,43 @@ def _cache_path_from_hash(self, hash: str) -> pathlib.Path:
         corresponding to the given sha256 hash"""
         return pathlib.Path(hash[:2]) / hash
 
-    def _lock_prefix_from_cache_path(self, cache_path: str):
-        """Returns the bit location corresponding to a given cache entry path
-        for file locking"""
-        return spack.util.hash.base32_prefix_bits(
-            spack.util.hash.b32_hash(cache_path), spack.util.crypto.bit_length(sys.maxsize)
-        )
-
-    def flush_manifest(self):
-        """Updates the concretization cache manifest file after a cache write operation
-        Updates the current byte count and entry counts and writes to the head of the
-        manifest file"""
-        manifest_file = self.root / self._cache_manifest
-        manifest_file.touch(exist_ok=True)
-        with open(manifest_file, "r+", encoding="utf-8") as f:
-            # check if manifest is empty
-            count, cache_bytes = self._extract_cache_metadata(f)
-            if not count or not cache_bytes:
-                # cache is unintialized
-                count = 0
-                cache_bytes = 0
-            f.seek(0, io.SEEK_END)
-            for manifest_update in self._manifest_queue:
-                entry_path, entry_bytes = manifest_update
-                count += 1
-                cache_bytes += entry_bytes
-                f.write(f"{entry_path.name} {entry_bytes}")
-            f.seek(0, io.SEEK_SET)
-            new_stats = f"{int(count)+1} {int(cache_bytes)}\n"
-            f.write(new_stats)
-
-    def _register_cache_update(self, cache_path: pathlib.Path, bytes_written: int):
-        """Adds manifest entry to update queue for later updates to the manifest"""
-        self._manifest_queue.append((cache_path, bytes_written))
-
-    def _safe_remove(self, cache_dir: pathlib.Path):
-        """Removes cache entries with handling for the case where the entry has been
-        removed already or there are multiple cache entries in a directory"""
-        try:
-            if cache_dir.is_dir():
-                cache_dir.rmdir()
-            else:
-                cache_dir.unlink()
-            return True
-        except FileNotFoundError:
-            # This is acceptable, removal is idempotent
-            pass
-        except OSError as e:
-            if e.errno == errno.ENOTEMPTY:
-                # there exists another cache entry in this directory, don't clean yet
-                pass
-        return False
-
-    def store(self, problem: str, result: Result, statistics: List, test: bool = False):
+    def store(
+        self,
+        problem: str,
+        result: Result,
+        statistics: List,
+        test: bool = False,
+        solve_time: float = 0.0,
+    ):
         """Creates entry in concretization cache for problem if none exists,
         storing the concretization Result object and statistics in the cache
         as serialized json joined as a single file.
 
         Hash membership is computed based on the sha256 of the provided asp
-        problem.
+        problem. The time spent solving the problem is recorded, to account for
+        the time saved by subsequent cache hits.
         """
         cache_path = self._cache_path_from_problem(problem)
-        if self._fc.init_entry(cache_path):
+        entry_path = self.root / cache_path
+        if entry_path.exists():
             # if an entry for this conc hash exists already, we're don't want
             # to overwrite, just exit
             tty.debug(f"Cache entry {cache_path} exists, will not be overwritten")
             return
-        with self._fc.write_transaction(cache_path) as (old, new):
-            if old:
-                # Entry for this conc hash exists already, do not overwrite
-                tty.debug(f"Cache entry {cache_path} exists, will not be overwritten")
-                return
-            cache_dict = {"results": result.to_dict(test=test), "statistics": statistics}
-            bytes_written = new.write(json.dumps(cache_dict))
-            self._register_cache_update(cache_path, bytes_written)
+        cache_dict = {
+            "results": result.to_dict(test=test),
+            "statistics": statistics,
+            "solve_time": solve_time,
+        }
+        try:
+            entry_path.parent.mkdir(exist_ok=True)
+            bytes_written = _publish(entry_path, json.dumps(cache_dict))
+        except OSError as e:
+            tty.debug(f"Cannot write concretization cache entry {cache_path}: {e}")
+            return
+        self._manifest_queue.append(
+            ("store", cache_path.name, bytes_written, solve_time, time.time())
+        )
 
     def fetch(self, problem: str) -> Union[Tuple[Result, List], Tuple[None, None]]:
         """Returns the concretization cache result for a lookup based on the given problem.
@@ -858,15 +984,26 @@ def fetch(self, problem: str) -> Union[Tuple[Result, List], Tuple[None, None]]:
         or returns none if no cache entry was found.
         """
         cache_path = self._cache_path_from_problem(problem)
-        result, statistics = None, None
-        with self._fc.read_transaction(cache_path) as f:
-            if f:
-                result = self._results_from_cache(f)
-                statistics = self._stats_from_cache(f)
+        result, statistics, solve_time, entry_bytes = None, None, 0.0, 0
+        try:
+            with open(self.root / cache_path, "r", encoding="utf-8") as f:
+                cache_str = f.read()
+        except FileNotFoundError:
+            cache_str = None
+        if cache_str:
+            entry_bytes = len(cache_str)
+            cache_entry = json.loads(cache_str)
+            result = Result.from_dict(cache_entry["results"])
+            statistics = cache_entry["statistics"]
+            solve_time = cache_entry.get("solve_time", 0.0)
         if result and statistics:
             tty.debug(f"Concretization cache hit at {str(cache_path)}")
+            self._manifest_queue.append(
+                ("hit", cache_path.name, entry_bytes, solve_time, time.time())
+            )
             return result, statistics
         tty.debug(f"Concretization cache miss at {str(cache_path)}")
+        self._manifest_queue.append(("miss", cache_path.name, 0, 0.0, time.time()))
         return None, None
 
 
@@ -1033,6 +1170,16 @@ def on_model(model):
         raise UnsatisfiableSpecError(msg)
 
 
+def _handle_timeout(specs: List[spack.spec.Spec], time_limit: int) -> None:
+    """Raises if the solver is not allowed to exceed the time limit, otherwise warns that the
+    best answer found so far is used."""
+    specs_str = ", ".join(spack.llnl.util.lang.elide_list([str(s) for s in specs], 4))
+    header = f"Spack is taking more than {time_limit} seconds to solve for {specs_str}"
+    if spack.config.CONFIG.get("concretizer:error_on_timeout", True):
+        raise UnsatisfiableSpecError(f"{header}, stopping concretization")
+    warnings.warn(f"{header}, using the best configuration found so far")
+
+
 class PyclingoDriver:
     def __init__(self, cores=True):
         """Driver for the Python clingo interface.
@@ -1045,6 +1192,34 @@ def __init__(self, cores=True):
         # This attribute will be reset at each call to solve
         self.control = None
 
+    def _solve_with_portfolio(
+        self,
+        members: List[portfolio.PortfolioMember],
+        asp_problem: str,
+        control_files: List[str],
+        setup: "SpackSolverSetup",
+        specs: List[spack.spec.Spec],
+        time_limit: int,
+    ) -> Optional[portfolio.Answer]:
+        """Solves the problem with a portfolio of solvers running in parallel. Returns None if
+        no answer was found, so that the problem is solved again in this process, where
+        unsatisfiable cores can be computed for error reporting.
+        """
+        names = ", ".join(x.name for x in members)
+        tty.debug(f"[PORTFOLIO] solving with {len(members)} configurations: {names}")
+        answer, not_optimal = portfolio.solve(
+            members, asp_problem, control_files, setup.assumptions, time_limit
+        )
+        if answer is None and not_optimal:
+            _handle_timeout(specs, time_limit)
+            answer = min(not_optimal, key=lambda x: x.cost)
+
+        if answer is not None:
+            tty.verbose(
+                f"Portfolio member '{answer.member}' found the answer in {answer.seconds:.2f}s"
+            )
+        return answer
+
     def solve(self, setup, specs, reuse=None, output=None, control=None, allow_deprecated=False):
         """Set up the input and solve for dependencies of ``specs``.
 
@@ -1087,6 +1262,9 @@ def solve(self, setup, specs, reuse=None, output=None, control=None, allow_depre
         if setup.enable_splicing:
             control_files.append("splices.lp")
 
+        if output.profile is not None:
+            setup.profiler = SetupProfiler()
+
         timer.start("setup")
         asp_problem = setup.setup(specs, reuse=reuse, allow_deprecated=allow_deprecated)
         if output.out is not None:
@@ -1113,62 +1291,76 @@ def solve(self, setup, specs, reuse=None, output=None, control=None, allow_depre
             result, concretization_stats = CONC_CACHE.fetch(problem_repr)
 
         timer.stop("cache-check")
+        cached = bool(result)
         if not result:
-            timer.start("load")
-            # Add the problem instance
-            self.control.add("base", [], asp_problem)
-            # Load the files
-            [self.control.load(lp) for lp in abs_control_files]
-            timer.stop("load")
-
-            # Grounding is the first step in the solve -- it turns our facts
-            # and first-order logic rules into propositional logic.
-            timer.start("ground")
-            self.control.ground([("base", [])])
-            timer.stop("ground")
-
-            # With a grounded program, we can run the solve.
-            models = []  # stable models if things go well
-            cores = []  # unsatisfiable cores if they do not
-
-            def on_model(model):
-                models.append((model.cost, model.symbols(shown=True, terms=True)))
-
-            solve_kwargs = {
-                "assumptions": setup.assumptions,
-                "on_model": on_model,
-                "on_core": cores.append,
-            }
-
-            if clingo_cffi():
-                solve_kwargs["on_unsat"] = cores.append
-
-            timer.start("solve")
             time_limit = spack.config.CONFIG.get("concretizer:timeout", -1)
-            error_on_timeout = spack.config.CONFIG.get("concretizer:error_on_timeout", True)
             # Spack uses 0 to set no time limit, clingo API uses -1
             if time_limit == 0:
                 time_limit = -1
-            with self.control.solve(**solve_kwargs, async_=True) as handle:
-                finished = handle.wait(time_limit)
-                if not finished:
-                    specs_str = ", ".join(
-                        spack.llnl.util.lang.elide_list([str(s) for s in specs], 4)
-                    )
-                    header = (
-                        f"Spack is taking more than {time_limit} seconds to solve for {specs_str}"
-                    )
-                    if error_on_timeout:
-                        raise UnsatisfiableSpecError(f"{header}, stopping concretization")
-                    warnings.warn(f"{header}, using the best configuration found so far")
-                    handle.cancel()
 
-                solve_result = handle.get()
-            timer.stop("solve")
+            answer = None
+            members = portfolio.members_from_config() if control is None else []
+            if members:
+                timer.start("portfolio")
+                answer = self._solve_with_portfolio(
+                    members,
+                    asp_problem,
+                    [x for x in abs_control_files if os.path.basename(x) != "heuristic.lp"],
+                    setup,
+                    specs,
+                    time_limit,
+                )
+                timer.stop("portfolio")
+
+            if answer is not None:
+                # models and cores are used below to construct the result
+                models, cores = [(answer.cost, answer.symbols)], []
+                satisfiable, statistics = True, answer.statistics
+            else:
+                timer.start("load")
+                # Add the problem instance
+                self.control.add("base", [], asp_problem)
+                # Load the files
+                [self.control.load(lp) for lp in abs_control_files]
+                timer.stop("load")
+
+                # Grounding is the first step in the solve -- it turns our facts
+                # and first-order logic rules into propositional logic.
+                timer.start("ground")
+                self.control.ground([("base", [])])
+                timer.stop("ground")
+
+                # With a grounded program, we can run the solve.
+                models = []  # stable models if things go well
+                cores = []  # unsatisfiable cores if they do not
+
+                def on_model(model):
+                    models.append((model.cost, model.symbols(shown=True, terms=True)))
+
+                solve_kwargs = {
+                    "assumptions": setup.assumptions,
+                    "on_model": on_model,
+                    "on_core": cores.append,
+                }
+
+                if clingo_cffi():
+                    solve_kwargs["on_unsat"] = cores.append
+
+                timer.start("solve")
+                with self.control.solve(**solve_kwargs, async_=True) as handle:
+                    finished = handle.wait(time_limit)
+                    if not finished:
+                        _handle_timeout(specs, time_limit)
+                        handle.cancel()
+
+                    solve_result = handle.get()
+                timer.stop("solve")
+                satisfiable, statistics = solve_result.satisfiable, self.control.statistics
 
             # once done, construct the solve result
             result = Result(specs)
-            result.satisfiable = solve_result.satisfiable
+            result.satisfiable = satisfiable
+            result.portfolio_member = answer.member if answer is not None else None
 
             if result.satisfiable:
                 timer.start("construct_specs")
@@ -1194,7 +1386,7 @@ def on_model(model):
                 result.criteria = build_criteria_names(min_cost, criteria_args)
 
                 # record the number of models the solver considered
-                result.nmodels = len(models)
+                result.nmodels = len(models) if answer is None else answer.nmodels
 
                 # record the possible dependencies in the solve
                 result.possible_dependencies = setup.pkgs
@@ -1210,12 +1402,34 @@ def on_model(model):
                 raise OutputDoesNotSatisfyInputError(result.unsolved_specs)
 
             if conc_cache_enabled:
-                CONC_CACHE.store(problem_repr, result, self.control.statistics, test=setup.tests)
-            concretization_stats = self.control.statistics
+                solve_time = sum(
+                    timer.duration(x)
+                    for x in ("portfolio", "load", "ground", "solve", "construct_specs")
+                )
+                CONC_CACHE.store(
+                    problem_repr, result, statistics, test=setup.tests, solve_time=solve_time
+                )
+            concretization_stats = statistics
+
+        if conc_cache_enabled:
+            CONC_CACHE.flush_manifest()
+
         if output.timers:
             timer.write_tty()
             print()
 
+        if output.profile is not None:
+            output.profile.record(
+                specs=specs,
+                timer=timer,
+                setup_profiler=setup.profiler,
+                problem=setup.gen.asp_problem,
+                programs=abs_control_files,
+                statistics=concretization_stats,
+                cached=cached,
+                portfolio_member=result.portfolio_member,
+            )
+
         if output.stats:
             print("Statistics:")
             pprint.pprint(concretization_stats)
@@ -1402,11 +1616,49 @@ class SpackSolverSetup:
 
     gen: "ProblemInstanceBuilder"
 
-    def __init__(self, tests: bool = False):
-        self.possible_graph = create_graph_analyzer()
+    def __init__(
+        self,
+        tests: bool = False,
+        possible_graph: Optional[PossibleDependencyGraph] = None,
+        memoize_facts: bool = False,
+    ):
+        """
+        Arguments:
+            tests: whether to add test dependencies to the solve
+            possible_graph: graph of the possible dependencies
+            memoize_facts: if True, the setup is used for multiple solves, and the facts that
+                don't change between solves are generated once and kept in memory. Only the
+                setup is memoized: each solve still grounds the whole program again
+        """
+        self.possible_graph = possible_graph or create_graph_analyzer()
+        self.memoize_facts = memoize_facts
 
-        # these are all initialized in setup()
         self.requirement_parser = RequirementParser(spack.config.CONFIG)
+        self._initialize_problem_state()
+
+        #: records time spent in, and facts emitted by, the phases of setup
+        self.profiler: NullSetupProfiler = NULL_SETUP_PROFILER
+
+        # Caches to optimize the setup phase of the solver
+        self.target_specs_cache = None
+
+        # whether to add installed/binary hashes to the solve
+        self.tests = tests
+
+        # If False allows for input specs that are not solved
+        self.concretize_everything = True
+
+        # If true, we have to load the code for synthesizing splices
+        self.enable_splicing: bool = spack.config.CONFIG.get("concretizer:splice:automatic")
+
+        # Cache for the facts derived from package directives, if enabled or memoized
+        self.fact_cache = fact_cache.fact_cache_from_config(in_memory=memoize_facts)
+        self._concrete_spec_fact_cache: Optional[fact_cache.ConcreteSpecFactCache] = None
+
+    def _initialize_problem_state(self) -> None:
+        """Initializes the state that is specific to a single problem instance. This is done
+        at the beginning of each setup, so that a setup can be used for multiple solves.
+        """
         self.possible_virtuals: Set[str] = set()
 
         self.assumptions: List[Tuple["clingo.Symbol", bool]] = []  # type: ignore[name-defined]
@@ -1436,15 +1688,6 @@ def __init__(self, tests: bool = False):
         self._trigger_cache: ConditionSpecCache = collections.defaultdict(dict)
         self._effect_cache: ConditionSpecCache = collections.defaultdict(dict)
 
-        # Caches to optimize the setup phase of the solver
-        self.target_specs_cache = None
-
-        # whether to add installed/binary hashes to the solve
-        self.tests = tests
-
-        # If False allows for input specs that are not solved
-        self.concretize_everything = True
-
         # Set during the call to setup
         self.pkgs: Set[str] = set()
         self.explicitly_required_namespaces: Dict[str, str] = {}
@@ -1452,9 +1695,6 @@ def __init__(self, tests: bool = False):
         # list of unique libc specs targeted by compilers (or an educated guess if no compiler)
         self.libcs: List[spack.spec.Spec] = []
 
-        # If true, we have to load the code for synthesizing splices
-        self.enable_splicing: bool = spack.config.CONFIG.get("concretizer:splice:automatic")
-
     def pkg_version_rules(self, pkg):
         """Output declared versions of a package.
 
@@ -1554,6 +1794,7 @@ def conflict_rules(self, pkg):
                 )
                 self.gen.newline()
 
+    @setup_phase
     def config_compatible_os(self):
         """Facts about compatible os's specified in configs"""
         self.gen.h2("Compatible OS from concretizer config file")
@@ -1566,6 +1807,7 @@ def config_compatible_os(self):
     def package_requirement_rules(self, pkg):
         self.emit_facts_from_requirement_rules(self.requirement_parser.rules(pkg))
 
+    @setup_phase
     def pkg_rules(self, pkg, tests):
         pkg = self.pkg_class(pkg)
 
@@ -1576,6 +1818,24 @@ def pkg_rules(self, pkg, tests):
         self.pkg_version_rules(pkg)
         self.gen.newline()
 
+        # variants, conflicts, virtuals, dependencies and splices
+        if self.fact_cache is None:
+            self.package_directive_rules(pkg)
+        else:
+            self.cached_package_directive_rules(pkg)
+
+        self.package_requirement_rules(pkg)
+
+        # trigger and effect tables
+        self.trigger_rules()
+        self.effect_rules()
+
+    def package_directive_rules(self, pkg):
+        """Emit the facts derived from the directives in a package recipe.
+
+        These facts depend only on the recipe and on a few solver settings, so they can be
+        stored in the fact cache (see ``cached_package_directive_rules``).
+        """
         # variants
         self.variant_rules(pkg)
 
@@ -1592,12 +1852,155 @@ def pkg_rules(self, pkg, tests):
         if self.enable_splicing:
             self.package_splice_rules(pkg)
 
-        self.package_requirement_rules(pkg)
-
         # trigger and effect tables
         self.trigger_rules()
         self.effect_rules()
 
+    def _package_fact_cache_settings(self, pkg) -> dict:
+        """Inputs, other than the recipe, that affect ``package_directive_rules``."""
+        tests = bool(self.tests) and (isinstance(self.tests, bool) or pkg.name in self.tests)
+        return {
+            "namespace": pkg.namespace,
+            "tests": tests,
+            "splicing": bool(self.enable_splicing),
+            "virtuals": sorted(
+                x for x in pkg.provided_virtual_names() if x in self.possible_virtuals
+            ),
+            "virtual_dependencies": sorted(
+                x for x in pkg.dependency_names() if spack.repo.PATH.is_virtual(x)
+            ),
+        }
+
+    def cached_package_directive_rules(self, pkg):
+        """Same as ``package_directive_rules``, but reuse the facts from the fact cache if
+        the package did not change since they were stored.
+        """
+        assert self.fact_cache is not None
+        digest = self.fact_cache.digest(pkg, **self._package_fact_cache_settings(pkg))
+        facts = self.fact_cache.fetch(pkg, digest)
+        if facts is not None and self._replay_package_facts(pkg, facts):
+            return
+
+        facts = self._record_package_facts(pkg)
+        if facts is None:
+            self.package_directive_rules(pkg)
+            return
+
+        self.fact_cache.store(pkg, digest, facts)
+        replayed = self._replay_package_facts(pkg, facts)
+        assert replayed, f"cannot replay the facts just generated for {pkg.name}"
+
+    def _variant_def_indices(self, pkg_name: str) -> Dict[int, Tuple[str, int]]:
+        """Map the ids of the variant definitions of a package to (name, index) tuples"""
+        pkg_cls = self.pkg_class(pkg_name)
+        return {
+            id(variant_def): (name, idx)
+            for name in pkg_cls.variant_names()
+            for idx, (_, variant_def) in enumerate(pkg_cls.variant_definitions(name))
+        }
+
+    def _record_package_facts(self, pkg) -> Optional[fact_cache.PackageFacts]:
+        """Run ``package_directive_rules`` and capture its output with relocatable ids.
+
+        The state of the setup is left untouched. Returns None if the side effects of
+        generating the facts cannot be stored.
+        """
+        # No condition generated outside of the record should leak into it
+        self.trigger_rules()
+        self.effect_rules()
+
+        saved_gen, saved_counter = self.gen, self._id_counter
+        version_constraints = self.version_constraints
+        target_constraints = self.target_constraints
+        variant_values = self.variant_values_from_specs
+        variant_ids = self.variant_ids_by_def_id
+
+        # Record side effects from scratch, since they must not depend on previous state
+        self.gen = ProblemInstanceBuilder()
+        self._id_counter = fact_cache.relocatable_ids()
+        self.version_constraints, self.target_constraints = set(), set()
+        self.variant_values_from_specs, self.variant_ids_by_def_id = set(), {}
+        try:
+            self.package_directive_rules(pkg)
+            asp = self.gen.asp_problem
+            num_ids = next(self._id_counter)
+            new_version_constraints = self.version_constraints
+            new_target_constraints = self.target_constraints
+            new_variant_values = self.variant_values_from_specs
+            new_variant_ids = self.variant_ids_by_def_id
+        finally:
+            self.gen, self._id_counter = saved_gen, saved_counter
+            self.version_constraints = version_constraints
+            self.target_constraints = target_constraints
+            self.variant_values_from_specs = variant_values
+            self.variant_ids_by_def_id = variant_ids
+
+        indices = {pkg.name: self._variant_def_indices(pkg.name)}
+        try:
+            recorded_variant_ids = [
+                (*indices[pkg.name][def_id], int(vid)) for def_id, vid in new_variant_ids.items()
+            ]
+            recorded_variant_values = []
+            for pkg_name, def_id, value in new_variant_values:
+                if pkg_name not in indices:
+                    indices[pkg_name] = self._variant_def_indices(pkg_name)
+                recorded_variant_values.append((pkg_name, *indices[pkg_name][def_id], value))
+        except KeyError:
+            return None
+
+        return fact_cache.PackageFacts(
+            asp=asp,
+            ids=int(num_ids),
+            version_constraints=sorted(
+                (name, str(versions)) for name, versions in new_version_constraints
+            ),
+            target_constraints=sorted(str(x) for x in new_target_constraints),
+            variant_ids=sorted(recorded_variant_ids),
+            variant_values=sorted(recorded_variant_values, key=str),
+        )
+
+    def _replay_package_facts(self, pkg, facts: fact_cache.PackageFacts) -> bool:
+        """Add facts from the fact cache to the problem, and apply their side effects.
+
+        Returns False, without modifying the setup, if the facts cannot be applied
+        """
+        try:
+            definitions = {}
+            for pkg_name in {pkg.name, *(x[0] for x in facts.variant_values)}:
+                pkg_cls = self.pkg_class(pkg_name)
+                definitions[pkg_name] = {
+                    name: [id(d) for _, d in pkg_cls.variant_definitions(name)]
+                    for name in pkg_cls.variant_names()
+                }
+            variant_ids = [
+                (definitions[pkg.name][name][idx], rel_id)
+                for name, idx, rel_id in facts.variant_ids
+            ]
+            variant_values = [
+                (pkg_name, definitions[pkg_name][name][idx], value)
+                for pkg_name, name, idx, value in facts.variant_values
+            ]
+            version_constraints = [
+                (name, vn.VersionList([versions])) for name, versions in facts.version_constraints
+            ]
+            target_constraints = [
+                spack.spec._make_microarchitecture(x) for x in facts.target_constraints
+            ]
+        except (KeyError, IndexError, ValueError, spack.error.SpackError) as e:
+            tty.debug(f"[SOLVER FACT CACHE] cannot replay facts for {pkg.name}: {e}")
+            return False
+
+        ids = [next(self._id_counter) for _ in range(facts.ids)]
+        for chunk in facts.asp:
+            self.gen.append(fact_cache.relocate(chunk, ids))
+
+        for def_id, rel_id in variant_ids:
+            self.variant_ids_by_def_id[def_id] = ids[rel_id]
+        self.variant_values_from_specs.update(variant_values)
+        self.version_constraints.update(version_constraints)
+        self.target_constraints.update(target_constraints)
+        return True
+
     def trigger_rules(self):
         """Flushes all the trigger rules collected so far, and clears the cache."""
         if not self._trigger_cache:
@@ -1730,6 +2133,7 @@ def define_variant(
 
         self.gen.newline()
 
+    @setup_phase
     def define_auto_variant(self, name: str, multi: bool):
         self.gen.h3(f"Special variant: {name}")
         vid = next(self._id_counter)
@@ -2056,12 +2460,14 @@ def virtual_preferences(self, pkg_name, func):
                 func(vspec, provider_name, i)
             self.gen.newline()
 
+    @setup_phase
     def provider_defaults(self):
         self.gen.h2("Default virtual providers")
         self.virtual_preferences(
             "all", lambda v, p, i: self.gen.fact(fn.default_provider_preference(v, p, i))
         )
 
+    @setup_phase
     def provider_requirements(self):
         self.gen.h2("Requirements on virtual providers")
         for virtual_str in sorted(self.possible_virtuals):
@@ -2158,6 +2564,7 @@ def emit_facts_from_requirement_rules(self, rules: List[RequirementRule]):
                 self.gen.newline()
                 requirement_weight += 1
 
+    @setup_phase
     def external_packages(self):
         """Facts on external packages, from packages.yaml and implicit externals."""
         self.gen.h1("External packages")
@@ -2287,6 +2694,7 @@ def external_imposition(input_spec, requirements):
             self.trigger_rules()
             self.effect_rules()
 
+    @setup_phase
     def preferred_variants(self, pkg_name):
         """Facts on concretization preferences, as read from packages.yaml"""
         preferences = spack.package_prefs.PackagePrefs
@@ -2620,6 +3028,7 @@ def _spec_clauses(
         clauses.extend(edge_clauses)
         return clauses
 
+    @setup_phase
     def define_package_versions_and_validate_preferences(
         self, possible_pkgs: Set[str], *, require_checksum: bool, allow_deprecated: bool
     ):
@@ -2680,6 +3089,7 @@ def define_package_versions_and_validate_preferences(
                 )
                 self.possible_versions[pkg_name].add(vdef)
 
+    @setup_phase
     def define_ad_hoc_versions_from_specs(
         self, specs, origin, *, allow_deprecated: bool, require_checksum: bool
     ):
@@ -2727,12 +3137,14 @@ def _supported_targets(self, compiler_name, compiler_version, targets):
 
         return supported, unsupported
 
+    @setup_phase
     def platform_defaults(self):
         self.gen.h2("Default platform")
         platform = spack.platforms.host()
         self.gen.fact(fn.node_platform_default(platform))
         self.gen.fact(fn.allowed_platform(platform))
 
+    @setup_phase
     def os_defaults(self, specs):
         self.gen.h2("Possible operating systems")
         platform = spack.platforms.host()
@@ -2765,6 +3177,7 @@ def keyfun(os):
         for i, os_name in enumerate(ordered_oses):
             self.gen.fact(fn.os(os_name, i))
 
+    @setup_phase
     def target_defaults(self, specs):
         """Add facts about targets and target compatibility."""
         self.gen.h2("Target compatibility")
@@ -2843,12 +3256,14 @@ def target_defaults(self, specs):
         self.default_targets = list(sorted(set(self.default_targets)))
         self.target_preferences()
 
+    @setup_phase
     def virtual_providers(self):
         self.gen.h2("Virtual providers")
         for vspec in sorted(self.possible_virtuals):
             self.gen.fact(fn.virtual(vspec))
         self.gen.newline()
 
+    @setup_phase
     def define_version_constraints(self):
         """Define what version_satisfies(...) means in ASP logic."""
 
@@ -2869,6 +3284,7 @@ def define_version_constraints(self):
                 self.gen.fact(fn.pkg_fact(pkg_name, fn.version_satisfies(versions, v)))
             self.gen.newline()
 
+    @setup_phase
     def collect_virtual_constraints(self):
         """Define versions for constraints on virtuals.
 
@@ -2900,6 +3316,7 @@ def versions_for(v):
             for version in sorted(possible_versions):
                 self.possible_versions[pkg_name].add(version)
 
+    @setup_phase
     def define_compiler_version_constraints(self):
         for constraint in sorted(self.compiler_version_constraints):
             for compiler_id, compiler in enumerate(self.possible_compilers):
@@ -2911,6 +3328,7 @@ def define_compiler_version_constraints(self):
                     )
         self.gen.newline()
 
+    @setup_phase
     def define_target_constraints(self):
         def _all_targets_satisfiying(single_constraint):
             allowed_targets = []
@@ -2944,6 +3362,7 @@ def _all_targets_satisfiying(single_constraint):
                 self.gen.fact(fn.target_satisfies(target_constraint, target))
             self.gen.newline()
 
+    @setup_phase
     def define_variant_values(self):
         """Validate variant values from the command line.
 
@@ -2979,15 +3398,31 @@ def register_concrete_spec(self, spec, possible):
 
         self.reusable_and_possible.add(spec)
 
+    @setup_phase
     def concrete_specs(self):
         """Emit facts for reusable specs"""
+        libcs = ",".join(sorted(str(x) for x in self.libcs))
+        cache = self.concrete_spec_fact_cache(f"{using_libc_compatibility()}:{libcs}")
+        groups: Dict[Tuple[str, ...], int] = {}
         for h, spec in self.reusable_and_possible.explicit_items():
-            # this indicates that there is a spec like this installed
-            self.gen.fact(fn.installed_hash(spec.name, h))
-            # indirection layer between hash constraints and imposition to allow for splicing
-            for pred in self.spec_clauses(spec, body=True, required_from=None):
-                self.gen.fact(fn.hash_attr(h, *pred.args))
-            self.gen.newline()
+            with self.profiler.package(spec.name, "concrete_specs", self):
+                # this indicates that there is a spec like this installed
+                self.gen.fact(fn.installed_hash(spec.name, h))
+                facts = self._concrete_spec_facts(spec, cache)
+
+                # attributes not referring to other hashes are emitted once for all the specs
+                # sharing them
+                shared = tuple(facts.shared)
+                if shared not in groups:
+                    groups[shared] = len(groups)
+                    for args in shared:
+                        self.gen.append(f"hash_group_attr({groups[shared]},{args}).\n")
+                self.gen.fact(fn.hash_attr_group(h, groups[shared]))
+
+                # indirection layer between hash constraints and imposition to allow for splicing
+                for args in facts.specific:
+                    self.gen.append(f'hash_attr("{h}",{args}).\n')
+                self.gen.newline()
             # Declare as possible parts of specs that are not in package.py
             # - Add versions to possible versions
             # - Add OS to possible OS's
@@ -3007,6 +3442,80 @@ def concrete_specs(self):
                     )
                 self.possible_oses.add(dep.os)
 
+        if cache is not None:
+            cache.flush()
+
+    def concrete_spec_fact_cache(self, digest: str) -> Optional[fact_cache.ConcreteSpecFactCache]:
+        """Returns the cache for the facts of reusable specs, if enabled or memoized. The
+        same cache is returned as long as the digest of the settings doesn't change.
+        """
+        cache = self._concrete_spec_fact_cache
+        if cache is None or cache.settings != digest:
+            cache = fact_cache.concrete_spec_fact_cache_from_config(
+                digest, in_memory=self.memoize_facts
+            )
+            self._concrete_spec_fact_cache = cache
+        return cache
+
+    def _concrete_spec_facts(
+        self, spec: spack.spec.Spec, cache: Optional[fact_cache.ConcreteSpecFactCache]
+    ) -> fact_cache.ConcreteSpecFacts:
+        """Returns the facts for a reusable spec, and applies the side effects of generating
+        them. Facts are taken from the cache, if possible."""
+        dag_hash = spec.dag_hash()
+        facts = cache.fetch(dag_hash) if cache is not None else None
+        if facts is not None:
+            try:
+                version_constraints = [
+                    (name, vn.VersionList([versions]))
+                    for name, versions in facts.version_constraints
+                ]
+                target_constraints = [
+                    spack.spec._make_microarchitecture(x) for x in facts.target_constraints
+                ]
+            except (ValueError, spack.error.SpackError) as e:
+                tty.debug(f"[SOLVER FACT CACHE] cannot replay facts for {spec.short_spec}: {e}")
+            else:
+                self.version_constraints.update(version_constraints)
+                self.target_constraints.update(target_constraints)
+                return facts
+
+        # Record side effects from scratch, so that they can be stored with the facts
+        saved_version_constraints = self.version_constraints
+        saved_target_constraints = self.target_constraints
+        self.version_constraints, self.target_constraints = set(), set()
+        try:
+            clauses = self.spec_clauses(spec, body=True, required_from=None)
+            new_version_constraints = self.version_constraints
+            new_target_constraints = self.target_constraints
+        finally:
+            self.version_constraints = saved_version_constraints
+            self.target_constraints = saved_target_constraints
+        self.version_constraints.update(new_version_constraints)
+        self.target_constraints.update(new_target_constraints)
+
+        shared, specific = [], []
+        for clause in clauses:
+            # str(AspFunction) is "name(args)", and we need just the arguments
+            args = str(AspFunction("", clause.args))[1:-1]
+            if clause.args[0] in ("hash", "concrete_build_dependency"):
+                specific.append(args)
+            else:
+                shared.append(args)
+
+        facts = fact_cache.ConcreteSpecFacts(
+            shared=shared,
+            specific=specific,
+            version_constraints=sorted(
+                (name, str(versions)) for name, versions in new_version_constraints
+            ),
+            target_constraints=sorted(str(x) for x in new_target_constraints),
+        )
+        if cache is not None:
+            cache.store(dag_hash, facts)
+        return facts
+
+    @setup_phase
     def define_concrete_input_specs(self, specs, possible):
         # any concrete specs in the input spec list
         for input_spec in specs:
@@ -3034,6 +3543,7 @@ def setup(
         """
         reuse = reuse or []
         check_packages_exist(specs)
+        self._initialize_problem_state()
         self.gen = ProblemInstanceBuilder(randomize="SPACK_SOLVER_RANDOMIZATION" in os.environ)
 
         # Compute possible compilers first, so we can record which dependencies they might inject
@@ -3149,9 +3659,10 @@ def setup(
 
         self.gen.h1("Package Constraints")
         for pkg in sorted(self.pkgs):
-            self.gen.h2(f"Package rules: {pkg}")
-            self.pkg_rules(pkg, tests=self.tests)
-            self.preferred_variants(pkg)
+            with self.profiler.package(pkg, "pkg_rules", self):
+                self.gen.h2(f"Package rules: {pkg}")
+                self.pkg_rules(pkg, tests=self.tests)
+                self.preferred_variants(pkg)
 
         self.gen.h1("Special variants")
         self.define_auto_variant("dev_path", multi=False)
@@ -3186,24 +3697,14 @@ def setup(
 
         return self.gen.value()
 
+    @setup_phase
     def internal_errors(self):
-        parent_dir = os.path.dirname(__file__)
-
-        def visit(node):
-            if ast_type(node) == clingo().ast.ASTType.Rule:
-                for term in node.body:
-                    if ast_type(term) == clingo().ast.ASTType.Literal:
-                        if ast_type(term.atom) == clingo().ast.ASTType.SymbolicAtom:
-                            name = ast_sym(term.atom).name
-                            if name == "internal_error":
-                                arg = ast_sym(ast_sym(term.atom).arguments[0])
-                                symbol = AspFunction(name)(arg.string)
-                                self.assumptions.append((parse_term(str(symbol)), True))
-                                self.gen.asp_problem.append(f"{{ {symbol} }}.\n")
-
-        path = os.path.join(parent_dir, "concretize.lp")
-        parse_files([path], visit)
+        path = os.path.join(os.path.dirname(__file__), "concretize.lp")
+        for symbol in _internal_error_atoms(path):
+            self.assumptions.append((parse_term(symbol), True))
+            self.gen.asp_problem.append(f"{{ {symbol} }}.\n")
 
+    @setup_phase
     def define_runtime_constraints(self) -> List[spack.spec.Spec]:
         """Define the constraints to be imposed on the runtimes, and returns a list of
         injected packages.
@@ -3261,6 +3762,7 @@ def define_runtime_constraints(self) -> List[spack.spec.Spec]:
         recorder.consume_facts()
         return sorted(recorder.injected_dependencies)
 
+    @setup_phase
     def literal_specs(self, specs):
         for spec in sorted(specs):
             self.gen.h2(f"Spec: {str(spec)}")
@@ -3357,6 +3859,7 @@ def virtual_handler(input_spec, requirements):
                 # A variant in the 'when=' condition can't apply to the parent of the edge
                 tty.debug(f"[{__name__}] cannot emit subcondition for {dspec.format()}: {e}")
 
+    @setup_phase
     def validate_and_define_versions_from_requirements(
         self, *, allow_deprecated: bool, require_checksum: bool
     ):
@@ -3461,6 +3964,29 @@ class _Body:
     propagate = fn.attr("propagate")
 
 
+@spack.llnl.util.lang.memoized
+def _internal_error_atoms(path: str) -> Tuple[str, ...]:
+    """Returns the internal_error atoms in the body of the rules of a logic program.
+
+    The logic programs shipped with Spack don't change while Spack runs, so they are parsed
+    only once, instead of once per solve.
+    """
+    result = []
+
+    def visit(node):
+        if ast_type(node) == clingo().ast.ASTType.Rule:
+            for term in node.body:
+                if ast_type(term) == clingo().ast.ASTType.Literal:
+                    if ast_type(term.atom) == clingo().ast.ASTType.SymbolicAtom:
+                        name = ast_sym(term.atom).name
+                        if name == "internal_error":
+                            arg = ast_sym(ast_sym(term.atom).arguments[0])
+                            result.append(str(AspFunction(name)(arg.string)))
+
+    parse_files([path], visit)
+    return tuple(result)
+
+
 class ProblemInstanceBuilder:
     """Provides an interface to construct a problem instance.
 
@@ -4218,13 +4744,32 @@ class Solver:
     def __init__(self):
         self.driver = PyclingoDriver()
         self.selector = ReusableSpecsSelector(configuration=spack.config.CONFIG)
+        #: Analyzer shared by all the solves, set only after a warm-up
+        self.possible_graph: Optional[PossibleDependencyGraph] = None
+
+    def warm_up(self, specs: List[spack.spec.Spec]) -> None:
+        """Compute upfront the data that can be shared by all the subsequent solves done
+        with this object: the selection of reusable specs, and the analysis of the possible
+        dependencies of the input specs.
+
+        This is meant to be called before forking worker processes, so that the data is
+        shared copy-on-write by the workers instead of being recomputed by each of them.
+        """
+        self.selector.warm_up()
+        self.possible_graph = create_graph_analyzer()
+        try:
+            self.possible_graph.possible_dependencies(
+                *(s for s in specs if s.name and not s.concrete), allowed_deps=dt.ALL
+            )
+        except spack.error.SpackError as e:
+            # Errors are reported by the solves needing the data
+            tty.debug(f"[SOLVER] cannot analyze possible dependencies during warm-up: {e}")
 
-    @staticmethod
     def _check_input_and_extract_concrete_specs(
-        specs: List[spack.spec.Spec],
+        self, specs: List[spack.spec.Spec]
     ) -> List[spack.spec.Spec]:
         reusable: List[spack.spec.Spec] = []
-        analyzer = create_graph_analyzer()
+        analyzer = self.possible_graph or create_graph_analyzer()
         for root in specs:
             for s in root.traverse():
                 if s.concrete:
@@ -4268,6 +4813,8 @@ def solve_with_stats(
         tests=False,
         setup_only=False,
         allow_deprecated=False,
+        profile=None,
+        reusable_specs=(),
     ):
         """
         Concretize a set of specs and track the timing and statistics for the solve
@@ -4282,17 +4829,21 @@ def solve_with_stats(
             packages (defaults to False: do not concretize test dependencies).
           setup_only (bool): if True, stop after setup and don't solve (default False).
           allow_deprecated (bool): allow deprecated version in the solve
+          profile (SolveProfile): if given, record a profiling report of the solve in it
+          reusable_specs (list): concrete specs that can be reused, with the same preference as
+            the nodes of concrete input specs
         """
         specs = [s.lookup_hash() for s in specs]
-        reusable_specs = self._check_input_and_extract_concrete_specs(specs)
-        reusable_specs.extend(self.selector.reusable_specs(specs))
-        setup = SpackSolverSetup(tests=tests)
-        output = OutputConfiguration(timers=timers, stats=stats, out=out, setup_only=setup_only)
+        reuse = self._check_input_and_extract_concrete_specs(specs)
+        reuse.extend(reusable_specs)
+        reuse.extend(self.selector.reusable_specs(specs))
+        setup = SpackSolverSetup(tests=tests, possible_graph=self.possible_graph)
+        output = OutputConfiguration(
+            timers=timers, stats=stats, out=out, setup_only=setup_only, profile=profile
+        )
 
-        CONC_CACHE.flush_manifest()
-        CONC_CACHE.cleanup()
         return self.driver.solve(
-            setup, specs, reuse=reusable_specs, output=output, allow_deprecated=allow_deprecated
+            setup, specs, reuse=reuse, output=output, allow_deprecated=allow_deprecated
         )
 
     def solve(self, specs, **kwargs):
@@ -4305,7 +4856,14 @@ def solve(self, specs, **kwargs):
         return result
 
     def solve_in_rounds(
-        self, specs, out=None, timers=False, stats=False, tests=False, allow_deprecated=False
+        self,
+        specs,
+        out=None,
+        timers=False,
+        stats=False,
+        tests=False,
+        allow_deprecated=False,
+        profile=None,
     ):
         """Solve for a stable model of specs in multiple rounds.
 
@@ -4315,6 +4873,13 @@ def solve_in_rounds(
 
         The function is a generator that yields the result of each round.
 
+        The facts generated by the setup for packages and reusable specs are memoized across
+        rounds, but each round creates a new clingo control, and grounds the logic programs
+        and the whole problem instance again. A control cannot be kept alive across rounds
+        yet, since clingo doesn't ground again the rules of a program part with the facts
+        added by later parts: the specs solved in a round are reusable in the next ones, so
+        the rules matching reusable specs would need to be in a part grounded every round.
+
         Arguments:
             specs (list): list of Specs to solve.
             out: Optionally write the generate ASP program to a file-like object.
@@ -4322,17 +4887,22 @@ def solve_in_rounds(
             stats (bool): print internal statistics if set to True
             tests (bool): add test dependencies to the solve
             allow_deprecated (bool): allow deprecated version in the solve
+            profile (SolveProfile): if given, record a profiling report of each round in it
         """
         specs = [s.lookup_hash() for s in specs]
         reusable_specs = self._check_input_and_extract_concrete_specs(specs)
         reusable_specs.extend(self.selector.reusable_specs(specs))
-        setup = SpackSolverSetup(tests=tests)
+        setup = SpackSolverSetup(
+            tests=tests, possible_graph=self.possible_graph, memoize_facts=True
+        )
 
         # Tell clingo that we don't have to solve all the inputs at once
         setup.concretize_everything = False
 
         input_specs = specs
-        output = OutputConfiguration(timers=timers, stats=stats, out=out, setup_only=False)
+        output = OutputConfiguration(
+            timers=timers, stats=stats, out=out, setup_only=False, profile=profile
+        )
         while True:
             result, _, _ = self.driver.solve(
                 setup,
@@ -4356,9 +4926,6 @@ def solve_in_rounds(
             for spec in result.specs:
                 reusable_specs.extend(spec.traverse())
 
-        CONC_CACHE.flush_manifest()
-        CONC_CACHE.cleanup()
-
 
 class UnsatisfiableSpecError(spack.error.UnsatisfiableSpecError):
     """There was an issue with the spec that was requested (i.e. a user error)."""
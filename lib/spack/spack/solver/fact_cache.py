@@ -0,0 +1,352 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+"""Persistent caches for the facts that the solver derives from package recipes, and from
+reusable concrete specs.
+
+The facts coming from the directives in a ``package.py`` (variants, conflicts, provided virtuals,
+dependencies and splices) depend only on the recipe, on a handful of solver settings, and on the
+code generating them. Here we store them on disk, keyed by a digest of all these inputs, so that
+the setup phase of the solver can skip regenerating them for packages that did not change.
+
+Condition ids are global to a problem instance, so they are stored in a relocatable form and
+assigned from the current id counter when an entry is replayed.
+
+Facts coming from a concrete spec depend only on its DAG hash, and on the code generating them,
+so they are stored in an index keyed by DAG hash.
+
+Both caches keep the entries they read or store in memory. A solver setup that is used for more
+than one solve, like the rounds of ``Solver.solve_in_rounds``, uses them without a backing store
+when the persistent cache is disabled, so that facts are generated only once for all solves.
+"""
+import functools
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import re
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import spack
+import spack.caches
+import spack.config
+import spack.llnl.util.tty as tty
+import spack.util.file_cache
+
+#: Bump this number whenever the structure of a cache entry changes
+FACT_CACHE_FORMAT_VERSION = 1
+
+#: Character delimiting relocatable ids in cached facts
+_ID_MARKER = "\x00"
+_ID_RE = re.compile(f"{_ID_MARKER}([0-9]+){_ID_MARKER}")
+
+
+class RelocatableId(int):
+    """An id that is rendered as a placeholder in ASP code, so it can be relocated later."""
+
+    def __str__(self) -> str:
+        return f"{_ID_MARKER}{int(self)}{_ID_MARKER}"
+
+    def __format__(self, format_spec: str) -> str:
+        return str(self)
+
+
+def relocatable_ids() -> Iterator[RelocatableId]:
+    """Counter yielding relocatable ids, starting from zero"""
+    return (RelocatableId(i) for i in itertools.count())
+
+
+def relocate(asp: str, ids: List[int]) -> str:
+    """Replace relocatable ids in ASP code with actual ids.
+
+    Arguments:
+        asp: ASP code with relocatable ids
+        ids: actual ids, indexed by the corresponding relocatable id
+    """
+    if _ID_MARKER not in asp:
+        return asp
+    return _ID_RE.sub(lambda m: str(ids[int(m.group(1))]), asp)
+
+
+class PackageFacts(NamedTuple):
+    """Facts generated from the directives of a single package, and the side effects that
+    generating them has on the solver setup.
+    """
+
+    #: Chunks of ASP code, as they were added to the problem instance builder
+    asp: List[str]
+    #: Number of relocatable ids used in ``asp``
+    ids: int
+    #: Version constraints encountered, as (package name, version constraint) tuples
+    version_constraints: List[Tuple[str, str]]
+    #: Target constraints encountered
+    target_constraints: List[str]
+    #: Variant definitions, as (variant name, definition index, relocatable id) tuples
+    variant_ids: List[Tuple[str, int, int]]
+    #: Variant values from specs, as (package, variant name, definition index, value) tuples
+    variant_values: List[Tuple[str, str, int, Any]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._asdict()
+
+    @staticmethod
+    def from_dict(obj: Dict[str, Any]) -> "PackageFacts":
+        return PackageFacts(
+            asp=list(obj["asp"]),
+            ids=int(obj["ids"]),
+            version_constraints=[tuple(x) for x in obj["version_constraints"]],
+            target_constraints=list(obj["target_constraints"]),
+            variant_ids=[tuple(x) for x in obj["variant_ids"]],
+            variant_values=[tuple(x) for x in obj["variant_values"]],
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def _generator_digest() -> str:
+    """Digest of the code generating package facts"""
+    h = hashlib.sha256(f"{FACT_CACHE_FORMAT_VERSION}:{spack.spack_version}".encode())
+    solver_dir = os.path.dirname(__file__)
+    for name in ("asp.py", "fact_cache.py"):
+        with open(os.path.join(solver_dir, name), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class PackageFactCache:
+    """Stores the facts generated from package recipes, one entry per package.
+
+    Each entry records the digest it was generated for, and is overwritten when the digest
+    changes. This keeps the cache bounded by the number of packages in the repositories.
+
+    If ``cache`` is None, entries are kept only in memory.
+    """
+
+    def __init__(
+        self, cache: Optional[spack.util.file_cache.FileCache], prefix: str = "solver-facts"
+    ):
+        self.cache = cache
+        self.prefix = prefix
+        self._source_digests: Dict[str, str] = {}
+        self._entries: Dict[str, Tuple[str, PackageFacts]] = {}
+
+    def _source_digest(self, path: str) -> str:
+        if path not in self._source_digests:
+            with open(path, "rb") as f:
+                self._source_digests[path] = hashlib.sha256(f.read()).hexdigest()
+        return self._source_digests[path]
+
+    def package_digest(self, pkg_cls) -> str:
+        """Digest of the sources of a package class, and of all its base classes."""
+        h = hashlib.sha256()
+        for cls in pkg_cls.__mro__:
+            if cls is object:
+                continue
+            h.update(f"{cls.__module__}.{cls.__qualname__}".encode())
+            try:
+                path = inspect.getsourcefile(cls)
+            except TypeError:
+                path = None
+            if path and os.path.exists(path):
+                h.update(self._source_digest(path).encode())
+        return h.hexdigest()
+
+    def digest(self, pkg_cls, **settings) -> str:
+        """Return the key under which the facts for a package are stored.
+
+        Arguments:
+            pkg_cls: package class
+            settings: any other input that affects the facts being generated. Must be
+                JSON serializable.
+        """
+        h = hashlib.sha256()
+        h.update(_generator_digest().encode())
+        h.update(self.package_digest(pkg_cls).encode())
+        h.update(json.dumps(settings, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def _key(self, pkg_cls) -> str:
+        return f"{self.prefix}/{pkg_cls.namespace}/{pkg_cls.name}.json"
+
+    def fetch(self, pkg_cls, digest: str) -> Optional[PackageFacts]:
+        """Return the facts for a package, or None if there is no valid cache entry"""
+        key = self._key(pkg_cls)
+        if key in self._entries and self._entries[key][0] == digest:
+            return self._entries[key][1]
+        if self.cache is None:
+            return None
+        try:
+            if not self.cache.init_entry(key):
+                return None
+            with self.cache.read_transaction(key) as f:
+                if f is None:
+                    return None
+                data = json.load(f)
+            if data.get("digest") != digest:
+                return None
+            facts = PackageFacts.from_dict(data["facts"])
+            self._entries[key] = (digest, facts)
+            return facts
+        except (OSError, ValueError, KeyError, TypeError, spack.util.file_cache.CacheError) as e:
+            tty.debug(f"[SOLVER FACT CACHE] cannot read entry for {pkg_cls.name}: {e}")
+            return None
+
+    def store(self, pkg_cls, digest: str, facts: PackageFacts) -> None:
+        """Store the facts for a package, replacing any previous entry"""
+        key = self._key(pkg_cls)
+        self._entries[key] = (digest, facts)
+        if self.cache is None:
+            return
+        try:
+            self.cache.init_entry(key)
+            with self.cache.write_transaction(key) as (old, new):
+                json.dump({"digest": digest, "facts": facts.to_dict()}, new)
+        except (OSError, spack.util.file_cache.CacheError) as e:
+            tty.debug(f"[SOLVER FACT CACHE] cannot write entry for {pkg_cls.name}: {e}")
+
+
+class ConcreteSpecFacts(NamedTuple):
+    """Facts generated from a concrete spec, and the side effects that generating them has on
+    the solver setup. Facts are stored as the rendered arguments of ``hash_attr``, without the
+    hash itself.
+    """
+
+    #: Arguments of facts that don't refer to any hash, and may be shared with other specs
+    shared: List[str]
+    #: Arguments of facts that refer to a hash
+    specific: List[str]
+    #: Version constraints encountered, as (package name, version constraint) tuples
+    version_constraints: List[Tuple[str, str]]
+    #: Target constraints encountered
+    target_constraints: List[str]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._asdict()
+
+    @staticmethod
+    def from_dict(obj: Dict[str, Any]) -> "ConcreteSpecFacts":
+        return ConcreteSpecFacts(
+            shared=list(obj["shared"]),
+            specific=list(obj["specific"]),
+            version_constraints=[tuple(x) for x in obj["version_constraints"]],
+            target_constraints=list(obj["target_constraints"]),
+        )
+
+
+class ConcreteSpecFactCache:
+    """Stores the facts generated from concrete specs, keyed by DAG hash.
+
+    Entries are grouped in shards by the first two characters of the hash. Shards are read the
+    first time one of their entries is needed, and new entries are written back by ``flush``.
+    Each shard records the digest of the settings it was generated for, and is discarded when
+    the digest changes.
+
+    If ``cache`` is None, entries are kept only in memory.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[spack.util.file_cache.FileCache],
+        digest: str,
+        prefix: str = "solver-reuse",
+    ):
+        self.cache = cache
+        self.prefix = prefix
+        self.settings = digest
+        self.digest = hashlib.sha256(f"{_generator_digest()}:{digest}".encode()).hexdigest()
+        self._shards: Dict[str, Dict[str, Any]] = {}
+        self._modified: Set[str] = set()
+
+    def _key(self, shard: str) -> str:
+        return f"{self.prefix}/{shard}.json"
+
+    def _read_shard(self, shard: str) -> Dict[str, Any]:
+        if self.cache is None:
+            return {}
+        key = self._key(shard)
+        try:
+            if not self.cache.init_entry(key):
+                return {}
+            with self.cache.read_transaction(key) as f:
+                if f is None:
+                    return {}
+                data = json.load(f)
+            if data.get("digest") != self.digest:
+                return {}
+            return data["specs"]
+        except (OSError, ValueError, KeyError, TypeError, spack.util.file_cache.CacheError) as e:
+            tty.debug(f"[SOLVER FACT CACHE] cannot read shard {shard}: {e}")
+            return {}
+
+    def _shard(self, dag_hash: str) -> Dict[str, Any]:
+        shard = dag_hash[:2]
+        if shard not in self._shards:
+            self._shards[shard] = self._read_shard(shard)
+        return self._shards[shard]
+
+    def fetch(self, dag_hash: str) -> Optional[ConcreteSpecFacts]:
+        """Return the facts for a concrete spec, or None if there is no valid cache entry"""
+        entry = self._shard(dag_hash).get(dag_hash)
+        if entry is None:
+            return None
+        try:
+            return ConcreteSpecFacts.from_dict(entry)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def store(self, dag_hash: str, facts: ConcreteSpecFacts) -> None:
+        """Store the facts for a concrete spec. They are written to disk by ``flush``."""
+        self._shard(dag_hash)[dag_hash] = facts.to_dict()
+        self._modified.add(dag_hash[:2])
+
+    def flush(self) -> None:
+        """Write to disk the shards with new entries, merging them with entries written
+        concurrently by other processes."""
+        if self.cache is None:
+            self._modified.clear()
+            return
+        for shard in sorted(self._modified):
+            key = self._key(shard)
+            try:
+                self.cache.init_entry(key)
+                with self.cache.write_transaction(key) as (old, new):
+                    specs = {}
+                    if old is not None:
+                        try:
+                            data = json.load(old)
+                            if data.get("digest") == self.digest:
+                                specs = data["specs"]
+                        except (ValueError, KeyError, TypeError):
+                            pass
+                    specs.update(self._shards[shard])
+                    json.dump({"digest": self.digest, "specs": specs}, new)
+            except (OSError, spack.util.file_cache.CacheError) as e:
+                tty.debug(f"[SOLVER FACT CACHE] cannot write shard {shard}: {e}")
+        self._modified.clear()
+
+
+def fact_cache_from_config(in_memory: bool = False) -> Optional[PackageFactCache]:
+    """Return the cache of package facts, or None if it is disabled in configuration.
+
+    Arguments:
+        in_memory: if True, return a cache without backing store when the persistent one is
+            disabled in configuration, instead of None
+    """
+    if not spack.config.get("concretizer:fact_cache", False):
+        return PackageFactCache(None) if in_memory else None
+    return PackageFactCache(spack.caches.MISC_CACHE)
+
+
+def concrete_spec_fact_cache_from_config(
+    digest: str, in_memory: bool = False
+) -> Optional[ConcreteSpecFactCache]:
+    """Return the cache of concrete spec facts, or None if it is disabled in configuration.
+
+    Arguments:
+        digest: digest of any setting, other than the spec, that affects the facts
+        in_memory: if True, return a cache without backing store when the persistent one is
+            disabled in configuration, instead of None
+    """
+    if not spack.config.get("concretizer:fact_cache", False):
+        return ConcreteSpecFactCache(None, digest) if in_memory else None
+    return ConcreteSpecFactCache(spack.caches.MISC_CACHE, digest)
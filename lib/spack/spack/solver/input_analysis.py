@@ -27,7 +27,7 @@ class PossibleGraph(NamedTuple):
 class PossibleDependencyGraph:
     """Returns information needed to set up an ASP problem"""
 
-    def unreachable(self, *, pkg_name: str, when_spec: spack.spec.Spec) -> bool:
+    def unreachable(self, *, pkg_name: str, when_spec: Union[str, spack.spec.Spec]) -> bool:
         """Returns true if the context can determine that the condition cannot ever
         be met on pkg_name.
         """
@@ -83,16 +83,11 @@ def is_virtual(self, name: str) -> bool:
     @lang.memoized
     def is_allowed_on_this_platform(self, *, pkg_name: str) -> bool:
         """Returns true if a package is allowed on the current host"""
-        pkg_cls = self.repo.get_pkg_class(pkg_name)
-        no_condition = spack.spec.Spec()
-        for when_spec, conditions in pkg_cls.requirements.items():
-            # Restrict analysis to unconditional requirements
-            if when_spec != no_condition:
-                continue
-            for requirements, _, _ in conditions:
-                if not any(x.intersects(self._platform_condition) for x in requirements):
-                    tty.debug(f"[{__name__}] {pkg_name} is not for this platform")
-                    return False
+        # The index stores only unconditional requirements
+        for requirements in self.repo.dependency_index.requirements(pkg_name):
+            if not any(self._platform_condition.intersects(x) for x in requirements):
+                tty.debug(f"[{__name__}] {pkg_name} is not for this platform")
+                return False
         return True
 
     def providers_for(self, virtual_str: str) -> List[spack.spec.Spec]:
@@ -103,7 +98,7 @@ def can_be_installed(self, *, pkg_name) -> bool:
         """Returns True if a package can be installed, False otherwise."""
         return True
 
-    def unreachable(self, *, pkg_name: str, when_spec: spack.spec.Spec) -> bool:
+    def unreachable(self, *, pkg_name: str, when_spec: Union[str, spack.spec.Spec]) -> bool:
         """Returns true if the context can determine that the condition cannot ever
         be met on pkg_name.
         """
@@ -163,8 +158,8 @@ def possible_dependencies(
             if pkg_name in self.libc_pkgs:
                 continue
 
-            pkg_cls = self.repo.get_pkg_class(pkg_name=pkg_name)
-            for name, conditions in pkg_cls.dependencies_by_name(when=True).items():
+            dependencies = self.repo.dependency_index.dependencies(pkg_name)
+            for name, conditions in dependencies.items():
                 if all(self.unreachable(pkg_name=pkg_name, when_spec=x) for x in conditions):
                     tty.debug(
                         f"[{__name__}] Not adding {name} as a dep of {pkg_name}, because "
@@ -224,14 +219,14 @@ def _package_list(self, specs: Tuple[Union[spack.spec.Spec, str], ...]) -> List[
             stack.append(current_spec.name)
         return sorted(set(stack))
 
-    def _has_deptypes(self, dependencies, *, allowed_deps: dt.DepFlag, strict: bool) -> bool:
+    def _has_deptypes(
+        self, dependencies: Dict[str, List[int]], *, allowed_deps: dt.DepFlag, strict: bool
+    ) -> bool:
         if strict is True:
             return any(
-                dep.depflag == allowed_deps for deplist in dependencies.values() for dep in deplist
+                depflag == allowed_deps for flags in dependencies.values() for depflag in flags
             )
-        return any(
-            dep.depflag & allowed_deps for deplist in dependencies.values() for dep in deplist
-        )
+        return any(depflag & allowed_deps for flags in dependencies.values() for depflag in flags)
 
     def _is_possible(self, *, pkg_name):
         try:
@@ -311,7 +306,7 @@ def _is_provider_candidate(self, *, pkg_name: str, virtual: str) -> bool:
         return True
 
     @lang.memoized
-    def unreachable(self, *, pkg_name: str, when_spec: spack.spec.Spec) -> bool:
+    def unreachable(self, *, pkg_name: str, when_spec: Union[str, spack.spec.Spec]) -> bool:
         """Returns true if the context can determine that the condition cannot ever
         be met on pkg_name.
         """
@@ -0,0 +1,218 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+"""Parallel portfolio solving.
+
+The same ground problem can take very different times to solve depending on the search
+configuration of clingo, and on the domain heuristic in use. In portfolio mode, a problem
+instance is solved by a few differently configured clingo instances, each in its own process.
+The first one that proves the optimality of its answer wins, and the others are terminated.
+
+Members of the portfolio differ only in how they search, so all of them find answers with the
+same, optimal, cost. When more than one answer has the optimal cost, though, different members
+may return different answers.
+"""
+import multiprocessing
+import os
+import queue
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import spack.config
+import spack.llnl.util.tty as tty
+import spack.util.path
+
+from .core import clingo, parse_term
+
+#: Members used when portfolio solving is enabled, but no member is configured
+DEFAULT_MEMBERS: List[Dict[str, Any]] = [
+    {"name": "tweety"},
+    {"name": "trendy", "configuration": "trendy"},
+    {"name": "branch-and-bound", "opt_strategy": "bb,hier"},
+    {"name": "no-heuristic", "heuristic": None},
+]
+
+
+class PortfolioMember(NamedTuple):
+    """Configuration of a clingo instance in the portfolio"""
+
+    #: Name used to report the member
+    name: str
+    #: clingo configuration preset, as in ``clingo --configuration``
+    configuration: str = "tweety"
+    #: Logic program with the domain heuristic, or None to use no heuristic
+    heuristic: Optional[str] = "heuristic.lp"
+    #: Seed for the random number generator of the solver
+    seed: int = 0
+    #: Optimization strategy, as in ``clingo --opt-strategy``
+    opt_strategy: str = "usc,one,1"
+
+    def control(self):
+        """Returns a clingo control object configured for this member"""
+        control = clingo().Control()
+        control.configuration.configuration = self.configuration
+        control.configuration.solver.heuristic = "Domain"
+        control.configuration.solver.seed = str(self.seed)
+        control.configuration.solver.opt_strategy = self.opt_strategy
+        return control
+
+    def heuristic_path(self) -> Optional[str]:
+        """Absolute path of the heuristic of this member, if any. Relative paths are taken
+        relative to the directory of the logic programs shipped with Spack."""
+        if self.heuristic is None:
+            return None
+        return spack.util.path.canonicalize_path(
+            self.heuristic, default_wd=os.path.dirname(__file__)
+        )
+
+
+class Answer(NamedTuple):
+    """Answer of a portfolio member"""
+
+    #: Name of the member
+    member: str
+    #: Cost of the best model found
+    cost: List[int]
+    #: Shown symbols of the best model
+    symbols: List[Any]
+    #: Number of models found
+    nmodels: int
+    #: Whether the answer was proved optimal
+    optimal: bool
+    #: Statistics from clingo
+    statistics: Dict[str, Any]
+    #: Seconds from the start of the member to the answer
+    seconds: float
+
+
+def members_from_config() -> List[PortfolioMember]:
+    """Returns the members of the portfolio, or an empty list if portfolio solving is
+    disabled in configuration"""
+    config = spack.config.get("concretizer:portfolio", {}) or {}
+    if not config.get("enable", False):
+        return []
+    return [PortfolioMember(**x) for x in config.get("members") or DEFAULT_MEMBERS]
+
+
+def _solve_member(
+    member: PortfolioMember,
+    asp_problem: str,
+    control_files: List[str],
+    assumptions: List[Tuple[str, bool]],
+    time_limit: int,
+    answers,
+) -> None:
+    """Solves a problem instance with the configuration of a member, and puts the best
+    answer found in a queue. Runs in a child process."""
+    start = time.time()
+    try:
+        control = member.control()
+        control.add("base", [], asp_problem)
+        for path in control_files:
+            control.load(path)
+        heuristic = member.heuristic_path()
+        if heuristic is not None:
+            control.load(heuristic)
+        control.ground([("base", [])])
+
+        best: List[Any] = []
+        nmodels = 0
+
+        def on_model(model):
+            nonlocal best, nmodels
+            nmodels += 1
+            best = [model.cost, [str(x) for x in model.symbols(shown=True, terms=True)]]
+
+        assumptions_symbols = [(parse_term(x), value) for x, value in assumptions]
+        with control.solve(assumptions=assumptions_symbols, on_model=on_model, async_=True) as h:
+            finished = h.wait(time_limit)
+            if not finished:
+                h.cancel()
+            result = h.get()
+
+        if not result.satisfiable:
+            answers.put((member.name, None))
+            return
+
+        optimal = bool(finished and result.exhausted)
+        answer = Answer(
+            member=member.name,
+            cost=best[0],
+            symbols=best[1],
+            nmodels=nmodels,
+            optimal=optimal,
+            statistics=control.statistics,
+            seconds=time.time() - start,
+        )
+        answers.put((member.name, answer))
+    except Exception as e:
+        answers.put((member.name, f"{e.__class__.__name__}: {e}"))
+
+
+def solve(
+    members: List[PortfolioMember],
+    asp_problem: str,
+    control_files: List[str],
+    assumptions: List[Tuple[Any, bool]],
+    time_limit: int,
+) -> Tuple[Optional[Answer], List[Answer]]:
+    """Solves a problem instance with all the members of a portfolio in parallel.
+
+    Arguments:
+        members: members of the portfolio
+        asp_problem: problem instance
+        control_files: logic programs to be loaded, except the heuristic
+        assumptions: assumptions for the solve
+        time_limit: time limit for each member, in seconds, or -1 for no limit
+
+    Returns:
+        The first answer proved optimal, if any, and the answers that were not proved
+        optimal within the time limit. No optimal answer is returned if the problem is
+        unsatisfiable, or if any member failed.
+    """
+    ctx = multiprocessing.get_context()
+    answers = ctx.Queue()
+    serialized_assumptions = [(str(x), value) for x, value in assumptions]
+    processes = {
+        m.name: ctx.Process(
+            target=_solve_member,
+            args=(m, asp_problem, control_files, serialized_assumptions, time_limit, answers),
+            daemon=True,
+        )
+        for m in members
+    }
+    for p in processes.values():
+        p.start()
+
+    not_optimal: List[Answer] = []
+    pending = set(processes)
+    try:
+        while pending:
+            try:
+                name, answer = answers.get(timeout=1)
+            except queue.Empty:
+                # A member that died without answering (e.g. killed by the OOM killer)
+                for name in [x for x in pending if not processes[x].is_alive()]:
+                    tty.debug(f"[PORTFOLIO] {name} exited with code {processes[name].exitcode}")
+                    pending.discard(name)
+                continue
+
+            pending.discard(name)
+            if answer is None:
+                tty.debug(f"[PORTFOLIO] {name} found the problem unsatisfiable")
+                return None, []
+            if isinstance(answer, str):
+                tty.debug(f"[PORTFOLIO] {name} failed: {answer}")
+                return None, []
+            if answer.optimal:
+                answer = answer._replace(symbols=[parse_term(x) for x in answer.symbols])
+                return answer, []
+            not_optimal.append(answer._replace(symbols=[parse_term(x) for x in answer.symbols]))
+    finally:
+        for p in processes.values():
+            if p.is_alive():
+                p.terminate()
+        for p in processes.values():
+            p.join()
+
+    return None, not_optimal
@@ -0,0 +1,268 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+"""Profiling of the setup, grounding and solving phases of the concretizer.
+
+During setup, each top-level method of the solver setup is timed, and the statements it emits
+in the problem instance are counted. The same is done for each package, when the rules coming
+from its recipe are emitted, and when its reusable specs are. Statements are counted from the
+text of the problem instance, so the setup code doesn't need to be instrumented.
+
+When profiling is disabled, a do-nothing profiler is used instead.
+"""
+import contextlib
+import functools
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import spack.util.spack_json as sjson
+
+from .core import ast_type, clingo, parse_files
+
+#: Keys of the clingo statistics on the ground program that are reported
+GROUND_PROGRAM_KEYS = ("atoms", "bodies", "rules", "rules_choice", "rules_minimize", "eqs")
+
+#: Keys of the clingo statistics on the search that are reported
+SEARCH_KEYS = ("choices", "conflicts", "restarts")
+
+
+def count_statements(chunks: Iterable[str]) -> int:
+    """Returns the number of facts and rules in chunks of a problem instance"""
+    return sum(
+        1
+        for chunk in chunks
+        for line in chunk.splitlines()
+        if line.endswith(".") and not line.lstrip().startswith("%")
+    )
+
+
+def program_statements(path: str) -> int:
+    """Returns the number of non-ground statements in a logic program file"""
+    statements = 0
+
+    def visit(node):
+        nonlocal statements
+        if ast_type(node) != clingo().ast.ASTType.Program:
+            statements += 1
+
+    parse_files([path], visit)
+    return statements
+
+
+class _Stats:
+    """Time spent in, and statements emitted by, a section of the setup"""
+
+    __slots__ = ["calls", "statements", "seconds"]
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.statements = 0
+        self.seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "statements": self.statements, "seconds": self.seconds}
+
+
+class NullSetupProfiler:
+    """Setup profiler that does nothing, used when profiling is disabled"""
+
+    _null = contextlib.nullcontext()
+
+    def phase(self, name: str, setup) -> contextlib.AbstractContextManager:
+        return self._null
+
+    def package(self, name: str, kind: str, setup) -> contextlib.AbstractContextManager:
+        return self._null
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"phases": {}, "packages": {}}
+
+
+class SetupProfiler(NullSetupProfiler):
+    """Records time spent in, and statements emitted by, each phase of the setup and each
+    package. Phases called from within another phase are accounted to the outer one.
+    """
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, _Stats] = {}
+        self.packages: Dict[str, Dict[str, _Stats]] = {}
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def _measure(self, stats: _Stats, setup):
+        start, first = time.perf_counter(), len(setup.gen.asp_problem)
+        try:
+            yield
+        finally:
+            stats.calls += 1
+            stats.seconds += time.perf_counter() - start
+            stats.statements += count_statements(setup.gen.asp_problem[first:])
+
+    @contextlib.contextmanager
+    def phase(self, name: str, setup):
+        """Measures a phase of the setup
+
+        Arguments:
+            name: name of the phase
+            setup: solver setup, whose problem instance is inspected to count statements
+        """
+        if self._depth:
+            yield
+            return
+
+        self._depth += 1
+        try:
+            with self._measure(self.phases.setdefault(name, _Stats()), setup):
+                yield
+        finally:
+            self._depth -= 1
+
+    def package(self, name: str, kind: str, setup):
+        """Measures the emission of facts for a package
+
+        Arguments:
+            name: name of the package
+            kind: kind of facts emitted, e.g. rules from the recipe, or reusable specs
+            setup: solver setup, whose problem instance is inspected to count statements
+        """
+        return self._measure(self.packages.setdefault(name, {}).setdefault(kind, _Stats()), setup)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "phases": {name: stats.to_dict() for name, stats in self.phases.items()},
+            "packages": {
+                name: {kind: stats.to_dict() for kind, stats in sorted(kinds.items())}
+                for name, kinds in sorted(self.packages.items())
+            },
+        }
+
+
+def setup_phase(method):
+    """Decorator for methods of the solver setup, that marks them as a profiled phase"""
+
+    @functools.wraps(method)
+    def _profiled(self, *args, **kwargs):
+        with self.profiler.phase(method.__name__, self):
+            return method(self, *args, **kwargs)
+
+    return _profiled
+
+
+#: instance of a do-nothing setup profiler
+NULL_SETUP_PROFILER = NullSetupProfiler()
+
+
+class SolveProfile:
+    """Collects the profiling report of one or more solves.
+
+    A report is a JSON-serializable dictionary with the input specs, the timers of the
+    solve, the number of statements in the problem instance and those emitted by each setup
+    phase and package, the number of statements in each logic program, and statistics from
+    clingo on the ground program and on the search.
+    """
+
+    def __init__(self) -> None:
+        self.solves: List[Dict[str, Any]] = []
+
+    def record(
+        self,
+        *,
+        specs,
+        timer,
+        setup_profiler: NullSetupProfiler,
+        problem: List[str],
+        programs: Iterable[str],
+        statistics,
+        cached: bool,
+        portfolio_member: Optional[str] = None,
+    ) -> None:
+        """Adds the report of a solve
+
+        Arguments:
+            specs: input specs of the solve
+            timer: timer of the phases of the solve
+            setup_profiler: profiler used during setup
+            problem: chunks of the problem instance
+            programs: paths to the logic programs loaded in the solver
+            statistics: statistics from clingo
+            cached: whether the result was taken from the concretization cache
+            portfolio_member: portfolio member that found the answer, if any
+        """
+        report: Dict[str, Any] = {
+            "specs": [str(x) for x in specs],
+            "cached": cached,
+            "timers": {name: timer.duration(name) for name in timer.phases},
+            "statements": count_statements(problem),
+            "portfolio_member": portfolio_member,
+        }
+        report["timers"]["total"] = timer.duration()
+        report.update(setup_profiler.to_dict())
+        report["programs"] = {os.path.basename(x): program_statements(x) for x in programs}
+        report["ground_program"], report["search"] = {}, {}
+        if statistics:
+            lp = statistics.get("problem", {}).get("lp", {})
+            report["ground_program"] = {x: int(lp[x]) for x in GROUND_PROGRAM_KEYS if x in lp}
+            solvers = statistics.get("solving", {}).get("solvers", {})
+            report["search"] = {x: int(solvers[x]) for x in SEARCH_KEYS if x in solvers}
+            report["search"].update(statistics.get("summary", {}).get("times", {}))
+        self.solves.append(report)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"solves": self.solves}
+
+    def write_json(self, out=sys.stdout) -> None:
+        """Writes the reports as JSON"""
+        out.write(sjson.dump(self.to_dict()))
+
+    def write_tty(self, out=sys.stdout, limit: int = 10) -> None:
+        """Writes a human-readable summary of the reports
+
+        Arguments:
+            out: output stream
+            limit: maximum number of packages to show for each solve
+        """
+        for report in self.solves:
+            out.write(f"Profile for {', '.join(report['specs'])}")
+            out.write(" (cached)\n" if report["cached"] else "\n")
+            out.write(f"  {report['statements']} statements in the problem instance\n")
+            if report["portfolio_member"]:
+                out.write(f"  Answer found by portfolio member {report['portfolio_member']}\n")
+
+            packages = {name: _total(kinds.values()) for name, kinds in report["packages"].items()}
+            phases = sorted(report["phases"].items(), key=lambda x: -x[1]["seconds"])
+            top_packages = sorted(packages.items(), key=lambda x: -x[1]["statements"])[:limit]
+            sections = [
+                ("Setup phases (statements, time)", _emission_rows(phases)),
+                (f"Top {limit} packages (statements, time)", _emission_rows(top_packages)),
+                ("Logic programs (non-ground statements)", _value_rows(report["programs"])),
+                ("Ground program", _value_rows(report["ground_program"])),
+                ("Search", _value_rows(report["search"])),
+                ("Timers", _value_rows(report["timers"])),
+            ]
+            width = max((len(row[0]) for _, rows in sections for row in rows), default=0)
+            for title, rows in sections:
+                if not rows:
+                    continue
+                out.write(f"  {title}:\n")
+                for row in rows:
+                    out.write(f"    {row[0]:<{width}}" + "".join(f" {x:>10}" for x in row[1:]))
+                    out.write("\n")
+            out.write("\n")
+
+
+def _total(stats: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    result = {"calls": 0, "statements": 0, "seconds": 0.0}
+    for x in stats:
+        for key in result:
+            result[key] += x[key]
+    return result
+
+
+def _emission_rows(items) -> List[Tuple[str, ...]]:
+    return [(name, str(x["statements"]), f"{x['seconds']:.3f}s") for name, x in items]
+
+
+def _value_rows(values: Dict[str, Any]) -> List[Tuple[str, ...]]:
+    return [(name, f"{x:.3f}s" if isinstance(x, float) else str(x)) for name, x in values.items()]
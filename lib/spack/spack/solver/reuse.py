@@ -3,7 +3,7 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 import enum
 import functools
-from typing import Callable, List, Mapping
+from typing import Callable, List, Mapping, Optional
 
 import spack.binary_distribution
 import spack.config
@@ -200,6 +200,7 @@ def __init__(self, configuration: spack.config.Configuration) -> None:
         self.configuration = configuration
         self.store = spack.store.create(configuration)
         self.reuse_strategy = ReuseStrategy.ROOTS
+        self._selected_specs: Optional[List[spack.spec.Spec]] = None
 
         reuse_yaml = self.configuration.get("concretizer:reuse", False)
         self.reuse_sources = []
@@ -286,13 +287,25 @@ def __init__(self, configuration: spack.config.Configuration) -> None:
                         )
                     )
 
+    def warm_up(self) -> None:
+        """Select the specs from all the sources once, and reuse the selection in any
+        subsequent call to ``reusable_specs``."""
+        if self.reuse_strategy == ReuseStrategy.NONE:
+            return
+        self._selected_specs = [
+            spec for reuse_source in self.reuse_sources for spec in reuse_source.selected_specs()
+        ]
+
     def reusable_specs(self, specs: List[spack.spec.Spec]) -> List[spack.spec.Spec]:
         if self.reuse_strategy == ReuseStrategy.NONE:
             return []
 
-        result = []
-        for reuse_source in self.reuse_sources:
-            result.extend(reuse_source.selected_specs())
+        if self._selected_specs is not None:
+            result = list(self._selected_specs)
+        else:
+            result = []
+            for reuse_source in self.reuse_sources:
+                result.extend(reuse_source.selected_specs())
         # If we only want to reuse dependencies, remove the root specs
         if self.reuse_strategy == ReuseStrategy.DEPENDENCIES:
             result = [spec for spec in result if not any(root in spec for root in specs)]
@@ -1489,6 +1489,10 @@ def _anonymous_star(dep, dep_format):
 class Spec:
     compiler = DeprecatedCompilerSpec()
 
+    #: Function connecting this node to dependents that may not be connected yet, called the
+    #: first time its dependents are asked for. Set on the specs a database creates lazily.
+    _connect_dependents: Optional[Callable[[], None]] = None
+
     @staticmethod
     def default_arch():
         """Return an anonymous spec for the default architecture"""
@@ -1654,6 +1658,14 @@ def edges_from_dependents(
             depflag: allowed dependency types
             virtuals: allowed virtuals
         """
+        connect = self._connect_dependents
+        if connect is not None:
+            self._connect_dependents = None
+            try:
+                connect()
+            except BaseException:
+                self._connect_dependents = connect
+                raise
         return [
             d for d in self._dependents.select(parent=name, depflag=depflag, virtuals=virtuals)
         ]
@@ -1960,10 +1972,10 @@ def root(self):
         """
         # FIXME: In the case of multiple parents this property does not
         # FIXME: make sense. Should we revisit the semantics?
-        if not self._dependents:
+        edges = self.edges_from_dependents()
+        if not edges:
             return self
-        edges_by_package = next(iter(self._dependents.values()))
-        return edges_by_package[0].parent.root
+        return edges[0].parent.root
 
     @property
     def package(self):
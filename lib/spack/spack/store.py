@@ -22,6 +22,8 @@
 import uuid
 from typing import Any, Callable, Dict, Generator, List, Optional, Tuple, Union
 
+import spack.build_history
+import spack.caches
 import spack.config
 import spack.database
 import spack.directory_layout
@@ -29,6 +31,7 @@
 import spack.llnl.util.lang
 import spack.paths
 import spack.spec
+import spack.util.file_cache
 import spack.util.path
 from spack.llnl.util import tty
 
@@ -184,6 +187,7 @@ def __init__(
         self.failure_tracker = spack.database.FailureTracker(
             self.root, default_timeout=lock_cfg.package_timeout
         )
+        self.build_history = spack.build_history.BuildHistory(str(self.db.database_directory))
 
     def reindex(self) -> None:
         """Convenience function to reindex the store DB with its own layout."""
@@ -215,7 +219,10 @@ def create(configuration: spack.config.Configuration) -> Store:
         install_properties["install_tree"]
         for install_properties in configuration.get("upstreams", {}).values()
     ]
-    upstreams = _construct_upstream_dbs_from_install_roots(install_roots)
+    index_cache = None
+    if configuration.get("config:upstream_index_cache", False):
+        index_cache = spack.caches.MISC_CACHE
+    upstreams = _construct_upstream_dbs_from_install_roots(install_roots, index_cache=index_cache)
 
     return Store(
         root=root,
@@ -255,7 +262,7 @@ def restore(token):
 
 
 def _construct_upstream_dbs_from_install_roots(
-    install_roots: List[str],
+    install_roots: List[str], index_cache: Optional[spack.util.file_cache.FileCache] = None
 ) -> List[spack.database.Database]:
     accumulated_upstream_dbs: List[spack.database.Database] = []
     for install_root in reversed(install_roots):
@@ -264,6 +271,7 @@ def _construct_upstream_dbs_from_install_roots(
             spack.util.path.canonicalize_path(install_root),
             is_upstream=True,
             upstream_dbs=upstream_dbs,
+            index_cache=index_cache,
         )
         next_db._read()
         accumulated_upstream_dbs.insert(0, next_db)
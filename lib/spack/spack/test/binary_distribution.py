@@ -1,6 +1,7 @@
 # Copyright Spack Project Developers. See COPYRIGHT file for details.
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import concurrent.futures
 import filecmp
 import glob
 import gzip
@@ -10,6 +11,7 @@
 import pathlib
 import re
 import tarfile
+import threading
 import urllib.error
 import urllib.request
 import urllib.response
@@ -29,6 +31,7 @@
 import spack.stage
 import spack.store
 import spack.util.gpg
+import spack.util.parallel
 import spack.util.spack_yaml as syaml
 import spack.util.url as url_util
 import spack.util.web as web_util
@@ -290,6 +293,373 @@ def test_use_bin_index(monkeypatch, tmp_path: pathlib.Path, mutable_config):
     assert "libdwarf" in cache_list
 
 
+@pytest.mark.usefixtures("install_mockery", "mock_packages", "mock_fetch")
+def test_push_updates_only_the_touched_index_shards(
+    monkeypatch, tmp_path: pathlib.Path, mutable_config
+):
+    """Tests that pushing with --update-index to a mirror with a sharded index pushes only the
+    shards recording the new specs, and that clients without a changelog fetch only those shards.
+    The unsharded index is rebuilt with the other shards in the local binary index cache.
+    """
+    monkeypatch.setattr(spack.binary_distribution, "INDEX_CHANGELOG_LENGTH", 0)
+    mirror_dir = tmp_path / "mirror_dir"
+    mirror_url = url_util.path_to_file_url(str(mirror_dir))
+    spack.config.set("mirrors", {"test": mirror_url})
+    libdwarf = spack.concretize.concretize_one("libdwarf")
+    corge = spack.concretize.concretize_one("corge")
+    install_cmd("--fake", "--no-cache", libdwarf.name, corge.name)
+
+    # The first push creates the index, and its shards
+    buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), libdwarf.name)
+    current = spack.binary_distribution._fetch_index_shards(mirror_url)
+    assert current is not None
+    shards = current.shards
+    assert set(shards) == {
+        spack.binary_distribution._index_shard_prefix(s.dag_hash()) for s in libdwarf.traverse()
+    }
+
+    index = spack.binary_distribution.BinaryCacheIndex(str(tmp_path / "index_cache"))
+    index.update()
+    assert index.find_built_spec(libdwarf)
+    assert not index.find_built_spec(corge)
+
+    # The next push updates only the shards of the new specs, or of their dependencies
+    pushed_blobs = []
+    push_blob = URLBuildcacheEntry.push_blob
+
+    def _push_blob(cls, mirror_url, blob_path, record):
+        pushed_blobs.append(record)
+        return push_blob(mirror_url, blob_path, record)
+
+    fetched_shards = []
+    fetch_index_shard = spack.binary_distribution._fetch_index_shard
+
+    def _fetch_index_shard(url, record):
+        fetched_shards.append(record.checksum)
+        return fetch_index_shard(url, record)
+
+    monkeypatch.setattr(URLBuildcacheEntry, "push_blob", classmethod(_push_blob))
+    monkeypatch.setattr(spack.binary_distribution, "_fetch_index_shard", _fetch_index_shard)
+    monkeypatch.setattr(spack.binary_distribution, "BINARY_INDEX", index)
+    index_record = spack.binary_distribution._fetch_index_record(mirror_url)
+    buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), corge.name)
+
+    # Only the shards that record the new specs are read, and the unsharded index is rebuilt
+    # from the ones in the local binary index cache
+    touched = {
+        spack.binary_distribution._index_shard_prefix(s.dag_hash()) for s in corge.traverse()
+    }
+    assert set(fetched_shards) == {shards[p].checksum for p in touched if p in shards}
+    index_media_type = URLBuildcacheEntry.component_to_media_type(BuildcacheComponent.INDEX)
+    pushed_shards = {r.checksum for r in pushed_blobs if r.media_type == index_media_type}
+    new_index_record = spack.binary_distribution._fetch_index_record(mirror_url)
+    assert index_record and new_index_record
+    assert new_index_record.checksum != index_record.checksum
+    pushed_shards.remove(new_index_record.checksum)
+    incremental = monolithic_index(mirror_url)
+    assert libdwarf.dag_hash() in incremental and corge.dag_hash() in incremental
+    updated = spack.binary_distribution._fetch_index_shards(mirror_url)
+    assert updated is not None
+    new_shards = updated.shards
+    changed = {
+        p for p, r in new_shards.items() if p not in shards or shards[p].checksum != r.checksum
+    }
+    assert pushed_shards == {new_shards[p].checksum for p in changed}
+    assert changed == touched
+
+    # Clients fetch only the shards that changed
+    fetched = []
+    fetch_index_blob = spack.binary_distribution.IndexFetcher.fetch_index_blob
+
+    def _fetch_index_blob(self, cache_entry, blob_record):
+        fetched.append(blob_record.checksum)
+        return fetch_index_blob(self, cache_entry, blob_record)
+
+    monkeypatch.setattr(
+        spack.binary_distribution.IndexFetcher, "fetch_index_blob", _fetch_index_blob
+    )
+    index.update()
+    assert set(fetched[1:]) == pushed_shards
+    assert index.find_built_spec(libdwarf) and index.find_built_spec(corge)
+
+    # The records are the same as in a full index
+    def local_index():
+        cache_entry = index._local_index_cache[f"{mirror_url}__v3"]
+        with open(index._index_file_cache.cache_path(cache_entry["index_path"])) as f:
+            return json.load(f)["database"]["installs"]
+
+    installs = local_index()
+    assert incremental == installs
+    buildcache_cmd("update-index", str(mirror_dir))
+    assert monolithic_index(mirror_url) == installs
+    full = spack.binary_distribution._fetch_index_shards(mirror_url)
+    assert full is not None
+    assert {p: r.checksum for p, r in full.shards.items()} == {
+        p: r.checksum for p, r in new_shards.items()
+    }
+    index.update()
+    assert local_index() == installs
+
+
+@pytest.mark.usefixtures("install_mockery", "mock_packages", "mock_fetch")
+def test_index_is_updated_from_its_changelog(monkeypatch, tmp_path: pathlib.Path, mutable_config):
+    """Tests that clients apply the deltas pushed since the index they fetched last, and fall
+    back to fetching shards when the changelog misses some of them.
+    """
+    mirror_dir = tmp_path / "mirror_dir"
+    mirror_url = url_util.path_to_file_url(str(mirror_dir))
+    spack.config.set("mirrors", {"test": mirror_url})
+    specs = [
+        spack.concretize.concretize_one(name)
+        for name in ("libdwarf", "corge", "trivial-install-test-package")
+    ]
+    install_cmd("--fake", "--no-cache", *(s.name for s in specs))
+
+    buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), specs[0].name)
+    index = spack.binary_distribution.BinaryCacheIndex(str(tmp_path / "index_cache"))
+    index.update()
+
+    fetched = []
+    fetch_index_blob = spack.binary_distribution.IndexFetcher.fetch_index_blob
+
+    def _fetch_index_blob(self, cache_entry, blob_record):
+        fetched.append(blob_record.media_type)
+        return fetch_index_blob(self, cache_entry, blob_record)
+
+    monkeypatch.setattr(
+        spack.binary_distribution.IndexFetcher, "fetch_index_blob", _fetch_index_blob
+    )
+
+    # Clients fetch the table of shards, and the delta of the push
+    buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), specs[1].name)
+    index.update()
+    assert fetched == [
+        URLBuildcacheEntry.component_to_media_type(BuildcacheComponent.INDEX_SHARDS),
+        URLBuildcacheEntry.component_to_media_type(BuildcacheComponent.INDEX_DELTA),
+    ]
+    assert index.find_built_spec(specs[0]) and index.find_built_spec(specs[1])
+
+    def local_index():
+        cache_entry = index._local_index_cache[f"{mirror_url}__v3"]
+        with open(index._index_file_cache.cache_path(cache_entry["index_path"])) as f:
+            return json.load(f)["database"]["installs"]
+
+    def full_index():
+        current = spack.binary_distribution._fetch_index_shards(mirror_url)
+        assert current is not None
+        installs = {}
+        for record in current.shards.values():
+            installs.update(spack.binary_distribution._fetch_index_shard(mirror_url, record))
+        return installs
+
+    assert local_index() == full_index()
+
+    # The changelog keeps only the last delta, so clients that missed two pushes fetch shards
+    monkeypatch.setattr(spack.binary_distribution, "INDEX_CHANGELOG_LENGTH", 1)
+    buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), specs[2].name)
+    current = spack.binary_distribution._fetch_index_shards(mirror_url)
+    assert current is not None and list(current.deltas) == [current.generation]
+    index._local_index_cache[f"{mirror_url}__v3"]["generation"] -= 1
+
+    fetched.clear()
+    index.update()
+    assert fetched[0] == URLBuildcacheEntry.component_to_media_type(
+        BuildcacheComponent.INDEX_SHARDS
+    )
+    assert set(fetched[1:]) == {
+        URLBuildcacheEntry.component_to_media_type(BuildcacheComponent.INDEX)
+    }
+    assert all(index.find_built_spec(s) for s in specs)
+    assert local_index() == full_index()
+
+    # A full update of the index that changes no record pushes nothing
+    buildcache_cmd("update-index", str(mirror_dir))
+    updated = spack.binary_distribution._fetch_index_shards(mirror_url)
+    assert updated is not None and updated.generation == current.generation
+
+
+@pytest.mark.usefixtures("install_mockery", "mock_packages", "mock_fetch")
+def test_deltas_are_applied_only_within_their_changelog(
+    monkeypatch, tmp_path: pathlib.Path, mutable_config
+):
+    """Tests that pushes keep the identifier of the changelog until it starts over, and that
+    clients don't apply deltas to a local index from another changelog.
+    """
+    mirror_dir = tmp_path / "mirror_dir"
+    mirror_url = url_util.path_to_file_url(str(mirror_dir))
+    spack.config.set("mirrors", {"test": mirror_url})
+    specs = [
+        spack.concretize.concretize_one(name)
+        for name in ("libdwarf", "corge", "trivial-install-test-package")
+    ]
+    install_cmd("--fake", "--no-cache", *(s.name for s in specs))
+
+    buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), specs[0].name)
+    first = spack.binary_distribution._fetch_index_shards(mirror_url)
+    index = spack.binary_distribution.BinaryCacheIndex(str(tmp_path / "index_cache"))
+    index.update()
+    cache_entry = index._local_index_cache[f"{mirror_url}__v3"]
+    assert first is not None and cache_entry["changelog"] == first.changelog
+
+    fetched = []
+    fetch_index_blob = spack.binary_distribution.IndexFetcher.fetch_index_blob
+
+    def _fetch_index_blob(self, cache_entry, blob_record):
+        fetched.append(blob_record.media_type)
+        return fetch_index_blob(self, cache_entry, blob_record)
+
+    monkeypatch.setattr(
+        spack.binary_distribution.IndexFetcher, "fetch_index_blob", _fetch_index_blob
+    )
+
+    # The local index has the preceding generation, but comes from another changelog
+    buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), specs[1].name)
+    second = spack.binary_distribution._fetch_index_shards(mirror_url)
+    assert second is not None and second.changelog == first.changelog
+    assert list(second.deltas) == [second.generation] == [cache_entry["generation"] + 1]
+    cache_entry["changelog"] = "another changelog"
+    index.update()
+    assert URLBuildcacheEntry.component_to_media_type(BuildcacheComponent.INDEX) in fetched
+    assert (
+        URLBuildcacheEntry.component_to_media_type(BuildcacheComponent.INDEX_DELTA) not in fetched
+    )
+    assert index.find_built_spec(specs[0]) and index.find_built_spec(specs[1])
+
+    # Without a changelog, every push starts a new one
+    monkeypatch.setattr(spack.binary_distribution, "INDEX_CHANGELOG_LENGTH", 0)
+    buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), specs[2].name)
+    third = spack.binary_distribution._fetch_index_shards(mirror_url)
+    assert third is not None and not third.deltas
+    assert third.changelog != second.changelog
+
+
+def monolithic_index(mirror_url: str):
+    """Returns the install records in the buildcache index of a mirror, read without shards"""
+    record = spack.binary_distribution._fetch_index_record(mirror_url)
+    assert record is not None
+    cache_entry = URLBuildcacheEntry(mirror_url, allow_unsigned=True)
+    try:
+        with open(cache_entry.fetch_blob(record), encoding="utf-8") as f:
+            return json.load(f)["database"]["installs"]
+    finally:
+        cache_entry.destroy()
+
+
+@pytest.mark.usefixtures("install_mockery", "mock_packages", "mock_fetch")
+def test_concurrent_pushes_keep_all_specs_in_the_index(
+    monkeypatch, tmp_path: pathlib.Path, mutable_config
+):
+    """Tests that a push updating the index regenerates it, if another push updated the index
+    after it was read, so that the specs of both pushes are in the index.
+    """
+    mirror_dir = tmp_path / "mirror_dir"
+    mirror_url = url_util.path_to_file_url(str(mirror_dir))
+    spack.config.set("mirrors", {"test": mirror_url})
+    specs = [
+        spack.concretize.concretize_one(name)
+        for name in ("libdwarf", "corge", "trivial-install-test-package")
+    ]
+    install_cmd("--fake", "--no-cache", *(s.name for s in specs))
+    buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), specs[0].name)
+
+    # Another push updates the index right after the index is read for the first time
+    fetch_index_shards = spack.binary_distribution._fetch_index_shards
+    calls = []
+
+    def _fetch_index_shards(url):
+        calls.append(url)
+        if len(calls) == 2:
+            buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), specs[1].name)
+        return fetch_index_shards(url)
+
+    monkeypatch.setattr(spack.binary_distribution, "_fetch_index_shards", _fetch_index_shards)
+    buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), specs[2].name)
+
+    installs = monolithic_index(mirror_url)
+    assert all(s.dag_hash() in installs for s in specs)
+    index = spack.binary_distribution.BinaryCacheIndex(str(tmp_path / "index_cache"))
+    index.update()
+    assert all(index.find_built_spec(s) for s in specs)
+
+
+@pytest.mark.usefixtures("install_mockery", "mock_packages", "mock_fetch")
+def test_full_update_replaces_an_unreadable_sharded_index(tmp_path: pathlib.Path, mutable_config):
+    """Tests that pushes don't update a sharded index whose shards cannot be read, and that a
+    full update of the index replaces it, starting a new changelog.
+    """
+    mirror_dir = tmp_path / "mirror_dir"
+    mirror_url = url_util.path_to_file_url(str(mirror_dir))
+    spack.config.set("mirrors", {"test": mirror_url})
+    specs = [spack.concretize.concretize_one(name) for name in ("libdwarf", "corge")]
+    install_cmd("--fake", "--no-cache", *(s.name for s in specs))
+    buildcache_cmd("push", "-u", "--update-index", str(mirror_dir), specs[0].name)
+
+    # Remove the blob of the shard recording the first spec
+    current = spack.binary_distribution._fetch_index_shards(mirror_url)
+    assert current is not None
+    prefix = spack.binary_distribution._index_shard_prefix(specs[0].dag_hash())
+    checksum = current.shards[prefix].checksum
+    os.remove(mirror_dir / "blobs" / "sha256" / checksum[:2] / checksum)
+
+    buildcache_cmd("push", "-u", str(mirror_dir), specs[1].name)
+    with pytest.raises(GenerateIndexError, match="update-index"):
+        spack.binary_distribution._url_update_package_index(mirror_url, specs, str(tmp_path))
+
+    buildcache_cmd("update-index", str(mirror_dir))
+    updated = spack.binary_distribution._fetch_index_shards(mirror_url)
+    assert updated is not None and updated.changelog != current.changelog
+    index = spack.binary_distribution.BinaryCacheIndex(str(tmp_path / "index_cache"))
+    index.update()
+    assert all(index.find_built_spec(s) for s in specs)
+
+
+@pytest.mark.usefixtures("install_mockery", "mock_packages", "mock_fetch")
+def test_update_skips_mirrors_that_time_out(monkeypatch, tmp_path: pathlib.Path, mutable_config):
+    """Tests that the indices of mirrors are fetched concurrently, and that a mirror whose index
+    is not fetched in time does not prevent using the indices of the others.
+    """
+    mirror_urls = {}
+    for name in ("fast", "slow"):
+        mirror_urls[name] = url_util.path_to_file_url(str(tmp_path / name))
+    spack.config.set("mirrors", mirror_urls)
+    spack.config.set("config:binary_index_timeout", 0.5)
+
+    s = spack.concretize.concretize_one("libdwarf")
+    install_cmd("--fake", "--no-cache", s.name)
+    buildcache_cmd("push", "-u", "--update-index", str(tmp_path / "fast"), s.name)
+    buildcache_cmd("push", "-u", "--update-index", str(tmp_path / "slow"), "libelf")
+    libelf = s["libelf"]
+
+    # The slow mirror answers only after the fast one is cached
+    release = threading.Event()
+    fetch_index = spack.binary_distribution.BinaryCacheIndex._fetch_index
+
+    slow_threads = []
+
+    def _fetch_index(self, url_and_version, *args):
+        if url_and_version.url == mirror_urls["slow"]:
+            slow_threads.append(threading.current_thread())
+            release.wait(timeout=30)
+        return fetch_index(self, url_and_version, *args)
+
+    monkeypatch.setattr(spack.binary_distribution.BinaryCacheIndex, "_fetch_index", _fetch_index)
+    index = spack.binary_distribution.BinaryCacheIndex(str(tmp_path / "index_cache"))
+    try:
+        index.update()
+        # The abandoned fetch doesn't delay the exit of the process
+        assert slow_threads and all(t.daemon for t in slow_threads)
+    finally:
+        release.set()
+
+    assert [r.url_and_version.url for r in index.find_built_spec(libelf)] == [mirror_urls["fast"]]
+    assert f"{mirror_urls['slow']}__v3" not in index._local_index_cache
+
+    # Once the slow mirror answers in time, its index is fetched as well
+    index.update()
+    urls = {r.url_and_version.url for r in index.find_built_spec(libelf)}
+    assert urls == set(mirror_urls.values())
+
+
 def test_generate_key_index_failure(monkeypatch, tmp_path: pathlib.Path):
     def list_url(url, recursive=False):
         if "fails-listing" in url:
@@ -701,6 +1071,24 @@ def _all_parents(prefix):
     return ["/".join(parts[: i + 1]) for i in range(len(parts))]
 
 
+@pytest.mark.parametrize(
+    "sequential,tarballs,expected", [(True, 3, 8), (False, 1, 8), (False, 3, 2), (False, 20, 1)]
+)
+def test_compression_jobs_are_split_among_concurrent_tarballs(
+    sequential, tarballs, expected, monkeypatch
+):
+    """Tests that tarballs created concurrently share the configured number of jobs, instead of
+    each compressing with that many threads"""
+    monkeypatch.setattr(spack.config, "determine_number_of_jobs", lambda **kwargs: 8)
+    executor = (
+        spack.util.parallel.SequentialExecutor()
+        if sequential
+        else concurrent.futures.ThreadPoolExecutor(8)
+    )
+    with executor:
+        assert spack.binary_distribution._compression_jobs(executor, tarballs) == expected
+
+
 def test_tarball_doesnt_include_buildinfo_twice(tmp_path: Path):
     """When tarballing a package that was installed from a buildcache, make
     sure that the buildinfo file is not included twice in the tarball."""
@@ -0,0 +1,91 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import spack.build_history
+import spack.concretize
+import spack.store
+from spack.build_history import BuildHistory
+from spack.installer import PackageInstaller
+
+
+def _record(name, total, cache=False):
+    return {"name": name, "total": total, "cache": cache}
+
+
+def test_build_history_records(tmp_path):
+    history = BuildHistory(str(tmp_path / "db"))
+    assert history.records() == []
+
+    history.add(_record("pkg-a", 1.0))
+    history.add(_record("pkg-b", 2.0))
+    with open(history.path, "a", encoding="utf-8") as f:
+        f.write('{"name": "pkg-a", "tot')
+
+    assert history.records() == [_record("pkg-a", 1.0), _record("pkg-b", 2.0)]
+    assert history.records(["pkg-b"]) == [_record("pkg-b", 2.0)]
+
+
+def test_build_history_is_rotated(tmp_path, monkeypatch):
+    """Tests that the history keeps the records of the current and of the previous file, when
+    the file grows too large"""
+    monkeypatch.setattr(spack.build_history, "MAX_HISTORY_SIZE", 100)
+    history = BuildHistory(str(tmp_path))
+    for i in range(10):
+        history.add(_record(f"pkg-{i}", 1.0))
+
+    # Each record is a bit over 40 bytes, so the file is rotated every third record
+    assert history.path.stat().st_size <= 100
+    assert history.records() == [_record(f"pkg-{i}", 1.0) for i in range(6, 10)]
+
+
+def test_build_history_build_times(tmp_path):
+    """Tests that build times are the median of the builds from source"""
+    history = BuildHistory(str(tmp_path))
+    for record in (
+        _record("pkg-a", 1.0),
+        _record("pkg-a", 5.0),
+        _record("pkg-a", 3.0),
+        _record("pkg-a", 100.0, cache=True),
+        _record("pkg-b", 100.0, cache=True),
+        _record("pkg-c", 2.0),
+    ):
+        history.add(record)
+
+    assert history.build_times(["pkg-a", "pkg-b"]) == {"pkg-a": 3.0}
+
+
+def test_build_history_peak_memory(tmp_path):
+    """Tests that the peak memory is the largest of the builds from source"""
+    history = BuildHistory(str(tmp_path))
+    for record in (
+        {"name": "pkg-a", "cache": False, "peak_rss": 10},
+        {"name": "pkg-a", "cache": False, "peak_rss": 30},
+        {"name": "pkg-a", "cache": True, "peak_rss": 50},
+        {"name": "pkg-b", "cache": False, "peak_rss": None},
+    ):
+        history.add(record)
+
+    assert history.peak_memory(["pkg-a", "pkg-b"]) == {"pkg-a": 30}
+
+
+def test_install_is_recorded_in_history(install_mockery, mock_fetch):
+    """Tests that builds from source are recorded with their resource usage, and that records
+    outlive the installation"""
+    spec = spack.concretize.concretize_one("trivial-install-test-package")
+    PackageInstaller([spec.package], fake=False).install()
+    spec.package.do_uninstall()
+
+    (record,) = spack.store.STORE.build_history.records()
+    assert record["name"] == "trivial-install-test-package"
+    assert record["hash"] == spec.dag_hash()
+    assert record["version"] == str(spec.version)
+    assert not record["cache"]
+    assert record["total"] > 0 and "install" in record["phases"]
+    assert record["jobs"] >= 1
+    assert record["cpu_time"] > 0 and record["peak_rss"] > 0
+
+
+def test_fake_install_is_not_recorded(install_mockery, mock_fetch):
+    spec = spack.concretize.concretize_one("trivial-install-test-package")
+    PackageInstaller([spec.package], fake=True).install()
+    assert spack.store.STORE.build_history.records() == []
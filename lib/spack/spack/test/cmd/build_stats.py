@@ -0,0 +1,47 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import spack.main
+import spack.store
+import spack.util.spack_json as sjson
+
+build_stats = spack.main.SpackCommand("build-stats")
+
+
+def _record(name, version, total, cache=False, peak_rss=None):
+    return {
+        "name": name,
+        "version": version,
+        "compiler": "gcc@10.2.1",
+        "hash": "abcdefghijklmnop",
+        "cache": cache,
+        "time": 1700000000.0,
+        "total": total,
+        "phases": {"install": total},
+        "jobs": None if cache else 8,
+        "cpu_time": None if cache else 4 * total,
+        "peak_rss": peak_rss,
+    }
+
+
+def test_build_stats_empty(mutable_database):
+    assert "No installations" in build_stats()
+
+
+def test_build_stats(mutable_database):
+    history = spack.store.STORE.build_history
+    history.add(_record("pkg-a", "1.0", 10.0, peak_rss=2 * 1024**3))
+    history.add(_record("pkg-a", "1.0", 30.0, peak_rss=1024**3))
+    history.add(_record("pkg-a", "1.0", 2.0, cache=True))
+    history.add(_record("pkg-b", "2.0", 125.0))
+
+    # One row per package, version, compiler and origin
+    lines = build_stats().strip().split("\n")
+    assert len(lines) == 4
+    pkg_a_source = next(x for x in lines if "pkg-a@1.0" in x and "source" in x).split()
+    assert pkg_a_source[3:] == ["2", "20.0s", "1m20s", "2.0GiB", "8"]
+
+    assert len(build_stats("--all", "pkg-a").strip().split("\n")) == 4
+
+    records = [sjson.load(x) for x in build_stats("--json", "pkg-b").strip().split("\n")]
+    assert records == [_record("pkg-b", "2.0", 125.0)]
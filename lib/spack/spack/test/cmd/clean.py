@@ -12,6 +12,7 @@
 import spack.llnl.util.filesystem as fs
 import spack.main
 import spack.package_base
+import spack.solver.asp
 import spack.stage
 import spack.store
 
@@ -105,3 +106,16 @@ def _check_files(directory):
 
     for d in [source_dir, var_dir]:
         _check_files(d)
+
+
+def test_clean_concretization_cache(mutable_config, tmp_path: pathlib.Path, monkeypatch):
+    """Tests that cleaning the concretization cache reports its statistics before removing it"""
+    cache = spack.solver.asp.ConcretizationCache(root=str(tmp_path))
+    (tmp_path / "ab").mkdir()
+    (tmp_path / "ab" / "abcd").write_text("{}")
+    monkeypatch.setattr(spack.solver.asp, "CONC_CACHE", cache)
+
+    output = clean("--concretization-cache")
+
+    assert "entries" in output and "hits" in output
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,55 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import pathlib
+
+import pytest
+
+import spack.config
+import spack.solver.asp
+import spack.util.spack_json as sjson
+from spack.main import SpackCommand
+
+pytestmark = pytest.mark.usefixtures("mutable_config", "mutable_mock_repo")
+
+solve = SpackCommand("solve")
+
+
+def test_solve_cache_stats(tmp_path: pathlib.Path, monkeypatch):
+    """Tests that the statistics of the concretization cache count the solves of the command"""
+    spack.config.set("config:concretization_cache:enable", True)
+    cache = spack.solver.asp.ConcretizationCache(root=str(tmp_path))
+    monkeypatch.setattr(spack.solver.asp, "CONC_CACHE", cache)
+
+    output = solve("--show=solutions", "--cache-stats", "zlib")
+    assert f"Concretization cache at {tmp_path}" in output
+    assert "misses            1" in output
+    assert "stores            1" in output
+
+    output = solve("--show=solutions", "--cache-stats", "zlib")
+    assert "hits              1 (50.0%)" in output
+    assert "misses            1" in output
+
+    # Without specs, only the statistics are printed
+    output = solve("--cache-stats")
+    assert "zlib" not in output
+    assert "entries           1" in output
+
+
+def test_solve_profile(tmp_path: pathlib.Path):
+    """Tests that the profiling report of a solve is printed, and written as JSON"""
+    report = tmp_path / "profile.json"
+
+    output = solve("--show=solutions", "--profile", "--profile-json", str(report), "zlib")
+
+    assert "Profile for zlib" in output
+    assert "statements in the problem instance" in output
+    for section in ("Setup phases", "packages (statements, time)", "Logic programs", "Timers"):
+        assert section in output
+
+    solves = sjson.load(report.read_text())["solves"]
+    assert len(solves) == 1
+    assert solves[0]["specs"] == ["zlib"]
+    assert solves[0]["statements"] > 0
+    assert "zlib" in solves[0]["packages"]
@@ -1,9 +1,12 @@
 # Copyright Spack Project Developers. See COPYRIGHT file for details.
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import io
+import json
 import os
 import pathlib
 import platform
+import re
 import sys
 from typing import Any, Dict
 
@@ -13,6 +16,7 @@
 import spack.vendor.jinja2
 
 import spack.binary_distribution
+import spack.caches
 import spack.cmd
 import spack.compilers.config
 import spack.concretize
@@ -29,6 +33,8 @@
 import spack.repo
 import spack.solver.asp
 import spack.solver.core
+import spack.solver.fact_cache
+import spack.solver.profiler
 import spack.solver.reuse
 import spack.solver.runtimes
 import spack.solver.versions
@@ -36,6 +42,7 @@
 import spack.store
 import spack.test.conftest
 import spack.util.file_cache
+import spack.util.parallel
 import spack.util.spack_yaml as syaml
 import spack.variant as vt
 from spack.installer import PackageInstaller
@@ -3056,6 +3063,51 @@ def test_selecting_reused_sources(
     assert not [x for x in specs if x.name == "compiler-wrapper"]
 
 
+@pytest.mark.usefixtures("mutable_database", "mock_store", "do_not_check_runtimes_on_reuse")
+def test_warmed_up_selector_selects_specs_once(mutable_config, monkeypatch):
+    """Tests that a warmed up selector doesn't query the sources of reusable specs again"""
+    mutable_config.set("concretizer:reuse", {"from": [{"type": "local"}]})
+    expected = spack.solver.asp.ReusableSpecsSelector(mutable_config).reusable_specs(["mpileaks"])
+
+    selector = spack.solver.asp.ReusableSpecsSelector(mutable_config)
+    selector.warm_up()
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("reusable specs should not be selected again")
+
+    monkeypatch.setattr(spack.solver.asp.SpecFilter, "selected_specs", _fail)
+    for _ in range(2):
+        assert selector.reusable_specs(["mpileaks"]) == expected
+
+
+@pytest.mark.usefixtures("mutable_config", "mock_packages")
+def test_concretize_separately_uses_warmed_up_solver():
+    """Tests that concretizing specs separately gives the same result as concretizing them one
+    by one, when the workers share a solver warmed up in the parent process.
+    """
+    abstract = [Spec("mpileaks"), Spec("libelf"), Spec("pkg-a")]
+    result = spack.concretize.concretize_separately([(s, None) for s in abstract])
+
+    assert spack.concretize._SHARED_SOLVER is None
+    for (input_spec, concrete), expected in zip(result, abstract):
+        assert input_spec is expected
+        assert concrete.dag_hash() == spack.concretize.concretize_one(expected).dag_hash()
+
+
+@pytest.mark.usefixtures("mutable_config", "mock_packages")
+def test_concretize_separately_warms_up_solver_only_for_inheriting_workers(monkeypatch):
+    """Tests that the solver is not warmed up in the parent process when the workers can't
+    inherit it, like spawned ones."""
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("the solver should not be warmed up")
+
+    monkeypatch.setattr(spack.util.parallel, "inherits_state", lambda *args: False)
+    monkeypatch.setattr(spack.solver.asp.Solver, "warm_up", _fail)
+    result = spack.concretize.concretize_separately([(Spec("libelf"), None)])
+    assert result[0][1].satisfies("libelf")
+
+
 @pytest.mark.parametrize(
     "specs,include,exclude,expected",
     [
@@ -3261,7 +3313,7 @@ def _setup(self, specs, *, reuse=None, allow_deprecated=False):
 
     # due to our forced determinism above, we should not be observing
     # cache misses, assert that we're not storing any new cache entries
-    def _ensure_no_store(self, problem: str, result, statistics, test=False):
+    def _ensure_no_store(self, problem: str, result, statistics, test=False, solve_time=0.0):
         # always throw, we never want to reach this code path
         assert False, "Concretization cache hit expected"
 
@@ -3282,6 +3334,347 @@ def _ensure_cache_hits(self, problem: str):
         assert h == spack.concretize.concretize_one("hdf5")
 
 
+def test_concretization_cache_records_stats(mock_packages, mutable_config, tmp_path):
+    """Tests that the concretization cache counts hits and misses in its index, together with
+    the bytes and the solve time saved by hits."""
+    result = spack.solver.asp.Solver().solve([Spec("pkg-a")])
+    cache = spack.solver.asp.ConcretizationCache(root=str(tmp_path))
+
+    assert cache.fetch("problem") == (None, None)
+    cache.store("problem", result, [{"stats": 1}], solve_time=2.0)
+    for _ in range(2):
+        cached_result, _ = cache.fetch("problem")
+        assert [s.dag_hash() for s in cached_result.specs] == [s.dag_hash() for s in result.specs]
+    cache.flush_manifest()
+
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert (stats["hits"], stats["misses"], stats["stores"]) == (2, 1, 1)
+    assert stats["seconds_saved"] == 4.0
+    assert stats["bytes_saved"] == 2 * stats["bytes"]
+
+
+@pytest.mark.parametrize(
+    "limits,expected",
+    [
+        # No limit set, nothing is evicted
+        ({"entry_limit": 0, "bytes_limit": 0, "max_age": 0}, []),
+        # Least recently used entries are evicted until 10% of the limit is freed
+        ({"entry_limit": 3, "bytes_limit": 0, "max_age": 0}, ["a"]),
+        ({"entry_limit": 0, "bytes_limit": 40, "max_age": 0}, ["a", "b"]),
+        # Entries that have not been used for too long are evicted
+        ({"entry_limit": 0, "bytes_limit": 0, "max_age": 2.5}, ["a", "b"]),
+        ({"entry_limit": 1, "bytes_limit": 0, "max_age": 2.5}, ["a", "b", "c"]),
+    ],
+)
+def test_concretization_cache_lru_evictions(limits, expected):
+    """Tests the selection of the entries to be evicted from the concretization cache"""
+    day = 24 * 3600
+    now = 10 * day
+    entries = {
+        "c": {"bytes": 10, "accessed": now - 2 * day},
+        "a": {"bytes": 20, "accessed": now - 4 * day},
+        "d": {"bytes": 20, "accessed": now - day},
+        "b": {"bytes": 10, "accessed": now - 3 * day},
+    }
+    assert spack.solver.asp._lru_evictions(entries, now=now, **limits) == expected
+
+
+def test_concretization_cache_evicts_entries(mock_packages, mutable_config, tmp_path):
+    """Tests that least recently used entries are removed from disk when the cache exceeds
+    its limits"""
+    mutable_config.set("config:concretization_cache:entry_limit", 2)
+    mutable_config.set("config:concretization_cache:size_limit", 0)
+    result = spack.solver.asp.Solver().solve([Spec("pkg-a")])
+    cache = spack.solver.asp.ConcretizationCache(root=str(tmp_path))
+    for problem in ("first", "second", "third"):
+        cache.store(problem, result, [{"stats": 1}])
+    cache.cleanup()
+
+    assert cache.fetch("first") == (None, None)
+    assert cache.fetch("third")[0] is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1
+    assert len(list(cache.cache_entries())) == 2
+
+
+def test_concretization_cache_limits_are_checked_on_flush(mock_packages, mutable_config, tmp_path):
+    """Tests that storing entries beyond the limits of the cache evicts the least recently
+    used ones, without waiting for many logs to pile up"""
+    mutable_config.set("config:concretization_cache:entry_limit", 2)
+    mutable_config.set("config:concretization_cache:size_limit", 0)
+    result = spack.solver.asp.Solver().solve([Spec("pkg-a")])
+    cache = spack.solver.asp.ConcretizationCache(root=str(tmp_path))
+    for problem in ("first", "second", "third"):
+        cache.store(problem, result, [{"stats": 1}])
+        cache.flush_manifest()
+
+    assert len(list(cache.cache_entries())) == 2
+    assert cache.fetch("first") == (None, None)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_concretization_cache_ignores_hits_on_evicted_entries():
+    """Tests that a logged hit on an entry that was evicted afterwards is not counted, and does
+    not bring the entry back in the index"""
+    counters = spack.solver.asp._CONC_CACHE_COUNTERS
+    manifest = {"entries": {}, "stats": {counter: 0 for counter in counters}}
+    spack.solver.asp.ConcretizationCache._fold(
+        manifest,
+        [
+            ("store", "kept", 10, 1.0, 1.0),
+            ("hit", "evicted", 20, 2.0, 2.0),
+            ("hit", "kept", 10, 1.0, 3.0),
+        ],
+    )
+
+    assert list(manifest["entries"]) == ["kept"]
+    assert manifest["entries"]["kept"]["accessed"] == 3.0
+    stats = manifest["stats"]
+    assert (stats["hits"], stats["stores"], stats["bytes_saved"]) == (1, 1, 10)
+
+
+def test_concretization_cache_is_lock_free(mock_packages, mutable_config, tmp_path):
+    """Tests that reading and writing entries doesn't take locks, and that accesses are logged
+    per process until compaction folds them into the index"""
+    result = spack.solver.asp.Solver().solve([Spec("pkg-a")])
+    cache = spack.solver.asp.ConcretizationCache(root=str(tmp_path))
+    cache.store("problem", result, [{"stats": 1}], solve_time=1.0)
+    cache.fetch("problem")
+    cache.flush_manifest()
+
+    assert not list(tmp_path.rglob("*.lock"))
+    assert not (tmp_path / ".cache_manifest").exists()
+    (log,) = (tmp_path / ".cache_log").iterdir()
+    assert len(log.read_text().splitlines()) == 2
+
+    # Another process reading the cache sees the logged accesses
+    other = spack.solver.asp.ConcretizationCache(root=str(tmp_path))
+    assert other.stats()["hits"] == 1
+
+    other.cleanup()
+    assert not list((tmp_path / ".cache_log").iterdir())
+    assert (tmp_path / ".cache_manifest").exists()
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["stores"]) == (1, 1, 1)
+
+
+@pytest.fixture()
+def use_fact_cache(mutable_config, tmp_path, monkeypatch):
+    """Enables the solver fact cache, in an isolated location"""
+    monkeypatch.setattr(
+        spack.caches, "MISC_CACHE", spack.util.file_cache.FileCache(tmp_path / "misc")
+    )
+    mutable_config.set("concretizer:fact_cache", True)
+
+
+@pytest.mark.parametrize("spec_str", ["hdf5", "mpileaks", "conditional-variant-pkg@2.0"])
+def test_fact_cache_produces_the_same_problem(spec_str, mock_packages, use_fact_cache):
+    """Tests that the ASP problem is the same with the fact cache disabled, cold and warm."""
+
+    def asp_problem():
+        return spack.solver.asp.SpackSolverSetup().setup([Spec(spec_str)])
+
+    with spack.config.override("concretizer:fact_cache", False):
+        expected = asp_problem()
+    cold, warm = asp_problem(), asp_problem()
+    assert cold == expected
+    assert warm == expected
+
+
+def test_fact_cache_reuses_package_facts(mock_packages, use_fact_cache, monkeypatch):
+    """Tests that facts from packages are not generated again when the cache is warm,
+    and that they are generated when the package is modified.
+    """
+    expected = spack.concretize.concretize_one("mpileaks")
+
+    calls = []
+    original = spack.solver.asp.SpackSolverSetup.package_directive_rules
+
+    def _package_directive_rules(self, pkg):
+        calls.append(pkg.name)
+        return original(self, pkg)
+
+    monkeypatch.setattr(
+        spack.solver.asp.SpackSolverSetup, "package_directive_rules", _package_directive_rules
+    )
+    assert spack.concretize.concretize_one("mpileaks") == expected
+    assert not calls
+
+    # Changing the digest of a package invalidates only its own entry
+    package_digest = spack.solver.fact_cache.PackageFactCache.package_digest
+
+    def _package_digest(self, pkg_cls):
+        result = package_digest(self, pkg_cls)
+        return result if pkg_cls.name != "callpath" else f"modified-{result}"
+
+    monkeypatch.setattr(
+        spack.solver.fact_cache.PackageFactCache, "package_digest", _package_digest
+    )
+    assert spack.concretize.concretize_one("mpileaks") == expected
+    assert calls == ["callpath"]
+
+
+@pytest.mark.usefixtures("mutable_database")
+def test_reused_specs_share_attribute_groups(mock_packages, mutable_config):
+    """Tests that attributes of reusable specs not referring to other hashes are emitted once,
+    and associated with each hash through its group"""
+    reuse = spack.store.STORE.db.query()
+    problem = spack.solver.asp.SpackSolverSetup().setup([Spec("mpileaks")], reuse=reuse)
+
+    installed = re.findall(r'^installed_hash\("[^"]+","([^"]+)"\)', problem, re.MULTILINE)
+    grouped = re.findall(r'^hash_attr_group\("([^"]+)",[0-9]+\)', problem, re.MULTILINE)
+    assert installed and sorted(installed) == sorted(grouped)
+    # Only facts referring to hashes are emitted per hash
+    hash_attrs = re.findall(r'^hash_attr\("[^"]+","([^"]+)"', problem, re.MULTILINE)
+    assert set(hash_attrs) <= {"hash", "concrete_build_dependency"}
+    assert len(re.findall(r"^hash_group_attr\(", problem, re.MULTILINE)) > 0
+
+
+@pytest.mark.usefixtures("mutable_database")
+def test_fact_cache_stores_reused_spec_facts(mock_packages, use_fact_cache, monkeypatch):
+    """Tests that the facts for reusable specs are the same with the fact cache disabled,
+    cold and warm, and that a warm cache doesn't generate them again"""
+    reuse = spack.store.STORE.db.query()
+
+    def asp_problem():
+        setup = spack.solver.asp.SpackSolverSetup()
+        return setup.setup([Spec("mpileaks")], reuse=reuse)
+
+    with spack.config.override("concretizer:fact_cache", False):
+        expected = asp_problem()
+    assert asp_problem() == expected
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("facts for reusable specs should come from the cache")
+
+    monkeypatch.setattr(spack.solver.fact_cache.ConcreteSpecFactCache, "store", _fail)
+    assert asp_problem() == expected
+
+
+@pytest.mark.usefixtures("mutable_database")
+def test_memoized_setup_generates_facts_once(mock_packages, mutable_config, monkeypatch):
+    """Tests that a setup used for multiple solves produces the same problems as fresh setups,
+    without generating again the facts from package directives and reusable specs"""
+    mutable_config.set("concretizer:fact_cache", False)
+    reuse = spack.store.STORE.db.query()
+    expected = spack.solver.asp.SpackSolverSetup().setup([Spec("mpileaks")], reuse=reuse)
+
+    setup = spack.solver.asp.SpackSolverSetup(memoize_facts=True)
+    assert setup.setup([Spec("mpileaks")], reuse=reuse) == expected
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("facts should have been generated in the first solve")
+
+    monkeypatch.setattr(spack.solver.asp.SpackSolverSetup, "_record_package_facts", _fail)
+    monkeypatch.setattr(spack.solver.fact_cache.ConcreteSpecFactCache, "store", _fail)
+    assert setup.setup([Spec("mpileaks")], reuse=reuse) == expected
+
+
+@pytest.mark.parametrize("fact_cache", [True, False])
+def test_solve_in_rounds_with_memoized_facts_produces_the_same_problems(
+    fact_cache, mock_packages, use_fact_cache, monkeypatch
+):
+    """Tests that solving in rounds with a memoized setup, which replays the facts generated in
+    previous rounds, produces the same problem in each round as fresh setups"""
+    spack.config.set("concretizer:fact_cache", fact_cache)
+    spack.config.set("concretizer:reuse", False)
+    specs = [Spec(s) for s in ("libdwarf@20130729^libelf@0.8.10", "libdwarf@20111030")]
+    setup = spack.solver.asp.SpackSolverSetup.setup
+    init = spack.solver.asp.SpackSolverSetup.__init__
+
+    def solve_in_rounds(memoize_facts: bool):
+        problems = []
+
+        def _init(self, *args, **kwargs):
+            init(self, *args, **{**kwargs, "memoize_facts": memoize_facts})
+
+        def _setup(self, *args, **kwargs):
+            problems.append(setup(self, *args, **kwargs))
+            return problems[-1]
+
+        with monkeypatch.context() as m:
+            m.setattr(spack.solver.asp.SpackSolverSetup, "__init__", _init)
+            m.setattr(spack.solver.asp.SpackSolverSetup, "setup", _setup)
+            solver = spack.solver.asp.Solver()
+            results = [r.specs_by_input for r in solver.solve_in_rounds(specs)]
+        return problems, results
+
+    expected_problems, expected_results = solve_in_rounds(memoize_facts=False)
+    problems, results = solve_in_rounds(memoize_facts=True)
+    assert len(expected_problems) > 1
+    assert problems == expected_problems
+    assert results == expected_results
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="portfolio members run in child processes")
+def test_portfolio_solve(mock_packages, mutable_config):
+    """Tests that portfolio solving finds an answer with the optimal cost, and reports which
+    member found it"""
+    expected = spack.solver.asp.Solver().solve([Spec("mpileaks")])
+
+    mutable_config.set(
+        "concretizer:portfolio",
+        {
+            "enable": True,
+            "members": [
+                {"name": "default"},
+                {"name": "no-heuristic", "heuristic": None, "configuration": "trendy"},
+            ],
+        },
+    )
+    result = spack.solver.asp.Solver().solve([Spec("mpileaks")])
+    assert result.portfolio_member in ("default", "no-heuristic")
+    assert result.answers[0][0] == expected.answers[0][0]
+    assert result.specs[0].satisfies("mpileaks")
+
+    # Unsatisfiable problems are solved again sequentially, to report errors
+    with pytest.raises(spack.error.UnsatisfiableSpecError):
+        spack.solver.asp.Solver().solve([Spec("mpileaks ^zmpi ^mpich")])
+
+
+def test_fact_cache_relocates_ids():
+    """Tests that relocatable ids are replaced with the actual ids on replay"""
+    counter = spack.solver.fact_cache.relocatable_ids()
+    first, second = next(counter), next(counter)
+    code = str(spack.solver.core.fn.condition_requirement(second, "node", first)) + "."
+    assert spack.solver.fact_cache.relocate(code, [10, 11]) == (
+        'condition_requirement(11,"node",10).'
+    )
+
+
+@pytest.mark.usefixtures("mutable_database")
+def test_solve_profile(mock_packages, mutable_config):
+    """Tests that a profile of the solve accounts for the statements in the problem instance,
+    and records statistics from clingo"""
+    profile = spack.solver.asp.SolveProfile()
+    out = io.StringIO()
+    spack.solver.asp.Solver().solve([Spec("mpileaks")], out=out, profile=profile)
+
+    assert len(profile.solves) == 1
+    report = profile.solves[0]
+    assert report["specs"] == ["mpileaks"]
+    assert not report["cached"]
+
+    # Top-level phases don't overlap, and account for most of the problem instance
+    total = spack.solver.profiler.count_statements(out.getvalue().splitlines(keepends=True))
+    assert report["statements"] == total
+    assert 0 < sum(x["statements"] for x in report["phases"].values()) <= total
+    assert report["phases"]["pkg_rules"]["calls"] == len(report["packages"])
+    assert report["packages"]["mpileaks"]["pkg_rules"]["statements"] > 0
+    assert report["packages"]["callpath"]["concrete_specs"]["statements"] > 0
+
+    assert report["programs"]["concretize.lp"] > 0
+    assert report["ground_program"]["rules"] > 0
+    assert "choices" in report["search"]
+    assert report["timers"]["ground"] > 0
+
+    # The report is serializable
+    buffer = io.StringIO()
+    profile.write_json(buffer)
+    assert json.loads(buffer.getvalue()) == profile.to_dict()
+
+
 @pytest.mark.regression("42679")
 @pytest.mark.parametrize("compiler_str", ["gcc@=9.4.0", "gcc@=9.4.0-foo"])
 def test_selecting_compiler_with_suffix(mutable_config, mock_packages, compiler_str):
@@ -1074,6 +1074,7 @@ def mock_store(
                     # make the DB filesystem writable only while we populate it
                     _recursive_chmod(store_path, 0o755)
                     _populate(store.db)
+                    store.db.compact()
                     _recursive_chmod(store_path, 0o555)
 
         _recursive_chmod(store_cache, 0o755)
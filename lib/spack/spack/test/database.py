@@ -6,6 +6,7 @@
 import datetime
 import functools
 import gzip
+import io
 import json
 import os
 import pathlib
@@ -38,6 +39,8 @@
 import spack.repo
 import spack.spec
 import spack.store
+import spack.traverse
+import spack.util.file_cache
 import spack.util.lock
 import spack.version as vn
 from spack.enums import InstallRecordStatus
@@ -1147,6 +1150,133 @@ def test_check_parents(spec_str, parent_name, expected_nparents, database):
     assert len(edges) == expected_nparents
 
 
+def test_query_creates_only_the_specs_it_needs(database):
+    """Tests that querying a database read from file creates only the specs of the records
+    matching by name, and of their dependencies."""
+    db = spack.database.Database(database.root)
+    assert len(db.query_local("mpileaks ^mpich")) == 1
+
+    mpileaks = [rec.spec for rec in db._data.values() if rec.name == "mpileaks"]
+    needed = {s.dag_hash() for s in spack.traverse.traverse_nodes(mpileaks)}
+    loaded = {key for key, rec in db._data.items() if rec.loaded}
+    assert loaded == needed
+    assert len(loaded) < len(db._data)
+
+
+def test_querying_a_leaf_does_not_create_its_dependents(database):
+    """Tests that querying a spec with many dependents creates only the specs it needs, and
+    that its dependents are created when they are asked for."""
+    db = spack.database.Database(database.root)
+    (libelf,) = db.query_local("libelf")
+    loaded = {key for key, rec in db._data.items() if rec.loaded}
+    assert loaded == {s.dag_hash() for s in libelf.traverse()}
+
+    expected = database.query_one("libelf").dependents()
+    assert sorted(s.dag_hash() for s in libelf.dependents()) == sorted(
+        s.dag_hash() for s in expected
+    )
+
+
+def test_lazy_specs_know_their_dependents(database):
+    """Tests that a spec looked up by hash prefix knows all its dependents in the database,
+    even if their specs were not created yet."""
+    db = spack.database.Database(database.root)
+    dag_hash = database.query_one("callpath ^mpich").dag_hash()
+    callpath = db.get_by_hash_local(dag_hash[:7])[0]
+    assert [s.name for s in callpath.dependents()] == ["mpileaks"]
+
+    dyninst = callpath.dependencies(name="dyninst")[0]
+    assert db.query_one("dyninst") is dyninst
+    assert len(dyninst.dependents(name="callpath")) == 3
+
+
+def test_lazy_records_are_written_unchanged(database):
+    """Tests that the records whose specs were not created are written back as they were"""
+    db = spack.database.Database(database.root)
+    db.query_local("mpileaks ^mpich")
+
+    written = io.StringIO()
+    db._write_to_file(written)
+    installs = json.loads(written.getvalue())["database"]["installs"]
+    expected = json.loads(db._index_path.read_text())["database"]["installs"]
+    assert installs == expected
+
+
+def _cached_upstream(root, cache):
+    db = spack.database.Database(root, is_upstream=True, index_cache=cache)
+    db._read()
+    return db
+
+
+def test_upstream_index_is_read_from_the_cache(database, tmp_path, monkeypatch):
+    """Tests that the index of an upstream is read from the cache, after the first time, and
+    that only the specs of the packages being queried are read.
+    """
+    cache = spack.util.file_cache.FileCache(tmp_path / "cache")
+    expected = {s.dag_hash(): s for s in _cached_upstream(database.root, cache)._query()}
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("the index should not be parsed")
+
+    monkeypatch.setattr(spack.database.Database, "_read_installs", _fail)
+    upstream = _cached_upstream(database.root, cache)
+    installs = upstream._data[next(iter(upstream._data))]._installs
+    assert isinstance(installs, spack.database._CachedInstalls)
+
+    assert set(upstream._data) == set(expected)
+    assert not any(rec.loaded for rec in upstream._data.values())
+
+    specs = upstream._query("callpath")
+    assert {s.dag_hash() for s in specs} == {
+        s.dag_hash() for s in expected.values() if s.name == "callpath"
+    }
+    assert "dyninst" in installs._by_name and "externaltool" not in installs._by_name
+    for s in specs:
+        assert s.eq_dag(expected[s.dag_hash()])
+
+
+def test_upstream_index_cache_is_invalidated(mutable_database, tmp_path, monkeypatch):
+    """Tests that the upstream is read again when its index changes"""
+    cache = spack.util.file_cache.FileCache(tmp_path / "cache")
+    before = _cached_upstream(mutable_database.root, cache)
+    assert before._query("externaltool")
+
+    mutable_database.remove("externaltool")
+
+    read_installs = spack.database.Database._read_installs
+    calls = []
+
+    def _read_installs(self, *args, **kwargs):
+        calls.append(self.root)
+        return read_installs(self, *args, **kwargs)
+
+    monkeypatch.setattr(spack.database.Database, "_read_installs", _read_installs)
+    after = _cached_upstream(mutable_database.root, cache)
+    assert calls == [mutable_database.root]
+    assert not after._query("externaltool")
+    assert set(after._data) == set(mutable_database.all_hashes())
+
+
+def test_upstream_is_read_again_when_its_cache_changes(mutable_database, tmp_path):
+    """Tests that an upstream whose index changes while specs are created from the cache is
+    read again in full, and that the cache drops the packages no longer in the index"""
+    cache = spack.util.file_cache.FileCache(tmp_path / "cache")
+    _cached_upstream(mutable_database.root, cache)
+    upstream = _cached_upstream(mutable_database.root, cache)
+    assert not any(rec.loaded for rec in upstream._data.values())
+
+    stale = cache.cache_path(upstream._index_cache._specs_key("no-longer-installed"))
+    stale.write_text("{}")
+    mutable_database.remove("externaltool")
+    _cached_upstream(mutable_database.root, cache)
+    assert not stale.exists()
+
+    assert len(upstream._query("callpath")) == 3
+    assert set(upstream._data) == set(mutable_database.all_hashes())
+    assert upstream._snapshot == mutable_database._snapshot
+    assert upstream._journal_offset == mutable_database._journal_offset
+
+
 def test_db_all_hashes(database):
     # ensure we get the right number of hashes without a read transaction
     hashes = database.all_hashes()
@@ -1235,6 +1365,183 @@ def test_database_read_works_with_trailing_data(
     assert spack.database.Database(root).query_local() == specs_in_db
 
 
+def test_writes_are_journaled(tmp_path: pathlib.Path, default_mock_concretization, monkeypatch):
+    """Tests that writes after the first one are appended to the journal, instead of rewriting
+    the index, and are seen by other processes."""
+    monkeypatch.setattr(spack.database, "_JOURNAL_COMPACTION_RATIO", 100)
+    root = str(tmp_path)
+    db = spack.database.Database(root, layout=None)
+    db.add(default_mock_concretization("pkg-c"))
+    index = db._index_path.read_text()
+
+    db.add(default_mock_concretization("pkg-a"))
+    db.mark(default_mock_concretization("pkg-c"), "explicit", True)
+
+    assert db._index_path.read_text() == index
+    assert len(db._journal_path.read_text().splitlines()) == 2
+
+    # A write interrupted half-way is ignored
+    with open(db._journal_path, "a", encoding="utf-8") as f:
+        f.write('{"snapshot": "abc')
+
+    other = spack.database.Database(root)
+    assert set(other.query_local()) == set(db.query_local())
+    assert other.query_local("pkg-c", explicit=True)
+
+
+def test_journal_is_read_incrementally(
+    tmp_path: pathlib.Path, default_mock_concretization, monkeypatch
+):
+    """Tests that a database reads only the tail of the journal written by other processes,
+    when the index was not written in full in the meantime."""
+    monkeypatch.setattr(spack.database, "_JOURNAL_COMPACTION_RATIO", 100)
+    root = str(tmp_path)
+    db = spack.database.Database(root, layout=None)
+    db.add(default_mock_concretization("pkg-c"))
+    db.add(default_mock_concretization("pkg-b"))
+
+    other = spack.database.Database(root)
+    pkg_c = other.query_local("pkg-c")[0]
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("the index should not be read again")
+
+    monkeypatch.setattr(other, "_read_from_file", _fail)
+
+    db.add(default_mock_concretization("pkg-a"))
+    db.mark(default_mock_concretization("pkg-c"), "explicit", True)
+    db.remove(default_mock_concretization("pkg-b"))
+
+    assert set(other.query_local()) == set(db.query_local())
+    assert other.query_local("pkg-c", explicit=True)[0] is pkg_c
+    assert not other.query_local("pkg-b", installed=True)
+
+
+def test_journal_is_compacted(tmp_path: pathlib.Path, default_mock_concretization, monkeypatch):
+    """Tests that the index is written in full once the journal grows too large"""
+    root = str(tmp_path)
+    db = spack.database.Database(root, layout=None)
+    db.add(default_mock_concretization("pkg-c"))
+    db.add(default_mock_concretization("pkg-b"))
+    assert db._journal_path.exists()
+
+    monkeypatch.setattr(spack.database, "_JOURNAL_COMPACTION_RATIO", 0)
+    db.remove(default_mock_concretization("pkg-c"))
+    assert not db._journal_path.exists()
+
+    names = {x.name for x in spack.database.Database(root).query_local()}
+    assert "pkg-b" in names and "pkg-c" not in names
+
+
+def test_journal_of_another_snapshot_is_ignored(
+    tmp_path: pathlib.Path, default_mock_concretization, monkeypatch
+):
+    """Tests that a journal left behind by a writer that didn't remove it, after writing the
+    index in full, is not applied to the new index."""
+    monkeypatch.setattr(spack.database, "_JOURNAL_COMPACTION_RATIO", 100)
+    root = str(tmp_path)
+    db = spack.database.Database(root, layout=None)
+    db.add(default_mock_concretization("pkg-b"))
+    db.add(default_mock_concretization("pkg-c"))
+    journal = db._journal_path.read_text()
+
+    db.compact()
+    db._journal_path.write_text(journal)
+
+    names = {x.name for x in spack.database.Database(root).query_local()}
+    assert "pkg-b" in names and "pkg-c" in names
+
+    db._journal_path.unlink()
+    db.remove(default_mock_concretization("pkg-c"))
+    db.compact()
+    db._journal_path.write_text(journal)
+
+    names = {x.name for x in spack.database.Database(root).query_local()}
+    assert "pkg-b" in names and "pkg-c" not in names
+
+
+def test_batched_writes(tmp_path: pathlib.Path, default_mock_concretization):
+    """Tests that records added in a batch of writes are written every few additions, and on
+    exit, and are seen by the process adding them in the meantime."""
+    root = str(tmp_path)
+    db = spack.database.Database(root, layout=None)
+    db.add(default_mock_concretization("pkg-c"))
+
+    with db.batched_writes(max_writes=2, max_seconds=3600):
+        db.add(default_mock_concretization("pkg-b"))
+        assert db.query_local("pkg-b")
+        assert not spack.database.Database(root).query_local("pkg-b")
+
+        db.add(default_mock_concretization("zmpi"))
+        assert spack.database.Database(root).query_local("pkg-b")
+
+        db.add(default_mock_concretization("pkg-a"))
+        assert not spack.database.Database(root).query_local("pkg-a")
+
+    names = {x.name for x in spack.database.Database(root).query_local()}
+    assert {"pkg-a", "pkg-b", "pkg-c", "zmpi"} <= names
+
+
+def test_batched_writes_after_other_writers(
+    tmp_path: pathlib.Path, default_mock_concretization, monkeypatch
+):
+    """Tests that records not written yet in a batch are kept, with the right reference counts,
+    when other processes write to the database, whether to the journal or in full."""
+    monkeypatch.setattr(spack.database, "_JOURNAL_COMPACTION_RATIO", 100)
+    root = str(tmp_path)
+    db = spack.database.Database(root, layout=None)
+    db.add(default_mock_concretization("pkg-c"))
+
+    with db.batched_writes(max_writes=100, max_seconds=3600):
+        db.add(default_mock_concretization("pkg-a"))
+
+        other = spack.database.Database(root, layout=None)
+        other.add(default_mock_concretization("pkg-b"))
+        assert {"pkg-a", "pkg-b"} <= {x.name for x in db.query_local()}
+        db._check_ref_counts()
+
+        other.add(default_mock_concretization("zmpi"))
+        other.compact()
+        assert {"pkg-a", "zmpi"} <= {x.name for x in db.query_local()}
+        db._check_ref_counts()
+
+    other = spack.database.Database(root, layout=None)
+    assert {"pkg-a", "pkg-b", "pkg-c", "zmpi"} <= {x.name for x in other.query_local()}
+    with other.read_transaction():
+        other._check_ref_counts()
+
+
+def test_database_without_journal_is_upgraded_by_reindex(mutable_database, monkeypatch):
+    """Tests that a database at the last version without a journal is written in full at that
+    version, so that older versions of Spack can keep using it, until it is reindexed, and that
+    older versions of Spack refuse to use a database with a journal."""
+    mutable_database.compact()
+    index = json.loads(mutable_database._index_path.read_text())
+    index["database"]["version"] = "8"
+    del index["database"]["snapshot"]
+    mutable_database._index_path.write_text(json.dumps(index))
+
+    def read_with_spack_v8():
+        with monkeypatch.context() as m:
+            m.setattr(spack.database, "_DB_VERSION", vn.Version("8"))
+            spack.database.Database(mutable_database.root)._read()
+
+    db = spack.database.Database(mutable_database.root, layout=mutable_database.layout)
+    spec = db.query_one("mpileaks ^mpich")
+    db.mark(spec, "explicit", False)
+    index = json.loads(db._index_path.read_text())["database"]
+    assert index["version"] == "8" and "snapshot" not in index
+    assert not index["installs"][spec.dag_hash()]["explicit"]
+    assert not db._journal_path.exists()
+    read_with_spack_v8()
+
+    db.reindex()
+    index = json.loads(db._index_path.read_text())["database"]
+    assert index["version"] == str(spack.database._DB_VERSION) and "snapshot" in index
+    with pytest.raises(spack.database.InvalidDatabaseVersionError):
+        read_with_spack_v8()
+
+
 def test_database_errors_with_just_a_version_key(mutable_database):
     next_version = f"{spack.database._DB_VERSION}.next"
     with open(mutable_database._index_path, "w", encoding="utf-8") as f:
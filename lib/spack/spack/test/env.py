@@ -9,6 +9,7 @@
 
 import pytest
 
+import spack.concretize
 import spack.config
 import spack.environment as ev
 import spack.llnl.util.filesystem as fs
@@ -1270,3 +1271,80 @@ def test_mixing_toolchains_in_an_input_spec(unify, tmp_path: pathlib.Path, mutab
 
     libelf = mpileaks["libelf"]
     assert libelf.satisfies("%[virtuals=c] gcc")  # libelf only depends on c
+
+
+@pytest.mark.parametrize("incremental", [True, False])
+def test_incremental_concretization_unifies_new_specs(
+    incremental, tmp_path: pathlib.Path, mutable_config, monkeypatch
+):
+    """Tests that adding a spec to a unified environment gives the same result with and without
+    incremental concretization, and that only the affected part of the environment is solved.
+    """
+    mutable_config.set("concretizer:incremental", incremental)
+    manifest = tmp_path / "spack.yaml"
+    manifest.write_text(
+        """\
+spack:
+  specs:
+  - mpileaks
+  concretizer:
+    unify: true
+"""
+    )
+
+    solver_inputs = []
+    concretize_specs_together = spack.concretize._concretize_specs_together
+
+    def _concretize_specs_together(abstract_specs, **kwargs):
+        solver_inputs.extend(abstract_specs)
+        return concretize_specs_together(abstract_specs, **kwargs)
+
+    with ev.Environment(tmp_path) as e:
+        e.concretize()
+        mpileaks = e.concrete_roots()[0]
+
+        monkeypatch.setattr(
+            spack.concretize, "_concretize_specs_together", _concretize_specs_together
+        )
+        e.add("callpath")
+        new_specs = e.concretize()
+
+    assert len(new_specs) == 1
+    _, callpath = new_specs[0]
+    assert callpath.dag_hash() == mpileaks["callpath"].dag_hash()
+    assert mpileaks.dag_hash() in {x.dag_hash() for x in e.concrete_roots()}
+
+    # mpileaks is not a possible dependency of callpath, so it's not part of an incremental solve
+    assert any(x.name == "mpileaks" for x in solver_inputs) is not incremental
+
+
+@pytest.mark.parametrize("new_spec", ["dtbuild1", "dtbuild1@0.5"])
+def test_incremental_concretization_with_shared_build_dependency(
+    new_spec, tmp_path: pathlib.Path, mutable_config
+):
+    """Tests that a build dependency of the environment, added as a new root, is concretized
+    the same with and without incremental concretization: reused if possible, and not pinned,
+    since a full solve doesn't impose the build dependencies of concrete specs."""
+    manifest = tmp_path / "spack.yaml"
+    manifest.write_text(
+        """\
+spack:
+  specs:
+  - dttop
+  concretizer:
+    unify: true
+"""
+    )
+
+    def add_and_concretize(incremental: bool) -> spack.spec.Spec:
+        mutable_config.set("concretizer:incremental", incremental)
+        with ev.Environment(tmp_path) as e:
+            e.concretize(force=True)
+            e.add(new_spec)
+            ((_, concrete),) = e.concretize()
+            e.remove(new_spec)
+        return concrete
+
+    dtbuild1 = add_and_concretize(incremental=True)
+    assert dtbuild1.dag_hash() == add_and_concretize(incremental=False).dag_hash()
+    assert dtbuild1.satisfies(new_spec)
@@ -3,17 +3,22 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import glob
+import multiprocessing
 import os
 import pathlib
 import shutil
 import sys
+import threading
 from typing import List, Optional, Union
 
 import py
 import pytest
 
 import spack.binary_distribution
+import spack.build_environment
+import spack.build_history
 import spack.concretize
+import spack.config
 import spack.database
 import spack.deptypes as dt
 import spack.error
@@ -25,8 +30,10 @@
 import spack.package_base
 import spack.package_prefs as prefs
 import spack.repo
+import spack.scheduling
 import spack.spec
 import spack.store
+import spack.util.jobserver
 import spack.test.conftest
 import spack.util.lock as lk
 from spack.installer import PackageInstaller
@@ -722,6 +729,182 @@ def test_install_splice_root_from_binary(
     assert len(spack.store.STORE.db.query()) == len(list(out.traverse()))
 
 
+@pytest.mark.parametrize("concurrent_packages", [1, 2])
+def test_install_prefetches_binaries(
+    concurrent_packages, install_mockery, mock_fetch, mutable_temporary_mirror, monkeypatch
+):
+    """Tests that binary packages are downloaded in the background, and extracted in child
+    processes when more than one package is installed at a time. Downloads are held back from
+    starting only while processes fork, not while binary packages are extracted in this process."""
+    spec = spack.concretize.concretize_one("splice-t")
+    PackageInstaller([spec.package], explicit=True).install()
+    SpackCommand("buildcache")(
+        "push", "--unsigned", "--update-index", mutable_temporary_mirror, f"/{spec.dag_hash()}"
+    )
+    SpackCommand("uninstall")("-ay")
+
+    threads = []
+    download_tarball = spack.binary_distribution.download_tarball
+
+    def _download_tarball(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return download_tarball(*args, **kwargs)
+
+    started = []
+    start_build_process = spack.build_environment.start_build_process
+
+    def _start_build_process(pkg, function, kwargs, **other):
+        # No download starts in the background while the process forks
+        started.append((function, installer.binary_prefetcher._paused))
+        return start_build_process(pkg, function, kwargs, **other)
+
+    paused = []
+    install_from_cache = inst._install_from_cache
+
+    def _install_from_cache(*args, **kwargs):
+        paused.append(installer.binary_prefetcher._paused)
+        return install_from_cache(*args, **kwargs)
+
+    monkeypatch.setattr(spack.binary_distribution, "download_tarball", _download_tarball)
+    monkeypatch.setattr(spack.build_environment, "start_build_process", _start_build_process)
+    monkeypatch.setattr(inst, "_install_from_cache", _install_from_cache)
+
+    installer = PackageInstaller(
+        [spec.package],
+        explicit=True,
+        package_cache_only=True,
+        dependencies_cache_only=True,
+        unsigned=True,
+        concurrent_packages=concurrent_packages,
+    )
+    installer.install()
+
+    nodes = [x for x in spec.traverse() if not x.external]
+    assert all(x.installed and x.package.installed_from_binary_cache for x in nodes)
+    assert len(threads) == len(nodes) and threading.main_thread() not in threads
+    forking = int(multiprocessing.get_start_method() == "fork")
+    expected = [(inst.extract_process, forking)] * len(nodes) if concurrent_packages > 1 else []
+    assert started == expected
+    assert paused == ([] if concurrent_packages > 1 else [0] * len(nodes))
+    assert installer.binary_prefetcher is None
+
+
+def test_prefetched_binary_is_kept_until_used(
+    install_mockery, mock_fetch, mutable_temporary_mirror, monkeypatch
+):
+    """Tests that a binary package downloaded in the background is kept for the next attempt of
+    a task that didn't start its extraction, and is forgotten once it's extracted."""
+    spec = spack.concretize.concretize_one("trivial-install-test-package")
+    PackageInstaller([spec.package], explicit=True).install()
+    SpackCommand("buildcache")(
+        "push", "--unsigned", "--update-index", mutable_temporary_mirror, f"/{spec.dag_hash()}"
+    )
+    SpackCommand("uninstall")("-ay")
+
+    installer = PackageInstaller([spec.package], explicit=True, unsigned=True)
+    installer._init_queue()
+    with installer._prefetching():
+        installer._prefetch_binaries()
+        assert installer.binary_prefetcher is not None
+        future = installer.binary_prefetcher.peek(inst.package_id(spec))
+        assert future is not None and future.result(timeout=60) is not None
+
+        # The first attempt fails before using the download
+        def _fail(task, pkg):
+            raise RuntimeError("failed before the extraction")
+
+        task = installer._pop_task()
+        with monkeypatch.context() as m:
+            m.setattr(inst.BuildTask, "_setup_install_dir", _fail)
+            m.setattr(inst.BuildTask, "_install_prefetched_binary", lambda task: False)
+            with pytest.raises(RuntimeError):
+                installer.start_task(task, MockInstallStatus(1), inst.TermStatusLine(False))
+        assert installer.binary_prefetcher.peek(task.pkg_id) is future
+
+        # The next attempt extracts it
+        task = task.next_attempt(installer.installed)
+        task.started = False
+        installer.start_task(task, MockInstallStatus(1), inst.TermStatusLine(False))
+        assert task.prefetched_binary is future and task.prefetched_binary_used
+        assert installer.binary_prefetcher.peek(task.pkg_id) is None
+        installer.complete_task(task, MockInstallStatus(1))
+
+    assert spec.installed and spec.package.installed_from_binary_cache
+
+
+def test_prefetch_sources_into_stages(install_mockery, mock_fetch, monkeypatch, mutable_config):
+    """Tests that the sources of all the packages in the queue are fetched into their stage in
+    the background, if requested, and that the stages of packages that are not built are
+    removed."""
+    installer = create_installer(["splice-t"])
+    with installer._prefetching():
+        assert installer.source_prefetcher is None
+
+    spack.config.set("config:prefetch_sources", True)
+    threads = []
+    do_fetch = spack.package_base.PackageBase.do_fetch
+
+    def _do_fetch(pkg, *args, **kwargs):
+        threads.append(threading.current_thread())
+        do_fetch(pkg, *args, **kwargs)
+
+    monkeypatch.setattr(spack.package_base.PackageBase, "do_fetch", _do_fetch)
+
+    installer = create_installer(["splice-t"])
+    installer._init_queue()
+    with installer._prefetching():
+        installer._prefetch_sources()
+        assert len(installer.source_prefetcher) == len(installer.build_pq) == 3
+        assert not installer.sources_pending
+
+        # Claim all the fetches but one
+        _, unclaimed = installer.build_pq[0]
+        for _, task in installer.build_pq[1:]:
+            pkg = installer.source_prefetcher.claim(task.pkg_id).result()
+            assert os.path.exists(pkg.stage.archive_file)
+            pkg.stage.destroy()
+
+        unclaimed_stage = installer.source_prefetcher.peek(unclaimed.pkg_id).result().stage
+        assert os.path.exists(unclaimed_stage.path)
+
+    assert installer.source_prefetcher is None
+    assert not os.path.exists(unclaimed_stage.path)
+    assert len(threads) == 3 and threading.main_thread() not in threads
+
+
+def test_prefetch_sources_skips_unconfirmed_fetches(install_mockery, mutable_config):
+    """Tests that packages whose fetch would need to be confirmed are not fetched in the
+    background."""
+    spack.config.set("config:deprecated", True)
+    spec = spack.concretize.concretize_one("deprecated-versions@1.1.0")
+    spack.config.set("config:deprecated", False)
+    assert inst._prefetch_sources(spec.package) is None
+    assert not os.path.exists(spec.package.stage.path)
+
+
+def test_install_batches_database_writes(install_mockery, mock_fetch, monkeypatch):
+    """Tests that installed packages are written to the database in batches, if configured,
+    and all of them at the end of the installation."""
+    spack.config.set("config:db_write_batch", {"installs": 2})
+    db = spack.store.STORE.db
+    writes = []
+    write = db._write
+
+    def _write(*args, **kwargs):
+        writes.append(db._batch is not None and len(db._batch.pending))
+        return write(*args, **kwargs)
+
+    monkeypatch.setattr(db, "_write", _write)
+
+    installer = create_installer(["splice-t"], {"fake": True})
+    installer.install()
+
+    # Two packages are written when the second is installed, and the last one on exit
+    assert writes == [2, 1] and db._batch is None
+    other = spack.database.Database(db.root, layout=None)
+    assert {"splice-t", "splice-h", "splice-z"} <= {x.name for x in other.query_local()}
+
+
 class MockInstallStatus(inst.InstallStatus):
     def next_pkg(self, *args, **kwargs):
         pass
@@ -1202,6 +1385,127 @@ def _requeued(installer, task, install_status):
         assert exp in ln
 
 
+@pytest.mark.parametrize("concurrent_packages", [1, 2])
+def test_install_starts_critical_path_first(install_mockery, monkeypatch, concurrent_packages):
+    """Tests that, with concurrent builds, ready tasks on the critical path are started first"""
+    monkeypatch.setattr(
+        spack.scheduling,
+        "estimated_build_times",
+        lambda names, store: {x: 100.0 if x == "mpich" else 1.0 for x in names},
+    )
+    installer = create_installer(["mpileaks"], {"concurrent_packages": concurrent_packages})
+    installer._init_queue()
+
+    # Start tasks in order, and complete them right away
+    started = []
+    while installer._peek_ready_task():
+        task = installer._pop_ready_task()
+        started.append(task.pkg.name)
+        installer._flag_installed(task.pkg, task.dependents)
+
+    if concurrent_packages == 1:
+        assert all(task.rank == 0 for task in installer.build_tasks.values())
+        assert installer.predicted_makespan is None
+    else:
+        assert started.index("mpich") < started.index("libelf")
+        assert installer.predicted_makespan is not None
+
+
+def test_install_holds_back_tasks_over_memory_budget(install_mockery, mutable_config, monkeypatch):
+    """Tests that, with concurrent builds, a task is started only if the peak memory of its
+    previous builds fits in what the active tasks leave of the memory budget"""
+    mutable_config.set("config:memory_budget", 4)
+    peaks = {"mpich": 3 * 1024**3, "libelf": 2 * 1024**3, "callpath": 1024**3}
+    monkeypatch.setattr(spack.build_history.BuildHistory, "peak_memory", lambda self, names: peaks)
+    installer = create_installer(["mpileaks"], {"concurrent_packages": 2})
+    installer._init_queue()
+    tasks = {task.pkg.name: task for task in installer.build_tasks.values()}
+
+    # A task can always start when no other task is active
+    assert installer._fits_in_memory(tasks["mpich"], [])
+    assert not installer._fits_in_memory(tasks["libelf"], [tasks["mpich"]])
+    assert installer._fits_in_memory(tasks["callpath"], [tasks["mpich"]])
+
+    # Tasks without a known peak memory are not held back
+    assert installer._fits_in_memory(tasks["libdwarf"], [tasks["mpich"], tasks["callpath"]])
+    assert installer.held_back == {tasks["libelf"].pkg_id}
+
+
+def test_install_starts_smaller_tasks_before_held_back_ones(
+    install_mockery, mutable_config, monkeypatch
+):
+    """Tests that a ready task that doesn't fit in the memory budget is overtaken by smaller ready
+    tasks, until it was overtaken too many times"""
+    mutable_config.set("config:memory_budget", 4)
+    peaks = {"compiler-wrapper": 3 * 1024**3}
+    monkeypatch.setattr(spack.build_history.BuildHistory, "peak_memory", lambda self, names: peaks)
+    installer = create_installer(["mpileaks"], {"concurrent_packages": 2})
+    installer._init_queue()
+    tasks = {task.pkg.name: task for task in installer.build_tasks.values()}
+    wrapper_id = tasks["compiler-wrapper"].pkg_id
+    active = [tasks["mpileaks"]]
+    tasks["mpileaks"].memory = 2 * 1024**3
+
+    # Make gcc-runtime ready, after compiler-wrapper
+    assert installer._pop_task_that_fits(active) is tasks["gcc"]
+    installer._flag_installed(tasks["gcc"].pkg, tasks["gcc"].dependents)
+
+    # compiler-wrapper is the first ready task, but only gcc-runtime fits
+    installer.overtaken[wrapper_id] = inst._MAX_OVERTAKES - 1
+    runtime = installer._pop_task_that_fits(active)
+    assert runtime.pkg.name == "gcc-runtime"
+    assert installer.overtaken[wrapper_id] == inst._MAX_OVERTAKES
+    assert wrapper_id in installer.build_tasks
+
+    # Then, smaller tasks wait for compiler-wrapper to fit
+    installer._push_task(runtime)
+    assert installer._pop_task_that_fits(active) is None
+    assert installer._pop_task_that_fits([]) is tasks["compiler-wrapper"]
+    assert installer._pop_task_that_fits([]) is runtime
+
+
+@pytest.mark.not_on_windows("jobservers are not supported on Windows")
+@pytest.mark.parametrize("concurrent_packages,makeflags", [(1, None), (2, None), (2, "-j4")])
+def test_installer_hosts_jobserver(
+    install_mockery, monkeypatch, concurrent_packages, makeflags, working_env
+):
+    """Tests that a jobserver is hosted only for concurrent builds, and when there isn't
+    one already"""
+    monkeypatch.setattr(inst.multiprocessing, "get_start_method", lambda: "fork")
+    if makeflags:
+        os.environ["MAKEFLAGS"] = f"{makeflags} --jobserver-auth=3,4"
+
+    installer = create_installer(["pkg-c"], {"concurrent_packages": concurrent_packages})
+    jobserver = installer._jobserver()
+    if concurrent_packages == 1 or makeflags:
+        assert not isinstance(jobserver, spack.util.jobserver.JobServer)
+        return
+
+    with jobserver:
+        assert "--jobserver-auth" in os.environ["MAKEFLAGS"]
+
+
+def test_install_waits_on_build_processes(install_mockery, mock_fetch, monkeypatch):
+    """Tests that the installer blocks until a build process has its result ready, rather than
+    polling build processes periodically."""
+    waits = []
+    wait = inst.multiprocessing.connection.wait
+
+    def _wait(objects, timeout=None):
+        waits.append((len(objects), timeout))
+        return wait(objects, timeout=timeout)
+
+    monkeypatch.setattr(inst.multiprocessing.connection, "wait", _wait)
+
+    installer = create_installer(["pkg-c"], {"fake": False})
+    installer.install()
+
+    assert inst.package_id(installer.build_requests[0].pkg.spec) in installer.installed
+    # Connection.poll() waits with a zero timeout
+    assert (1, None) in waits
+    assert all(timeout in (None, 0) for _, timeout in waits)
+
+
 def test_install_skip_patch(install_mockery, mock_fetch):
     """Test the path skip_patch install path."""
     # Note: this test relies on installing a package with no dependencies
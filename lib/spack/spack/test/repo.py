@@ -3,10 +3,13 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 import os
 import pathlib
+import sys
 
 import pytest
 
 import spack
+import spack.dependency_index
+import spack.deptypes
 import spack.environment
 import spack.package_base
 import spack.paths
@@ -962,3 +965,106 @@ def _get_close_matches(*args, **kwargs):
 def test_unknownpkgerror_str_repo():
     """Ensure reasonable error message when repo is a string."""
     assert "not found in repository" in str(spack.repo.UnknownPackageError("pkg_a", "my_repo"))
+
+
+def test_dependency_index_is_updated_incrementally(tmp_path: pathlib.Path, monkeypatch):
+    """Tests that the dependency index is persisted in the repo cache, and that only new or
+    modified packages are indexed when it is read again."""
+    builder = RepoBuilder(str(tmp_path / "repo"))
+    builder.add_package("pkg-b")
+    builder.add_package("pkg-c")
+    builder.add_package("pkg-a", dependencies=[("pkg-b", "build", None)])
+    cache = spack.util.file_cache.FileCache(str(tmp_path / "cache"))
+
+    with spack.repo.use_repositories(spack.repo.Repo(builder.root, cache=cache)) as repos:
+        index = repos.dependency_index
+        assert index.dependencies("pkg-a") == {"pkg-b": {"": [spack.deptypes.BUILD]}}
+        assert index.dependencies("pkg-b") == {}
+
+    # Add a single package, and check it is the only one to be indexed
+    builder.add_package("pkg-d", dependencies=[("pkg-c", "link", "@1.0")])
+    future = os.stat(builder.root).st_mtime + 100
+    os.utime(os.path.join(builder.root, "packages", "pkg_d", "package.py"), (future, future))
+
+    # Stats of package files are cached for the lifetime of the process
+    monkeypatch.setattr(spack.repo.FastPackageChecker, "_paths_cache", {})
+    updated = []
+    original_update = spack.dependency_index.DependencyIndex.update_package
+
+    def _update_package(self, name):
+        updated.append(name)
+        return original_update(self, name)
+
+    monkeypatch.setattr(spack.dependency_index.DependencyIndex, "update_package", _update_package)
+    with spack.repo.use_repositories(spack.repo.Repo(builder.root, cache=cache)) as repos:
+        index = repos.dependency_index
+        assert index.dependencies("pkg-d") == {"pkg-c": {"@1.0": [spack.deptypes.LINK]}}
+        assert index.dependencies("pkg-a") == {"pkg-b": {"": [spack.deptypes.BUILD]}}
+        assert updated == ["pkg-d"]
+
+
+def test_dependency_index_is_updated_when_a_base_class_changes(
+    tmp_path: pathlib.Path, monkeypatch
+):
+    """Tests that packages are indexed again when the file of one of their base classes, like
+    another package, changes, even if their own package file didn't."""
+    builder = RepoBuilder(str(tmp_path / "repo"))
+    builder.add_package("pkg-b", dependencies=[("pkg-c", "build", None)])
+    pkg_a_py = builder._recipe_filename("pkg-a")
+    os.makedirs(os.path.dirname(pkg_a_py))
+    with open(pkg_a_py, "w", encoding="utf-8") as f:
+        f.write("from ..pkg_b.package import PkgB\n\n\nclass PkgA(PkgB):\n    pass\n")
+    cache = spack.util.file_cache.FileCache(str(tmp_path / "cache"))
+
+    with spack.repo.use_repositories(spack.repo.Repo(builder.root, cache=cache)) as repos:
+        assert repos.dependency_index.dependencies("pkg-a") == {
+            "pkg-c": {"": [spack.deptypes.BUILD]}
+        }
+
+    # Modify only the parent package
+    builder.add_package("pkg-b", dependencies=[("pkg-d", "link", None)])
+    future = os.stat(builder.root).st_mtime + 100
+    os.utime(builder._recipe_filename("pkg-b"), (future, future))
+
+    # Forget the modules of the repository, and the stats of package files
+    for module in [m for m in sys.modules if m.startswith(f"spack_repo.{builder.namespace}")]:
+        monkeypatch.delitem(sys.modules, module)
+    monkeypatch.setattr(spack.repo.FastPackageChecker, "_paths_cache", {})
+
+    with spack.repo.use_repositories(spack.repo.Repo(builder.root, cache=cache)) as repos:
+        assert repos.dependency_index.dependencies("pkg-a") == {
+            "pkg-d": {"": [spack.deptypes.LINK]}
+        }
+
+
+def test_dependency_index_checks_base_classes_only_once(tmp_path: pathlib.Path, monkeypatch):
+    """Tests that reading a cached dependency index checks each recorded base class file once,
+    rather than once per package deriving from it."""
+    builder = RepoBuilder(str(tmp_path / "repo"))
+    builder.add_package("pkg-b")
+    for name in ("pkg-a", "pkg-c"):
+        pkg_py = builder._recipe_filename(name)
+        os.makedirs(os.path.dirname(pkg_py))
+        cls_name = "".join(x.capitalize() for x in name.split("-"))
+        with open(pkg_py, "w", encoding="utf-8") as f:
+            f.write(f"from ..pkg_b.package import PkgB\n\n\nclass {cls_name}(PkgB):\n    pass\n")
+    cache = spack.util.file_cache.FileCache(str(tmp_path / "cache"))
+
+    with spack.repo.use_repositories(spack.repo.Repo(builder.root, cache=cache)) as repos:
+        repos.dependency_index.dependencies("pkg-a")
+
+    stats = []
+    original_mtime = spack.dependency_index.DependencyIndex._mtime
+
+    def _mtime(self, path):
+        stats.append(path)
+        return original_mtime(self, path)
+
+    monkeypatch.setattr(spack.dependency_index.DependencyIndex, "_mtime", _mtime)
+    monkeypatch.setattr(spack.repo.FastPackageChecker, "_paths_cache", {})
+    with spack.repo.use_repositories(spack.repo.Repo(builder.root, cache=cache)) as repos:
+        assert repos.dependency_index.dependencies("pkg-c") == {}
+
+    assert [os.path.realpath(x) for x in stats] == [
+        os.path.realpath(builder._recipe_filename("pkg-b"))
+    ]
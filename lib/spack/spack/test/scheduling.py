@@ -0,0 +1,53 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import pytest
+
+import spack.concretize
+import spack.scheduling
+import spack.store
+from spack.installer import PackageInstaller
+
+#: A diamond with a long build on one side, and another dependency of the root:
+#:
+#:        a
+#:      / | \
+#:     b  c  e
+#:      \ |
+#:        d
+#:
+#: The build of c takes 10s
+DEPENDENTS = {"a": set(), "b": {"a"}, "c": {"a"}, "d": {"b", "c"}, "e": {"a"}}
+DURATIONS = {"a": 1.0, "b": 1.0, "c": 10.0, "d": 2.0, "e": 3.0}
+
+
+def test_critical_path_ranks():
+    ranks = spack.scheduling.critical_path_ranks(DEPENDENTS, DURATIONS)
+    assert ranks == {"a": 1.0, "b": 2.0, "c": 11.0, "d": 13.0, "e": 4.0}
+
+
+@pytest.mark.parametrize("workers,expected", [(1, 17.0), (2, 13.0), (4, 13.0)])
+def test_predicted_makespan(workers, expected):
+    ranks = spack.scheduling.critical_path_ranks(DEPENDENTS, DURATIONS)
+    assert spack.scheduling.predicted_makespan(DEPENDENTS, DURATIONS, ranks, workers) == expected
+
+
+def test_predicted_makespan_starts_critical_path_first():
+    """Tests that ready nodes on the critical path are started first"""
+    # "b" is quick, but "a" can start only after it's done
+    dependents = {"a": set(), "b": {"a"}, "x": set(), "y": set()}
+    durations = {"a": 10.0, "b": 1.0, "x": 5.0, "y": 5.0}
+    ranks = spack.scheduling.critical_path_ranks(dependents, durations)
+    assert spack.scheduling.predicted_makespan(dependents, durations, ranks, 2) == 11.0
+
+
+def test_estimated_build_times(install_mockery, mock_fetch):
+    """Tests that build times are read from the build history of the store"""
+    spec = spack.concretize.concretize_one("trivial-install-test-package")
+    PackageInstaller([spec.package], fake=False).install()
+
+    times = spack.scheduling.estimated_build_times(
+        ["trivial-install-test-package", "pkg-c"], spack.store.STORE
+    )
+    assert list(times) == ["trivial-install-test-package"]
+    assert times["trivial-install-test-package"] > 0
@@ -4,6 +4,7 @@
 
 import gzip
 import hashlib
+import io
 import os
 import shutil
 import tarfile
@@ -15,6 +16,7 @@
 import spack.version
 from spack.llnl.util.filesystem import working_dir
 from spack.util.archive import (
+    ParallelGzipWriter,
     gzip_compressed_tarfile,
     reproducible_tarfile_from_prefix,
     retrieve_commit_from_archive,
@@ -164,6 +166,54 @@ def test_gzip_compressed_tarball_is_reproducible(tmp_path: Path, monkeypatch):
             )
 
 
+@pytest.mark.parametrize("size", [0, 1000, 64 * 1024, 300 * 1024 + 7])
+def test_parallel_gzip_writer(size):
+    """Tests that data compressed in parallel can be decompressed by gzip, and that the compressed
+    data does not depend on the number of threads"""
+    data = b"".join(b"%d %x\n" % (i, i * i) for i in range(size))[:size]
+
+    compressed = []
+    for jobs in (1, 4):
+        f = io.BytesIO()
+        writer = ParallelGzipWriter(f, jobs=jobs, block_size=64 * 1024)
+        for i in range(0, size, 5000):
+            assert writer.write(memoryview(data[i : i + 5000])) == len(data[i : i + 5000])
+        assert writer.tell() == size
+        writer.close()
+        assert writer.closed and not f.closed
+        compressed.append(f.getvalue())
+
+    assert compressed[0] == compressed[1]
+    assert gzip.decompress(compressed[0]) == data
+    with gzip.GzipFile(fileobj=io.BytesIO(compressed[0])) as g:
+        g.read()
+        assert g.mtime == 0 and g.name == ""
+
+
+def test_gzip_compressed_tarfile_in_parallel_is_reproducible(tmp_path: Path):
+    """Tests that tarballs compressed in parallel are the same for any number of threads"""
+    root = tmp_path / "root"
+    root.mkdir()
+    for i in range(20):
+        (root / f"file-{i}").write_bytes(b"".join(b"%d %d\n" % (i, j) for j in range(20000)))
+
+    checksums = []
+    for jobs in (1, 3):
+        tarball = str(tmp_path / f"root-{jobs}.tar.gz")
+        with gzip_compressed_tarfile(tarball, jobs=jobs) as (tar, gzip_checksum, tar_checksum):
+            reproducible_tarfile_from_prefix(tar, str(root))
+        assert gzip_checksum.hexdigest() == spack.util.crypto.checksum(hashlib.sha256, tarball)
+        with gzip.open(tarball, "rb") as f:
+            assert tar_checksum.hexdigest() == spack.util.crypto.checksum_stream(
+                hashlib.sha256, f  # type: ignore
+            )
+        with tarfile.open(tarball, "r:gz") as tar:
+            assert len(tar.getmembers()) == 21
+        checksums.append((gzip_checksum.hexdigest(), tar_checksum.hexdigest()))
+
+    assert checksums[0] == checksums[1]
+
+
 def test_reproducible_tarfile_from_prefix_path_to_name(tmp_path: Path):
     prefix = tmp_path / "example"
     prefix.mkdir()
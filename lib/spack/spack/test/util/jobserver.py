@@ -0,0 +1,48 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import os
+import pathlib
+
+import pytest
+
+import spack.build_environment
+import spack.llnl.util.filesystem
+import spack.util.executable
+from spack.util.jobserver import JobServer
+
+pytestmark = pytest.mark.not_on_windows("jobservers are not supported on Windows")
+
+#: Makefile with four jobs, recording how many run at the same time
+MAKEFILE = """\
+all: a b c d
+a b c d:
+\t@mkdir running_$@ && ls -d running_* | wc -l >> counts && sleep 0.2 && rmdir running_$@
+"""
+
+
+def test_jobserver_environment(working_env):
+    os.environ["MAKEFLAGS"] = "-k"
+    with JobServer(4) as jobserver:
+        assert spack.build_environment.jobserver_enabled()
+        assert os.environ["MAKEFLAGS"] == jobserver.makeflags
+
+        # Each make owns an implicit job slot, so the pipe holds one token less
+        os.set_blocking(jobserver.read_fd, False)
+        assert os.read(jobserver.read_fd, 16) == b"+++"
+
+    assert os.environ["MAKEFLAGS"] == "-k"
+
+
+@pytest.mark.skipif(
+    not spack.util.executable.which("make"), reason="requires GNU make to be installed"
+)
+def test_jobserver_limits_jobs(tmp_path: pathlib.Path, working_env):
+    """Tests that make takes jobs from the jobserver, when called by Spack without -j"""
+    (tmp_path / "Makefile").write_text(MAKEFILE)
+    make = spack.build_environment.MakeExecutable("make", jobs=8)
+    with JobServer(2), spack.llnl.util.filesystem.working_dir(str(tmp_path)):
+        make()
+
+    counts = [int(x) for x in (tmp_path / "counts").read_text().split()]
+    assert len(counts) == 4 and max(counts) == 2
@@ -0,0 +1,42 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import spack.util.memory
+
+pytestmark = pytest.mark.skipif(
+    not os.path.isdir("/proc"), reason="memory of processes is sampled from /proc"
+)
+
+
+def test_memory_available():
+    assert spack.util.memory.memory_available() > 0
+
+
+def test_process_tree_rss_includes_children():
+    own = spack.util.memory.process_tree_rss(os.getpid())
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(10)"])
+    try:
+        child_rss = spack.util.memory.process_tree_rss(child.pid)
+        assert child_rss > 0
+        assert spack.util.memory.process_tree_rss(os.getpid()) > own
+    finally:
+        child.kill()
+        child.wait()
+
+
+def test_peak_memory_sampler():
+    before = spack.util.memory.process_tree_rss(os.getpid())
+    with spack.util.memory.PeakMemorySampler(interval=0.01) as memory:
+        data = b"x" * 64 * 1024**2
+        time.sleep(0.1)
+        del data
+    assert memory.peak >= before + 60 * 1024**2
+    assert memory.baseline >= before
+    assert memory.growth >= 60 * 1024**2
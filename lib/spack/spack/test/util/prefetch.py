@@ -0,0 +1,110 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import threading
+
+import spack.llnl.util.tty as tty
+from spack.util.prefetch import Prefetcher
+
+
+def test_prefetcher_claim():
+    prefetcher = Prefetcher(2)
+    prefetcher.submit("a", lambda x: x + 1, 1)
+    prefetcher.submit("a", lambda x: x + 2, 1)
+    assert "a" in prefetcher and len(prefetcher) == 1
+
+    future = prefetcher.claim("a")
+    assert future is not None and future.result() == 2
+    assert "a" not in prefetcher and prefetcher.claim("a") is None
+    prefetcher.shutdown()
+
+
+def test_prefetcher_cleans_up_unclaimed_results():
+    """Tests that only results that were not claimed, and are not None, are cleaned up"""
+    cleaned = []
+    prefetcher = Prefetcher(2, cleanup=cleaned.append)
+    for key, result in (("a", "a"), ("b", "b"), ("c", None)):
+        prefetcher.submit(key, lambda x: x, result)
+    prefetcher.claim("a")
+    prefetcher.shutdown()
+
+    assert cleaned == ["b"]
+    assert len(prefetcher) == 0
+
+
+def test_prefetcher_cancels_pending_work():
+    """Tests that work that didn't start is cancelled on shutdown"""
+    started, release = threading.Event(), threading.Event()
+    ran = []
+
+    def _block():
+        started.set()
+        release.wait()
+        return "running"
+
+    prefetcher = Prefetcher(1, cleanup=ran.append)
+    prefetcher.submit("a", _block)
+    prefetcher.submit("b", ran.append, "pending")
+    started.wait()
+
+    # Let the running work finish only after shutdown started
+    timer = threading.Timer(0.1, release.set)
+    timer.start()
+    prefetcher.shutdown()
+    timer.join()
+
+    assert ran == ["running"]
+
+
+def test_prefetcher_suppresses_output(capfd):
+    """Tests that functions run in the background don't print messages, while the main thread
+    still does, and that their warnings are kept"""
+
+    def _print():
+        tty.msg("background message")
+        tty.warn("background warning")
+        return tty.msg_enabled()
+
+    prefetcher = Prefetcher(1)
+    prefetcher.submit("a", _print)
+    future = prefetcher.claim("a")
+    assert future is not None and future.result() is False
+    prefetcher.shutdown()
+    tty.msg("main message")
+
+    out, err = capfd.readouterr()
+    assert "background message" not in out + err
+    assert "background warning" in err
+    assert "main message" in out
+
+
+def test_prefetcher_starts_nothing_while_paused():
+    """Tests that entering the paused context doesn't wait for running functions, and that
+    functions submitted in the context start only on exit"""
+    started, release = threading.Event(), threading.Event()
+    ran = []
+
+    def _block():
+        started.set()
+        release.wait()
+        ran.append("running")
+
+    prefetcher = Prefetcher(2)
+    prefetcher.submit("a", _block)
+    started.wait()
+
+    with prefetcher.paused():
+        assert not ran
+        prefetcher.submit("b", ran.append, "submitted")
+        future = prefetcher.peek("b")
+        assert future is not None and not future.done()
+
+        # The running function completes in the context
+        release.set()
+        running = prefetcher.peek("a")
+        assert running is not None and running.result(timeout=10) is None
+        assert ran == ["running"] and not future.done()
+
+    assert future.result(timeout=10) is None
+    assert ran == ["running", "submitted"]
+    prefetcher.shutdown()
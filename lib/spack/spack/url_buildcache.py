@@ -45,6 +45,9 @@
 #: The name of the default buildcache index manifest file
 INDEX_MANIFEST_FILE = "index.manifest.json"
 
+#: The name of the manifest of the buildcache index split in shards
+INDEX_SHARDS_MANIFEST_FILE = "index-shards.manifest.json"
+
 
 class BuildcacheComponent(enum.Enum):
     """Enumeration of the kinds of things that live in a URL buildcache
@@ -60,6 +63,10 @@ class BuildcacheComponent(enum.Enum):
     BLOB = enum.auto()
     # binary mirror index
     INDEX = enum.auto()
+    # table of the shards of the binary mirror index
+    INDEX_SHARDS = enum.auto()
+    # records of the binary mirror index changed by a push
+    INDEX_DELTA = enum.auto()
     # public key used for verifying signed binary packages
     KEY = enum.auto()
     # index of all public keys found in the mirror
@@ -185,15 +192,21 @@ class URLBuildcacheEntry:
 
     SPEC_URL_REGEX = re.compile(r"(.+)/v([\d]+)/manifests/.+")
     LAYOUT_VERSION = 3
-    BUILDCACHE_INDEX_MEDIATYPE = f"application/vnd.spack.db.v{spack.database._DB_VERSION}+json"
+    BUILDCACHE_INDEX_MEDIATYPE = (
+        f"application/vnd.spack.db.v{spack.database._DB_VERSION_WITHOUT_JOURNAL}+json"
+    )
+    BUILDCACHE_INDEX_SHARDS_MEDIATYPE = "application/vnd.spack.db-shards.v1+json"
+    BUILDCACHE_INDEX_DELTA_MEDIATYPE = "application/vnd.spack.db-delta.v1+json"
     SPEC_MEDIATYPE = f"application/vnd.spack.spec.v{spack.spec.SPECFILE_FORMAT_VERSION}+json"
     TARBALL_MEDIATYPE = "application/vnd.spack.install.v2.tar+gzip"
     PUBLIC_KEY_MEDIATYPE = "application/pgp-keys"
     PUBLIC_KEY_INDEX_MEDIATYPE = "application/vnd.spack.keyindex.v1+json"
     BUILDCACHE_INDEX_FILE = "index.manifest.json"
+    BUILDCACHE_INDEX_SHARDS_FILE = "index-shards.manifest.json"
     COMPONENT_PATHS = {
         BuildcacheComponent.BLOB: ["blobs"],
         BuildcacheComponent.INDEX: [f"v{LAYOUT_VERSION}", "manifests", "index"],
+        BuildcacheComponent.INDEX_SHARDS: [f"v{LAYOUT_VERSION}", "manifests", "index"],
         BuildcacheComponent.KEY: [f"v{LAYOUT_VERSION}", "manifests", "key"],
         BuildcacheComponent.SPEC: [f"v{LAYOUT_VERSION}", "manifests", "spec"],
         BuildcacheComponent.KEY_INDEX: [f"v{LAYOUT_VERSION}", "manifests", "key"],
@@ -260,6 +273,14 @@ def get_index_url(cls, mirror_url: str):
             cls.BUILDCACHE_INDEX_FILE,
         )
 
+    @classmethod
+    def get_index_shards_url(cls, mirror_url: str):
+        return url_util.join(
+            mirror_url,
+            *cls.get_relative_path_components(BuildcacheComponent.INDEX_SHARDS),
+            cls.BUILDCACHE_INDEX_SHARDS_FILE,
+        )
+
     @classmethod
     def get_relative_path_components(cls, component: BuildcacheComponent) -> List[str]:
         """Given any type of buildcache component, return its relative location within
@@ -295,6 +316,8 @@ def get_buildcache_component_include_pattern(
             return "*.spec.manifest.json"
         elif buildcache_component == BuildcacheComponent.INDEX:
             return ".*index.manifest.json"
+        elif buildcache_component == BuildcacheComponent.INDEX_SHARDS:
+            return "index-shards.manifest.json"
         elif buildcache_component == BuildcacheComponent.KEY:
             return "*.key.manifest.json"
         elif buildcache_component == BuildcacheComponent.KEY_INDEX:
@@ -311,6 +334,10 @@ def component_to_media_type(cls, component: BuildcacheComponent) -> str:
             return cls.TARBALL_MEDIATYPE
         elif component == BuildcacheComponent.INDEX:
             return cls.BUILDCACHE_INDEX_MEDIATYPE
+        elif component == BuildcacheComponent.INDEX_SHARDS:
+            return cls.BUILDCACHE_INDEX_SHARDS_MEDIATYPE
+        elif component == BuildcacheComponent.INDEX_DELTA:
+            return cls.BUILDCACHE_INDEX_DELTA_MEDIATYPE
         elif component == BuildcacheComponent.KEY:
             return cls.PUBLIC_KEY_MEDIATYPE
         elif component == BuildcacheComponent.KEY_INDEX:
@@ -374,6 +401,7 @@ def fetch_blob(self, record: BlobRecord) -> str:
                 blob_stage.create()
                 blob_stage.fetch()
             except spack.error.FetchError as e:
+                blob_stage.destroy()
                 self.destroy()
                 raise BuildcacheEntryError(f"Unable to fetch blob from {blob_url}") from e
 
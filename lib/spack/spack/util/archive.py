@@ -1,15 +1,19 @@
 # Copyright Spack Project Developers. See COPYRIGHT file for details.
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
+import collections
+import concurrent.futures
 import errno
 import hashlib
 import io
 import os
 import pathlib
+import struct
 import tarfile
+import zlib
 from contextlib import closing, contextmanager
 from gzip import GzipFile
-from typing import Callable, Dict, Generator, List, Tuple
+from typing import Callable, Deque, Dict, Generator, List, Optional, Tuple
 
 from spack.llnl.util import tty
 from spack.llnl.util.filesystem import readlink
@@ -96,14 +100,145 @@ def readline(self, size=-1):
         raise OSError(errno.EBADF, "readline() on write-only object")
 
 
+#: Size of the blocks of uncompressed data that are compressed in parallel. Same as pigz.
+PARALLEL_GZIP_BLOCK_SIZE = 128 * 1024
+
+#: Size of the window of deflate, which is how far back in the data compressed blocks can refer to
+DEFLATE_WINDOW_SIZE = 32 * 1024
+
+
+def _deflate_block(block: bytes, dictionary: bytes, compresslevel: int, last: bool) -> bytes:
+    """Compress a block of data to raw deflate, using the data preceding it as dictionary. All
+    but the last block end on a byte boundary, so that the compressed blocks can be
+    concatenated."""
+    if dictionary:
+        compressor = zlib.compressobj(
+            compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary
+        )
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(block) + compressor.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    )
+
+
+class ParallelGzipWriter(io.BufferedIOBase):
+    """Gzip writer that compresses blocks of data in a pool of threads, like pigz.
+
+    Each block is compressed with the end of the block before it as dictionary, and the
+    compressed blocks are written in order, as a single gzip member that any gzip reader can
+    decode. The output depends on the data and the compression level only, not on the number of
+    threads, and the gzip header has no file name and zero mtime, for reproducibility. The file
+    object is not closed on close, like with :class:`gzip.GzipFile`."""
+
+    def __init__(
+        self,
+        fileobj,
+        *,
+        compresslevel: int = 6,
+        jobs: int = 1,
+        block_size: int = PARALLEL_GZIP_BLOCK_SIZE,
+    ):
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.block_size = block_size
+        self.length = 0
+        self._crc = 0
+        self._buffer = bytearray()
+        self._dictionary = b""
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        # Keep every thread busy, while bounding the memory used by blocks waiting to be written
+        self._max_pending = 2 * jobs
+        self._pending: Deque[concurrent.futures.Future] = collections.deque()
+
+        # Same header as GzipFile(filename="", mtime=0)
+        if compresslevel == zlib.Z_BEST_COMPRESSION:
+            xfl = b"\002"
+        elif compresslevel == zlib.Z_BEST_SPEED:
+            xfl = b"\004"
+        else:
+            xfl = b"\000"
+        self.fileobj.write(b"\037\213\010\000" + struct.pack("<L", 0) + xfl + b"\377")
+
+    def _submit(self, block: bytes, last: bool) -> None:
+        args = (block, self._dictionary, self.compresslevel, last)
+        self._pending.append(self._executor.submit(_deflate_block, *args))
+        self._dictionary = block[-DEFLATE_WINDOW_SIZE:]
+        while len(self._pending) > self._max_pending:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def write(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            length = len(data)
+        else:
+            data = memoryview(data)
+            length = data.nbytes
+
+        self._crc = zlib.crc32(data, self._crc)
+        self._buffer += data
+        self.length += length
+
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[: self.block_size])
+            del self._buffer[: self.block_size]
+            self._submit(block, last=False)
+
+        return length
+
+    def read(self, size=-1):
+        raise OSError(errno.EBADF, "read() on write-only object")
+
+    def read1(self, size=-1):
+        raise OSError(errno.EBADF, "read1() on write-only object")
+
+    @property
+    def closed(self):
+        return self.fileobj is None
+
+    def close(self):
+        if self.fileobj is None:
+            return
+        try:
+            self._submit(bytes(self._buffer), last=True)
+            self._buffer.clear()
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().result())
+            trailer = struct.pack("<LL", self._crc & 0xFFFFFFFF, self.length & 0xFFFFFFFF)
+            self.fileobj.write(trailer)
+        finally:
+            self._executor.shutdown()
+            self.fileobj = None
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def readable(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        return self.length
+
+
 @contextmanager
 def gzip_compressed_tarfile(
-    path: str,
+    path: str, *, jobs: Optional[int] = None
 ) -> Generator[Tuple[tarfile.TarFile, ChecksumWriter, ChecksumWriter], None, None]:
     """Create a reproducible, gzip compressed tarfile, and keep track of shasums of both the
     compressed and uncompressed tarfile. Reproduciblity is achived by normalizing the gzip header
     (no file name and zero mtime).
 
+    Args:
+        path: path of the tarfile
+        jobs: if given, compress with a :class:`ParallelGzipWriter` using this many threads.
+            Its output is the same for any number of threads, but differs from the output of the
+            default, single threaded, compression.
+
     Yields:
         A tuple of three elements
 
@@ -119,12 +254,18 @@ def gzip_compressed_tarfile(
     # compresslevel=6 gzip default: llvm takes 4mins, roughly 2.1GB
     # compresslevel=9 python default: llvm takes 12mins, roughly 2.1GB
     # So we follow gzip.
-    with open(path, "wb") as f, ChecksumWriter(f) as gzip_checksum, closing(
-        GzipFile(filename="", mode="wb", compresslevel=6, mtime=0, fileobj=gzip_checksum)
-    ) as gzip_file, ChecksumWriter(gzip_file) as tarfile_checksum, tarfile.TarFile(
-        name="", mode="w", fileobj=tarfile_checksum
-    ) as tar:
-        yield tar, gzip_checksum, tarfile_checksum
+    with open(path, "wb") as f, ChecksumWriter(f) as gzip_checksum:
+        gzip_file: io.BufferedIOBase
+        if jobs is None:
+            gzip_file = GzipFile(
+                filename="", mode="wb", compresslevel=6, mtime=0, fileobj=gzip_checksum
+            )
+        else:
+            gzip_file = ParallelGzipWriter(gzip_checksum, compresslevel=6, jobs=jobs)
+        with closing(gzip_file), ChecksumWriter(gzip_file) as tarfile_checksum, tarfile.TarFile(
+            name="", mode="w", fileobj=tarfile_checksum
+        ) as tar:
+            yield tar, gzip_checksum, tarfile_checksum
 
 
 def default_path_to_name(path: str) -> str:
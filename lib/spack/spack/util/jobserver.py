@@ -0,0 +1,57 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+"""A GNU make compatible jobserver, to share a budget of jobs among concurrent builds.
+
+GNU make coordinates the jobs of recursive invocations with a pipe that holds one token for each
+job slot, besides the one implicitly owned by each make process. A make that finds
+``--jobserver-auth=R,W`` in ``MAKEFLAGS`` reads a token from file descriptor ``R`` before starting
+an additional job, and writes it back to ``W`` when the job is done.
+
+When Spack hosts such a pipe, and exports it in ``MAKEFLAGS``, the makes run by concurrent builds
+share the same budget of jobs, instead of each one running as many jobs as there are cores.
+"""
+import os
+from typing import Optional
+
+
+class JobServer:
+    """Pipe with a fixed number of job tokens, shared by child processes through ``MAKEFLAGS``.
+
+    Used as a context manager, it sets ``MAKEFLAGS`` in the environment of the current process,
+    so that it's inherited by the processes started in the context, and closes the pipe on exit.
+    """
+
+    def __init__(self, jobs: int) -> None:
+        """
+        Arguments:
+            jobs: total number of jobs. The pipe holds one token less, since each make process
+                owns an implicit job slot.
+        """
+        self.jobs = jobs
+        self.read_fd, self.write_fd = os.pipe()
+        for fd in (self.read_fd, self.write_fd):
+            os.set_inheritable(fd, True)
+        os.write(self.write_fd, b"+" * (jobs - 1))
+        self._makeflags: Optional[str] = None
+
+    @property
+    def makeflags(self) -> str:
+        """Value of ``MAKEFLAGS`` that makes GNU make use this jobserver"""
+        return f"-j{self.jobs} --jobserver-auth={self.read_fd},{self.write_fd}"
+
+    def close(self) -> None:
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+    def __enter__(self) -> "JobServer":
+        self._makeflags = os.environ.get("MAKEFLAGS")
+        os.environ["MAKEFLAGS"] = self.makeflags
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._makeflags is None:
+            os.environ.pop("MAKEFLAGS", None)
+        else:
+            os.environ["MAKEFLAGS"] = self._makeflags
+        self.close()
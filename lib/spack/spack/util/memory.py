@@ -0,0 +1,118 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+"""Memory available on the system, and memory used by a tree of processes."""
+import os
+import threading
+from typing import Dict, List, Optional
+
+
+def memory_available() -> Optional[int]:
+    """Returns the memory, in bytes, available for new processes without swapping, or the
+    physical memory when that information cannot be retrieved. Returns None if neither is
+    known."""
+    try:
+        with open("/proc/meminfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """Returns the sum of the resident set sizes, in bytes, of a process and its descendants,
+    or None if ``/proc`` is not available.
+
+    Args:
+        pid: id of the root process
+    """
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return None
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name, in parentheses, may contain spaces
+        ppid = int(stat[stat.rindex(")") + 2 :].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/statm", encoding="utf-8") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, ValueError, IndexError):
+            continue
+        stack.extend(children.get(current, ()))
+    return total
+
+
+class PeakMemorySampler:
+    """Samples the memory used by the current process and its descendants in a background
+    thread, and keeps the peak.
+
+    Unlike the maximum resident set size returned by ``getrusage``, which is the peak of the
+    largest single process, this is the peak of the sum over all the processes that run at the
+    same time, e.g. the compilers started by a parallel make.
+
+    The memory used when sampling starts is kept as a baseline, so that the memory that a
+    forked process shares with its parent can be told apart from the memory used after it.
+    """
+
+    def __init__(self, interval: float = 1.0) -> None:
+        """
+        Arguments:
+            interval: time, in seconds, between samples
+        """
+        self.interval = interval
+        self.peak: Optional[int] = None
+        self.baseline: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        rss = process_tree_rss(os.getpid())
+        if rss is not None:
+            self.peak = max(self.peak or 0, rss)
+
+    @property
+    def growth(self) -> Optional[int]:
+        """Peak memory, in bytes, above the memory used when sampling started, or None if no
+        sample was taken."""
+        if self.peak is None or self.baseline is None:
+            return None
+        return self.peak - self.baseline
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "PeakMemorySampler":
+        if os.path.isdir("/proc"):
+            self._sample()
+            self.baseline = self.peak
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
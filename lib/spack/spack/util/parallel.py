@@ -56,8 +56,26 @@ def __call__(self, *args, **kwargs):
         return value
 
 
+def runs_in_process(num_tasks: int, processes: int) -> bool:
+    """Returns whether ``imap_unordered`` runs the tasks in the calling process, instead of in
+    a pool of worker processes."""
+    return sys.platform in ("darwin", "win32") or num_tasks == 1 or processes == 1
+
+
+def inherits_state(num_tasks: int, processes: int) -> bool:
+    """Returns whether the tasks of ``imap_unordered(..., inherit_state=True)`` see the global
+    state of the calling process as is: when they run in process, or in forked workers."""
+    return runs_in_process(num_tasks, processes) or multiprocessing.get_start_method() == "fork"
+
+
 def imap_unordered(
-    f, list_of_args, *, processes: int, maxtaskperchild: Optional[int] = None, debug=False
+    f,
+    list_of_args,
+    *,
+    processes: int,
+    maxtaskperchild: Optional[int] = None,
+    debug=False,
+    inherit_state: bool = False,
 ):
     """Wrapper around multiprocessing.Pool.imap_unordered.
 
@@ -69,19 +87,24 @@ def imap_unordered(
             from workers, if True an exception with complete stacktraces
         maxtaskperchild: number of tasks to be executed by a child before being
             killed and substituted
+        inherit_state: if True, and processes are forked, children use the global state
+            of the parent as is (sharing it copy-on-write), instead of restoring it
 
     Raises:
         RuntimeError: if any error occurred in the worker processes
     """
     from spack.subprocess_context import GlobalStateMarshaler
 
-    if sys.platform in ("darwin", "win32") or len(list_of_args) == 1:
+    if runs_in_process(len(list_of_args), processes):
         yield from map(f, list_of_args)
         return
 
-    marshaler = GlobalStateMarshaler()
+    initializer = None
+    if not inherit_state or not inherits_state(len(list_of_args), processes):
+        initializer = GlobalStateMarshaler().restore
+
     with multiprocessing.Pool(
-        processes, initializer=marshaler.restore, maxtasksperchild=maxtaskperchild
+        processes, initializer=initializer, maxtasksperchild=maxtaskperchild
     ) as p:
         for result in p.imap_unordered(Task(f), list_of_args):
             if isinstance(result, ErrorFromWorker):
@@ -0,0 +1,106 @@
+# Copyright Spack Project Developers. See COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+"""Run work ahead of time in a bounded pool of background threads, and claim results by key."""
+import concurrent.futures
+import contextlib
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import spack.llnl.util.tty as tty
+
+
+class Prefetcher:
+    """Runs functions in a bounded pool of background threads, so that their results are ready
+    by the time they are needed.
+
+    Each function is submitted with a key, and its future is later claimed by that key. Results
+    that are never claimed, and are not None, are passed to a cleanup function on shutdown.
+
+    Functions run with their messages suppressed, so that they don't interleave with the output
+    of the main thread. Their warnings and errors are still printed. Forks are meant to happen in
+    the ``paused()`` context, so that no function starts while the process forks. Functions that
+    are running go on in the parent, and the child process must not use their results.
+    """
+
+    def __init__(self, jobs: int, cleanup: Optional[Callable[[Any], None]] = None) -> None:
+        """
+        Arguments:
+            jobs: maximum number of functions running at the same time
+            cleanup: function called on the results that were not claimed, on shutdown
+        """
+        self.jobs = jobs
+        self.cleanup = cleanup
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        self._futures: Dict[Hashable, concurrent.futures.Future] = {}
+        self._condition = threading.Condition()
+        self._running = 0
+        self._paused = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._futures
+
+    def __len__(self) -> int:
+        """Number of results that were submitted, and not yet claimed"""
+        return len(self._futures)
+
+    def submit(self, key: Hashable, fn: Callable, *args, **kwargs) -> None:
+        """Starts running a function in the background, unless one with the same key was
+        submitted and not yet claimed."""
+        if key not in self._futures:
+            self._futures[key] = self._executor.submit(self._run, fn, *args, **kwargs)
+
+    def _run(self, fn: Callable, *args, **kwargs) -> Any:
+        with self._condition:
+            self._condition.wait_for(lambda: not self._paused)
+            self._running += 1
+        try:
+            with tty.suppress_thread_output():
+                return fn(*args, **kwargs)
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def paused(self):
+        """Context in which no function starts: the ones that didn't start yet are held back
+        until exit, while the running ones go on. Results that are not ready must not be waited
+        for in this context."""
+        with self._condition:
+            self._paused += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._paused -= 1
+                self._condition.notify_all()
+
+    def peek(self, key: Hashable) -> Optional[concurrent.futures.Future]:
+        """Returns the future submitted with a key, without claiming it, or None if there is
+        none."""
+        return self._futures.get(key)
+
+    def claim(self, key: Hashable) -> Optional[concurrent.futures.Future]:
+        """Returns the future submitted with a key, and forgets about it, or None if there
+        is none."""
+        return self._futures.pop(key, None)
+
+    def shutdown(self) -> None:
+        """Cancels functions that didn't start, waits for the running ones, and cleans up
+        results that were not claimed."""
+        for future in self._futures.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
+
+        futures, self._futures = self._futures, {}
+        if self.cleanup is None:
+            return
+
+        for key, future in futures.items():
+            if future.cancelled() or future.exception() is not None or future.result() is None:
+                continue
+            try:
+                self.cleanup(future.result())
+            except Exception as e:
+                tty.debug(f"Failed to clean up the result prefetched for {key}: {e}")
@@ -353,6 +353,7 @@ complete -c spack -n '__fish_spack_using_command_pos 0 ' -f -a audit -d 'audit c
 complete -c spack -n '__fish_spack_using_command_pos 0 ' -f -a blame -d 'show contributors to packages'
 complete -c spack -n '__fish_spack_using_command_pos 0 ' -f -a bootstrap -d 'manage bootstrap configuration'
 complete -c spack -n '__fish_spack_using_command_pos 0 ' -f -a build-env -d 'run a command in a spec'"'"'s install environment, or dump its environment to screen or file'
+complete -c spack -n '__fish_spack_using_command_pos 0 ' -f -a build-stats -d 'show the history of builds and binary cache installs'
 complete -c spack -n '__fish_spack_using_command_pos 0 ' -f -a buildcache -d 'create, download and install binary packages'
 complete -c spack -n '__fish_spack_using_command_pos 0 ' -f -a cd -d 'cd to spack directories in the shell'
 complete -c spack -n '__fish_spack_using_command_pos 0 ' -f -a change -d 'change an existing spec in an environment'
@@ -685,6 +686,16 @@ complete -c spack -n '__fish_spack_using_command build-env' -l dump -r -d 'dump
 complete -c spack -n '__fish_spack_using_command build-env' -l pickle -r -f -a pickle
 complete -c spack -n '__fish_spack_using_command build-env' -l pickle -r -d 'dump a pickled source-able environment to FILE'
 
+# spack build-stats
+set -g __fish_spack_optspecs_spack_build_stats h/help a/all json
+
+complete -c spack -n '__fish_spack_using_command build-stats' -s h -l help -f -a help
+complete -c spack -n '__fish_spack_using_command build-stats' -s h -l help -d 'show this help message and exit'
+complete -c spack -n '__fish_spack_using_command build-stats' -s a -l all -f -a all
+complete -c spack -n '__fish_spack_using_command build-stats' -s a -l all -d 'show every installation, instead of a summary for each package, version and compiler'
+complete -c spack -n '__fish_spack_using_command build-stats' -l json -f -a json
+complete -c spack -n '__fish_spack_using_command build-stats' -l json -d 'output the installations as machine-readable json records, one per line'
+
 # spack buildcache
 set -g __fish_spack_optspecs_spack_buildcache h/help
 complete -c spack -n '__fish_spack_using_command_pos 0 buildcache' -f -a push -d 'create a binary package and push it to a mirror'
@@ -1035,7 +1046,7 @@ complete -c spack -n '__fish_spack_using_command ci verify-versions' -s h -l hel
 complete -c spack -n '__fish_spack_using_command ci verify-versions' -s h -l help -d 'show this help message and exit'
 
 # spack clean
-set -g __fish_spack_optspecs_spack_clean h/help s/stage d/downloads f/failures m/misc-cache p/python-cache b/bootstrap a/all
+set -g __fish_spack_optspecs_spack_clean h/help s/stage d/downloads f/failures m/misc-cache p/python-cache concretization-cache b/bootstrap a/all
 complete -c spack -n '__fish_spack_using_command_pos_remainder 0 clean' -f -k -a '(__fish_spack_specs)'
 complete -c spack -n '__fish_spack_using_command clean' -s h -l help -f -a help
 complete -c spack -n '__fish_spack_using_command clean' -s h -l help -d 'show this help message and exit'
@@ -1049,6 +1060,8 @@ complete -c spack -n '__fish_spack_using_command clean' -s m -l misc-cache -f -a
 complete -c spack -n '__fish_spack_using_command clean' -s m -l misc-cache -d 'remove long-lived caches, like the virtual package index'
 complete -c spack -n '__fish_spack_using_command clean' -s p -l python-cache -f -a python_cache
 complete -c spack -n '__fish_spack_using_command clean' -s p -l python-cache -d 'remove .pyc, .pyo files and __pycache__ folders'
+complete -c spack -n '__fish_spack_using_command clean' -l concretization-cache -f -a concretization_cache
+complete -c spack -n '__fish_spack_using_command clean' -l concretization-cache -d 'report statistics of the concretization cache, then remove all its entries'
 complete -c spack -n '__fish_spack_using_command clean' -s b -l bootstrap -f -a bootstrap
 complete -c spack -n '__fish_spack_using_command clean' -s b -l bootstrap -d 'remove software and configuration needed to bootstrap Spack'
 complete -c spack -n '__fish_spack_using_command clean' -s a -l all -f -a all
@@ -2908,7 +2921,7 @@ complete -c spack -n '__fish_spack_using_command restage' -s h -l help -f -a hel
 complete -c spack -n '__fish_spack_using_command restage' -s h -l help -d 'show this help message and exit'
 
 # spack solve
-set -g __fish_spack_optspecs_spack_solve h/help show= timers stats l/long L/very-long N/namespaces I/install-status no-install-status y/yaml j/json format= c/cover= t/types f/force U/fresh reuse fresh-roots deprecated
+set -g __fish_spack_optspecs_spack_solve h/help show= timers stats profile profile-json= cache-stats cache-compact l/long L/very-long N/namespaces I/install-status no-install-status y/yaml j/json format= c/cover= t/types f/force U/fresh reuse fresh-roots deprecated
 complete -c spack -n '__fish_spack_using_command_pos_remainder 0 solve' -f -k -a '(__fish_spack_specs_or_id)'
 complete -c spack -n '__fish_spack_using_command solve' -s h -l help -f -a help
 complete -c spack -n '__fish_spack_using_command solve' -s h -l help -d 'show this help message and exit'
@@ -2918,6 +2931,14 @@ complete -c spack -n '__fish_spack_using_command solve' -l timers -f -a timers
 complete -c spack -n '__fish_spack_using_command solve' -l timers -d 'print out timers for different solve phases'
 complete -c spack -n '__fish_spack_using_command solve' -l stats -f -a stats
 complete -c spack -n '__fish_spack_using_command solve' -l stats -d 'print out statistics from clingo'
+complete -c spack -n '__fish_spack_using_command solve' -l profile -f -a profile
+complete -c spack -n '__fish_spack_using_command solve' -l profile -d 'print time spent and facts emitted by each setup phase and package, together with grounding and solving statistics'
+complete -c spack -n '__fish_spack_using_command solve' -l profile-json -r -f -a profile_json
+complete -c spack -n '__fish_spack_using_command solve' -l profile-json -r -d 'write the profiling report as JSON to FILE'
+complete -c spack -n '__fish_spack_using_command solve' -l cache-stats -f -a cache_stats
+complete -c spack -n '__fish_spack_using_command solve' -l cache-stats -d 'print out hit/miss statistics of the concretization cache'
+complete -c spack -n '__fish_spack_using_command solve' -l cache-compact -f -a cache_compact
+complete -c spack -n '__fish_spack_using_command solve' -l cache-compact -d 'fold the access logs of the concretization cache into its index, and prune it'
 complete -c spack -n '__fish_spack_using_command solve' -s l -l long -f -a long
 complete -c spack -n '__fish_spack_using_command solve' -s l -l long -d 'show dependency hashes as well as versions'
 complete -c spack -n '__fish_spack_using_command solve' -s L -l very-long -f -a very_long